@@ -0,0 +1,136 @@
+"""
+予約書き込みの受付制御（アドミッションコントロール）
+- 予約確定・仮押さえは Firestore への逐次呼び出しが多く、スロット単位のロック待ちもあるため、
+  そのまま受けるとアクセス集中時に共有スレッドプールを使い切り、空き枠 API（読み取り）まで止まる
+- 同時に実行する書き込み数を max_concurrent に制限し、超えた分は (診療科, 日付) ごとの待ち行列に並べる
+  - 同じキーの中は到着順（FIFO）、キー同士は順番に1件ずつ（ラウンドロビン）で、特定の日付に偏らない
+- 待ち行列が上限（キーごと・全体）に達したら、待たせずに 503 + Retry-After で即座に断る
+- イベントループ上で動く（asyncio）。待機中はスレッドを占有しない
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Hashable
+
+import metrics
+
+
+class Overloaded(Exception):
+    """受付上限を超えた（retry_after 秒後の再試行を促す）"""
+
+    def __init__(self, retry_after: int, reason: str = "queue_full"):
+        super().__init__(f"overloaded: {reason}")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """同時実行数の上限 + キーごとの FIFO 待ち行列（キー間はラウンドロビン）"""
+
+    def __init__(self, max_concurrent: int, *, max_queue_per_key: int, max_queue_total: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue_per_key = max_queue_per_key
+        self.max_queue_total = max_queue_total
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._queued = 0
+        # キー → 待機中の Future（到着順）。先頭のキーから順に1件ずつ起こす
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()
+        # 1件あたりの処理時間の指数移動平均（Retry-After の見積もり用）
+        self._avg_service = 0.5
+
+    def _retry_after(self) -> int:
+        """待ち行列がはけるまでの見積もり秒数（最低1秒）"""
+        waves = (self._queued + self._running) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(waves * self._avg_service))
+
+    def _reject(self, reason: str) -> Overloaded:
+        metrics.incr("admission.rejected")
+        metrics.incr(f"admission.rejected.{reason}")
+        return Overloaded(self._retry_after(), reason)
+
+    def _wake_next(self) -> None:
+        """空きが出たら、待ち行列の先頭キーから1件だけ起こし、そのキーを末尾に回す"""
+        while self._queues and self._running < self.max_concurrent:
+            key, waiters = next(iter(self._queues.items()))
+            fut = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._running += 1
+            fut.set_result(None)
+
+    async def _acquire(self, key: Hashable) -> None:
+        if self._running < self.max_concurrent and not self._queues:
+            self._running += 1
+            metrics.incr("admission.admitted")
+            return
+        waiters = self._queues.get(key)
+        if waiters is not None and len(waiters) >= self.max_queue_per_key:
+            raise self._reject("key_queue_full")
+        if self._queued >= self.max_queue_total:
+            raise self._reject("queue_full")
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(fut)
+        self._queued += 1
+        metrics.incr("admission.queued")
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(key, fut)
+            raise self._reject("timeout") from None
+        except asyncio.CancelledError:  # クライアント切断など
+            self._abandon(key, fut)
+            raise
+        metrics.incr("admission.admitted")
+
+    def _abandon(self, key: Hashable, fut: asyncio.Future) -> None:
+        """待機をやめる。起こされた直後だった場合は受け取った枠を返す"""
+        if fut.done():
+            self._release()
+            return
+        fut.cancel()
+        waiters = self._queues.get(key)
+        if waiters is not None and fut in waiters:
+            waiters.remove(fut)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[key]
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable) -> AsyncIterator[None]:
+        """
+        書き込み1件分の実行枠を得る。満杯なら key の待ち行列で順番を待ち、
+        待ち行列が上限・待ち時間切れなら Overloaded を投げる。
+        """
+        await self._acquire(key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_service = 0.8 * self._avg_service + 0.2 * (time.monotonic() - started)
+            self._release()
+
+    def stats(self) -> dict[str, int]:
+        """実行中・待機中の件数（管理 API 用）"""
+        return {"running": self._running, "queued": self._queued, "keys": len(self._queues)}
+
+
+# 予約確定・仮押さえ用（ワーカープロセスごと）。既定の同時実行数はスレッドプール（40）より十分小さくし、読み取りの分を残す
+booking_admission = AdmissionController(
+    int(os.environ.get("BOOKING_MAX_CONCURRENT", "8")),
+    max_queue_per_key=int(os.environ.get("BOOKING_QUEUE_PER_KEY", "32")),
+    max_queue_total=int(os.environ.get("BOOKING_QUEUE_MAX", "256")),
+    queue_timeout=float(os.environ.get("BOOKING_QUEUE_TIMEOUT", "10")),
+)
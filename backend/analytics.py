@@ -0,0 +1,223 @@
+"""
+稼働率の集計（管理者向け。診療科・医師・曜日・時間帯ごとの予約枠の埋まり具合）
+- 期間内の doctors の勤務マスクと booked_slots / slot_counters を NumPy の配列（医師 × 日 × 32枠）に載せ、
+  供給（capacity = 勤務枠 × 定員）と予約数（booked）をまとめて集計する。枠ごとの Python ループは回さない
+- 祝日は供給 0。仮押さえ（hold）は予約数に含めない
+- 稼働率 = booked / capacity（供給 0 の区分は None）。勤務表の変更後に残った予約があると 1 を超えうる
+- 結果は (期間, 診療科) ごとに ANALYTICS_CACHE_TTL 秒キャッシュし、同時の同じ集計はシングルフライトで1回にまとめる
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+
+import slot_counters
+from singleflight import SingleFlight
+from slot_logic import _SLOT_INDEX, TIME_SLOTS, WEEKDAY_KEYS, _is_japanese_holiday, _normalize_schedules, slot_capacity
+from storage import get_db
+
+# 1回の集計で指定できる最大日数
+MAX_RANGE_DAYS = 366
+# 集計結果のキャッシュ（秒・件数）
+CACHE_TTL_SECONDS = float(os.environ.get("ANALYTICS_CACHE_TTL", "600"))
+CACHE_MAX_ENTRIES = 64
+
+# 枠 → 時間帯（時）
+_SLOT_HOURS = np.array([int(t[:2]) for t in TIME_SLOTS])
+HOURS = sorted({int(t[:2]) for t in TIME_SLOTS})
+
+_cache: OrderedDict[tuple[str, str, str], tuple[float, dict[str, Any]]] = OrderedDict()
+_cache_lock = threading.Lock()
+_flight = SingleFlight("analytics")
+
+
+def _date_range(date_from: str, date_to: str) -> list[str]:
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date()
+        end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except (ValueError, TypeError) as e:
+        raise ValueError("日付は YYYY-MM-DD 形式で指定してください。") from e
+    if end < start:
+        raise ValueError("終了日は開始日以降を指定してください。")
+    days = (end - start).days + 1
+    if days > MAX_RANGE_DAYS:
+        raise ValueError(f"期間は最大{MAX_RANGE_DAYS}日までです。")
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def _load_doctors(db, department: str) -> list[dict[str, Any]]:
+    q = db.collection("doctors")
+    if department:
+        q = q.where("department", "==", department)
+    doctors = []
+    for doc in q.stream():
+        d = doc.to_dict() or {}
+        doctors.append({
+            "id": doc.id, "name": d.get("name") or "", "department": str(d.get("department") or "").strip(),
+            "schedules": _normalize_schedules(d.get("schedules")), "capacity": d.get("capacity"),
+        })
+    return sorted(doctors, key=lambda d: (d["department"], d["id"]))
+
+
+def _load_bookings(
+    db, dates: list[str], doctor_index: dict[str, int], department: str = "",
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    期間内の予約を (医師, 日, 枠, 人数) の添字配列で返す（対象外の医師・グリッド外の時刻は捨てる）。
+    department を指定するとその診療科の予約だけを読む
+    """
+    day_index = {d: i for i, d in enumerate(dates)}
+    di: list[int] = []
+    ni: list[int] = []
+    si: list[int] = []
+    counts: list[int] = []
+
+    def add(d: dict[str, Any], n: int) -> None:
+        doctor, day, slot = doctor_index.get(d.get("doctorId") or ""), day_index.get(d.get("date") or ""), _SLOT_INDEX.get(d.get("time") or "")
+        if doctor is None or day is None or slot is None or n <= 0:
+            return
+        di.append(doctor)
+        ni.append(day)
+        si.append(slot)
+        counts.append(n)
+
+    def in_range(collection: str):
+        q = db.collection(collection)
+        if department:
+            q = q.where("department", "==", department)
+        return q.where("date", ">=", dates[0]).where("date", "<=", dates[-1])
+
+    for doc in in_range("booked_slots").stream():
+        d = doc.to_dict() or {}
+        if not d.get("hold"):
+            add(d, 1)
+    for doc in in_range(slot_counters.COLLECTION).stream():
+        d = doc.to_dict() or {}
+        add(d, int(d.get("count") or 0))
+    return (np.array(di, dtype=np.intp), np.array(ni, dtype=np.intp), np.array(si, dtype=np.intp),
+            np.array(counts, dtype=np.int64))
+
+
+def build_arrays(
+    doctors: list[dict[str, Any]], dates: list[str], bookings: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+) -> tuple[np.ndarray, np.ndarray]:
+    """(capacity, booked) の配列（形は 医師 × 日 × 枠）を作る"""
+    n_slots = len(TIME_SLOTS)
+    masks = np.array(
+        [[doc["schedules"].get(k, 0) for k in WEEKDAY_KEYS] for doc in doctors], dtype=np.uint64,
+    ).reshape(len(doctors), len(WEEKDAY_KEYS))
+    # 曜日ごとの勤務マスクをビット列に展開: 医師 × 曜日 × 枠
+    bits = (masks[:, :, None] >> np.arange(n_slots, dtype=np.uint64)) & np.uint64(1)
+    weekdays = np.array([datetime.strptime(d, "%Y-%m-%d").weekday() for d in dates], dtype=np.intp)
+    open_days = np.array([not _is_japanese_holiday(d) for d in dates], dtype=np.int64)
+    seats = np.array([slot_capacity(doc, doc["department"]) for doc in doctors], dtype=np.int64)
+    capacity = bits[:, weekdays, :].astype(np.int64) * open_days[None, :, None] * seats[:, None, None]
+
+    booked = np.zeros_like(capacity)
+    di, ni, si, counts = bookings
+    np.add.at(booked, (di, ni, si), counts)
+    return capacity, booked
+
+
+def _rate(booked: float, capacity: float) -> float | None:
+    return round(float(booked) / float(capacity), 4) if capacity else None
+
+
+def _row(capacity: Any, booked: Any, **key: Any) -> dict[str, Any]:
+    return {**key, "capacity": int(capacity), "booked": int(booked), "utilization": _rate(booked, capacity)}
+
+
+def summarize(
+    doctors: list[dict[str, Any]], dates: list[str], capacity: np.ndarray, booked: np.ndarray,
+) -> dict[str, Any]:
+    """配列から区分ごとの供給・予約数・稼働率を求める（すべて軸方向の集約）"""
+    weekdays = np.array([datetime.strptime(d, "%Y-%m-%d").weekday() for d in dates], dtype=np.intp)
+    n_weekdays = len(WEEKDAY_KEYS)
+    hour_index = np.searchsorted(HOURS, _SLOT_HOURS)
+
+    by_doctor_cap, by_doctor_booked = capacity.sum(axis=(1, 2)), booked.sum(axis=(1, 2))
+    departments = sorted({doc["department"] for doc in doctors})
+    dept_index = np.array([departments.index(doc["department"]) for doc in doctors], dtype=np.intp)
+    by_dept_cap = np.bincount(dept_index, weights=by_doctor_cap, minlength=len(departments))
+    by_dept_booked = np.bincount(dept_index, weights=by_doctor_booked, minlength=len(departments))
+
+    # 日 × 枠（医師方向に畳む）→ 曜日 × 時間帯
+    day_slot_cap, day_slot_booked = capacity.sum(axis=0), booked.sum(axis=0)
+    grid_cap = np.zeros((n_weekdays, len(HOURS)), dtype=np.int64)
+    grid_booked = np.zeros_like(grid_cap)
+    np.add.at(grid_cap, (weekdays[:, None], hour_index[None, :]), day_slot_cap)
+    np.add.at(grid_booked, (weekdays[:, None], hour_index[None, :]), day_slot_booked)
+
+    return {
+        "total": _row(capacity.sum(), booked.sum()),
+        "departments": [
+            _row(by_dept_cap[i], by_dept_booked[i], department=dept) for i, dept in enumerate(departments)
+        ],
+        "doctors": [
+            _row(by_doctor_cap[i], by_doctor_booked[i], doctorId=doc["id"], name=doc["name"], department=doc["department"])
+            for i, doc in enumerate(doctors)
+        ],
+        "weekdays": [
+            _row(grid_cap[w].sum(), grid_booked[w].sum(), weekday=WEEKDAY_KEYS[w]) for w in range(n_weekdays)
+        ],
+        "hours": [
+            _row(grid_cap[:, h].sum(), grid_booked[:, h].sum(), hour=hour) for h, hour in enumerate(HOURS)
+        ],
+        # 曜日 × 時間帯の稼働率（ヒートマップ用。行は WEEKDAY_KEYS、列は hours の順）
+        "weekdayHour": [
+            [_rate(grid_booked[w, h], grid_cap[w, h]) for h in range(len(HOURS))] for w in range(n_weekdays)
+        ],
+    }
+
+
+def _compute(dates: list[str], department: str) -> dict[str, Any]:
+    db = get_db()
+    doctors = _load_doctors(db, department)
+    if doctors:
+        bookings = _load_bookings(db, dates, {doc["id"]: i for i, doc in enumerate(doctors)}, department)
+        capacity, booked = build_arrays(doctors, dates, bookings)
+    else:
+        capacity = booked = np.zeros((0, len(dates), len(TIME_SLOTS)), dtype=np.int64)
+    return {
+        "from": dates[0],
+        "to": dates[-1],
+        "department": department,
+        "generatedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **summarize(doctors, dates, capacity, booked),
+    }
+
+
+def utilization(date_from: str, date_to: str, *, department: str = "", use_cache: bool = True) -> dict[str, Any]:
+    """
+    期間（最大 MAX_RANGE_DAYS 日）の稼働率を返す。department を指定するとその診療科の医師だけを集計する。
+    戻り値: {"from", "to", "department", "generatedAt", "total", "departments", "doctors", "weekdays", "hours", "weekdayHour"}
+    """
+    dates = _date_range((date_from or "").strip(), (date_to or "").strip())
+    department = (department or "").strip()
+    key = (dates[0], dates[-1], department)
+    now = time.monotonic()
+    if use_cache:
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None and now - entry[0] < CACHE_TTL_SECONDS:
+                _cache.move_to_end(key)
+                return entry[1]
+    result = _flight.do(key, lambda: _compute(dates, department))
+    with _cache_lock:
+        _cache[key] = (now, result)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return result
+
+
+def clear_cache() -> None:
+    """集計結果のキャッシュを空にする（テスト用）"""
+    with _cache_lock:
+        _cache.clear()
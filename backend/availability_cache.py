@@ -0,0 +1,125 @@
+"""
+ユーザーに依存しない空き状況のプロセス内キャッシュ（週送り・先読みした期間を問い合わせずに返す）
+- (診療科, デモ枠, 予約1件の枠数, 開始できる枠, 日付) → (医師がいるか, 1日分の結果) を TTL 秒保持する（件数上限は LRU）
+- このプロセスでの予約・キャンセル・仮押さえ（slot_events.notify）で該当の診療科・日付を即座に捨てる。
+  計算中に変更があった結果は保存しない（変更前の予約状況で計算した可能性があるため）
+- 他プロセスでの変更は最大 TTL 秒遅れて反映される（表示上の○×だけで、二重予約は予約処理の Firestore 確認で防ぐ）
+- 縮退結果（degraded）は保存しない
+- AVAILABILITY_CACHE_TTL=0 で無効
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import metrics
+import slot_events
+
+TTL_SECONDS = float(os.environ.get("AVAILABILITY_CACHE_TTL", "15"))
+MAX_ENTRIES = int(os.environ.get("AVAILABILITY_CACHE_SIZE", "20000"))
+
+# (department, use_demo, slots_needed, starts) — reservation_service._base_availability_key の日付以外
+Variant = tuple[str, bool, int, int]
+
+_entries: OrderedDict[tuple[Variant, str], tuple[float, bool, dict[str, Any]]] = OrderedDict()
+# (department, date) → その日のエントリのキー（invalidate で全件を走査しないため）
+_by_day: dict[tuple[str, str], set[tuple[Variant, str]]] = {}
+# (department, date) → 変更の回数。計算開始時と保存時で違えば保存しない
+_generations: dict[tuple[str, str], int] = {}
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return TTL_SECONDS > 0
+
+
+def generation(department: str, dates: list[str]) -> dict[str, int]:
+    """日付ごとの変更回数。計算開始時に取っておき、store に渡す"""
+    with _lock:
+        return {d: _generations.get((department, d), 0) for d in dates}
+
+
+def lookup(variant: Variant, dates: list[str]) -> tuple[bool, dict[str, dict[str, Any]]] | None:
+    """dates がすべて有効期限内なら (医師がいるか, 日付 → 1日分の結果) を返す。1日でも無ければ None"""
+    if not enabled():
+        return None
+    now = time.monotonic()
+    out: dict[str, dict[str, Any]] = {}
+    has_doctors = False
+    with _lock:
+        for date in dates:
+            entry = _entries.get((variant, date))
+            if entry is None or now - entry[0] >= TTL_SECONDS:
+                metrics.incr("availability_cache_misses")
+                return None
+            _entries.move_to_end((variant, date))
+            has_doctors = has_doctors or entry[1]
+            out[date] = entry[2]
+    metrics.incr("availability_cache_hits")
+    return has_doctors, out
+
+
+def contains(variant: Variant, dates: list[str]) -> bool:
+    """dates がすべて有効期限内で保存されているか（先読みを省くかの判定用。LRU の順は変えない）"""
+    if not enabled():
+        return False
+    now = time.monotonic()
+    with _lock:
+        for date in dates:
+            entry = _entries.get((variant, date))
+            if entry is None or now - entry[0] >= TTL_SECONDS:
+                return False
+    return True
+
+
+def store(variant: Variant, base: tuple[bool, dict[str, dict[str, Any]]], started: dict[str, int], stored_at: float) -> None:
+    """
+    計算結果を保存する。started は計算前に generation() で取った値、stored_at は計算前の time.monotonic()。
+    計算中に変更のあった日・縮退結果の日は保存しない。
+    """
+    if not enabled():
+        return
+    has_doctors, computed = base
+    department = variant[0]
+    with _lock:
+        for date, day in computed.items():
+            if day.get("degraded") or _generations.get((department, date), 0) != started.get(date):
+                continue
+            _entries[(variant, date)] = (stored_at, has_doctors, day)
+            _entries.move_to_end((variant, date))
+            _by_day.setdefault((department, date), set()).add((variant, date))
+        while len(_entries) > MAX_ENTRIES:
+            key, _ = _entries.popitem(last=False)
+            _discard_index(key)
+
+
+def _discard_index(key: tuple[Variant, str]) -> None:
+    """_by_day から key を外す（_lock 保持中に呼ぶ）"""
+    day = (key[0][0], key[1])
+    keys = _by_day.get(day)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _by_day[day]
+
+
+def invalidate(department: str, date: str, time_slot: str = "") -> None:
+    """診療科・日付の結果を捨てる（slot_events の受け手。種別ごとの結果もまとめて捨てる）"""
+    with _lock:
+        _generations[(department, date)] = _generations.get((department, date), 0) + 1
+        for key in _by_day.pop((department, date), ()):
+            _entries.pop(key, None)
+
+
+def clear() -> None:
+    """全エントリを捨てる（テスト用）"""
+    with _lock:
+        _entries.clear()
+        _by_day.clear()
+        _generations.clear()
+
+
+slot_events.add_listener(invalidate)
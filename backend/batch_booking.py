@@ -0,0 +1,221 @@
+"""
+複数枠の一括予約（臨床検査 09:00 → 循環器内科 10:00 のように、続けて受ける予約をまとめて確定する）
+- 入力チェックと予約が占める枠の決定は1件ずつ create_reservation と同じ（_validate_booking_request・_appointment_run）
+- 医師は診療科ごとに1回、予約済み枠は全件の医師・日付分を1回（_get_reservations_bulk）でまとめて読み、件ごとに候補の医師を並べる
+- 全件の枠（booked_slots、定員制の枠はカウンターのシャード）と予約ドキュメントを1トランザクションで書く。
+  読み取りをすべて済ませてから書くため、1件でも確保できなければ何も書かない（全件成功か全件失敗）
+- 件どうしで同じ日の時間が重なる指定、既存の予約（同じ診療科・日）と占める枠が重なる指定は ValueError
+"""
+from __future__ import annotations
+
+import logging
+import os
+from collections import Counter
+from typing import Any
+
+import metrics
+import slot_counters
+import slot_events
+import user_booked_cache
+from log_setup import SAMPLED
+from reservation_service import (
+    SLOT_MINUTES_STEP,
+    _appointment_run,
+    _assign_strategy,
+    _demo_reservable,
+    _get_booking_lock,
+    _get_doctors_by_department,
+    _get_firestore,
+    _get_reservations_bulk,
+    _is_expired_hold,
+    _reservation_times,
+    _slot_doc_id,
+    _validate_booking_request,
+    available_for_run,
+    order_candidates,
+    slot_capacity,
+)
+from storage import server_timestamp, transactional
+
+logger = logging.getLogger(__name__)
+
+# 1回の一括予約で指定できる件数
+BATCH_MAX_ITEMS = 5
+
+
+def _prepare(items: list[dict[str, Any]], user_id: str) -> list[dict[str, Any]]:
+    """入力チェックと各件の占める枠の決定。件どうしで同じ日の枠が重なれば ValueError"""
+    if not items:
+        raise ValueError("予約する枠を1件以上指定してください。")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"一度に予約できるのは{BATCH_MAX_ITEMS}件までです。")
+    plans = []
+    taken: set[tuple[str, str]] = set()
+    for item in items:
+        department, date, time, user_id = _validate_booking_request(item.get("department"), item.get("date"), item.get("time"), user_id)
+        purpose = str(item.get("purpose") or "").strip()
+        times = _appointment_run(department, time, purpose)
+        if any((date, t) in taken for t in times):
+            raise ValueError("指定した予約どうしで時間が重なっています。時間をずらしてお選びください。")
+        taken.update((date, t) for t in times)
+        plans.append({"department": department, "date": date, "time": time, "purpose": purpose, "times": times})
+    return plans
+
+
+def _check_duplicates(db, user_id: str, plans: list[dict[str, Any]]) -> None:
+    """同じ診療科・日で占める枠の重なる予約がすでにあれば ValueError（全件の日付分を1クエリで確認する）"""
+    dates = sorted({p["date"] for p in plans})
+    try:
+        q = db.collection("users").document(user_id).collection("reservations").where("date", "in", dates)
+        existing = {
+            (d.get("department"), d.get("date"), t)
+            for d in (doc.to_dict() or {} for doc in q.stream())
+            for t in _reservation_times(d)
+        }
+    except Exception as e:
+        logger.warning("batch booking duplicate check failed: %s", e)
+        return
+    for p in plans:
+        if any((p["department"], p["date"], t) in existing for t in p["times"]):
+            raise ValueError("この診療科・日時はすでに予約済みです。予約一覧からご確認ください。")
+
+
+def _attach_candidates(plans: list[dict[str, Any]], user_id: str) -> None:
+    """
+    各件の候補の医師（連続枠が空いている医師を割当戦略の順に）を plans に入れる。
+    医師取得は診療科ごとに1回、予約済み枠は全医師・全日付分を1回で読む。
+    """
+    doctors_by_department = {dept: _get_doctors_by_department(dept) for dept in dict.fromkeys(p["department"] for p in plans)}
+    doctor_ids = sorted({d["id"] for doctors in doctors_by_department.values() for d in doctors})
+    reserved = _get_reservations_bulk(doctor_ids, sorted({p["date"] for p in plans})) if doctor_ids else set()
+    load = Counter((did, date) for did, date, _ in reserved)
+    strategy = _assign_strategy()
+    for p in plans:
+        doctors = doctors_by_department[p["department"]]
+        available = available_for_run(doctors, p["date"], p["time"], reserved, len(p["times"]))
+        day_load = {d["id"]: load[(d["id"], p["date"])] for d in doctors}
+        p["candidates"] = order_candidates(available, strategy, date=p["date"], time=p["time"], user_id=user_id, load=day_load)
+
+
+def _pick(transaction, db, plan: dict[str, Any]) -> tuple[dict[str, Any], list[Any], list[Any] | None] | None:
+    """候補の医師を順に読み、全枠が空いている最初の医師と確保する枠を返す（書き込みはしない）"""
+    for candidate in plan["candidates"]:
+        cand_id = str(candidate.get("id") or "").strip()
+        if not cand_id:
+            continue
+        capacity = slot_capacity(candidate, plan["department"])
+        if capacity > 1:
+            picked = slot_counters.pick_seats(transaction, db, cand_id, plan["date"], plan["times"], capacity)
+            if picked:
+                return candidate, [], picked
+            continue
+        refs = [db.collection("booked_slots").document(_slot_doc_id(cand_id, plan["date"], t)) for t in plan["times"]]
+        if all(not s.exists or _is_expired_hold(s.to_dict() or {}) for s in transaction.get_all(refs)):
+            return candidate, refs, None
+    return None
+
+
+@transactional
+def _book_in_transaction(transaction, db, user_id: str, plans: list[dict[str, Any]], use_demo: bool) -> list[dict[str, Any]] | int:
+    """
+    全件の枠と予約ドキュメントを書く。確保できない件があれば何も書かずにその添字を返す。
+    戻り値: 件ごとの {"id", "doctorId"}、または確保できなかった件の添字
+    """
+    chosen = []
+    for i, plan in enumerate(plans):
+        pick = _pick(transaction, db, plan)
+        if pick is None:
+            # デモモードのフォールバック（create_reservation と同じ条件）
+            if not (use_demo and all(_demo_reservable(plan["date"], t) for t in plan["times"])):
+                return i
+            pick = ({"id": "demo", "name": "（自動割当）"}, [], None)
+        chosen.append(pick)
+
+    out = []
+    for plan, (doctor, slot_refs, seats) in zip(plans, chosen):
+        doctor_id = str(doctor.get("id") or "").strip()
+        res_ref = db.collection("users").document(user_id).collection("reservations").document()
+        payload = {
+            "date": plan["date"],
+            "time": plan["time"],
+            "category": "",
+            "department": plan["department"],
+            "purpose": plan["purpose"],
+            "duration": len(plan["times"]) * SLOT_MINUTES_STEP,
+            "doctor": str(doctor.get("name") or "（自動割当）").strip(),
+            "doctorId": doctor_id,
+            "createdAt": server_timestamp(),
+        }
+        if seats:
+            capacity = slot_capacity(doctor, plan["department"])
+            payload["seats"] = slot_counters.write_seats(transaction, seats, doctor_id, plan["department"], plan["date"], capacity)
+        transaction.create(res_ref, payload)
+        for ref, t in zip(slot_refs, plan["times"]):
+            transaction.set(ref, {
+                "doctorId": doctor_id,
+                "date": plan["date"],
+                "time": t,
+                "department": plan["department"],
+                "userId": user_id,
+                "reservationId": res_ref.id,
+                "createdAt": server_timestamp(),
+            })
+        out.append({"id": res_ref.id, "doctorId": doctor_id})
+    return out
+
+
+def create_reservations_batch(items: list[dict[str, Any]], user_id: str) -> list[dict[str, Any]]:
+    """
+    items（{"department", "date", "time", "purpose"} の列、最大 BATCH_MAX_ITEMS 件）をまとめて予約する。全件成功か全件失敗。
+    確保できない件があれば ValueError（何件目かを含む利用者向けメッセージ）。戻り値は件ごとに create_reservation と同じ形。
+    """
+    plans = _prepare(items, user_id)
+    user_id = user_id.strip()
+    logger.info("create_reservations_batch start: items=%d user_id=%r", len(plans), user_id, extra=SAMPLED)
+
+    # create_reservation と同じ枠単位のロックを、デッドロックしないよう決まった順に取る
+    lock_keys = sorted({f"{p['department']}::{p['date']}::{t}" for p in plans for t in p["times"]})
+    held = []
+    try:
+        for key in lock_keys:
+            lock = _get_booking_lock(key)
+            if not lock.acquire(timeout=5):
+                raise ValueError("この時間は現在処理中です。しばらくしてから再度お試しください。")
+            held.append(lock)
+
+        db = _get_firestore()
+        use_demo = os.environ.get("USE_DEMO_SLOTS", "1").strip() != "0"
+        _check_duplicates(db, user_id, plans)
+        _attach_candidates(plans, user_id)
+        result = _book_in_transaction(db.transaction(), db, user_id, plans, use_demo)
+    finally:
+        for lock in reversed(held):
+            lock.release()
+
+    if isinstance(result, int):
+        metrics.incr("batch_booking_rejected")
+        p = plans[result]
+        raise ValueError(
+            f"{result + 1}件目（{p['department']} {p['date']} {p['time']}）は現在予約できません。別の時間をお選びください。"
+        )
+
+    metrics.incr("batch_bookings")
+    for plan in plans:
+        user_booked_cache.add(user_id, plan["department"], plan["date"], plan["times"])
+        for t in plan["times"]:
+            slot_events.notify(plan["department"], plan["date"], t)
+    logger.info(
+        "create_reservations_batch done: ids=%s", ",".join(r["id"] for r in result),
+        extra={"event": "reservations_batch_created", "items": len(result)},
+    )
+    return [
+        {
+            "id": r["id"],
+            "departmentId": plan["department"],
+            "doctorId": r["doctorId"],
+            "date": plan["date"],
+            "time": plan["time"],
+            "userId": user_id,
+        }
+        for plan, r in zip(plans, result)
+    ]
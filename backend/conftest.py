@@ -0,0 +1,35 @@
+"""
+pytest 共通フィクスチャ
+fake_db: storage をインメモリの Firestore スタブに差し替える（テスト終了時に元へ戻す）
+        プロセス内キャッシュ（予約済み枠・空き状況・Idempotency-Key）もテストごとに空にする
+IP ごとのレート制限は無効にする（TestClient は全テストで同じクライアント扱いのため、件数次第で 429 になる）
+空き状況の先読み（prefetch）も既定で無効にする（裏のスレッドが Firestore の呼び出し回数を数えるテストに混ざるため）
+"""
+import os
+
+import pytest
+
+import availability_cache
+import idempotency
+import storage
+import user_booked_cache
+from fake_firestore import FakeBackend
+
+os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+os.environ.setdefault("PREFETCH_ENABLED", "0")
+
+
+@pytest.fixture
+def fake_db():
+    backend = FakeBackend()
+    storage.set_backend(backend)
+    user_booked_cache.clear()
+    availability_cache.clear()
+    idempotency.clear()
+    try:
+        yield backend.db
+    finally:
+        storage.reset_backend()
+        user_booked_cache.clear()
+        availability_cache.clear()
+        idempotency.clear()
@@ -0,0 +1,168 @@
+"""
+読み取りの期限（デッドライン）と投機的な再送（ヘッジ）
+- リクエストごとの期限を contextvars に置き（budget）、その内側の Firestore 読み取り（call）はすべて残り時間で打ち切る。
+  残り時間は Firestore の timeout= にも渡し、呼び出し側は期限を過ぎたら DeadlineExceeded を受け取る（遅い1回に引きずられない）
+- 入れ子の budget は短い方が勝つ（内側で期限を延ばせない）。スレッドをまたぐときは bounded で期限ごと渡す
+- HEDGED_READS=1 のとき、読み取りが名前ごとの最近の所要時間の p95 を過ぎても返らなければ同じ読み取りをもう1本出し、
+  先に成功した方を使う（読み取りは冪等なので二重に実行してよい）。余分な読み取りは最大でも約 5%
+- 期限・ヘッジとも無効（期限なし・ヘッジ無効）の呼び出しはその場で実行し、スレッドを使わない
+- 件数は metrics の read_deadline_exceeded / read_hedged / read_hedge_wins で数える
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+# 空き状況などの読み取り系リクエストの期限（秒）
+READ_DEADLINE_SECONDS = float(os.environ.get("READ_DEADLINE_SECONDS", "2.0"))
+HEDGE_ENABLED = os.environ.get("HEDGED_READS", "0").strip() == "1"
+# ヘッジを出すまでの待ち時間 = 最近の所要時間のこのパーセンタイル（下限 HEDGE_MIN_DELAY 秒）
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.01"))
+# パーセンタイルを求める直近の件数と、ヘッジを始めるのに必要な件数
+LATENCY_WINDOW = 256
+MIN_SAMPLES = 20
+# 読み取りを実行するスレッド数（期限切れで見捨てた読み取りもここで終わるまで走る）
+READ_POOL_SIZE = int(os.environ.get("READ_POOL_SIZE", "32"))
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("read_deadline", default=None)
+_latencies: dict[str, deque[float]] = {}
+_latency_lock = threading.Lock()
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """リクエストの期限までに読み取りが終わらなかった"""
+
+
+@contextmanager
+def at(expires_at: float | None) -> Iterator[None]:
+    """期限を time.monotonic() の時刻で設定する（既に短い期限があればそちらのまま）"""
+    current = _deadline.get()
+    if expires_at is None or (current is not None and current <= expires_at):
+        yield
+        return
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def budget(seconds: float | None = None) -> Any:
+    """今から seconds 秒（既定 READ_DEADLINE_SECONDS）の期限を設定する。0 以下なら期限なし"""
+    seconds = READ_DEADLINE_SECONDS if seconds is None else seconds
+    return at(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def remaining() -> float | None:
+    """期限までの残り秒数（期限なしなら None。過ぎていれば 0）"""
+    expires_at = _deadline.get()
+    return None if expires_at is None else max(0.0, expires_at - time.monotonic())
+
+
+def bounded(fn: Callable[..., T]) -> Callable[..., T]:
+    """今の期限を持ったまま別スレッド（executor・シングルフライト）で fn を実行するためのラッパー"""
+    expires_at = _deadline.get()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        with at(expires_at):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+def _record(name: str, seconds: float) -> None:
+    with _latency_lock:
+        samples = _latencies.get(name)
+        if samples is None:
+            samples = _latencies[name] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+
+
+def hedge_delay(name: str) -> float | None:
+    """name の読み取りでヘッジを出すまでの秒数（ヘッジ無効・件数不足なら None）"""
+    if not HEDGE_ENABLED:
+        return None
+    with _latency_lock:
+        samples = sorted(_latencies.get(name) or ())
+    if len(samples) < MIN_SAMPLES:
+        return None
+    return max(HEDGE_MIN_DELAY, samples[min(len(samples) - 1, len(samples) * HEDGE_PERCENTILE // 100)])
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="firestore-read")
+        return _pool
+
+
+def _submit(name: str, fn: Callable[[float | None], T], timeout: float | None) -> Future:
+    started = time.monotonic()
+
+    def run() -> T:
+        result = fn(timeout)
+        _record(name, time.monotonic() - started)
+        return result
+
+    return _executor().submit(run)
+
+
+def call(name: str, fn: Callable[[float | None], T]) -> T:
+    """
+    読み取り fn(timeout) を期限内で実行する。timeout は残り秒数（期限なしなら None）で、Firestore の timeout= に渡す。
+    name は所要時間を集計する単位（コレクション名など）。期限切れは DeadlineExceeded、fn の例外はそのまま送出する。
+    """
+    expires_at = _deadline.get()
+    delay = hedge_delay(name)
+    if expires_at is None and delay is None:
+        started = time.monotonic()
+        result = fn(None)
+        _record(name, time.monotonic() - started)
+        return result
+
+    left = remaining()
+    if left is not None and left <= 0:
+        metrics.incr("read_deadline_exceeded")
+        raise DeadlineExceeded(f"{name}: deadline exceeded before the read started")
+    first = _submit(name, fn, left)
+    pending = {first}
+    if delay is not None and (left is None or delay < left):
+        done, _ = wait(pending, timeout=delay)
+        if not done:
+            metrics.incr("read_hedged")
+            pending.add(_submit(name, fn, remaining()))
+
+    error: BaseException | None = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            metrics.incr("read_deadline_exceeded")
+            raise DeadlineExceeded(f"{name}: deadline exceeded")
+        for fut in done:
+            if fut.exception() is None:
+                if fut is not first:
+                    metrics.incr("read_hedge_wins")
+                return fut.result()
+            error = fut.exception()
+    assert error is not None
+    raise error
+
+
+def reset_latencies() -> None:
+    """所要時間の集計を捨てる（テスト・ベンチマーク用）"""
+    with _latency_lock:
+        _latencies.clear()
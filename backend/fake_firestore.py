@@ -0,0 +1,630 @@
+"""
+インメモリの Firestore 互換スタブ（テスト・ベンチマーク・ローカル検証用）
+- reservation_service が使う範囲（document / collection / collection_group / where / order_by /
+  limit / start_after / select / transaction / batch / on_snapshot）だけを実装する
+- storage.set_backend(FakeBackend(...)) で本番の Firestore と差し替えて使う
+- トランザクションは楽観ロック（読んだドキュメントの版が commit 時に変わっていれば中断・再試行）
+- latency を指定すると RPC ごとに待ち時間を入れ、ネットワーク往復を模擬できる
+- FaultInjector を on_rpc に渡すと、一部の RPC だけを遅く・失敗させられる（テール遅延・障害の再現）
+- seeded_client はシードの医師（scripts.seed_doctors_data）を入れたクライアント（FIRESTORE_BACKEND=fake 用）
+"""
+from __future__ import annotations
+
+import copy
+import itertools
+import random
+import threading
+import time as time_mod
+import uuid
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Iterable, Iterator
+
+
+class AlreadyExists(Exception):
+    """create() 対象のドキュメントが既に存在する（本番の 409 ALREADY_EXISTS 相当）"""
+
+    def __init__(self, path: str):
+        super().__init__(f"409 Document already exists: {path}")
+
+
+class NotFound(Exception):
+    """update() 対象のドキュメントが存在しない（本番の 404 NOT_FOUND 相当）"""
+
+    def __init__(self, path: str):
+        super().__init__(f"404 No document to update: {path}")
+
+
+class Aborted(Exception):
+    """トランザクションの競合（本番の 409 ABORTED 相当）。transactional が再試行する。"""
+
+
+SERVER_TIMESTAMP = object()
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+# order_by / start_after でドキュメントIDを指すフィールド名（firestore.FieldPath.document_id() と同じ）
+DOCUMENT_ID = "__name__"
+
+
+def _resolve(data: dict[str, Any]) -> dict[str, Any]:
+    """SERVER_TIMESTAMP を現在時刻に置き換えたコピー"""
+    now = datetime.now(timezone.utc)
+    return {k: (now if v is SERVER_TIMESTAMP else copy.deepcopy(v)) for k, v in data.items()}
+
+
+def _sort_key(value: Any) -> tuple:
+    """Firestore の型順（null < bool < 数値 < 日時 < 文字列）に近い比較キー"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    return (4, str(value))
+
+
+_MISSING = object()
+
+
+def _match(data: dict[str, Any], field: str, op: str, value: Any) -> bool:
+    actual = data.get(field, _MISSING)
+    if actual is _MISSING:
+        return False
+    if op == "==":
+        return actual == value
+    if op == "!=":
+        return actual != value
+    if op == "in":
+        return actual in value
+    if op == "not-in":
+        return actual not in value
+    if op == "array_contains":
+        return isinstance(actual, list) and value in actual
+    if op == "array_contains_any":
+        return isinstance(actual, list) and any(v in actual for v in value)
+    a, b = _sort_key(actual), _sort_key(value)
+    if a[0] != b[0]:
+        return False
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    if op == ">=":
+        return a >= b
+    raise ValueError(f"unsupported operator: {op}")
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: dict[str, Any] | None, version: int, fields: tuple[str, ...] | None = None):
+        self.reference = reference
+        self._data = data
+        self._version = version
+        self._fields = fields
+        self.update_time = version
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> dict[str, Any] | None:
+        if self._data is None:
+            return None
+        data = copy.deepcopy(self._data)
+        if self._fields is not None:
+            data = {k: v for k, v in data.items() if k in self._fields}
+        return data
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, client: "FakeFirestore", path: str):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "CollectionReference":
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, transaction: "Transaction | None" = None, **_: Any) -> DocumentSnapshot:
+        if transaction is not None:
+            return transaction.get(self)
+        self._client._rpc("get", self.path)
+        return self._client._snapshot(self)
+
+    def create(self, data: dict[str, Any], **_: Any) -> None:
+        self._client._commit([("create", self, data)])
+
+    def set(self, data: dict[str, Any], merge: bool = False, **_: Any) -> None:
+        self._client._commit([("set_merge" if merge else "set", self, data)])
+
+    def update(self, data: dict[str, Any], **_: Any) -> None:
+        self._client._commit([("update", self, data)])
+
+    def delete(self, **_: Any) -> None:
+        self._client._commit([("delete", self, None)])
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+
+class Query:
+    def __init__(self, client: "FakeFirestore", *, parent: str | None = None, group: str | None = None):
+        self._client = client
+        self._parent = parent
+        self._group = group
+        self._filters: list[tuple[str, str, Any]] = []
+        self._orders: list[tuple[str, str]] = []
+        self._limit: int | None = None
+        self._start_after: Any = None
+        self._fields: tuple[str, ...] | None = None
+
+    def _copy(self) -> "Query":
+        q = Query(self._client, parent=self._parent, group=self._group)
+        q._filters = list(self._filters)
+        q._orders = list(self._orders)
+        q._limit = self._limit
+        q._start_after = self._start_after
+        q._fields = self._fields
+        return q
+
+    def where(self, field_path: str | None = None, op_string: str | None = None, value: Any = None, *, filter: Any = None) -> "Query":
+        q = self._copy()
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        q._filters.append((field_path, op_string, value))
+        return q
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        q = self._copy()
+        q._orders.append((field_path, direction))
+        return q
+
+    def limit(self, count: int) -> "Query":
+        q = self._copy()
+        q._limit = count
+        return q
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "Query":
+        q = self._copy()
+        q._start_after = document_fields_or_snapshot
+        return q
+
+    def select(self, field_paths: Iterable[str]) -> "Query":
+        q = self._copy()
+        q._fields = tuple(field_paths)
+        return q
+
+    def _in_scope(self, path: str) -> bool:
+        parts = path.split("/")
+        if self._group is not None:
+            return len(parts) >= 2 and parts[-2] == self._group
+        return path.rsplit("/", 1)[0] == self._parent
+
+    def _order_key(self, path: str, data: dict[str, Any]) -> tuple:
+        key = []
+        for field, direction in self._orders:
+            k = _sort_key(path if field == DOCUMENT_ID else data.get(field))
+            key.append(_Reverse(k) if direction == DESCENDING else k)
+        last_dir = self._orders[-1][1] if self._orders else ASCENDING
+        key.append(_Reverse(path) if last_dir == DESCENDING else path)
+        return tuple(key)
+
+    def _run(self, transaction: "Transaction | None" = None) -> list[DocumentSnapshot]:
+        rows = []
+        with self._client._lock:
+            for path, (data, version) in self._client._docs.items():
+                if not self._in_scope(path):
+                    continue
+                if not all(_match(data, f, op, v) for f, op, v in self._filters):
+                    continue
+                if any(field not in data for field, _ in self._orders if field != DOCUMENT_ID):
+                    continue
+                rows.append((path, copy.deepcopy(data), version))
+        rows.sort(key=lambda r: self._order_key(r[0], r[1]))
+        if self._start_after is not None:
+            cursor = self._start_after
+            if isinstance(cursor, DocumentSnapshot):
+                cursor_key = self._order_key(cursor.reference.path, cursor._data or {})
+                rows = [r for r in rows if self._order_key(r[0], r[1]) > cursor_key]
+            else:
+                # フィールド値の dict で指定された場合は order_by のフィールドだけで比較する
+                n = len(self._orders)
+                values = dict(cursor)
+                doc_id = values.pop(DOCUMENT_ID, "")
+                if isinstance(doc_id, DocumentReference):
+                    doc_id = doc_id.path
+                elif doc_id and "/" not in doc_id:
+                    doc_id = f"{self._parent}/{doc_id}"
+                cursor_key = self._order_key(doc_id, values)[:n]
+                rows = [r for r in rows if self._order_key(r[0], r[1])[:n] > cursor_key]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        snaps = []
+        for path, data, version in rows:
+            ref = DocumentReference(self._client, path)
+            if transaction is not None:
+                transaction._record_read(path, version)
+            snaps.append(DocumentSnapshot(ref, data, version, self._fields))
+        return snaps
+
+    def stream(self, transaction: "Transaction | None" = None, **_: Any) -> Iterator[DocumentSnapshot]:
+        self._client._rpc("query", self._parent or self._group or "")
+        return iter(self._run(transaction))
+
+    def get(self, transaction: "Transaction | None" = None, **_: Any) -> list[DocumentSnapshot]:
+        return list(self.stream(transaction=transaction))
+
+    def _matches(self, path: str, data: dict[str, Any] | None) -> bool:
+        return data is not None and self._in_scope(path) and all(_match(data, f, op, v) for f, op, v in self._filters)
+
+    def on_snapshot(self, callback: Callable[[list, list, datetime], None]) -> "Watch":
+        """
+        クエリ結果の変更を購読する（google-cloud-firestore の Query.on_snapshot 互換）。
+        初回は現在の一致ドキュメントをすべて ADDED で通知し、以降は書き込みのたびに差分を通知する。
+        コールバックは書き込んだスレッドで同期的に呼ぶ。
+        """
+        watch = Watch(self, callback)
+        self._client._add_watch(watch)
+        return watch
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class DocumentChange:
+    def __init__(self, type_: ChangeType, document: DocumentSnapshot):
+        self.type = type_
+        self.document = document
+
+
+class Watch:
+    """on_snapshot の購読（unsubscribe() で解除）"""
+
+    def __init__(self, query: Query, callback: Callable[[list, list, datetime], None]):
+        self._query = query
+        self._callback = callback
+        self._matching: set[str] = set()
+        self._active = True
+        self._lock = threading.Lock()
+
+    def _initial(self) -> None:
+        docs = self._query._run()
+        self._matching = {d.reference.path for d in docs}
+        self._callback(docs, [DocumentChange(ChangeType.ADDED, d) for d in docs], datetime.now(timezone.utc))
+
+    def _on_commit(self, changed: list[tuple[str, dict[str, Any] | None, int]]) -> None:
+        with self._lock:
+            self._deliver(changed)
+
+    def _deliver(self, changed: list[tuple[str, dict[str, Any] | None, int]]) -> None:
+        changes = []
+        for path, data, version in changed:
+            before = path in self._matching
+            after = self._query._matches(path, data)
+            if not before and not after:
+                continue
+            ref = DocumentReference(self._query._client, path)
+            if after:
+                self._matching.add(path)
+                change_type = ChangeType.MODIFIED if before else ChangeType.ADDED
+                changes.append(DocumentChange(change_type, DocumentSnapshot(ref, copy.deepcopy(data), version)))
+            else:
+                self._matching.discard(path)
+                changes.append(DocumentChange(ChangeType.REMOVED, DocumentSnapshot(ref, None, 0)))
+        if changes and self._active:
+            self._callback(self._query._run(), changes, datetime.now(timezone.utc))
+
+    def unsubscribe(self) -> None:
+        self._active = False
+        self._query._client._remove_watch(self)
+
+
+class _Reverse:
+    """降順ソート用の比較反転ラッパー"""
+
+    __slots__ = ("v",)
+
+    def __init__(self, v: Any):
+        self.v = v
+
+    def __lt__(self, other: "_Reverse") -> bool:
+        return other.v < self.v
+
+    def __gt__(self, other: "_Reverse") -> bool:
+        return other.v > self.v
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Reverse) and other.v == self.v
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "FakeFirestore", path: str):
+        super().__init__(client, parent=path)
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: str | None = None) -> DocumentReference:
+        return DocumentReference(self._client, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data: dict[str, Any], document_id: str | None = None, **_: Any) -> tuple[datetime, DocumentReference]:
+        ref = self.document(document_id)
+        ref.create(data)
+        return datetime.now(timezone.utc), ref
+
+
+class WriteBatch:
+    def __init__(self, client: "FakeFirestore"):
+        self._client = client
+        self._writes: list[tuple[str, DocumentReference, Any]] = []
+
+    def create(self, reference: DocumentReference, document_data: dict[str, Any]) -> None:
+        self._writes.append(("create", reference, document_data))
+
+    def set(self, reference: DocumentReference, document_data: dict[str, Any], merge: bool = False) -> None:
+        self._writes.append(("set_merge" if merge else "set", reference, document_data))
+
+    def update(self, reference: DocumentReference, field_updates: dict[str, Any]) -> None:
+        self._writes.append(("update", reference, field_updates))
+
+    def delete(self, reference: DocumentReference) -> None:
+        self._writes.append(("delete", reference, None))
+
+    def commit(self, **_: Any) -> list:
+        writes, self._writes = self._writes, []
+        self._client._commit(writes)
+        return writes
+
+
+class Transaction(WriteBatch):
+    def __init__(self, client: "FakeFirestore"):
+        super().__init__(client)
+        self._reads: dict[str, int] = {}
+
+    def _record_read(self, path: str, version: int) -> None:
+        self._reads.setdefault(path, version)
+
+    def get(self, ref_or_query: Any, **_: Any) -> Any:
+        if isinstance(ref_or_query, DocumentReference):
+            self._client._rpc("get", ref_or_query.path)
+            snap = self._client._snapshot(ref_or_query)
+            self._record_read(ref_or_query.path, snap._version)
+            return snap
+        return ref_or_query.stream(transaction=self)
+
+    def get_all(self, references: Iterable[DocumentReference], **_: Any) -> Iterator[DocumentSnapshot]:
+        refs = list(references)
+        self._client._rpc("get_all", "")
+        for ref in refs:
+            snap = self._client._snapshot(ref)
+            self._record_read(ref.path, snap._version)
+            yield snap
+
+    def commit(self, **_: Any) -> list:
+        writes, self._writes = self._writes, []
+        self._client._commit(writes, reads=self._reads)
+        return writes
+
+
+class Unavailable(Exception):
+    """google.api_core.exceptions.ServiceUnavailable 相当（FaultInjector が送出する）"""
+
+
+class FaultInjector:
+    """
+    on_rpc に渡す障害注入フック。ops（既定は読み取り系）の RPC のうち、
+    slow_rate の割合を slow_seconds 秒遅らせ、error_rate の割合を Unavailable で失敗させる。
+    """
+
+    def __init__(
+        self,
+        *,
+        slow_rate: float = 0.0,
+        slow_seconds: float = 0.0,
+        error_rate: float = 0.0,
+        ops: Iterable[str] = ("get", "get_all", "query"),
+        seed: int | None = None,
+    ):
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.error_rate = error_rate
+        self.ops = frozenset(ops)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, op: str, path: str) -> None:
+        if op not in self.ops:
+            return
+        with self._lock:
+            slow = self._rng.random() < self.slow_rate
+            fail = self._rng.random() < self.error_rate
+        if slow:
+            time_mod.sleep(self.slow_seconds)
+        if fail:
+            raise Unavailable(f"injected failure: {op} {path}")
+
+
+class FakeFirestore:
+    """Firestore クライアント互換のインメモリ DB（スレッドセーフ）"""
+
+    def __init__(self, *, latency: float = 0.0):
+        self.latency = latency
+        self._docs: dict[str, tuple[dict[str, Any], int]] = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.RLock()
+        self.rpc_count = 0
+        self.aborted_count = 0
+        # on_rpc(op, path) はテストで遅延・障害を差し込むためのフック
+        self.on_rpc: Callable[[str, str], None] | None = None
+        self._watches: list[Watch] = []
+
+    # --- 公開 API（firestore.Client 互換） ---
+
+    def collection(self, path: str) -> CollectionReference:
+        return CollectionReference(self, path)
+
+    def collection_group(self, collection_id: str) -> Query:
+        return Query(self, group=collection_id)
+
+    def document(self, path: str) -> DocumentReference:
+        return DocumentReference(self, path)
+
+    def transaction(self, **_: Any) -> Transaction:
+        return Transaction(self)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    # --- 内部 ---
+
+    def _rpc(self, op: str, path: str) -> None:
+        with self._lock:
+            self.rpc_count += 1
+        if self.on_rpc is not None:
+            self.on_rpc(op, path)
+        if self.latency:
+            time_mod.sleep(self.latency)
+
+    def _snapshot(self, ref: DocumentReference) -> DocumentSnapshot:
+        with self._lock:
+            entry = self._docs.get(ref.path)
+        if entry is None:
+            return DocumentSnapshot(ref, None, 0)
+        return DocumentSnapshot(ref, copy.deepcopy(entry[0]), entry[1])
+
+    def _add_watch(self, watch: "Watch") -> None:
+        with self._lock:
+            self._watches.append(watch)
+        watch._initial()
+
+    def _remove_watch(self, watch: "Watch") -> None:
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _commit(self, writes: list[tuple[str, DocumentReference, Any]], reads: dict[str, int] | None = None) -> None:
+        self._rpc("commit", writes[0][1].path if writes else "")
+        with self._lock:
+            # 楽観ロック: 読んだ時点から版が変わっていれば中断
+            for path, version in (reads or {}).items():
+                current = self._docs.get(path)
+                if (current[1] if current else 0) != version:
+                    self.aborted_count += 1
+                    raise Aborted(f"Transaction aborted due to contention on {path}")
+            # 事前検証（1件でも失敗したら何も書かない）
+            staged = {path: entry for path, entry in self._docs.items()}
+            for op, ref, data in writes:
+                exists = ref.path in staged
+                if op == "create":
+                    if exists:
+                        raise AlreadyExists(ref.path)
+                    staged[ref.path] = (_resolve(data), 0)
+                elif op == "set":
+                    staged[ref.path] = (_resolve(data), 0)
+                elif op == "set_merge":
+                    base = dict(staged[ref.path][0]) if exists else {}
+                    base.update(_resolve(data))
+                    staged[ref.path] = (base, 0)
+                elif op == "update":
+                    if not exists:
+                        raise NotFound(ref.path)
+                    base = dict(staged[ref.path][0])
+                    base.update(_resolve(data))
+                    staged[ref.path] = (base, 0)
+                elif op == "delete":
+                    staged.pop(ref.path, None)
+            touched = {ref.path for _, ref, _ in writes}
+            changed: list[tuple[str, dict[str, Any] | None, int]] = []
+            for path in touched:
+                if path in staged:
+                    self._docs[path] = (staged[path][0], next(self._versions))
+                    changed.append((path, staged[path][0], self._docs[path][1]))
+                else:
+                    self._docs.pop(path, None)
+                    changed.append((path, None, 0))
+            watches = list(self._watches)
+        for watch in watches:
+            watch._on_commit(changed)
+
+    # --- テスト補助 ---
+
+    def dump(self, collection_path: str) -> dict[str, dict[str, Any]]:
+        """collection 直下のドキュメントを {id: data} で返す"""
+        with self._lock:
+            return {
+                path.rsplit("/", 1)[-1]: copy.deepcopy(data)
+                for path, (data, _) in self._docs.items()
+                if path.rsplit("/", 1)[0] == collection_path
+            }
+
+
+def transactional(fn: Callable[..., Any], max_attempts: int = 5) -> Callable[..., Any]:
+    """firestore.transactional 互換: Aborted なら新しいトランザクションで再試行する"""
+
+    def wrapper(transaction: Transaction, *args: Any, **kwargs: Any) -> Any:
+        for attempt in range(max_attempts):
+            tx = transaction if attempt == 0 else Transaction(transaction._client)
+            result = fn(tx, *args, **kwargs)
+            try:
+                tx.commit()
+                return result
+            except Aborted:
+                if attempt == max_attempts - 1:
+                    raise
+        return None
+
+    return wrapper
+
+
+def seeded_client(*, latency: float = 0.0) -> FakeFirestore:
+    """scripts.seed_doctors と同じ医師を doctors に入れたクライアントを返す"""
+    from scripts.seed_doctors_data import DOCTORS_SEED
+
+    db = FakeFirestore(latency=latency)
+    for doc in DOCTORS_SEED:
+        db.collection("doctors").document(doc["id"]).set({
+            "name": doc["name"], "department": doc["department"], "schedules": doc["schedules"],
+        })
+    return db
+
+
+class FakeBackend:
+    """storage.set_backend() に渡すバックエンド"""
+
+    def __init__(self, client: FakeFirestore | None = None):
+        self.db = client or FakeFirestore()
+
+    def client(self) -> FakeFirestore:
+        return self.db
+
+    def server_timestamp(self) -> Any:
+        return SERVER_TIMESTAMP
+
+    def transactional(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        return transactional(fn)
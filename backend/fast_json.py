@@ -0,0 +1,83 @@
+"""
+空き枠レスポンスの高速 JSON 直列化
+- 空き状況は reservation_service が組み立てた信頼済みの dict なので、pydantic 検証と jsonable_encoder を通さず直接 bytes にする
+- orjson があれば使い、無ければ標準 json（compact 形式）にフォールバックする
+- 1日分の直列化結果を内容キーでキャッシュし、変化のない日は前回の bytes をそのまま再利用する
+"""
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson は任意依存
+    orjson = None
+
+# 1日分の bytes キャッシュ上限（診療科数 × 表示日数 を十分まかなえる件数）
+DAY_CACHE_MAX_ENTRIES = 4096
+
+_day_cache: OrderedDict[tuple, bytes] = OrderedDict()
+_day_cache_lock = threading.Lock()
+
+
+def dumps(obj: Any) -> bytes:
+    """obj を UTF-8 の JSON bytes にする（FastAPI の JSONResponse と同じく非 ASCII はそのまま）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _day_key(day: dict[str, Any]) -> tuple:
+    """1日分の内容キー（slots 以外のフィールド + reservable のビットマスク）"""
+    mask = 0
+    for i, s in enumerate(day.get("slots") or ()):
+        if s["reservable"]:
+            mask |= 1 << i
+    return (tuple((k, v) for k, v in day.items() if k != "slots"), len(day.get("slots") or ()), mask)
+
+
+def encode_day(day: dict[str, Any]) -> bytes:
+    """1日分の空き状況を JSON bytes にする。同じ内容の日はキャッシュ済み bytes を返す。"""
+    try:
+        key = _day_key(day)
+    except (TypeError, KeyError):
+        # 想定外の形（ハッシュ不可な値など）はキャッシュせず直列化のみ
+        return dumps(day)
+    with _day_cache_lock:
+        cached = _day_cache.get(key)
+        if cached is not None:
+            _day_cache.move_to_end(key)
+            return cached
+    body = dumps(day)
+    with _day_cache_lock:
+        _day_cache[key] = body
+        if len(_day_cache) > DAY_CACHE_MAX_ENTRIES:
+            _day_cache.popitem(last=False)
+    return body
+
+
+def encode_days(days: Iterable[dict[str, Any]]) -> bytes:
+    """複数日分を JSON 配列の bytes にする（日ごとのキャッシュを連結するだけ）"""
+    return b"[" + b",".join(encode_day(d) for d in days) + b"]"
+
+
+def clear_cache() -> None:
+    """1日分 bytes キャッシュを破棄（ベンチマーク・テスト用）"""
+    with _day_cache_lock:
+        _day_cache.clear()
+
+
+class FastJSONResponse(Response):
+    """dumps() で直列化する JSONResponse。bytes を渡した場合はそのまま返す。"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
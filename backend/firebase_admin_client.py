@@ -66,10 +66,17 @@ def init_firebase_admin() -> firebase_admin.App:
         raise
 
 
+# FIRESTORE_BACKEND=fake のときだけ受け付ける検証用トークンの接頭辞（"fake:<uid>"。リプレイ・負荷試験用）
+FAKE_TOKEN_PREFIX = "fake:"
+
+
 def verify_id_token(id_token: str) -> dict:
     """
     Firebase IDトークンを検証して claims を返す
+    FIRESTORE_BACKEND=fake（インメモリスタブ）で起動したときは "fake:<uid>" をそのまま uid として受け付ける
     """
+    if os.getenv("FIRESTORE_BACKEND", "").strip().lower() == "fake" and id_token.startswith(FAKE_TOKEN_PREFIX):
+        return {"uid": id_token[len(FAKE_TOKEN_PREFIX):]}
     init_firebase_admin()
     return auth.verify_id_token(id_token)
 
@@ -0,0 +1,169 @@
+"""
+予約作成の Idempotency-Key（通信が不安定なモバイルの再送対策）
+- POST /api/reservations（・/batch）に Idempotency-Key ヘッダーがあれば、成功したレスポンスを (uid, キー) ごとに保存する。
+  同じキーの再送は予約処理（重複確認・医師割当・受付制御）を通らず、保存したレスポンスをそのまま返す
+- リクエスト内容のハッシュ（fingerprint）も保存し、同じキーが別の内容で使われたら IdempotencyConflict（422）
+- 保存するのは成功だけ。失敗したリクエストの再送は通常どおり処理する
+- 同じプロセスで同じキーが同時に来たらシングルフライトで1回にまとめる。別プロセスで同時に処理された場合は
+  後着側が「予約済み」で失敗するので、そのときは保存済みの結果を引き直して返す
+- 保存先は IDEMPOTENCY_STORE で選ぶ:
+  local     … プロセス内（件数上限は LRU、期限は TTL）。既定。ワーカーが1つか、再送が同じワーカーに届く構成向け
+  firestore … idempotency_keys コレクション（全ワーカー共有）。expiresAt に Firestore の TTL ポリシーを設定して自動削除する
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+import metrics
+from singleflight import SingleFlight
+from storage import get_db
+
+# 結果の保存期間（秒）と、local で保持するキー数の上限
+TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000"))
+# Idempotency-Key の最大長
+MAX_KEY_LENGTH = 255
+
+COLLECTION = "idempotency_keys"
+
+_flight = SingleFlight("idempotency")
+
+
+class IdempotencyConflict(Exception):
+    """同じ Idempotency-Key が別の内容のリクエストで使われた"""
+
+
+def fingerprint(*parts: Any) -> str:
+    """リクエスト内容のハッシュ（エンドポイント名と本文を渡す）"""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LocalStore:
+    """プロセス内の保存先（LRU + TTL）"""
+
+    def __init__(self, *, max_keys: int = MAX_KEYS, ttl: float = TTL_SECONDS):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, str], tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, key: str) -> dict[str, Any] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            if now - entry[0] >= self.ttl:
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return entry[1]
+
+    def put(self, user_id: str, key: str, record: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[(user_id, key)] = (time.monotonic(), record)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class FirestoreStore:
+    """Firestore の保存先（idempotency_keys/{sha256(uid, キー)}。全ワーカーで共有）"""
+
+    def __init__(self, *, ttl: float = TTL_SECONDS):
+        self.ttl = ttl
+
+    @staticmethod
+    def _ref(user_id: str, key: str):
+        doc_id = hashlib.sha256(f"{user_id}\n{key}".encode("utf-8")).hexdigest()
+        return get_db().collection(COLLECTION).document(doc_id)
+
+    def get(self, user_id: str, key: str) -> dict[str, Any] | None:
+        snap = self._ref(user_id, key).get()
+        if not snap.exists:
+            return None
+        data = snap.to_dict() or {}
+        expires_at = data.get("expiresAt")
+        # TTL ポリシーの削除は即時ではないため、期限切れはここでも無視する
+        if not isinstance(expires_at, datetime) or expires_at <= datetime.now(timezone.utc):
+            return None
+        return {"fingerprint": data.get("fingerprint") or "", "result": data.get("result") or {}}
+
+    def put(self, user_id: str, key: str, record: dict[str, Any]) -> None:
+        self._ref(user_id, key).set({
+            **record,
+            "userId": user_id,
+            "expiresAt": datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+        })
+
+    def clear(self) -> None:
+        pass
+
+
+_store: LocalStore | FirestoreStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> LocalStore | FirestoreStore:
+    """IDEMPOTENCY_STORE（local / firestore）に応じた保存先（初回に作る）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            kind = os.environ.get("IDEMPOTENCY_STORE", "local").strip().lower()
+            _store = FirestoreStore() if kind == "firestore" else LocalStore()
+        return _store
+
+
+def clear() -> None:
+    """保存先を捨てる（次回 get_store で作り直す。テスト用）"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.clear()
+        _store = None
+
+
+def lookup(user_id: str, key: str, fp: str) -> dict[str, Any] | None:
+    """保存済みのレスポンスを返す（無ければ None）。同じキーで内容が違えば IdempotencyConflict"""
+    record = get_store().get(user_id, key)
+    if record is None:
+        return None
+    if record.get("fingerprint") != fp:
+        raise IdempotencyConflict("Idempotency-Key が別の内容のリクエストで使われています。")
+    metrics.incr("idempotency_replays")
+    return record["result"]
+
+
+def run(user_id: str, key: str, fp: str, fn: Callable[[], dict[str, Any]]) -> dict[str, Any]:
+    """
+    保存済みならそれを返し、無ければ fn()（予約処理。JSON にできる dict を返す）を実行して結果を保存する。
+    同じプロセスの同じ (uid, キー) はシングルフライトで1回だけ実行する。
+    """
+
+    def once() -> dict[str, Any]:
+        cached = lookup(user_id, key, fp)
+        if cached is not None:
+            return cached
+        try:
+            result = fn()
+        except ValueError:
+            # 別ワーカーで同じキーの予約が先に成功していれば、その結果を返す
+            cached = lookup(user_id, key, fp)
+            if cached is not None:
+                return cached
+            raise
+        get_store().put(user_id, key, {"fingerprint": fp, "result": result})
+        return result
+
+    return _flight.do((user_id, key), once)
@@ -0,0 +1,145 @@
+"""
+ログ出力の設定（リクエスト処理スレッドで I/O しない）
+- ルートロガーには QueueHandler だけを付け、リクエストスレッドはレコードをキューに積むだけにする。
+  整形（JSON 化）と stderr への書き込みは QueueListener の専用スレッドで行う
+- 既定は1行1 JSON の構造化ログ（ts, level, logger, msg と extra で渡した項目）。LOG_FORMAT=text で従来の1行テキスト
+- 大量に出るイベント（枠確保ごとの INFO など）は呼び出し側で extra=SAMPLED を付け、LOG_SAMPLE_RATE の割合だけ残す。
+  WARNING 以上は間引かない
+- キューは有限。溢れたら捨てて log_dropped として数え、リクエストを待たせない
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+import metrics
+
+# 間引き対象のレコードに付ける extra（logger.info(..., extra=SAMPLED)）
+SAMPLED = {"sampled": True}
+
+# LogRecord の標準属性（これ以外は extra で渡された構造化項目として JSON に含める）
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sampled", "taskName"}
+
+_listener: QueueListener | None = None
+_installed: list[logging.Handler] = []
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード = 1行の JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, separators=(",", ":"))
+
+
+class SamplingFilter(logging.Filter):
+    """extra=SAMPLED の INFO 以下のレコードを rate の割合だけ通す（通したレコードには sample_rate を付ける）"""
+
+    def __init__(self, rate: float, rng: random.Random | None = None):
+        super().__init__()
+        self.rate = min(1.0, max(0.0, rate))
+        self._random = (rng or random.Random()).random
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno > logging.INFO or not getattr(record, "sampled", False):
+            return True
+        if self._random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    キューに積むだけの Handler。
+    同一プロセス内のキューなので、標準の prepare() のようにこのスレッドでメッセージを整形・複製しない
+    （args は logger 呼び出し時の値への参照のまま。呼び出し側は不変な値を渡す）。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log_dropped")
+
+
+def _formatter(fmt: str) -> logging.Formatter:
+    if fmt == "text":
+        return logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    return JsonFormatter()
+
+
+def setup_logging(*, stream=None, force: bool = False) -> None:
+    """
+    ルートロガーを設定する（main.py の起動時に1回）。logging.basicConfig と同じく、
+    既に他のハンドラが付いていれば（テストランナー等）force=True でない限り何もしない。
+    環境変数: LOG_LEVEL（既定 INFO）/ LOG_FORMAT=json|text / LOG_SAMPLE_RATE（0〜1、既定 1）/
+    LOG_QUEUE=0 で同期出力（キューを使わない）/ LOG_QUEUE_SIZE（既定 10000）
+    """
+    global _listener
+    root = logging.getLogger()
+    if any(h not in _installed for h in root.handlers) and not force:
+        return
+    stop_logging()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").strip().upper() or "INFO")
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(_formatter(os.environ.get("LOG_FORMAT", "json").strip().lower()))
+    sampling = SamplingFilter(_env_float("LOG_SAMPLE_RATE", 1.0))
+
+    if os.environ.get("LOG_QUEUE", "1").strip() == "0":
+        output.addFilter(sampling)
+        root.addHandler(output)
+        _installed.append(output)
+        return
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=max(1, int(_env_float("LOG_QUEUE_SIZE", 10000)))))
+    handler.addFilter(sampling)
+    root.addHandler(handler)
+    _installed.append(handler)
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """リスナースレッドを止め、このモジュールが付けたハンドラを外す（キューに残ったレコードは書き出してから止まる）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    root = logging.getLogger()
+    for h in _installed:
+        root.removeHandler(h)
+    _installed.clear()
+
+
+atexit.register(stop_logging)
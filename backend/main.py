@@ -5,10 +5,12 @@ FastAPI バックエンド - 予約アプリ用 API
 """
 from __future__ import annotations
 
+import hashlib
 import logging
 import os
 import time
 from collections import defaultdict
+from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -16,22 +18,44 @@ from dotenv import load_dotenv
 # backend/.env を読み込み（GOOGLE_CLOUD_PROJECT 等の環境変数を設定）
 load_dotenv(Path(__file__).resolve().parent / ".env")
 
-# ログ設定（タイムスタンプ・レベル付き）
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-)
+# ログ設定（QueueHandler 経由の構造化ログ。書き込みは専用スレッド: log_setup）
+from log_setup import setup_logging
+
+setup_logging()
 
-from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
 logger = logging.getLogger(__name__)
 from fastapi.middleware.cors import CORSMiddleware
 
-from models import UserResponse, SlotItem, AvailabilityForDateResponse, CreateReservationBody, ReservationCreated
+from models import (
+    UserResponse, SlotItem, AvailabilityForDateResponse, DoctorGridResponse, CreateReservationBody, ReservationCreated, ReservationPage,
+    HoldBody, HoldResponse, BatchReservationBody, BatchReservationCreated,
+    BulkCancelBody, BulkCancelResponse, DoctorAbsenceBody, DoctorAbsenceResponse,
+)
+import analytics
+import availability_cache
+import deadline
+import idempotency
+import metrics
+import prefetch
+import slot_stream
+import traffic_capture
+from admission import Overloaded, booking_admission
+from batch_booking import create_reservations_batch
+from fast_json import FastJSONResponse, dumps, encode_day, encode_days
 from firebase_admin_client import verify_id_token
-from reservation_service import get_availability_for_date, get_availability_for_dates, create_reservation as create_reservation_service, cancel_reservation as cancel_reservation_service
+from reassignment import reassign_absent_doctor
+from reservation_export import MEDIA_TYPES, export_filename, export_reservations
+from slot_holds import confirm_hold, place_hold, release_hold
+from reservation_service import (
+    get_availability_for_date, get_availability_for_dates, get_doctor_grid,
+    create_reservation as create_reservation_service, cancel_reservation as cancel_reservation_service,
+    cancel_reservations_bulk, find_reservations_for_doctor_date, list_user_reservations, resolve_reservation_owners,
+)
 
 # CORS: フロントエンド（Vite 開発サーバー）を許可
 _default_origins = ["http://localhost:5200", "http://127.0.0.1:5200", "http://localhost:5201", "http://127.0.0.1:5201"]
@@ -39,6 +63,9 @@ _origins_env = os.getenv("ALLOWED_ORIGINS", "").strip()
 _extra_origins = [o.strip() for o in _origins_env.split(",") if o.strip()] if _origins_env else []
 ALLOWED_ORIGINS = list(dict.fromkeys([*_default_origins, *_extra_origins]))
 
+# 管理者: Firebase カスタムクレーム admin=true、または ADMIN_UIDS（カンマ区切り）に含まれる uid
+ADMIN_UIDS = {u.strip() for u in os.getenv("ADMIN_UIDS", "").split(",") if u.strip()}
+
 
 # --------------- レート制限ミドルウェア ---------------
 class RateLimitMiddleware(BaseHTTPMiddleware):
@@ -64,20 +91,29 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
 app = FastAPI(title="Reservation API", version="1.0")
 
-app.add_middleware(RateLimitMiddleware, max_requests=60, window_seconds=60)
+# IP ごとの1分あたりの上限（0 で無効。同じ IP から大量に送るリプレイ・負荷試験用）
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+if RATE_LIMIT_PER_MINUTE > 0:
+    app.add_middleware(RateLimitMiddleware, max_requests=RATE_LIMIT_PER_MINUTE, window_seconds=60)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match", "Idempotency-Key"],
+    expose_headers=["ETag"],
 )
+# TRAFFIC_CAPTURE_PATH 設定時のみ、匿名化したリクエストを記録する（レート制限で弾いたものも含めるよう最も外側）
+traffic_capture.install(app)
 
 
 @app.get("/health")
 def health():
-    """ヘルスチェック"""
-    return {"status": "ok"}
+    """ヘルスチェック。空き状況キャッシュ・先読みの設定も返す（リプレイ結果を比べるときの前提の確認用）"""
+    return {
+        "status": "ok",
+        "cache": {"availability_ttl": availability_cache.TTL_SECONDS, "prefetch": prefetch.ENABLED},
+    }
 
 
 def _get_bearer_token(authorization: str | None) -> str:
@@ -96,6 +132,23 @@ def _get_bearer_token(authorization: str | None) -> str:
     return token
 
 
+def _require_admin(authorization: str | None) -> str:
+    """管理者トークンを検証して uid を返す。未認証は 401、管理者でなければ 403。"""
+    token = _get_bearer_token(authorization)
+    try:
+        claims = verify_id_token(token)
+    except Exception as e:
+        logger.warning("[401] 管理 API IDトークン検証失敗: %s", e)
+        raise HTTPException(status_code=401, detail="IDトークンの検証に失敗しました。") from e
+    uid = str(claims.get("uid", ""))
+    if not uid:
+        raise HTTPException(status_code=401, detail="トークンから uid を取得できません。")
+    if claims.get("admin") is not True and uid not in ADMIN_UIDS:
+        logger.warning("[403] 管理 API への非管理者アクセス: uid=%s", uid)
+        raise HTTPException(status_code=403, detail="管理者権限が必要です。")
+    return uid
+
+
 @app.get("/users/me", response_model=UserResponse)
 def users_me(authorization: str | None = Header(default=None)):
     """Firebase IDトークンを検証して、ユーザー情報（uid/email）を返す。"""
@@ -124,7 +177,10 @@ def api_info():
         "name": "Day5 Reservation API",
         "endpoints": {
             "slots": "GET /api/slots",
+            "grid": "GET /api/grid",
+            "slotStream": "GET /api/slots/stream",
             "reservations": "POST /api/reservations",
+            "reservationsBatch": "POST /api/reservations/batch",
         },
     }
 
@@ -146,46 +202,114 @@ def _try_get_uid(authorization: str | None) -> str:
         return ""
 
 
-@app.get("/api/slots/week")
-def api_slots_week(department: str = "", dates: str = "", authorization: str | None = Header(default=None)):
+@app.get("/api/slots/week", response_model=list[AvailabilityForDateResponse], response_class=FastJSONResponse)
+def api_slots_week(department: str = "", dates: str = "", purpose: str = "", authorization: str | None = Header(default=None)):
     """
     複数日分の空き枠を一括で返す（高速版）。
     dates はカンマ区切り（例: 2026-02-10,2026-02-11,...）。最大14日。
+    purpose（種別）を指定すると、その所要時間分の連続枠が取れる開始時刻を○にする。
     認証トークンがある場合、そのユーザーの予約済みスロットも×にする。
+    結果は信頼済みの内部データのため、モデル検証を省いて日ごとに直列化済み bytes を返す。
     """
     department = (department or "").strip()
     date_list = [d.strip() for d in (dates or "").split(",") if d.strip()]
     if not department or not date_list:
-        return []
+        return FastJSONResponse(b"[]")
     if len(date_list) > 14:
         date_list = date_list[:14]
     uid = _try_get_uid(authorization)
     try:
-        return get_availability_for_dates(department, date_list, user_id=uid)
+        with prefetch.foreground():
+            body = encode_days(get_availability_for_dates(department, date_list, user_id=uid, purpose=purpose.strip()))
     except Exception as e:
         logger.exception("GET /api/slots/week failed: %s", e)
         raise HTTPException(status_code=500, detail="空き枠情報の取得に失敗しました。") from e
+    # 次の週はほぼ続けて開かれるため、低優先度で先に計算しておく（予算・負荷しだいで省く）
+    prefetch.schedule(department, date_list, purpose=purpose.strip())
+    return FastJSONResponse(body)
 
 
-@app.get("/api/slots", response_model=AvailabilityForDateResponse)
-def api_slots(department: str = "", date: str = "", authorization: str | None = Header(default=None)):
+@app.get("/api/slots", response_model=AvailabilityForDateResponse, response_class=FastJSONResponse)
+def api_slots(department: str = "", date: str = "", purpose: str = "", authorization: str | None = Header(default=None)):
     """
     診療科・日付の空き枠を返す。祝日・過去日はバックエンドで判定し date, is_holiday, reason を含める。
+    purpose（種別）を指定すると、その所要時間分の連続枠が取れる開始時刻を○にする。
     認証トークンがある場合、そのユーザーの予約済みスロットも×にする。
+    response_model はドキュメント用。実レスポンスは検証を省いて直接直列化する。
     """
     department = (department or "").strip()
     date = (date or "").strip()
     uid = _try_get_uid(authorization)
     try:
-        return get_availability_for_date(department, date, user_id=uid)
+        with prefetch.foreground():
+            return FastJSONResponse(encode_day(get_availability_for_date(department, date, user_id=uid, purpose=purpose.strip())))
     except Exception as e:
         logger.exception("GET /api/slots failed: %s", e)
         raise HTTPException(status_code=500, detail="空き枠情報の取得に失敗しました。") from e
 
 
-@app.post("/api/reservations", response_model=ReservationCreated)
-def api_create_reservation(body: CreateReservationBody, authorization: str | None = Header(default=None)):
-    """予約を確定する。担当医はバックエンドで自動割当。認証必須。"""
+@app.get("/api/grid", response_model=DoctorGridResponse, response_class=FastJSONResponse)
+def api_grid(department: str = "", date: str = ""):
+    """
+    診療科・日付の医師 × 時間枠の表を返す（医師ごとに working / booked / free を timeSlots の順で）。
+    医師取得1回 + 予約一括取得1回で全医師分を計算する。ユーザーに依存しない値のため認証は不要。
+    """
+    department = (department or "").strip()
+    if not department:
+        raise HTTPException(status_code=400, detail="department を指定してください。")
+    try:
+        return FastJSONResponse(dumps(get_doctor_grid(department, date)))
+    except deadline.DeadlineExceeded as e:
+        logger.warning("[503] GET /api/grid: %s", e)
+        raise HTTPException(
+            status_code=503, detail="ただいま空き状況を確認できません。しばらくしてから再度お試しください。", headers={"Retry-After": "1"},
+        ) from e
+    except Exception as e:
+        logger.exception("GET /api/grid failed: %s", e)
+        raise HTTPException(status_code=500, detail="空き枠情報の取得に失敗しました。") from e
+
+
+@app.get("/api/slots/stream")
+async def api_slots_stream(
+    request: Request, department: str = "", date_from: str = Query("", alias="from"), to: str = "", purpose: str = "",
+):
+    """
+    空き枠の変更を Server-Sent Events で配信する（購読範囲は from〜to、最大31日。purpose は /api/slots と同じ）。
+    event: ready（接続完了）/ slots（{"department", "c": [[日付, 時間, 予約可否], ...]}）/ resync（全体を取り直す）。
+    ○×はユーザーに依存しない値のため認証は不要（EventSource はヘッダーを付けられない）。
+    """
+    department = (department or "").strip()
+    try:
+        start = datetime.strptime((date_from or "").strip(), "%Y-%m-%d").date()
+        end = datetime.strptime((to or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from / to は YYYY-MM-DD で指定してください。") from None
+    if not department:
+        raise HTTPException(status_code=400, detail="department を指定してください。")
+    if end < start or (end - start).days >= slot_stream.MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"期間は{slot_stream.MAX_RANGE_DAYS}日以内で指定してください。")
+    return StreamingResponse(
+        slot_stream.stream(department, start.isoformat(), end.isoformat(), request.is_disconnected, purpose.strip()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/reservations", response_model=ReservationPage, response_class=FastJSONResponse)
+def api_list_reservations(
+    scope: str = "upcoming",
+    limit: int = 20,
+    cursor: str = "",
+    fields: str = "",
+    authorization: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    ログインユーザーの予約一覧を1ページ返す。認証必須。
+    scope: upcoming（今日以降・昇順）/ past（過去・新しい順）/ all。limit は最大100。
+    cursor は前ページの nextCursor。fields はカンマ区切りで返すフィールドを絞る（例: date,time,department）。
+    本文の ETag を返し、If-None-Match が一致すれば 304（本文なし）を返す。
+    """
     token = _get_bearer_token(authorization)
     try:
         claims = verify_id_token(token)
@@ -197,15 +321,108 @@ def api_create_reservation(body: CreateReservationBody, authorization: str | Non
         logger.warning("[401] トークンから uid を取得できません。")
         raise HTTPException(status_code=401, detail="トークンから uid を取得できません。")
 
+    field_list = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    try:
+        page = list_user_reservations(uid, scope=(scope or "").strip(), limit=limit, cursor=(cursor or "").strip(), fields=field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        logger.exception("GET /api/reservations failed: %s", e)
+        raise HTTPException(status_code=500, detail="予約一覧の取得に失敗しました。") from e
+
+    body = dumps(page)
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    # 他ユーザーと共有キャッシュさせず、毎回 ETag で再検証させる
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(body, headers=headers)
+
+
+async def _run_booking(key: tuple[str, str], fn, *args):
+    """
+    予約系の書き込みを受付制御の枠内でスレッドプール実行する。
+    同時実行数を超えた分は key=(診療科, 日付) ごとに到着順で待ち、待ち行列が満杯なら 503 + Retry-After を返す。
+    """
+    try:
+        async with booking_admission.slot(key):
+            return await run_in_threadpool(fn, *args)
+    except Overloaded as e:
+        logger.warning("[503] booking rejected: key=%s reason=%s retry_after=%ds", key, e.reason, e.retry_after)
+        raise HTTPException(
+            status_code=503,
+            detail="ただいま予約が混み合っています。しばらくしてから再度お試しください。",
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+
+
+def _created(out: dict) -> dict:
+    """予約処理の戻り値を ReservationCreated の形にする（Idempotency-Key の保存内容にもなる）"""
+    return {"id": out["id"], "date": out["date"], "time": out["time"], "department": out["departmentId"]}
+
+
+async def _run_idempotent(key: tuple[str, str], uid: str, idempotency_key: str, fp: str, fn):
+    """
+    Idempotency-Key 付きの予約系の書き込み。保存済みのレスポンスがあれば受付制御も予約処理も通さずに返し、
+    無ければ _run_booking の枠内で fn を実行して結果を保存する。キーが無ければ _run_booking と同じ。
+    同じキーが別の内容で使われていれば 422。
+    """
+    if len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key は{idempotency.MAX_KEY_LENGTH}文字以内で指定してください。")
+    if not idempotency_key:
+        return await _run_booking(key, fn)
+    try:
+        cached = await run_in_threadpool(idempotency.lookup, uid, idempotency_key, fp)
+        if cached is not None:
+            logger.info("idempotent replay: uid=%s key=%s", uid, idempotency_key)
+            return cached
+        return await _run_booking(key, idempotency.run, uid, idempotency_key, fp, fn)
+    except idempotency.IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
+@app.post("/api/reservations", response_model=ReservationCreated)
+async def api_create_reservation(
+    body: CreateReservationBody, authorization: str | None = Header(default=None), idempotency_key: str | None = Header(default=None),
+):
+    """
+    予約を確定する。担当医はバックエンドで自動割当。認証必須。holdId があれば仮押さえを確定する。
+    書き込みは受付制御（admission）を通し、混雑時は (診療科, 日付) ごとに順番待ち、満杯なら 503 + Retry-After。
+    Idempotency-Key ヘッダーがあれば、同じキーの再送には最初の成功レスポンスをそのまま返す（idempotency）。
+    """
+    token = _get_bearer_token(authorization)
+    try:
+        claims = await run_in_threadpool(verify_id_token, token)
+    except Exception as e:
+        logger.warning("[401] IDトークン検証失敗: %s", e)
+        raise HTTPException(status_code=401, detail="IDトークンの検証に失敗しました。") from e
+    uid = str(claims.get("uid", ""))
+    if not uid:
+        logger.warning("[401] トークンから uid を取得できません。")
+        raise HTTPException(status_code=401, detail="トークンから uid を取得できません。")
+
     department = (body.department or "").strip()
     date = (body.date or "").strip()
     time = (body.time or "").strip()
     purpose = (body.purpose or "").strip()
     if not department or not date or not time:
         raise HTTPException(status_code=400, detail="診療科・日付・時間は必須です。")
+
+    def book():
+        if body.holdId:
+            # 仮押さえ済みなら1トランザクションで確定。期限切れ等で無効なら通常の予約へ
+            out = confirm_hold(body.holdId, department, date, time, uid, purpose=purpose)
+            if out is not None:
+                return _created(out)
+            logger.info("POST /api/reservations: hold %s not usable, falling back to normal booking", body.holdId)
+        return _created(create_reservation_service(department, date, time, uid, purpose=purpose))
+
+    fp = idempotency.fingerprint("reservations", department, date, time, purpose)
     try:
-        out = create_reservation_service(department, date, time, uid, purpose=purpose)
-        return ReservationCreated(id=out["id"], date=out["date"], time=out["time"], department=out["departmentId"])
+        out = await _run_idempotent((department, date), uid, (idempotency_key or "").strip(), fp, book)
+        return ReservationCreated(**out)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
     except Exception as e:
@@ -213,6 +430,99 @@ def api_create_reservation(body: CreateReservationBody, authorization: str | Non
         raise HTTPException(status_code=500, detail="予約の保存に失敗しました。") from e
 
 
+@app.post("/api/reservations/batch", response_model=BatchReservationCreated)
+async def api_create_reservations_batch(
+    body: BatchReservationBody, authorization: str | None = Header(default=None), idempotency_key: str | None = Header(default=None),
+):
+    """
+    複数枠（検査 → 診察など）をまとめて予約する。認証必須。全件の枠と予約を1トランザクションで確定し、
+    1件でも確保できなければどれも予約しない（400）。受付制御は先頭の件の (診療科, 日付) で行う。
+    Idempotency-Key は POST /api/reservations と同じ。
+    """
+    token = _get_bearer_token(authorization)
+    try:
+        claims = await run_in_threadpool(verify_id_token, token)
+    except Exception as e:
+        logger.warning("[401] IDトークン検証失敗: %s", e)
+        raise HTTPException(status_code=401, detail="IDトークンの検証に失敗しました。") from e
+    uid = str(claims.get("uid", ""))
+    if not uid:
+        logger.warning("[401] トークンから uid を取得できません。")
+        raise HTTPException(status_code=401, detail="トークンから uid を取得できません。")
+
+    items = [item.model_dump() for item in body.items]
+    key = (items[0]["department"].strip(), items[0]["date"].strip())
+
+    def book():
+        return {"items": [_created(r) for r in create_reservations_batch(items, uid)]}
+
+    fp = idempotency.fingerprint("reservations/batch", items)
+    try:
+        out = await _run_idempotent(key, uid, (idempotency_key or "").strip(), fp, book)
+        return BatchReservationCreated(items=[ReservationCreated(**r) for r in out["items"]])
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        logger.exception("POST /api/reservations/batch failed: %s", e)
+        raise HTTPException(status_code=500, detail="予約の保存に失敗しました。") from e
+
+
+@app.post("/api/holds", response_model=HoldResponse)
+async def api_place_hold(body: HoldBody, authorization: str | None = Header(default=None)):
+    """
+    予約枠を一時的に仮押さえする（確認画面の間に他の人に取られないように）。認証必須。
+    仮押さえ中の枠は空き枠 API で×になり、期限（expiresAt）を過ぎると自動で解放される。1ユーザー1枠。
+    """
+    token = _get_bearer_token(authorization)
+    try:
+        claims = await run_in_threadpool(verify_id_token, token)
+    except Exception as e:
+        logger.warning("[401] IDトークン検証失敗: %s", e)
+        raise HTTPException(status_code=401, detail="IDトークンの検証に失敗しました。") from e
+    uid = str(claims.get("uid", ""))
+    if not uid:
+        logger.warning("[401] トークンから uid を取得できません。")
+        raise HTTPException(status_code=401, detail="トークンから uid を取得できません。")
+
+    try:
+        hold = await _run_booking(
+            (body.department, body.date),
+            lambda: place_hold(body.department, body.date, body.time, uid, purpose=body.purpose),
+        )
+        return HoldResponse(**hold)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except Exception as e:
+        logger.exception("POST /api/holds failed: %s", e)
+        raise HTTPException(status_code=500, detail="予約枠の確保に失敗しました。") from e
+
+
+@app.delete("/api/holds/{hold_id}")
+def api_release_hold(hold_id: str, authorization: str | None = Header(default=None)):
+    """仮押さえを解放する（確認画面から戻った場合など）。認証必須。既に無い場合も ok を返す。"""
+    token = _get_bearer_token(authorization)
+    try:
+        claims = verify_id_token(token)
+    except Exception as e:
+        logger.warning("[401] IDトークン検証失敗: %s", e)
+        raise HTTPException(status_code=401, detail="IDトークンの検証に失敗しました。") from e
+    uid = str(claims.get("uid", ""))
+    if not uid:
+        logger.warning("[401] トークンから uid を取得できません。")
+        raise HTTPException(status_code=401, detail="トークンから uid を取得できません。")
+
+    try:
+        released = release_hold(hold_id.strip(), uid)
+    except Exception as e:
+        logger.exception("DELETE /api/holds/%s failed: %s", hold_id, e)
+        raise HTTPException(status_code=500, detail="仮押さえの解放に失敗しました。") from e
+    return {"ok": True, "released": released}
+
+
 @app.delete("/api/reservations/{reservation_id}")
 def api_cancel_reservation(reservation_id: str, authorization: str | None = Header(default=None)):
     """
@@ -241,3 +551,123 @@ def api_cancel_reservation(reservation_id: str, authorization: str | None = Head
     except Exception as e:
         logger.exception("DELETE /api/reservations/%s failed: %s", reservation_id, e)
         raise HTTPException(status_code=500, detail="予約のキャンセルに失敗しました。") from e
+
+
+# ----- 管理 API（スタッフ用。管理者権限必須） -----
+
+
+@app.post("/api/admin/reservations/cancel", response_model=BulkCancelResponse)
+def api_admin_bulk_cancel(body: BulkCancelBody, authorization: str | None = Header(default=None)):
+    """
+    予約を一括キャンセルする（医師の急な休診など）。
+    reservations で個別指定、または doctorId + date でその日の担当予約すべてを対象にする。
+    トランザクション単位でまとめて処理し、1件ごとの結果を返す。
+    """
+    admin_uid = _require_admin(authorization)
+    doctor_id = (body.doctorId or "").strip()
+    date = (body.date or "").strip()
+    if bool(doctor_id) != bool(date):
+        raise HTTPException(status_code=400, detail="doctorId と date は両方指定してください。")
+    if not body.reservations and not doctor_id:
+        raise HTTPException(status_code=400, detail="キャンセル対象が指定されていません。")
+
+    try:
+        targets: list[tuple[str, str]] = []
+        unresolved: list[str] = []
+        missing_owner = [r.id.strip() for r in body.reservations if not r.userId.strip()]
+        owners = resolve_reservation_owners(missing_owner) if missing_owner else {}
+        for r in body.reservations:
+            rid = r.id.strip()
+            uid = r.userId.strip() or owners.get(rid, "")
+            if uid:
+                targets.append((uid, rid))
+            else:
+                unresolved.append(rid)
+        if doctor_id:
+            targets.extend(find_reservations_for_doctor_date(doctor_id, date))
+        results = cancel_reservations_bulk(targets)
+    except Exception as e:
+        logger.exception("POST /api/admin/reservations/cancel failed: %s", e)
+        raise HTTPException(status_code=500, detail="一括キャンセルに失敗しました。") from e
+
+    results.extend({"userId": "", "id": rid, "status": "not_found", "detail": "予約の所有者が見つかりません。"} for rid in unresolved)
+    cancelled = sum(1 for r in results if r["status"] == "cancelled")
+    logger.info("bulk cancel by admin=%s: cancelled=%d total=%d", admin_uid, cancelled, len(results))
+    return {"cancelled": cancelled, "failed": len(results) - cancelled, "results": results}
+
+
+@app.post("/api/admin/doctor-absence", response_model=DoctorAbsenceResponse)
+def api_admin_doctor_absence(body: DoctorAbsenceBody, authorization: str | None = Header(default=None)):
+    """
+    医師の休診期間の予約を、同じ診療科の他の医師（同日・同時刻）へ一括で振り替える。
+    dryRun=true なら振替計画のみ返す。振替できなかった予約は unplaced に理由付きで含める。
+    """
+    admin_uid = _require_admin(authorization)
+    try:
+        result = reassign_absent_doctor(body.doctorId, body.dateFrom, body.dateTo, dry_run=body.dryRun)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        logger.exception("POST /api/admin/doctor-absence failed: %s", e)
+        raise HTTPException(status_code=500, detail="予約の振替に失敗しました。") from e
+    logger.info(
+        "doctor absence by admin=%s: doctor=%s moved=%d unplaced=%d",
+        admin_uid, body.doctorId, len(result["moved"]), len(result["unplaced"]),
+    )
+    return result
+
+
+@app.get("/api/admin/reservations/export")
+def api_admin_export_reservations(
+    date_from: str = Query("", alias="from"), to: str = "", fmt: str = Query("csv", alias="format"), department: str = "",
+    doctorId: str = "",
+    authorization: str | None = Header(default=None),
+):
+    """
+    期間（from〜to、最大366日）の全予約を CSV / NDJSON / Parquet でダウンロードさせる。department・doctorId で絞り込める。
+    1ページ読むたびに書き出すため、期間の長さによらずメモリ使用量は一定。
+    """
+    admin_uid = _require_admin(authorization)
+    fmt = (fmt or "").strip().lower()
+    try:
+        chunks = export_reservations(date_from, to, fmt, department=department, doctor_id=doctorId)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    logger.info(
+        "reservation export by admin=%s: %s..%s format=%s department=%s doctor=%s",
+        admin_uid, date_from, to, fmt, department, doctorId,
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(date_from.strip(), to.strip(), fmt)}"'},
+    )
+
+
+@app.get("/api/admin/analytics/utilization", response_class=FastJSONResponse)
+def api_admin_utilization(
+    date_from: str = Query("", alias="from"), to: str = "", department: str = "",
+    authorization: str | None = Header(default=None),
+):
+    """
+    期間（from〜to、最大366日）の予約枠の稼働率を、全体・診療科・医師・曜日・時間帯・曜日×時間帯で返す。
+    department を指定するとその診療科だけを集計する。同じ条件の結果は一定時間キャッシュする（generatedAt が集計時刻）。
+    """
+    _require_admin(authorization)
+    try:
+        return FastJSONResponse(dumps(analytics.utilization(date_from, to, department=department)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        logger.exception("GET /api/admin/analytics/utilization failed: %s", e)
+        raise HTTPException(status_code=500, detail="稼働率の集計に失敗しました。") from e
+
+
+@app.get("/api/admin/metrics")
+def api_admin_metrics(authorization: str | None = Header(default=None)):
+    """このワーカープロセスのカウンタ（スロット確保の試行・衝突回数など）と予約受付の混雑状況を返す"""
+    _require_admin(authorization)
+    return {
+        "pid": os.getpid(), "counters": metrics.snapshot(), "admission": booking_admission.stats(),
+        "slotStreamSubscribers": slot_stream.hub.subscriber_count(),
+    }
@@ -0,0 +1,36 @@
+"""
+プロセス内の簡易メトリクス（カウンタのみ）
+- 予約スロット確保の競合回数などを数え、管理 API /api/admin/metrics で参照する
+- ワーカープロセスごとの値（集約は行わない）
+"""
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+
+_counters: dict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+
+
+def incr(name: str, value: int = 1) -> None:
+    """カウンタ name を value だけ増やす"""
+    with _lock:
+        _counters[name] += value
+
+
+def get(name: str) -> int:
+    """カウンタ name の現在値"""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict[str, int]:
+    """全カウンタのコピー（名前順）"""
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def reset() -> None:
+    """全カウンタを 0 に戻す（テスト・ベンチマーク用）"""
+    with _lock:
+        _counters.clear()
@@ -26,8 +26,28 @@ class AvailabilityForDateResponse(BaseModel):
     date: str
     is_holiday: bool
     reservable: bool
-    reason: Optional[str] = None  # "holiday" | "past" | "closed" | null
+    reason: Optional[str] = None  # "holiday" | "past" | "closed" | "degraded" | null
     slots: list[SlotItem]
+    degraded: bool = False  # 予約状況を読めなかった（reason="degraded" は全枠×、それ以外は自分の予約の×が未反映）
+
+
+class DoctorGridRow(BaseModel):
+    """医師1人分の枠の状態（timeSlots と同じ順）"""
+    id: str
+    name: str
+    working: list[bool]
+    booked: list[bool]
+    free: list[bool]
+
+
+class DoctorGridResponse(BaseModel):
+    """診療科・日付の医師 × 時間枠の表（空き判定はバックエンド、フロントは表示のみ）"""
+    date: str
+    department: str
+    is_holiday: bool
+    reason: Optional[str] = None  # "holiday" | "past" | "closed" | null
+    timeSlots: list[str]
+    doctors: list[DoctorGridRow]
 
 
 class CreateReservationBody(BaseModel):
@@ -36,6 +56,24 @@ class CreateReservationBody(BaseModel):
     date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
     time: str = Field(..., pattern=r"^\d{2}:\d{2}$")
     purpose: str = Field(default="", max_length=20)  # 初診/再診
+    holdId: str = Field(default="", max_length=64)  # 仮押さえ（POST /api/holds）を確定する場合に指定
+
+
+class HoldBody(BaseModel):
+    """予約枠の仮押さえ（診療科・日・時間。医師はバックエンドで割当）"""
+    department: str = Field(..., min_length=1, max_length=100)
+    date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
+    time: str = Field(..., pattern=r"^\d{2}:\d{2}$")
+    purpose: str = Field(default="", max_length=20)  # 種別（所要時間分の連続枠を仮押さえする）
+
+
+class HoldResponse(BaseModel):
+    """仮押さえ結果（expiresAt を過ぎると自動で解放される）"""
+    holdId: str
+    department: str
+    date: str
+    time: str
+    expiresAt: str
 
 
 class ReservationCreated(BaseModel):
@@ -44,3 +82,101 @@ class ReservationCreated(BaseModel):
     date: str
     time: str
     department: str
+
+
+class BatchReservationItem(BaseModel):
+    """一括予約の1件（診療科・日・時間・種別。担当医はバックエンドで自動割当）"""
+    department: str = Field(..., min_length=1, max_length=100)
+    date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
+    time: str = Field(..., pattern=r"^\d{2}:\d{2}$")
+    purpose: str = Field(default="", max_length=20)
+
+
+class BatchReservationBody(BaseModel):
+    """複数枠の一括予約（全件成功か全件失敗）"""
+    items: list[BatchReservationItem] = Field(..., min_length=1, max_length=5)
+
+
+class BatchReservationCreated(BaseModel):
+    """一括予約レスポンス（items は指定の順）"""
+    items: list[ReservationCreated]
+
+
+class ReservationSummary(BaseModel):
+    """マイ予約一覧の1件（fields 指定時は id と指定フィールドのみ）"""
+    id: str
+    date: Optional[str] = None
+    time: Optional[str] = None
+    category: Optional[str] = None
+    department: Optional[str] = None
+    purpose: Optional[str] = None
+    doctor: Optional[str] = None
+
+
+class ReservationPage(BaseModel):
+    """マイ予約一覧の1ページ（nextCursor が null なら最終ページ）"""
+    items: list[ReservationSummary]
+    nextCursor: Optional[str] = None
+
+
+class ReservationRef(BaseModel):
+    """予約の参照（userId 省略時は booked_slots から所有者を引く）"""
+    userId: str = Field(default="", max_length=128)
+    id: str = Field(..., min_length=1, max_length=128)
+
+
+class BulkCancelBody(BaseModel):
+    """一括キャンセル（予約の列挙、または医師+日付で対象を指定。両方指定時は合算）"""
+    reservations: list[ReservationRef] = Field(default_factory=list, max_length=1000)
+    doctorId: str = Field(default="", max_length=128)
+    date: str = Field(default="", pattern=r"^(\d{4}-\d{2}-\d{2})?$")
+
+
+class BulkCancelItem(BaseModel):
+    """一括キャンセルの1件ごとの結果"""
+    userId: str
+    id: str
+    status: str  # "cancelled" | "not_found" | "error"
+    detail: Optional[str] = None
+
+
+class BulkCancelResponse(BaseModel):
+    """一括キャンセル結果"""
+    cancelled: int
+    failed: int
+    results: list[BulkCancelItem]
+
+
+class DoctorAbsenceBody(BaseModel):
+    """医師休診時の予約一括振替（期間は両端含む）"""
+    doctorId: str = Field(..., min_length=1, max_length=128)
+    dateFrom: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
+    dateTo: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
+    dryRun: bool = False
+
+
+class ReassignedItem(BaseModel):
+    """振替できた予約"""
+    userId: str
+    id: str
+    date: str
+    time: str
+    toDoctorId: str
+
+
+class UnplacedItem(BaseModel):
+    """振替できなかった予約（reason: "no_available_doctor" | "changed" | "conflict"）"""
+    userId: str
+    id: str
+    date: str
+    time: str
+    reason: str
+
+
+class DoctorAbsenceResponse(BaseModel):
+    """一括振替結果"""
+    doctorId: str
+    department: str
+    dryRun: bool
+    moved: list[ReassignedItem]
+    unplaced: list[UnplacedItem]
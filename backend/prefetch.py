@@ -0,0 +1,154 @@
+"""
+隣の期間の空き状況の先読み（週カレンダーで「次の週」を押したときに冷えた計算をさせない）
+- /api/slots/week を返すたびに、表示中の期間の次の同じ日数分（next_dates）の計算を低優先度で予約し、
+  結果を availability_cache に入れる。ユーザーに依存しない部分だけを計算する（自分の予約の×は user_booked_cache）
+- 実行は専用の小さなスレッドプール（PREFETCH_WORKERS）。リクエスト処理のスレッドプールは使わない
+- 予算: 1分あたり PREFETCH_PER_MINUTE 件、待ち・実行中は合わせて PREFETCH_MAX_PENDING 件まで。超えた分は捨てる
+- 負荷が高いとき（予約の受付制御に待ちがある・実行中の空き枠リクエストが PREFETCH_MAX_FOREGROUND 件以上）は予約せず、
+  待っていた先読みも実行直前に確認して取り消す
+- 読み取りには短い期限（PREFETCH_DEADLINE_SECONDS）を付ける。期限切れ・失敗は捨てるだけ（縮退結果はキャッシュされない）
+- 同じ範囲が待ち・実行中なら予約せず、実行時にキャッシュ済み（共有メモリを含む）なら計算しない
+- 件数は metrics の prefetch_* で数える
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date as date_cls, timedelta
+from typing import Iterator
+
+import availability_cache
+import deadline
+import metrics
+from admission import booking_admission
+from reservation_service import warm_availability
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("PREFETCH_ENABLED", "1").strip() != "0"
+WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
+PER_MINUTE = float(os.environ.get("PREFETCH_PER_MINUTE", "120"))
+MAX_PENDING = int(os.environ.get("PREFETCH_MAX_PENDING", "8"))
+MAX_FOREGROUND = int(os.environ.get("PREFETCH_MAX_FOREGROUND", "8"))
+DEADLINE_SECONDS = float(os.environ.get("PREFETCH_DEADLINE_SECONDS", "1.0"))
+# 先読みする最大日数（/api/slots/week の上限と同じ）
+MAX_DAYS = 14
+
+_lock = threading.Lock()
+_pending: set[tuple[str, tuple[str, ...], str]] = set()
+_foreground = 0
+# トークンバケット（1分あたり PER_MINUTE 件、最大 PER_MINUTE 件まで貯まる）
+_tokens = PER_MINUTE
+_refilled_at = time.monotonic()
+_pool: ThreadPoolExecutor | None = None
+
+
+def next_dates(dates: list[str]) -> list[str]:
+    """dates（YYYY-MM-DD）の最終日の翌日から同じ日数分（最大 MAX_DAYS 日）。不正な日付があれば空"""
+    try:
+        last = max(date_cls.fromisoformat(d) for d in dates)
+    except ValueError:
+        return []
+    return [(last + timedelta(days=i)).isoformat() for i in range(1, min(len(dates), MAX_DAYS) + 1)]
+
+
+@contextmanager
+def foreground() -> Iterator[None]:
+    """空き枠リクエストの処理中であることを示す（実行中の件数を負荷の目安にする）"""
+    global _foreground
+    with _lock:
+        _foreground += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _foreground -= 1
+
+
+def _overloaded() -> bool:
+    with _lock:
+        busy = _foreground >= MAX_FOREGROUND
+    return busy or booking_admission.stats()["queued"] > 0
+
+
+def _take_token() -> bool:
+    """予算から1件分を取る（_lock 保持中に呼ぶ）"""
+    global _tokens, _refilled_at
+    now = time.monotonic()
+    _tokens = min(PER_MINUTE, _tokens + (now - _refilled_at) * PER_MINUTE / 60)
+    _refilled_at = now
+    if _tokens < 1:
+        return False
+    _tokens -= 1
+    return True
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="prefetch")
+        return _pool
+
+
+def schedule(department: str, dates: list[str], *, purpose: str = "") -> bool:
+    """dates の次の期間の先読みを予約する。予約したら True（予算切れ・負荷・重複なら False）"""
+    if not ENABLED or not availability_cache.enabled() or not department:
+        return False
+    upcoming = next_dates(dates)
+    if not upcoming:
+        return False
+    if _overloaded():
+        metrics.incr("prefetch_skipped_load")
+        return False
+    key = (department, tuple(upcoming), purpose)
+    with _lock:
+        if key in _pending:
+            return False
+        if len(_pending) >= MAX_PENDING or not _take_token():
+            metrics.incr("prefetch_skipped_budget")
+            return False
+        _pending.add(key)
+    metrics.incr("prefetch_scheduled")
+    _executor().submit(_run, key)
+    return True
+
+
+def _run(key: tuple[str, tuple[str, ...], str]) -> None:
+    department, dates, purpose = key
+    try:
+        if _overloaded():
+            metrics.incr("prefetch_cancelled")
+            return
+        with deadline.budget(DEADLINE_SECONDS):
+            if warm_availability(department, list(dates), purpose=purpose):
+                metrics.incr("prefetch_computed")
+    except Exception as e:
+        metrics.incr("prefetch_failed")
+        logger.info("prefetch %s %s..%s failed: %r", department, dates[0], dates[-1], e)
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def drain(timeout: float = 5.0) -> bool:
+    """待ち・実行中の先読みが終わるまで待つ（テスト・ベンチマーク用）。timeout 内に終われば True"""
+    until = time.monotonic() + timeout
+    while time.monotonic() < until:
+        with _lock:
+            if not _pending:
+                return True
+        time.sleep(0.005)
+    return False
+
+
+def reset() -> None:
+    """予算を満タンに戻す（テスト用）"""
+    global _tokens, _refilled_at
+    with _lock:
+        _tokens = PER_MINUTE
+        _refilled_at = time.monotonic()
@@ -0,0 +1,273 @@
+"""
+医師の急な休診時の予約一括振替（管理者用）
+- 休診医師の期間内の予約を一括取得し、同じ診療科の他の医師の同日同時刻へメモリ上で割り当てを計算する
+  （複数枠の予約は、同じ枠数だけ連続して空いている医師へまとめて移す）
+- 定員制の枠（slot_counters）は旧医師のシャードを -1 し、振替先が定員制なら上限に達していないシャードを +1 する。
+  計画段階では振替先の残席数が分からないため、定員制でも1枠につき1件だけ割り当てる（満席なら確定時に失敗し未振替になる）
+- 確定はトランザクション単位でまとめて行い（新スロット確保 + 旧スロット解放 + 予約の担当医更新）、
+  振替できなかった予約を理由付きで報告する
+- 休診医師への新規予約の受付停止は対象外（doctors の schedules 側で行う）
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any
+
+from reservation_service import (
+    _get_doctors_by_department,
+    _get_firestore,
+    _get_reservations_bulk,
+    _is_expired_hold,
+    _reservation_ref,
+    _slot_doc_id,
+    find_doctor_bookings,
+)
+import slot_counters
+import slot_events
+from slot_logic import assign_doctor, available_for_run, slot_capacity, slot_run
+from storage import server_timestamp, transactional
+
+logger = logging.getLogger(__name__)
+
+# 1回の振替で扱う最大日数（誤った範囲指定で全期間を走査しないため）
+MAX_RANGE_DAYS = 62
+# 1トランザクションあたりの振替枠数（1枠につき create（またはシャード更新）+ delete、予約1件につき update。500書き込み以内に収める）
+CHUNK_SIZE = 100
+
+
+def _date_range(date_from: str, date_to: str) -> list[str]:
+    """YYYY-MM-DD の閉区間を日付リストにする。不正な範囲は ValueError。"""
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date()
+        end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except (ValueError, TypeError) as e:
+        raise ValueError("日付は YYYY-MM-DD 形式で指定してください。") from e
+    if end < start:
+        raise ValueError("終了日は開始日以降を指定してください。")
+    days = (end - start).days + 1
+    if days > MAX_RANGE_DAYS:
+        raise ValueError(f"期間は最大{MAX_RANGE_DAYS}日までです。")
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def _booking_times(booking: dict[str, Any]) -> list[str]:
+    """予約が占める枠の時刻の列（find_doctor_bookings の time・slots から）"""
+    return slot_run(booking["time"], int(booking.get("slots") or 1)) or [booking["time"]]
+
+
+def plan_reassignment(
+    bookings: list[dict[str, Any]],
+    doctors: list[dict[str, Any]],
+    reserved: set[tuple[str, str, str]],
+    department_label: str = "",
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    振替先をメモリ上で決める（I/O なし）。
+    bookings は日付・時間順。割り当てたスロットは reserved に加えて以降の候補から外す。
+    戻り値: (moves, unplaced)
+    """
+    reserved = set(reserved)
+    # 振替先は同日の予約数が少ない医師を優先し、特定の医師に寄せない
+    load: Counter[str] = Counter(did for did, _, _ in reserved)
+    moves: list[dict[str, Any]] = []
+    unplaced: list[dict[str, Any]] = []
+    for b in bookings:
+        date, times = b["date"], _booking_times(b)
+        candidates = available_for_run(doctors, date, b["time"], reserved, len(times))
+        doctor = assign_doctor(candidates, "least_loaded", load=load)
+        if doctor is None:
+            unplaced.append({**b, "reason": "no_available_doctor"})
+            continue
+        reserved.update((doctor["id"], date, t) for t in times)
+        load[doctor["id"]] += len(times)
+        moves.append({
+            **b, "toDoctorId": doctor["id"], "toDoctorName": doctor.get("name") or "",
+            "toCapacity": slot_capacity(doctor, department_label),
+        })
+    return moves, unplaced
+
+
+def _chunks(moves: list[dict[str, Any]]) -> list[list[dict[str, Any]]]:
+    """振替を、占める枠数の合計が CHUNK_SIZE 以下になるように分ける"""
+    chunks: list[list[dict[str, Any]]] = []
+    size = 0
+    for m in moves:
+        k = len(_booking_times(m))
+        if not chunks or size + k > CHUNK_SIZE:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(m)
+        size += k
+    return chunks
+
+
+@transactional
+def _apply_moves(transaction, db, from_doctor_id: str, department: str, moves: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    振替を1トランザクションで確定する。予約が既に変更・削除されていたものは適用せず返す。
+    新スロットは読み取ってから書く。期限切れの仮押さえは空きとして上書きし（_create_run と同じ）、
+    他の予約・有効な仮押さえと競合した場合は例外（RuntimeError）でトランザクション全体を失敗させる。
+    定員制の振替先が満席の場合も同じく RuntimeError。
+    """
+    refs = {_reservation_ref(db, m["userId"], m["id"]).path: m for m in moves}
+    current: dict[str, dict[str, Any]] = {}
+    for snap in transaction.get_all([_reservation_ref(db, m["userId"], m["id"]) for m in moves]):
+        if snap.exists:
+            current[snap.reference.path] = snap.to_dict() or {}
+    old_slot_refs = {
+        path: [db.collection("booked_slots").document(_slot_doc_id(from_doctor_id, m["date"], t)) for t in _booking_times(m)]
+        for path, m in refs.items()
+    }
+    old_owner: dict[str, str] = {}
+    for snap in transaction.get_all([ref for slot_refs in old_slot_refs.values() for ref in slot_refs]):
+        if snap.exists:
+            old_owner[snap.reference.path] = (snap.to_dict() or {}).get("userId") or ""
+    # 定員1の振替先の枠: 予約・有効な仮押さえがあれば使えない（期限切れの仮押さえは空き）
+    new_slot_refs = {
+        path: [db.collection("booked_slots").document(_slot_doc_id(m["toDoctorId"], m["date"], t)) for t in _booking_times(m)]
+        for path, m in refs.items() if m.get("toCapacity", 1) <= 1
+    }
+    taken: set[str] = set()
+    all_new_refs = [ref for slot_refs in new_slot_refs.values() for ref in slot_refs]
+    if all_new_refs:
+        for snap in transaction.get_all(all_new_refs):
+            if snap.exists and not _is_expired_hold(snap.to_dict() or {}):
+                taken.add(snap.reference.path)
+    # 定員制の枠: 旧シャードと振替先の全シャードを書き込み前に読んでおく（件数はメモリ上で増減する）
+    old_seats = Counter(s for data in current.values() for s in (data.get("seats") or []))
+    shard_counts: dict[str, int] = {}
+    shard_snaps: dict[str, Any] = {}
+    seat_targets = {
+        (m["toDoctorId"], m["date"], t, m["toCapacity"]) for m in moves if m.get("toCapacity", 1) > 1 for t in _booking_times(m)
+    }
+    new_shards = {
+        slot_counters.shard_id(did, date, t, i): {"doctorId": did, "date": date, "time": t, "capacity": capacity, "cap": cap}
+        for did, date, t, capacity in seat_targets for i, cap in enumerate(slot_counters.shard_caps(capacity))
+    }
+    for snap in transaction.get_all(slot_counters.seat_refs(db, list(dict.fromkeys([*old_seats, *new_shards])))):
+        shard_snaps[snap.reference.id] = snap
+        shard_counts[snap.reference.id] = int((snap.to_dict() or {}).get("count") or 0) if snap.exists else 0
+    touched: set[str] = set()
+
+    stale: list[dict[str, Any]] = []
+    for path, m in refs.items():
+        data = current.get(path)
+        if data is None or data.get("doctorId") != from_doctor_id or data.get("date") != m["date"] or data.get("time") != m["time"]:
+            stale.append(m)
+            continue
+        seats: list[str] = []
+        capacity = m.get("toCapacity", 1)
+        for i, t in enumerate(_booking_times(m)):
+            if capacity > 1:
+                caps = slot_counters.shard_caps(capacity)
+                ids = [slot_counters.shard_id(m["toDoctorId"], m["date"], t, i) for i in range(len(caps))]
+                free = next((sid for sid, cap in zip(ids, caps) if shard_counts[sid] < cap), None)
+                if free is None:
+                    raise RuntimeError(f"slot {m['toDoctorId']}_{m['date']}_{t} is full")
+                shard_counts[free] += 1
+                touched.add(free)
+                seats.append(free)
+                continue
+            slot_ref = new_slot_refs[path][i]
+            if slot_ref.path in taken:
+                raise RuntimeError(f"slot {slot_ref.id} is taken")
+            transaction.set(slot_ref, {
+                "doctorId": m["toDoctorId"],
+                "date": m["date"],
+                "time": t,
+                "department": department,
+                "userId": m["userId"],
+                "reservationId": m["id"],
+                "createdAt": server_timestamp(),
+            })
+        for old_ref in old_slot_refs[path]:
+            if old_owner.get(old_ref.path) in ("", m["userId"]):
+                transaction.delete(old_ref)
+        for sid in data.get("seats") or []:
+            if sid in shard_counts and shard_snaps[sid].exists:
+                shard_counts[sid] = max(0, shard_counts[sid] - 1)
+                touched.add(sid)
+        update = {"doctorId": m["toDoctorId"], "doctor": m["toDoctorName"]}
+        if seats or data.get("seats"):
+            update["seats"] = seats
+        transaction.update(_reservation_ref(db, m["userId"], m["id"]), update)
+    for sid in sorted(touched):
+        snap = shard_snaps[sid]
+        if snap.exists:
+            transaction.update(snap.reference, {"count": shard_counts[sid]})
+            continue
+        transaction.set(snap.reference, {**new_shards[sid], "department": department, "count": shard_counts[sid]})
+    return stale
+
+
+def reassign_absent_doctor(doctor_id: str, date_from: str, date_to: str, *, dry_run: bool = False) -> dict[str, Any]:
+    """
+    休診医師の予約を同じ診療科の他の医師（同日・同時刻）へ一括で振り替える。
+    読み取りは 医師1件 + 同科医師1回 + 対象予約（30日ごと）+ 他医師の予約（30日ごと）の一括クエリのみ。
+    dry_run=True なら計画だけ返し、書き込みは行わない。
+    戻り値: {"doctorId", "department", "dryRun", "moved": [...], "unplaced": [...]}
+    """
+    doctor_id = (doctor_id or "").strip()
+    if not doctor_id:
+        raise ValueError("医師IDが必要です。")
+    dates = _date_range((date_from or "").strip(), (date_to or "").strip())
+
+    db = _get_firestore()
+    snap = db.collection("doctors").document(doctor_id).get()
+    if not snap.exists:
+        raise ValueError("指定された医師が見つかりません。")
+    department = (snap.to_dict() or {}).get("department") or ""
+
+    bookings = find_doctor_bookings(doctor_id, dates)
+    others = [d for d in _get_doctors_by_department(department) if d["id"] != doctor_id]
+    booking_dates = sorted({b["date"] for b in bookings})
+    reserved = _get_reservations_bulk([d["id"] for d in others], booking_dates) if others and booking_dates else set()
+    moves, unplaced = plan_reassignment(bookings, others, reserved, department)
+    logger.info(
+        "reassign_absent_doctor plan: doctor=%s %s..%s bookings=%d movable=%d unplaced=%d",
+        doctor_id, dates[0], dates[-1], len(bookings), len(moves), len(unplaced),
+    )
+
+    moved: list[dict[str, Any]] = []
+    if dry_run:
+        moved = moves
+    else:
+        for chunk in _chunks(moves):
+            try:
+                stale = _apply_moves(db.transaction(), db, doctor_id, department, chunk)
+                stale_keys = {(m["userId"], m["id"]) for m in stale}
+                moved.extend(m for m in chunk if (m["userId"], m["id"]) not in stale_keys)
+                unplaced.extend({**m, "reason": "changed"} for m in stale)
+            except Exception as e:
+                # 同時予約との競合など: 1件ずつ確定し直し、失敗分のみ未振替として報告
+                logger.warning("reassign_absent_doctor: chunk of %d failed, retrying one by one: %s", len(chunk), e)
+                for m in chunk:
+                    try:
+                        if _apply_moves(db.transaction(), db, doctor_id, department, [m]):
+                            unplaced.append({**m, "reason": "changed"})
+                        else:
+                            moved.append(m)
+                    except Exception as item_err:
+                        logger.warning("reassign_absent_doctor: %s/%s failed: %s", m["userId"], m["id"], item_err)
+                        unplaced.append({**m, "reason": "conflict"})
+
+    if not dry_run:
+        # 旧医師の枠が空き、新医師の枠が埋まる。診療科の空き状況（○×）が変わりうる日時を通知する
+        for date, time in sorted({(m["date"], t) for m in moved for t in _booking_times(m)}):
+            slot_events.notify(department, date, time)
+
+    return {
+        "doctorId": doctor_id,
+        "department": department,
+        "dryRun": dry_run,
+        "moved": [
+            {"userId": m["userId"], "id": m["id"], "date": m["date"], "time": m["time"], "toDoctorId": m["toDoctorId"]}
+            for m in moved
+        ],
+        "unplaced": [
+            {"userId": m["userId"], "id": m["id"], "date": m["date"], "time": m["time"], "reason": m["reason"]}
+            for m in unplaced
+        ],
+    }
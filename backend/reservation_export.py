@@ -0,0 +1,189 @@
+"""
+予約の一括エクスポート（受付・運用スタッフ向けの日次・月次出力）
+- 期間内の予約を collectionGroup("reservations") から date・time・ドキュメントパス順に EXPORT_PAGE_SIZE 件ずつ読み、
+  ページ末尾のスナップショットをカーソル（start_after）にして次のページへ進む。全件をメモリに載せない
+- 1ページ読むたびにその分の出力（CSV / NDJSON / Parquet）を bytes で yield するジェネレータを返す。
+  API は StreamingResponse、CLI（scripts.export_reservations）はファイルへそのまま書き出す
+- 診療科・医師（doctorId）で絞り込める
+- Parquet は pyarrow がある場合のみ（任意依存）。行グループ = 1ページで書き、書けた分から送る
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Iterator
+
+from storage import ASCENDING, DOCUMENT_ID, get_db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow は任意依存（Parquet 出力のみで使う）
+    pa = pq = None
+
+# 1回のクエリで読む件数
+EXPORT_PAGE_SIZE = max(1, int(os.environ.get("EXPORT_PAGE_SIZE", "500")))
+# 1回のエクスポートで指定できる最大日数（年次の集計まで）
+MAX_EXPORT_DAYS = 366
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# 出力する列（順序どおり）
+EXPORT_COLUMNS = (
+    "date", "time", "department", "doctorId", "doctor", "userId", "reservationId",
+    "purpose", "category", "duration", "createdAt",
+)
+
+
+def _validate_range(date_from: str, date_to: str) -> tuple[str, str]:
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date()
+        end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except (ValueError, TypeError) as e:
+        raise ValueError("日付は YYYY-MM-DD 形式で指定してください。") from e
+    if end < start:
+        raise ValueError("終了日は開始日以降を指定してください。")
+    if end - start >= timedelta(days=MAX_EXPORT_DAYS):
+        raise ValueError(f"期間は最大{MAX_EXPORT_DAYS}日までです。")
+    return start.isoformat(), end.isoformat()
+
+
+def _row(snap) -> dict[str, Any]:
+    """予約ドキュメント1件を出力用の行にする（パス: users/{uid}/reservations/{id}）"""
+    d = snap.to_dict() or {}
+    parts = snap.reference.path.split("/")
+    created = d.get("createdAt")
+    duration = d.get("duration")
+    return {
+        "date": str(d.get("date") or ""),
+        "time": str(d.get("time") or ""),
+        "department": str(d.get("department") or ""),
+        "doctorId": str(d.get("doctorId") or ""),
+        "doctor": str(d.get("doctor") or ""),
+        "userId": parts[1] if len(parts) >= 4 and parts[0] == "users" else "",
+        "reservationId": snap.id,
+        "purpose": str(d.get("purpose") or ""),
+        "category": str(d.get("category") or ""),
+        "duration": duration if isinstance(duration, int) and not isinstance(duration, bool) else None,
+        "createdAt": created.isoformat() if isinstance(created, datetime) else "",
+    }
+
+
+def iter_pages(
+    date_from: str, date_to: str, *, department: str = "", doctor_id: str = "", page_size: int | None = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """期間内の予約を1ページ（page_size 件以下の行のリスト）ずつ返す。保持するのは現在のページと末尾のカーソルだけ"""
+    date_from, date_to = _validate_range((date_from or "").strip(), (date_to or "").strip())
+    page_size = max(1, page_size or EXPORT_PAGE_SIZE)
+    query = get_db().collection_group("reservations")
+    if department:
+        query = query.where("department", "==", department)
+    if doctor_id:
+        query = query.where("doctorId", "==", doctor_id)
+    query = query.where("date", ">=", date_from).where("date", "<=", date_to)
+    query = query.order_by("date", direction=ASCENDING).order_by("time", direction=ASCENDING)
+    query = query.order_by(DOCUMENT_ID, direction=ASCENDING).limit(page_size)
+    last = None
+    while True:
+        docs = list((query.start_after(last) if last is not None else query).stream())
+        if not docs:
+            return
+        yield [_row(s) for s in docs]
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def _csv_chunks(pages: Iterator[list[dict[str, Any]]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, lineterminator="\r\n")
+    writer.writeheader()
+    # 先頭に BOM を付け、Excel で開いても日本語が化けないようにする
+    yield b"\xef\xbb\xbf" + buf.getvalue().encode("utf-8")
+    for rows in pages:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(pages: Iterator[list[dict[str, Any]]]) -> Iterator[bytes]:
+    for rows in pages:
+        yield "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in rows).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """ParquetWriter の書き込み先。書かれた bytes を溜めて take() で取り出す（tell() は通算の位置を返す）"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def _parquet_chunks(pages: Iterator[list[dict[str, Any]]]) -> Iterator[bytes]:
+    schema = pa.schema([
+        (c, pa.int64() if c == "duration" else pa.string()) for c in EXPORT_COLUMNS
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in pages:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_reservations(
+    date_from: str, date_to: str, fmt: str = "csv", *, department: str = "", doctor_id: str = "",
+    page_size: int | None = None,
+) -> Iterator[bytes]:
+    """
+    期間内の予約を fmt（csv / ndjson / parquet）で少しずつ出力するジェネレータを返す。
+    引数の検証（日付・形式・pyarrow の有無）は呼び出し時に行い、不正なら ValueError（出力開始前に返せるように）。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format は {', '.join(EXPORT_FORMATS)} のいずれかを指定してください。")
+    if fmt == "parquet" and pq is None:
+        raise ValueError("Parquet 出力には pyarrow が必要です。")
+    _validate_range((date_from or "").strip(), (date_to or "").strip())
+    pages = iter_pages(
+        date_from, date_to, department=(department or "").strip(), doctor_id=(doctor_id or "").strip(), page_size=page_size,
+    )
+    if fmt == "csv":
+        return _csv_chunks(pages)
+    if fmt == "ndjson":
+        return _ndjson_chunks(pages)
+    return _parquet_chunks(pages)
+
+
+def export_filename(date_from: str, date_to: str, fmt: str) -> str:
+    return f"reservations_{date_from}_{date_to}.{fmt}"
@@ -1,65 +1,84 @@
 """
 予約・空き枠の業務ロジック（バックエンド専用）
-- 勤務判定・空き判定・医師割当はすべてここで行う
+- 勤務判定・空き判定・医師割当はすべてバックエンドで行う（純粋ロジックは slot_logic.py）
+- Firestore へは storage.py 経由でアクセスし、firebase_admin は初回アクセス時まで import しない
 - フロントは API の { time, reservable } のみ表示する
 - 予約の正規情報は Firestore（doctorId 付き）で、キャンセル時もスロットが正しく解放される
 - 環境変数 USE_DEMO_SLOTS=1 のとき、医師データが無い場合にデモ用の○を返す（シード未実行時用）
 """
 from __future__ import annotations
 
+import base64
+import json
 import logging
-import math
 import os
 import threading
-from datetime import datetime
-from typing import Any
-
-from firebase_admin import firestore
+import time as time_mod
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Iterable
+
+# slot_logic の関数は従来どおり reservation_service からも参照できるよう再エクスポートする
+from slot_logic import (  # noqa: F401
+    TIME_SLOTS,
+    WEEKDAY_KEYS,
+    _autumnal_equinox_day,
+    _demo_reservable,
+    _is_japanese_holiday,
+    _is_working,
+    _normalize_schedules,
+    _nth_monday,
+    _vernal_equinox_day,
+    _weekday_key,
+    _SLOT_INDEX,
+    ASSIGN_STRATEGIES,
+    DEFAULT_ASSIGN_STRATEGY,
+    FULL_DAY_MASK,
+    SLOT_MINUTES_STEP,
+    appointment_minutes,
+    appointment_slots,
+    assign_doctor,
+    available_for_run,
+    classify_date,
+    compute_availability,
+    compute_doctor_grid,
+    degraded_day,
+    longest_appointment_slots,
+    apply_user_booked,
+    order_candidates,
+    slot_capacity,
+    slot_run,
+    start_mask,
+)
+import availability_cache
+import deadline
+import metrics
+import shared_availability
+import slot_counters
+import slot_events
+import store
+import user_booked_cache
+from admission import Overloaded
+from log_setup import SAMPLED
+from singleflight import SingleFlight
+from storage import ASCENDING, DESCENDING, DOCUMENT_ID, get_db, is_aborted, is_already_exists, server_timestamp, transactional
 
 logger = logging.getLogger(__name__)
 
-from firebase_admin_client import init_firebase_admin
-
-# 15分刻み 09:00〜16:45（フロント getTimeSlots と一致）
-TIME_SLOTS = [
-    f"{h:02d}:{m:02d}"
-    for h in range(9, 17)
-    for m in (0, 15, 30, 45)
-]
-
-WEEKDAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
-
 
 def _get_firestore():
-    init_firebase_admin()
-    return firestore.client()
-
-
-def _weekday_key(date_str: str) -> str:
-    """YYYY-MM-DD → mon, tue, ... (0=Mon)"""
-    try:
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        return WEEKDAY_KEYS[dt.weekday()]
-    except (ValueError, IndexError):
-        return "sun"
-
-
-def _normalize_schedules(schedules: dict[str, Any] | None) -> dict[str, list[str]]:
-    """schedules を WEEKDAY_KEYS ごとの list に正規化（キー欠損・非list を [] に）"""
-    schedules = schedules or {}
-    out: dict[str, list[str]] = {}
-    for k in WEEKDAY_KEYS:
-        val = schedules.get(k)
-        out[k] = list(val) if isinstance(val, list) else []
-    return out
+    return get_db()
 
 
 def _get_doctors_by_department(department_label: str) -> list[dict[str, Any]]:
-    """Firestore doctors から診療科（表示名）で医師一覧を取得"""
+    """Firestore doctors から診療科（表示名）で医師一覧を取得（ローカルレプリカが使えればそちらを読む）"""
+    replica = store.get_replica()
+    if replica is not None:
+        return replica.doctors_by_department(department_label)
     db = _get_firestore()
     coll = db.collection("doctors")
     q = coll.where("department", "==", department_label.strip())
-    snap = q.stream()
+    snap = deadline.call("doctors", lambda timeout: list(q.stream(timeout=timeout)))
     out = []
     for doc in snap:
         d = doc.to_dict()
@@ -69,6 +88,7 @@ def _get_doctors_by_department(department_label: str) -> list[dict[str, Any]]:
             "name": d.get("name") or "",
             "department": d.get("department") or "",
             "schedules": schedules,
+            "capacity": d.get("capacity"),
         })
     return out
 
@@ -78,138 +98,223 @@ def _slot_doc_id(doctor_id: str, date: str, time: str) -> str:
     return f"{doctor_id}_{date}_{time}"
 
 
-def _has_reservation(doctor_id: str, date: str, time: str) -> bool:
+def _get_slot_candidates(
+    department_label: str, date: str, time: str, slots_needed: int = 1,
+) -> tuple[list[dict[str, Any]], dict[str, int]]:
     """
-    該当医師・日・時間のスロットが予約済みか。
-    booked_slots（高速）を先にチェックし、なければ reservations（正規データ）も確認する。
-    これにより booked_slots マイグレーション未実施でも正しく判定できる。
+    その診療科・日・時間から slots_needed 枠続けて空いている医師と、医師ごとのその日の予約数を返す。
+    医師取得1回 + 予約一括取得1回（その日の分）で完結し、医師数に比例した読み取りをしない。
     """
-    db = _get_firestore()
-    # 1. booked_slots チェック（O(1) ドキュメント読み取り）
-    slot_doc = db.collection("booked_slots").document(_slot_doc_id(doctor_id, date, time)).get()
-    if slot_doc.exists:
-        return True
-    # 2. フォールバック: reservations collectionGroup チェック
-    q = (db.collection_group("reservations")
-         .where("doctorId", "==", doctor_id)
-         .where("date", "==", date)
-         .where("time", "==", time)
-         .limit(1))
-    return len(list(q.stream())) > 0
-
-
-def _is_working(doctor: dict[str, Any], date: str, time: str) -> bool:
-    """その日・その時間に勤務しているか（schedules の配列に time が含まれるか）"""
-    key = _weekday_key(date)
-    slots = doctor.get("schedules") or {}
-    arr = slots.get(key) or []
-    return time in arr
-
-
-def _get_available_doctors(department_label: str, date: str, time: str) -> list[dict[str, Any]]:
-    """その診療科・日・時間で空いている医師一覧（勤務かつ未予約）"""
     doctors = _get_doctors_by_department(department_label)
-    return [
-        d for d in doctors
-        if _is_working(d, date, time) and not _has_reservation(d["id"], date, time)
-    ]
+    if not doctors:
+        return [], {}
+    reserved = _get_reservations_bulk([d["id"] for d in doctors], [date])
+    load = Counter(did for did, _, _ in reserved)
+    return available_for_run(doctors, date, time, reserved, slots_needed), dict(load)
 
 
-def is_reservable(department_label: str, date: str, time: str) -> bool:
+def _appointment_run(department_label: str, time: str, purpose: str = "") -> list[str]:
     """
-    診療科・日・時間で予約可能か（1人でも空いていれば True）。
-    get_slots（availability API）と create_reservation の両方で使用する共通判定。
+    予約が占める枠の時刻の列（time から所要時間分の連続枠）。
+    開始時刻が診療科の刻み（start_mask）に合わない・診療時間をはみ出す場合は ValueError（利用者向けメッセージ）。
     """
-    return len(_get_available_doctors(department_label, date, time)) > 0
+    times = slot_run(time, appointment_slots(department_label, purpose))
+    if not times or not start_mask(department_label) >> _SLOT_INDEX[time] & 1:
+        raise ValueError("この時間は現在予約できません。別の時間をお選びください。")
+    return times
 
 
-def assign_doctor(available_doctors: list[dict[str, Any]]) -> dict[str, Any] | None:
-    """空いている医師から1人を選択（先頭を返す）"""
-    if not available_doctors:
-        return None
-    return available_doctors[0]
+def _assign_strategy() -> str:
+    """環境変数 ASSIGN_STRATEGY（不正値は既定値）"""
+    strategy = os.environ.get("ASSIGN_STRATEGY", DEFAULT_ASSIGN_STRATEGY).strip()
+    return strategy if strategy in ASSIGN_STRATEGIES else DEFAULT_ASSIGN_STRATEGY
 
 
-def _nth_monday(year: int, month: int, n: int) -> int:
-    """year/month の第n月曜の日を返す（weekday(): 0=Mon）"""
-    first = datetime(year, month, 1)
-    return (n - 1) * 7 + 1 + (7 - first.weekday()) % 7
+def _is_expired_hold(data: dict[str, Any], now: datetime | None = None) -> bool:
+    """booked_slots のドキュメントが期限切れの仮押さえか（slot_holds 参照）"""
+    if not data.get("hold"):
+        return False
+    expires_at = data.get("expiresAt")
+    if not isinstance(expires_at, datetime):
+        return True
+    return expires_at <= (now or datetime.now(timezone.utc))
 
 
-def _vernal_equinox_day(year: int) -> int:
-    """春分の日（簡易天文計算: 2000〜2099年用）"""
-    return math.floor(20.8431 + 0.242194 * (year - 1980) - math.floor((year - 1980) / 4))
+@transactional
+def _reclaim_expired_hold(transaction, slot_ref) -> bool:
+    """スロットが期限切れの仮押さえなら削除する。削除したら True。"""
+    snap = slot_ref.get(transaction=transaction)
+    if not snap.exists or not _is_expired_hold(snap.to_dict() or {}):
+        return False
+    transaction.delete(slot_ref)
+    return True
 
 
-def _autumnal_equinox_day(year: int) -> int:
-    """秋分の日（簡易天文計算: 2000〜2099年用）"""
-    return math.floor(23.2488 + 0.242194 * (year - 1980) - math.floor((year - 1980) / 4))
+@transactional
+def _create_run(transaction, slot_refs: list[Any], datas: list[dict[str, Any]]) -> bool:
+    """
+    連続枠をまとめて確保する（全部空いていれば全部書き、1つでも埋まっていれば何も書かない）。
+    期限切れの仮押さえは空きとして上書きする。確保できたら True。
+    """
+    for snap in transaction.get_all(slot_refs):
+        if snap.exists and not _is_expired_hold(snap.to_dict() or {}):
+            return False
+    for ref, data in zip(slot_refs, datas):
+        transaction.set(ref, data)
+    return True
 
 
-def _is_japanese_holiday(date_str: str) -> bool:
-    """日本の祝日かどうか。フロント utils/holiday.js isJapaneseHoliday と同一条件にすること。"""
-    try:
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-    except (ValueError, TypeError):
-        return False
-    y, m, d = dt.year, dt.month, dt.day
-    # 固定祝日
-    fixed = [
-        (1, 1),    # 元日
-        (2, 11),   # 建国記念の日
-        (2, 23),   # 天皇誕生日（令和）
-        (4, 29),   # 昭和の日
-        (5, 3),    # 憲法記念日
-        (5, 4),    # みどりの日
-        (5, 5),    # こどもの日
-        (8, 11),   # 山の日
-        (11, 3),   # 文化の日
-        (11, 23),  # 勤労感謝の日
-    ]
-    if (m, d) in fixed:
-        return True
-    # 成人の日（1月第2月曜）
-    if m == 1 and d == _nth_monday(y, 1, 2):
-        return True
-    # 春分の日
-    if m == 3 and d == _vernal_equinox_day(y):
-        return True
-    # 海の日（7月第3月曜）
-    if m == 7 and d == _nth_monday(y, 7, 3):
-        return True
-    # 敬老の日（9月第3月曜）
-    if m == 9 and d == _nth_monday(y, 9, 3):
-        return True
-    # 秋分の日
-    if m == 9 and d == _autumnal_equinox_day(y):
-        return True
-    # スポーツの日（10月第2月曜）
-    if m == 10 and d == _nth_monday(y, 10, 2):
-        return True
-    return False
+def _claim_run(
+    db, candidates: list[dict[str, Any]], department_label: str, date: str, times: list[str], user_id: str, *,
+    strategy: str = "first", extra: dict[str, Any] | None = None,
+) -> tuple[dict[str, Any] | None, list[str]]:
+    """
+    連続 len(times) 枠を原子的に確保する（1枠なら _claim_slot と同じ）。
+    複数枠は candidates の順に、医師ごとに1トランザクションで全枠を読んでから書く。
+    同時に重なる枠を確保しようとした側はトランザクションの再試行で埋まっていることを見て次の医師へ進む。
+    戻り値: (確保できた医師, booked_slots のドキュメントIDの列)。全滅なら (None, [])
+    """
+    if len(times) == 1:
+        doctor, sid = _claim_slot(db, candidates, department_label, date, times[0], user_id, strategy=strategy, extra=extra)
+        return doctor, [sid] if sid else []
+    for candidate in candidates:
+        cand_id = str(candidate.get("id") or "").strip()
+        if not cand_id:
+            continue
+        sids = [_slot_doc_id(cand_id, date, t) for t in times]
+        datas = [{
+            "doctorId": cand_id,
+            "date": date,
+            "time": t,
+            "department": department_label,
+            "userId": user_id,
+            "createdAt": server_timestamp(),
+            **(extra or {}),
+        } for t in times]
+        metrics.incr("slot_claim_attempts")
+        if _create_run(db.transaction(), [db.collection("booked_slots").document(sid) for sid in sids], datas):
+            logger.info("Slots locked: %s", ",".join(sids), extra=SAMPLED)
+            return candidate, sids
+        metrics.incr("slot_claim_collisions")
+        metrics.incr(f"slot_claim_collisions.{strategy}")
+        logger.info("Slots %s already taken, trying next doctor", sids[0], extra=SAMPLED)
+    return None, []
+
+
+def _claim_slot(
+    db, candidates: list[dict[str, Any]], department_label: str, date: str, time: str, user_id: str, *,
+    strategy: str = "first", extra: dict[str, Any] | None = None,
+) -> tuple[dict[str, Any] | None, str]:
+    """
+    Firestore 原子的スロット確保。
+    candidates の順に booked_slots/{doctorId}_{date}_{time} を create() で確保する。
+    create() はドキュメントが既に存在する場合に例外を投げるため、
+    同時リクエストでも1つだけが成功する（Firestore レベルのアトミック保証）。
+    衝突（ALREADY_EXISTS）は slot_claim_collisions として数える。
+    既存ドキュメントが期限切れの仮押さえなら、その場で削除して確保し直す。
+    extra は追加で書き込むフィールド（仮押さえの holdId・expiresAt など）。
+    戻り値: (確保できた医師, booked_slots のドキュメントID)。全滅なら (None, "")
+    """
+    for candidate in candidates:
+        cand_id = str(candidate.get("id") or "").strip()
+        if not cand_id:
+            continue
+        sid = _slot_doc_id(cand_id, date, time)
+        slot_ref = db.collection("booked_slots").document(sid)
+        data = {
+            "doctorId": cand_id,
+            "date": date,
+            "time": time,
+            "department": department_label,
+            "userId": user_id,
+            "createdAt": server_timestamp(),
+            **(extra or {}),
+        }
+        for attempt in range(2):
+            metrics.incr("slot_claim_attempts")
+            try:
+                slot_ref.create(data)
+                # create() が成功 = このスロットを確保できた
+                logger.info("Slot locked: %s", sid, extra=SAMPLED)
+                return candidate, sid
+            except Exception as e:
+                if not is_already_exists(e):
+                    logger.exception("Unexpected error creating slot %s: %s", sid, e)
+                    raise
+            # ALREADY_EXISTS = 他のリクエストが先に確保済み。期限切れの仮押さえなら1回だけ取り直す
+            if attempt == 0 and _reclaim_expired_hold(db.transaction(), slot_ref):
+                metrics.incr("slot_holds_reclaimed")
+                logger.info("Reclaimed expired hold on slot %s", sid)
+                continue
+            metrics.incr("slot_claim_collisions")
+            metrics.incr(f"slot_claim_collisions.{strategy}")
+            logger.info("Slot %s already taken, trying next doctor", sid, extra=SAMPLED)
+            break
+    return None, ""
 
 
-def _demo_reservable(date_str: str, time_str: str) -> bool:
-    """デモ用: 平日の 09:00〜11:45 を予約可とする（シード未実行時用）"""
-    try:
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        if dt.weekday() >= 5:  # 土日は×
-            return False
-    except (ValueError, TypeError):
-        return False
-    demo_times = [t for t in TIME_SLOTS if t < "12:00"]  # 09:00〜11:45
-    return time_str in demo_times
+def _claim_booking(
+    db, candidates: list[dict[str, Any]], department_label: str, date: str, times: list[str], user_id: str, *,
+    strategy: str = "first",
+) -> tuple[dict[str, Any] | None, list[str], list[str]]:
+    """
+    candidates の順に予約枠を確保する。定員1の医師は booked_slots（_claim_run）、
+    定員2以上の医師は分散カウンター（slot_counters.claim_seats）で1席ずつ確保する。
+    戻り値: (確保できた医師, booked_slots のドキュメントIDの列, カウンターのシャードIDの列)。全滅なら (None, [], [])。
+    カウンターの競合で取り直しても確保できなかった医師があり、他の医師でも確保できなければ、満枠ではないので
+    admission.Overloaded（503 + Retry-After）を送出する。
+    """
+    contended = False
+    for candidate in candidates:
+        cand_id = str(candidate.get("id") or "").strip()
+        capacity = slot_capacity(candidate, department_label)
+        if not cand_id:
+            continue
+        if capacity <= 1:
+            doctor, sids = _claim_run(db, [candidate], department_label, date, times, user_id, strategy=strategy)
+            if doctor is not None:
+                return doctor, sids, []
+            continue
+        metrics.incr("slot_claim_attempts")
+        try:
+            seats = slot_counters.claim_seats(db, cand_id, department_label, date, times, capacity)
+        except Exception as e:
+            if not is_aborted(e):
+                raise
+            # 同じ枠への同時予約が多く取り直しても競合した（席は残っている）。次の医師を試し、全滅なら混雑として断る
+            metrics.incr("slot_claim_contended")
+            logger.info("Seats of %s_%s_%s contended, trying next doctor", cand_id, date, times[0], extra=SAMPLED)
+            contended = True
+            continue
+        if seats:
+            logger.info("Seats taken: %s", ",".join(seats), extra=SAMPLED)
+            return candidate, [], seats
+        metrics.incr("slot_claim_collisions")
+        metrics.incr(f"slot_claim_collisions.{strategy}")
+        logger.info("Slot %s_%s_%s is full, trying next doctor", cand_id, date, times[0], extra=SAMPLED)
+    if contended:
+        raise Overloaded(1, "seat_contention")
+    return None, [], []
 
 
-def get_slots(department_label: str, date: str) -> list[dict[str, str | bool]]:
+def is_reservable(department_label: str, date: str, time: str) -> bool:
+    """
+    診療科・日・時間で予約可能か（1人でも空いていれば True）。
+    get_slots（availability API）と create_reservation の両方で使用する共通判定。
     """
-    診療科・日付に対する全時間枠の予約可否を返す。
+    available, _ = _get_slot_candidates(department_label, date, time)
+    return len(available) > 0
+
+
+def get_slots(department_label: str, date: str, *, purpose: str = "") -> list[dict[str, str | bool]]:
+    """
+    診療科・日付に対する全時間枠の予約可否を返す（purpose の所要時間分の連続枠が取れる開始枠が○）。
     内部で get_availability_for_dates を使い、Firestore クエリ2回で完結（N+1 解消）。
     """
     if not department_label or not date:
         return [{"time": t, "reservable": False} for t in TIME_SLOTS]
     try:
-        results = get_availability_for_dates(department_label, [date])
+        results = get_availability_for_dates(department_label, [date], purpose=purpose)
         if results and len(results) > 0:
             return results[0].get("slots", [{"time": t, "reservable": False} for t in TIME_SLOTS])
     except Exception:
@@ -220,205 +325,236 @@ def get_slots(department_label: str, date: str) -> list[dict[str, str | bool]]:
 def _get_reservations_bulk(doctor_ids: list[str], dates: list[str]) -> set[tuple[str, str, str]]:
     """
     複数医師・複数日付の予約済みスロットを一括取得し、(doctorId, date, time) の set を返す。
-    booked_slots と reservations の両方を確認しマージする。
+    booked_slots と reservations の両方を確認しマージする。定員制の枠は満席のものだけを含める。
     これにより booked_slots マイグレーション未実施でも正しく判定できる。
+    ローカルレプリカ（store）が使える場合は booked_slots のレプリカだけを読む。
+    読み取りは期限内で行い（deadline.call）、失敗・期限切れは例外のまま送出する
+    （一部だけ読めた結果を返すと予約済みの枠を空きと誤判定するため。呼び出し側で縮退表示にする）。
     """
     if not doctor_ids or not dates:
         return set()
+    replica = store.get_replica()
+    if replica is not None:
+        return replica.reserved_slots(doctor_ids, dates)
     db = _get_firestore()
     reserved: set[tuple[str, str, str]] = set()
     doctor_id_set = set(doctor_ids)
     chunk_size = 30
+    now = datetime.now(timezone.utc)
 
     for i in range(0, len(dates), chunk_size):
         date_chunk = dates[i:i + chunk_size]
 
-        # 1. booked_slots から取得
-        try:
-            q = db.collection("booked_slots").where("date", "in", date_chunk)
-            for doc in q.stream():
-                d = doc.to_dict()
-                did = d.get("doctorId", "")
-                if did in doctor_id_set:
-                    reserved.add((did, d.get("date", ""), d.get("time", "")))
-        except Exception as e:
-            logger.warning("_get_reservations_bulk booked_slots failed: %s", e)
-
-        # 2. reservations collectionGroup からも取得（フォールバック）
-        try:
-            q = db.collection_group("reservations").where("date", "in", date_chunk)
-            for doc in q.stream():
-                d = doc.to_dict()
-                did = d.get("doctorId", "")
-                if did in doctor_id_set:
-                    reserved.add((did, d.get("date", ""), d.get("time", "")))
-        except Exception as e:
-            logger.warning("_get_reservations_bulk reservations failed: %s", e)
+        # 1. booked_slots から取得（有効な仮押さえは予約済みとして扱い、期限切れは空きとみなす）
+        q = db.collection("booked_slots").where("date", "in", date_chunk)
+        for doc in deadline.call("booked_slots", lambda timeout: list(q.stream(timeout=timeout))):
+            d = doc.to_dict()
+            did = d.get("doctorId", "")
+            if did in doctor_id_set and not _is_expired_hold(d, now):
+                reserved.add((did, d.get("date", ""), d.get("time", "")))
+
+        # 2. reservations collectionGroup からも取得（フォールバック。定員制の枠の予約は 3. で数える）
+        q = db.collection_group("reservations").where("date", "in", date_chunk)
+        for doc in deadline.call("reservations", lambda timeout: list(q.stream(timeout=timeout))):
+            d = doc.to_dict()
+            did = d.get("doctorId", "")
+            if did in doctor_id_set and not d.get("seats"):
+                reserved.add((did, d.get("date", ""), d.get("time", "")))
+
+        # 3. 定員制の枠は分散カウンターの合計が定員に達したものだけ満枠とする
+        q = db.collection(slot_counters.COLLECTION).where("date", "in", date_chunk)
+        docs = deadline.call(slot_counters.COLLECTION, lambda timeout: list(q.stream(timeout=timeout)))
+        shards = [d for d in (doc.to_dict() or {} for doc in docs) if d.get("doctorId", "") in doctor_id_set]
+        reserved |= slot_counters.full_slots(shards)
 
     return reserved
 
 
+def _load_user_booked(user_id: str) -> set[tuple[str, str, str]]:
+    """ユーザーの今日以降の予約が占める枠 (department, date, time) を1クエリで取得する（user_booked_cache の読み込み用）"""
+    db = _get_firestore()
+    today = datetime.now().date().isoformat()
+    q = (
+        db.collection("users").document(user_id).collection("reservations")
+        .where("date", ">=", today)
+        .select(["department", "date", "time", "duration"])
+    )
+    booked: set[tuple[str, str, str]] = set()
+    for doc in deadline.call("user_reservations", lambda timeout: list(q.stream(timeout=timeout))):
+        d = doc.to_dict() or {}
+        dept, dt = d.get("department", ""), d.get("date", "")
+        if dept and dt:
+            booked.update((dept, dt, tm) for tm in _reservation_times(d))
+    return booked
+
+
 def _get_user_reservations_for_dates(user_id: str, department_label: str, dates: list[str]) -> set[tuple[str, str]]:
     """
-    指定ユーザーが指定診療科・指定日付で既に予約している (date, time) のセットを返す。
+    指定ユーザーが指定診療科・指定日付で既に予約している枠 (date, time) のセットを返す（複数枠の予約は占める枠すべて）。
     同一ユーザーの重複予約を防ぐために使用。
+    ユーザーの予約済み枠は user_booked_cache に保持し、週送りのたびに Firestore を読まない。
+    読み取りの失敗・期限切れは例外のまま送出する（空集合を返すと自分の予約済みの枠が○に見えるため）。
     """
     if not user_id or not department_label or not dates:
         return set()
-    db = _get_firestore()
-    booked: set[tuple[str, str]] = set()
-    chunk_size = 30
-    for i in range(0, len(dates), chunk_size):
-        date_chunk = dates[i:i + chunk_size]
+    booked = user_booked_cache.get(user_id, lambda: _load_user_booked(user_id))
+    wanted = set(dates)
+    return {(dt, tm) for dept, dt, tm in booked if dept == department_label and dt in wanted}
+
+
+# 同じ診療科・日付の空き計算が同時に来たら1回にまとめる（公開直後のアクセス集中向け）
+_availability_flight = SingleFlight("availability")
+
+
+def _split_dates(department_label: str, dates: list[str]) -> tuple[dict[str, dict[str, Any]], list[str]]:
+    """過去日・祝日などデータを見ずに決まる日と、計算が必要な日に分ける"""
+    today = datetime.now().date()
+    decided: dict[str, dict[str, Any]] = {}
+    dates_to_compute: list[str] = []
+    for date in dates:
+        result = classify_date(department_label, date, today)
+        if result is not None:
+            decided[date] = result
+        elif date not in dates_to_compute:
+            dates_to_compute.append(date)
+    return decided, dates_to_compute
+
+
+def _compute_base_availability(
+    department_label: str, dates_to_compute: list[str], use_demo: bool,
+    slots_needed: int = 1, starts: int = FULL_DAY_MASK,
+) -> tuple[bool, dict[str, dict[str, Any]]]:
+    """
+    ユーザーに依存しない空き状況（医師取得1回 + 予約取得1回）。
+    slots_needed・starts は予約1件の枠数と開始できる枠（slot_logic.compute_availability 参照）。
+    戻り値: (医師がいるか, 日付 → 1日分の結果)。結果はシングルフライトで他の呼び出しと共有するため変更しないこと。
+    医師・予約の読み取りに失敗した（期限切れを含む）日は推測で○×を出さず、縮退結果（degraded_day）にする。
+    """
+    reserved: set[tuple[str, str, str]] = set()
+    try:
+        # 医師取得（1回のみ）
+        doctors = _get_doctors_by_department(department_label)
+        if doctors:
+            # 予約一括取得（1回のみ）
+            reserved = _get_reservations_bulk([doc["id"] for doc in doctors], dates_to_compute)
+    except Exception as e:
+        metrics.incr("availability_degraded")
+        logger.warning("get_availability_for_dates: read failed, returning degraded result: %r", e)
+        return False, {date: degraded_day(date) for date in dates_to_compute}
+
+    # メモリ上で各日・各時間の空き判定
+    return bool(doctors), compute_availability(
+        dates_to_compute, doctors, reserved, use_demo=use_demo, slots_needed=slots_needed, starts=starts,
+    )
+
+
+def _finish_availability(
+    department_label: str, dates: list[str], decided: dict[str, dict[str, Any]],
+    base: tuple[bool, dict[str, dict[str, Any]]], user_id: str, slots_needed: int = 1,
+) -> list[dict[str, Any]]:
+    """共有の計算結果にユーザーの既存予約（×）を重ね、dates の順に並べる（slots_needed は予約1件の枠数）"""
+    has_doctors, computed = base
+    results = {**decided, **computed}
+    # ユーザーの既存予約を×にする（同一ユーザーが同じ診療科+日+時間を二重予約するのを防止）
+    if user_id and has_doctors and computed:
         try:
-            ref = db.collection("users").document(user_id).collection("reservations")
-            q = ref.where("department", "==", department_label).where("date", "in", date_chunk)
-            for doc in q.stream():
-                d = doc.to_dict()
-                dt = d.get("date", "")
-                tm = d.get("time", "")
-                if dt and tm:
-                    booked.add((dt, tm))
+            user_booked = _get_user_reservations_for_dates(user_id, department_label, list(computed))
         except Exception as e:
-            logger.warning("_get_user_reservations_for_dates failed: %s", e)
-    return booked
+            # 自分の予約が×にならないだけで空き自体は正しいため、○×はそのままに degraded を付けて返す
+            metrics.incr("availability_degraded")
+            logger.warning("get_availability_for_dates: user reservation fetch failed: %r", e)
+            for date, day in computed.items():
+                results[date] = {**day, "degraded": True}
+            return [results[d] for d in dates]
+        if user_booked:
+            for date, day in computed.items():
+                results[date] = apply_user_booked(day, user_booked, slots_needed)
+    return [results[d] for d in dates]
+
+
+def _base_availability_key(department_label: str, dates_to_compute: list[str], use_demo: bool, purpose: str) -> tuple:
+    """シングルフライトのキー。所要時間・開始刻みが同じ種別どうしは同じ計算を共有する"""
+    return (department_label, tuple(dates_to_compute), use_demo, appointment_slots(department_label, purpose), start_mask(department_label))
+
+
+def _compute_and_cache(key: tuple) -> tuple[bool, dict[str, dict[str, Any]]]:
+    """_compute_base_availability を実行し、結果を availability_cache に入れる（key は _base_availability_key）"""
+    department_label, dates, use_demo, slots_needed, starts = key
+    started = availability_cache.generation(department_label, list(dates))
+    stored_at = time_mod.monotonic()
+    base = _compute_base_availability(department_label, list(dates), use_demo, slots_needed, starts)
+    availability_cache.store((department_label, use_demo, slots_needed, starts), base, started, stored_at)
+    return base
+
+
+def _lookup_cached(key: tuple) -> tuple[bool, dict[str, dict[str, Any]]] | None:
+    """availability_cache に key の全日付分があれば返す"""
+    department_label, dates, use_demo, slots_needed, starts = key
+    return availability_cache.lookup((department_label, use_demo, slots_needed, starts), list(dates))
 
 
-def get_availability_for_dates(department_label: str, dates: list[str], *, user_id: str = "") -> list[dict[str, Any]]:
+def _lookup_shared(department_label: str, dates_to_compute: list[str], use_demo: bool, purpose: str):
+    """共有メモリの空き状況を引く。共有するのは1枠・どの枠からでも開始できる場合の結果だけ"""
+    if appointment_slots(department_label, purpose) != 1 or start_mask(department_label) != FULL_DAY_MASK:
+        return None
+    return shared_availability.lookup(department_label, dates_to_compute, use_demo)
+
+
+def get_availability_for_dates(
+    department_label: str, dates: list[str], *, user_id: str = "", purpose: str = "",
+) -> list[dict[str, Any]]:
     """
     複数日分の空き状況を一括で返す（高速版）。
     医師取得1回 + 予約取得1回 = Firestore 2クエリで全日分を計算。
+    purpose（種別）から予約1件の枠数を決め、その枠数だけ連続して空いている開始枠を○にする。
+    共有メモリの空き状況（shared_availability）が使えれば問い合わせない。
+    同じ診療科・日付の計算が実行中なら、新たに問い合わせずその結果を待って使う（シングルフライト）。
     user_id が指定された場合、そのユーザーが既に予約済みのスロットも reservable=False にする。
+    判定そのものは slot_logic（Firebase 非依存）で行い、ここでは I/O のみ担当する。
+    返す dict は他の呼び出しと共有されることがあるため、呼び出し側で変更しないこと。
     """
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     use_demo = os.environ.get("USE_DEMO_SLOTS", "1").strip() != "0"
-    all_false = [{"time": t, "reservable": False} for t in TIME_SLOTS]
-
-    # 過去日・祝日は即決定
-    results: dict[str, dict[str, Any]] = {}
-    dates_to_compute: list[str] = []
-    for date in dates:
-        if not date or not department_label:
-            results[date] = {"date": date or "", "is_holiday": False, "reservable": False, "reason": "closed", "slots": all_false}
-            continue
-        try:
-            dt = datetime.strptime(date, "%Y-%m-%d")
-            if dt.date() < today.date():
-                results[date] = {"date": date, "is_holiday": False, "reservable": False, "reason": "past", "slots": all_false}
-                continue
-        except (ValueError, TypeError):
-            results[date] = {"date": date, "is_holiday": False, "reservable": False, "reason": "closed", "slots": all_false}
-            continue
-        if _is_japanese_holiday(date):
-            results[date] = {"date": date, "is_holiday": True, "reservable": False, "reason": "holiday", "slots": all_false}
-            continue
-        dates_to_compute.append(date)
+    decided, dates_to_compute = _split_dates(department_label, dates)
 
     # 計算対象の日付がなければ即返却
     if not dates_to_compute:
-        return [results[d] for d in dates]
+        return [decided[d] for d in dates]
 
-    # 医師取得（1回のみ）
-    try:
-        doctors = _get_doctors_by_department(department_label)
-    except Exception:
-        doctors = []
+    # 読み取りはリクエストごとの期限内で行う（deadline。呼び出し側に短い期限があればそちら）
+    with deadline.budget():
+        # 複数ワーカー運用時はホスト共有の空き状況を先に見る（無効・古い・未登録なら None で通常の計算）
+        base = _lookup_shared(department_label, dates_to_compute, use_demo, purpose)
+        if base is None:
+            key = _base_availability_key(department_label, dates_to_compute, use_demo, purpose)
+            base = _lookup_cached(key) or _availability_flight.do(key, lambda: _compute_and_cache(key))
+        return _finish_availability(department_label, dates, decided, base, user_id, appointment_slots(department_label, purpose))
 
-    if not doctors and use_demo:
-        for date in dates_to_compute:
-            slot_list = [{"time": t, "reservable": _demo_reservable(date, t)} for t in TIME_SLOTS]
-            any_ok = any(s["reservable"] for s in slot_list)
-            results[date] = {"date": date, "is_holiday": False, "reservable": any_ok, "reason": None, "slots": slot_list}
-        return [results[d] for d in dates]
 
-    if not doctors:
-        for date in dates_to_compute:
-            results[date] = {"date": date, "is_holiday": False, "reservable": False, "reason": None, "slots": all_false}
-        return [results[d] for d in dates]
-
-    # 予約一括取得（1回のみ）
-    doctor_ids = [doc["id"] for doc in doctors]
-    doctor_id_set = set(doctor_ids)
-    try:
-        reserved = _get_reservations_bulk(doctor_ids, dates_to_compute)
-    except Exception as e:
-        logger.warning("get_availability_for_dates: bulk reservation fetch failed: %s", e)
-        reserved = set()
-
-    # ユーザーの既存予約を取得（同一ユーザーが同じ診療科+日+時間を二重予約するのを防止）
-    user_booked: set[tuple[str, str]] = set()
-    if user_id:
-        try:
-            user_booked = _get_user_reservations_for_dates(user_id, department_label, dates_to_compute)
-        except Exception as e:
-            logger.warning("get_availability_for_dates: user reservation fetch failed: %s", e)
-
-    # メモリ上で各日・各時間の空き判定
-    # ルール: 勤務中かつ未予約の医師が1人でもいれば○（ただしユーザー既存予約は×）
-    for date in dates_to_compute:
-        slot_list = []
-        for t in TIME_SLOTS:
-            # このユーザーが既に同じ診療科+日+時間で予約済みなら×
-            if (date, t) in user_booked:
-                slot_list.append({"time": t, "reservable": False})
-                continue
-            available = False
-            for doc in doctors:
-                if _is_working(doc, date, t) and (doc["id"], date, t) not in reserved:
-                    available = True
-                    break
-            slot_list.append({"time": t, "reservable": available})
-        any_ok = any(s["reservable"] for s in slot_list)
-        results[date] = {"date": date, "is_holiday": False, "reservable": any_ok, "reason": None, "slots": slot_list}
-
-    return [results[d] for d in dates]
+def warm_availability(department_label: str, dates: list[str], *, purpose: str = "") -> bool:
+    """
+    dates のユーザーに依存しない空き状況を計算して availability_cache に入れる（prefetch 用）。
+    計算不要（過去日・祝日のみ）・共有メモリやキャッシュに既にある場合は何もしない。計算したら True。
+    読み取りの期限は呼び出し側の deadline に従い、縮退結果はキャッシュされない。
+    """
+    use_demo = os.environ.get("USE_DEMO_SLOTS", "1").strip() != "0"
+    _, dates_to_compute = _split_dates(department_label, dates)
+    if not dates_to_compute or _lookup_shared(department_label, dates_to_compute, use_demo, purpose) is not None:
+        return False
+    key = _base_availability_key(department_label, dates_to_compute, use_demo, purpose)
+    if availability_cache.contains((key[0], key[2], key[3], key[4]), dates_to_compute):
+        return False
+    _availability_flight.do(key, lambda: _compute_and_cache(key))
+    return True
 
 
-def get_availability_for_date(department_label: str, date: str, *, user_id: str = "") -> dict[str, Any]:
+def get_availability_for_date(department_label: str, date: str, *, user_id: str = "", purpose: str = "") -> dict[str, Any]:
     """
     1日分の空き状況を返す。祝日・過去日はバックエンドで判定し、レスポンスに含める。
     判定優先: 過去日 → 祝日 → 休診 → 医師勤務なし → 可。
     user_id が指定された場合、そのユーザーの予約済みスロットも reservable=False にする。
     """
-    slots = [{"time": t, "reservable": False} for t in TIME_SLOTS]
-    if not department_label or not date:
-        return {
-            "date": date or "",
-            "is_holiday": False,
-            "reservable": False,
-            "reason": "closed",
-            "slots": slots,
-        }
-    try:
-        dt = datetime.strptime(date, "%Y-%m-%d")
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        if dt.date() < today.date():
-            return {
-                "date": date,
-                "is_holiday": False,
-                "reservable": False,
-                "reason": "past",
-                "slots": slots,
-            }
-    except (ValueError, TypeError):
-        return {
-            "date": date,
-            "is_holiday": False,
-            "reservable": False,
-            "reason": "closed",
-            "slots": slots,
-        }
-    # 祝日は必ず is_holiday: True と全枠 reservable: False を返す（フロントは isHoliday で表示制御）
-    if _is_japanese_holiday(date):
-        return {
-            "date": date,
-            "is_holiday": True,
-            "reservable": False,
-            "reason": "holiday",
-            "slots": slots,
-        }
     # user_id を伝播するため get_availability_for_dates を直接使用
-    results = get_availability_for_dates(department_label, [date], user_id=user_id)
+    results = get_availability_for_dates(department_label, [date], user_id=user_id, purpose=purpose)
     if results:
         return results[0]
     return {
@@ -426,10 +562,40 @@ def get_availability_for_date(department_label: str, date: str, *, user_id: str
         "is_holiday": False,
         "reservable": False,
         "reason": None,
+        "degraded": False,
         "slots": [{"time": t, "reservable": False} for t in TIME_SLOTS],
     }
 
 
+def get_doctor_grid(department_label: str, date: str) -> dict[str, Any]:
+    """
+    診療科・日付の医師 × 時間枠の表（working / booked / free）を返す（担当医の空き一覧画面用）。
+    get_availability_for_dates と同じく医師取得1回 + 予約一括取得1回で全医師分を計算し、医師ごとに問い合わせない。
+    過去日・祝日の判定は classify_date と同じ（reason に "past" / "holiday"）。日付が不正なら reason="closed" で医師なし。
+    読み取りの失敗・期限切れ（deadline.DeadlineExceeded）は例外のまま送出する。
+    """
+    department_label = (department_label or "").strip()
+    date = (date or "").strip()
+    decided = classify_date(department_label, date, datetime.now().date())
+    reason = decided["reason"] if decided else None
+    result: dict[str, Any] = {
+        "date": date,
+        "department": department_label,
+        "is_holiday": bool(decided and decided["is_holiday"]),
+        "reason": reason,
+        "timeSlots": list(TIME_SLOTS),
+        "doctors": [],
+    }
+    if reason == "closed":
+        return result
+    with deadline.budget():
+        doctors = sorted(_get_doctors_by_department(department_label), key=lambda d: d["id"])
+        reserved = _get_reservations_bulk([d["id"] for d in doctors], [date]) if doctors else set()
+    result["doctors"] = compute_doctor_grid(
+        date, doctors, reserved, past=reason == "past", is_holiday=result["is_holiday"],
+    )
+    return result
+
 # --------------- ダブルブッキング防止: スロット単位のロック ---------------
 _booking_locks: dict[str, threading.Lock] = {}
 _lock_manager = threading.Lock()
@@ -443,16 +609,42 @@ def _get_booking_lock(key: str) -> threading.Lock:
         return _booking_locks[key]
 
 
-def create_reservation(department_label: str, date: str, time: str, user_id: str, *, purpose: str = "") -> dict[str, Any]:
+def _acquire_booking_locks(department_label: str, date: str, times: list[str]) -> list[threading.Lock]:
     """
-    予約を確定する。担当医は自動割当。
-    Firestore users/{uid}/reservations に doctorId 付きで保存。
-    スロット単位のロックでダブルブッキングを防止する。
+    予約が占める全枠（times）のロックを、デッドロックしないよう決まった順に取る。戻り値の順に取得済み（解放は逆順）。
+    取れなければ取得済みを解放して ValueError（利用者向けメッセージ）
     """
-    logger.info(
-        "create_reservation start: department=%r date=%r time=%r user_id=%r",
-        department_label, date, time, user_id,
+    held: list[threading.Lock] = []
+    for key in sorted({f"{department_label}::{date}::{t}" for t in times}):
+        lock = _get_booking_lock(key)
+        if not lock.acquire(timeout=5):
+            for h in reversed(held):
+                h.release()
+            raise ValueError("この時間は現在処理中です。しばらくしてから再度お試しください。")
+        held.append(lock)
+    return held
+
+
+def _own_bookings_query(db, user_id: str, department_label: str, date: str):
+    """ユーザーの同じ診療科・日の予約（重なりの確認用）"""
+    return (
+        db.collection("users").document(user_id).collection("reservations")
+        .where("department", "==", department_label)
+        .where("date", "==", date)
     )
+
+
+def _overlaps_own_booking(docs: Iterable[Any], times: list[str]) -> bool:
+    """既存の予約ドキュメント（time から duration 分の枠を占める）のどれかが times と枠を共有するか"""
+    wanted = set(times)
+    return any(wanted & set(_reservation_times(doc.to_dict() or {})) for doc in docs)
+
+
+def _validate_booking_request(department_label: str, date: str, time: str, user_id: str) -> tuple[str, str, str, str]:
+    """
+    予約・仮押さえ共通の入力チェック（必須項目・過去日・祝日・今日の過去時刻）。
+    問題があれば ValueError（利用者向けメッセージ）。戻り値: 前後空白を除いた (診療科, 日付, 時間, uid)
+    """
     department_label = (department_label or "").strip()
     date = (date or "").strip()
     time = (time or "").strip()
@@ -488,30 +680,35 @@ def create_reservation(department_label: str, date: str, time: str, user_id: str
             raise
     except TypeError:
         pass
+    return department_label, date, time, user_id
+
+
+def create_reservation(department_label: str, date: str, time: str, user_id: str, *, purpose: str = "") -> dict[str, Any]:
+    """
+    予約を確定する。担当医は自動割当。
+    Firestore users/{uid}/reservations に doctorId 付きで保存。
+    所要時間が複数枠の種別（appointment_minutes）は、同じ医師の連続枠をまとめて確保する。
+    スロット単位のロックでダブルブッキングを防止する。
+    """
+    logger.info(
+        "create_reservation start: department=%r date=%r time=%r user_id=%r",
+        department_label, date, time, user_id, extra=SAMPLED,
+    )
+    department_label, date, time, user_id = _validate_booking_request(department_label, date, time, user_id)
+    times = _appointment_run(department_label, time, purpose)
 
-    logger.info("create_reservation passed validation")
+    logger.info("create_reservation passed validation", extra=SAMPLED)
 
-    # ダブルブッキング防止: プロセス内ロック + Firestore 原子的スロット確保の2段構え
-    lock_key = f"{department_label}::{date}::{time}"
-    slot_lock = _get_booking_lock(lock_key)
-    if not slot_lock.acquire(timeout=5):
-        raise ValueError("この時間は現在処理中です。しばらくしてから再度お試しください。")
+    # ダブルブッキング防止: プロセス内ロック（予約が占める全枠）+ Firestore 原子的スロット確保の2段構え
+    held = _acquire_booking_locks(department_label, date, times)
 
     try:
         db = _get_firestore()
         use_demo = os.environ.get("USE_DEMO_SLOTS", "1").strip() != "0"
 
-        # 同一ユーザーが同じ診療科+日+時間で既に予約しているか確認
+        # 同一ユーザーが同じ診療科・日で、占める枠の重なる予約をすでに持っているか確認
         try:
-            existing = list(
-                db.collection("users").document(user_id).collection("reservations")
-                .where("department", "==", department_label)
-                .where("date", "==", date)
-                .where("time", "==", time)
-                .limit(1)
-                .stream()
-            )
-            if existing:
+            if _overlaps_own_booking(_own_bookings_query(db, user_id, department_label, date).stream(), times):
                 raise ValueError("この診療科・日時はすでに予約済みです。予約一覧からご確認ください。")
         except ValueError:
             raise
@@ -519,54 +716,20 @@ def create_reservation(department_label: str, date: str, time: str, user_id: str
             logger.warning("create_reservation user duplicate check failed: %s", e)
 
         try:
-            available = _get_available_doctors(department_label, date, time)
+            available, load = _get_slot_candidates(department_label, date, time, len(times))
         except Exception as e:
-            logger.exception("create_reservation _get_available_doctors failed: %s", e)
+            logger.exception("create_reservation _get_slot_candidates failed: %s", e)
             raise
 
-        # --- Firestore 原子的スロット確保 ---
-        # 各候補医師について booked_slots/{doctorId}_{date}_{time} を create() で確保。
-        # create() はドキュメントが既に存在する場合に例外を投げるため、
-        # 同時リクエストでも1つだけが成功する（Firestore レベルのアトミック保証）。
-        doctor = None
-        doctor_id = ""
-        doctor_name = ""
-        slot_doc_id = ""
-
-        for candidate in available:
-            cand_id = str(candidate.get("id") or "").strip()
-            cand_name = str(candidate.get("name") or "（自動割当）").strip()
-            if not cand_id:
-                continue
-            sid = _slot_doc_id(cand_id, date, time)
-            slot_ref = db.collection("booked_slots").document(sid)
-            try:
-                slot_ref.create({
-                    "doctorId": cand_id,
-                    "date": date,
-                    "time": time,
-                    "department": department_label,
-                    "userId": user_id,
-                    "createdAt": firestore.SERVER_TIMESTAMP,
-                })
-                # create() が成功 = このスロットを確保できた
-                doctor = candidate
-                doctor_id = cand_id
-                doctor_name = cand_name
-                slot_doc_id = sid
-                logger.info("Slot locked: %s", sid)
-                break
-            except Exception as e:
-                # ALREADY_EXISTS = 他のリクエストが先に確保済み → 次の医師を試す
-                err_str = str(e).lower()
-                if "already exists" in err_str or "already_exists" in err_str or "409" in err_str:
-                    logger.info("Slot %s already taken, trying next doctor", sid)
-                    continue
-                logger.exception("Unexpected error creating slot %s: %s", sid, e)
-                raise
+        # 同時予約が同じ医師のスロットに集中しないよう、割当戦略の順に確保を試す
+        strategy = _assign_strategy()
+        ordered = order_candidates(available, strategy, date=date, time=time, user_id=user_id, load=load)
+        doctor, slot_doc_ids, seats = _claim_booking(db, ordered, department_label, date, times, user_id, strategy=strategy)
+        doctor_id = str(doctor.get("id") or "").strip() if doctor else ""
+        doctor_name = str(doctor.get("name") or "（自動割当）").strip() if doctor else ""
 
         # デモモードのフォールバック
-        if not doctor and use_demo and _demo_reservable(date, time):
+        if not doctor and use_demo and all(_demo_reservable(date, t) for t in times):
             doctor_id = "demo"
             doctor_name = "（自動割当）"
             doctor = {"id": "demo", "name": doctor_name}
@@ -581,10 +744,13 @@ def create_reservation(department_label: str, date: str, time: str, user_id: str
             "category": "",
             "department": str(department_label),
             "purpose": str(purpose).strip(),
+            "duration": len(times) * SLOT_MINUTES_STEP,
             "doctor": doctor_name,
             "doctorId": doctor_id,
-            "createdAt": firestore.SERVER_TIMESTAMP,
+            "createdAt": server_timestamp(),
         }
+        if seats:
+            payload["seats"] = seats
 
         try:
             ref = db.collection("users").document(user_id).collection("reservations")
@@ -592,17 +758,22 @@ def create_reservation(department_label: str, date: str, time: str, user_id: str
             doc_id = doc_ref.id if doc_ref else ""
         except Exception as e:
             # 予約作成に失敗した場合、確保したスロットを解放
-            if slot_doc_id:
+            for slot_doc_id in slot_doc_ids:
                 try:
                     db.collection("booked_slots").document(slot_doc_id).delete()
                     logger.info("Released slot %s due to reservation creation failure", slot_doc_id)
                 except Exception:
                     logger.exception("Failed to release slot %s", slot_doc_id)
+            if seats:
+                try:
+                    slot_counters.release_seats(db.transaction(), db, seats)
+                except Exception:
+                    logger.exception("Failed to release seats %s", ",".join(seats))
             logger.exception("create_reservation Firestore add failed: %s", e)
             raise
 
         # スロットに予約IDを記録（キャンセル時の参照用）
-        if slot_doc_id:
+        for slot_doc_id in slot_doc_ids:
             try:
                 db.collection("booked_slots").document(slot_doc_id).update({
                     "reservationId": doc_id,
@@ -610,7 +781,13 @@ def create_reservation(department_label: str, date: str, time: str, user_id: str
             except Exception:
                 logger.warning("Failed to update slot %s with reservationId", slot_doc_id)
 
-        logger.info("create_reservation done: doc_id=%s slot=%s", doc_id, slot_doc_id)
+        user_booked_cache.add(user_id, department_label, date, times)
+        for t in times:
+            slot_events.notify(department_label, date, t)
+        logger.info(
+            "create_reservation done: doc_id=%s slots=%s", doc_id, ",".join(slot_doc_ids or seats),
+            extra={"event": "reservation_created", "department": department_label, "date": date, "doctor_id": doctor_id},
+        )
         return {
             "id": doc_id,
             "departmentId": department_label,
@@ -620,41 +797,294 @@ def create_reservation(department_label: str, date: str, time: str, user_id: str
             "userId": user_id,
         }
     finally:
-        slot_lock.release()
+        for lock in reversed(held):
+            lock.release()
+
+
+# --------------- マイ予約一覧: カーソル方式のページング ---------------
+# 1ページの件数（既定・上限）。履歴が何百件あっても1回の読み取りは上限件数に収まる。
+RESERVATION_PAGE_SIZE = 20
+RESERVATION_PAGE_MAX = 100
+RESERVATION_SCOPES = ("upcoming", "past", "all")
+# 射影で指定できるフィールド（id は常に含める）。doctorId・createdAt など内部向けの項目は返さない。
+RESERVATION_FIELDS = ("date", "time", "category", "department", "purpose", "doctor")
+
+
+def _encode_cursor(data: dict[str, Any], reservation_id: str) -> str:
+    """ページ末尾の予約から不透明なカーソル文字列を作る（base64url の JSON）"""
+    raw = json.dumps({"d": data.get("date", ""), "t": data.get("time", ""), "id": reservation_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> dict[str, str]:
+    """カーソル文字列を start_after 用の値に戻す。不正な値は ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        obj = json.loads(raw)
+        return {"date": str(obj["d"]), "time": str(obj["t"]), DOCUMENT_ID: str(obj["id"])}
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("カーソルが不正です。") from e
+
+
+def list_user_reservations(
+    user_id: str,
+    *,
+    scope: str = "upcoming",
+    limit: int = RESERVATION_PAGE_SIZE,
+    cursor: str = "",
+    fields: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    ユーザーの予約を1ページ分返す（users/{uid}/reservations を日付・時間順に limit 件だけ読む）。
+    scope: upcoming = 今日以降を昇順 / past = 昨日以前を新しい順 / all = 全件を昇順
+    fields: 返すフィールド（RESERVATION_FIELDS の部分集合。未指定なら全部）。Firestore 側でも select で射影する。
+    戻り値: {"items": [{"id", ...fields}], "nextCursor": str | None}
+    """
+    if not user_id:
+        raise ValueError("ユーザーIDが不正です。")
+    if scope not in RESERVATION_SCOPES:
+        raise ValueError(f"scope は {', '.join(RESERVATION_SCOPES)} のいずれかを指定してください。")
+    limit = max(1, min(int(limit or RESERVATION_PAGE_SIZE), RESERVATION_PAGE_MAX))
+    if fields:
+        unknown = [f for f in fields if f not in RESERVATION_FIELDS]
+        if unknown:
+            raise ValueError(f"指定できないフィールドです: {', '.join(unknown)}")
+        selected = [f for f in RESERVATION_FIELDS if f in fields]
+    else:
+        selected = list(RESERVATION_FIELDS)
+
+    db = _get_firestore()
+    query = db.collection("users").document(user_id).collection("reservations")
+    today = datetime.now().date().isoformat()
+    direction = DESCENDING if scope == "past" else ASCENDING
+    if scope == "upcoming":
+        query = query.where("date", ">=", today)
+    elif scope == "past":
+        query = query.where("date", "<", today)
+    # 同一日時の予約があってもページ境界で重複・欠落しないよう、最後にドキュメントIDで順序を確定する
+    query = query.order_by("date", direction=direction).order_by("time", direction=direction)
+    query = query.order_by(DOCUMENT_ID, direction=direction)
+    if cursor:
+        query = query.start_after(_decode_cursor(cursor))
+    # カーソルに date/time が必要なため射影に含める。1件多く読み、次ページの有無を判定する。
+    query = query.select(sorted({*selected, "date", "time"})).limit(limit + 1)
+
+    docs = list(query.stream())
+    page = docs[:limit]
+    items = []
+    for doc in page:
+        data = doc.to_dict() or {}
+        item = {"id": doc.id}
+        for f in selected:
+            item[f] = str(data.get(f) or "")
+        items.append(item)
+    next_cursor = None
+    if len(docs) > limit and page:
+        next_cursor = _encode_cursor(page[-1].to_dict() or {}, page[-1].id)
+    return {"items": items, "nextCursor": next_cursor}
+
+
+# --------------- キャンセル（単体・一括）: トランザクションで原子的に実行 ---------------
+# Firestore の1トランザクションの書き込み上限
+TRANSACTION_MAX_WRITES = 500
+# 1トランザクションあたりの件数。1件につき予約の delete + 占める枠ごとに booked_slots の delete（定員制の枠はシャードの更新）。
+# 予約を読むまで枠数は分からないため、最も長い種別（longest_appointment_slots）の件だけでも上限以内に収まる件数にする。
+BULK_CANCEL_CHUNK_SIZE = TRANSACTION_MAX_WRITES // (1 + longest_appointment_slots())
+
+
+def _reservation_ref(db, user_id: str, reservation_id: str):
+    return db.collection("users").document(user_id).collection("reservations").document(reservation_id)
+
+
+def _reservation_times(data: dict[str, Any]) -> list[str]:
+    """予約が占める枠の時刻の列（duration 未記録の旧データ・グリッド外の時刻は開始枠のみ）"""
+    time_val = data.get("time", "")
+    duration = data.get("duration")
+    k = duration // SLOT_MINUTES_STEP if isinstance(duration, int) and duration > 0 else 1
+    return slot_run(time_val, k) or ([time_val] if time_val else [])
+
+
+def _reservation_slot_ids(data: dict[str, Any]) -> list[str]:
+    """予約データに対応する booked_slots のドキュメントIDの列（デモ予約・定員制の枠の予約・欠損時は空）"""
+    doctor_id = data.get("doctorId", "")
+    date = data.get("date", "")
+    if not doctor_id or not date or doctor_id == "demo" or data.get("seats"):
+        return []
+    return [_slot_doc_id(doctor_id, date, t) for t in _reservation_times(data)]
+
+
+@transactional
+def _cancel_in_transaction(transaction, db, targets: list[tuple[str, str]]) -> dict[tuple[str, str], dict[str, Any] | None]:
+    """
+    targets（(user_id, reservation_id) の並び）をまとめてキャンセルする。
+    読み取り（予約 → booked_slots）をすべて済ませてから削除するため、途中失敗でスロットだけが残ることはない。
+    戻り値: (user_id, reservation_id) → 削除した予約データ（見つからなければ None）
+    """
+    res_refs = {_reservation_ref(db, uid, rid).path: (uid, rid) for uid, rid in targets}
+    found: dict[tuple[str, str], tuple[Any, dict[str, Any]]] = {}
+    for snap in transaction.get_all([_reservation_ref(db, uid, rid) for uid, rid in targets]):
+        if snap.exists:
+            found[res_refs[snap.reference.path]] = (snap.reference, snap.to_dict() or {})
+
+    slot_refs = {
+        key: [db.collection("booked_slots").document(sid) for sid in _reservation_slot_ids(data)]
+        for key, (_, data) in found.items()
+    }
+    slot_owner: dict[str, str] = {}
+    all_slot_refs = [ref for refs in slot_refs.values() for ref in refs]
+    if all_slot_refs:
+        for snap in transaction.get_all(all_slot_refs):
+            if snap.exists:
+                slot_owner[snap.reference.path] = (snap.to_dict() or {}).get("userId") or ""
+    # 定員制の枠の予約は、確保したカウンターのシャードを予約の数だけ減らす（同じシャードは1回の書き込みにまとめる）
+    seat_counts = Counter(seat for _, data in found.values() for seat in data.get("seats") or [])
+    seat_snaps = list(transaction.get_all(slot_counters.seat_refs(db, list(seat_counts)))) if seat_counts else []
+
+    out: dict[tuple[str, str], dict[str, Any] | None] = {key: None for key in targets}
+    for key, (res_ref, data) in found.items():
+        for slot_ref in slot_refs[key]:
+            # 別ユーザーが確保し直したスロットは消さない（userId 未記録の旧データは本人のものとみなす）
+            if slot_ref.path in slot_owner and slot_owner[slot_ref.path] in ("", key[0]):
+                transaction.delete(slot_ref)
+        transaction.delete(res_ref)
+        out[key] = data
+    for snap in seat_snaps:
+        slot_counters.release(transaction, snap, seat_counts[snap.reference.id])
+    return out
+
+
+def _forget_user_booking(user_id: str, data: dict[str, Any]) -> None:
+    """キャンセルした予約をユーザーの予約済み枠キャッシュから外し、空き状況の変更を通知する"""
+    department, date = data.get("department") or "", data.get("date") or ""
+    times = _reservation_times(data)
+    user_booked_cache.discard(user_id, department, date, times)
+    for t in times:
+        slot_events.notify(department, date, t)
 
 
 def cancel_reservation(user_id: str, reservation_id: str) -> dict[str, Any]:
     """
-    予約をキャンセルする。
-    1. users/{uid}/reservations/{id} を読み取り、doctorId/date/time を取得
-    2. booked_slots/{doctorId}_{date}_{time} を削除（スロット解放）
+    予約をキャンセルする。1トランザクションで以下を行う（途中失敗時はどちらも削除されない）。
+    1. users/{uid}/reservations/{id} を読み取り、doctorId/date/time/duration を取得
+    2. booked_slots/{doctorId}_{date}_{time} を予約が占める枠の分だけ削除（スロット解放）
     3. users/{uid}/reservations/{id} を削除
     """
     if not user_id or not reservation_id:
         raise ValueError("ユーザーIDまたは予約IDが不正です。")
 
     db = _get_firestore()
-    res_ref = db.collection("users").document(user_id).collection("reservations").document(reservation_id)
-    res_doc = res_ref.get()
-
-    if not res_doc.exists:
+    key = (user_id, reservation_id)
+    result = _cancel_in_transaction(db.transaction(), db, [key])
+    data = result.get(key)
+    if data is None:
         raise ValueError("指定された予約が見つかりません。")
+    _forget_user_booking(user_id, data)
+
+    logger.info(
+        "cancel_reservation done: user=%s reservation=%s", user_id, reservation_id,
+        extra={"event": "reservation_cancelled"},
+    )
+    return {"ok": True, "id": reservation_id}
+
+
+def find_doctor_bookings(doctor_id: str, dates: list[str]) -> list[dict[str, Any]]:
+    """
+    指定医師・指定日付群の全予約を返す（休診時の一括キャンセル・振替用）。
+    booked_slots と reservations（collectionGroup）の両方を 30日ずつの in クエリで一括取得しマージする。
+    複数枠の予約は1件にまとめ、time は開始時刻、slots は占める枠数。
+    戻り値: [{"userId", "id", "date", "time", "slots", "seats"?}]（日付・時間順。seats は定員制の枠で確保したシャードID）
+    """
+    doctor_id = (doctor_id or "").strip()
+    dates = [d for d in dict.fromkeys(dates) if d]
+    if not doctor_id or not dates:
+        return []
+    db = _get_firestore()
+    out: dict[tuple[str, str], dict[str, Any]] = {}
+    chunk_size = 30
+    for i in range(0, len(dates), chunk_size):
+        date_chunk = dates[i:i + chunk_size]
+        q = db.collection("booked_slots").where("doctorId", "==", doctor_id).where("date", "in", date_chunk)
+        for doc in q.stream():
+            d = doc.to_dict() or {}
+            uid = d.get("userId") or ""
+            rid = d.get("reservationId") or ""
+            if not uid or not rid:
+                continue
+            prev = out.get((uid, rid))
+            if prev is None:
+                out[(uid, rid)] = {"userId": uid, "id": rid, "date": d.get("date", ""), "time": d.get("time", ""), "slots": 1}
+            else:
+                prev["time"] = min(prev["time"], d.get("time", ""))
+                prev["slots"] += 1
+        q = db.collection_group("reservations").where("doctorId", "==", doctor_id).where("date", "in", date_chunk)
+        for doc in q.stream():
+            # パス: users/{uid}/reservations/{id}
+            parts = doc.reference.path.split("/")
+            if len(parts) >= 4 and parts[0] == "users":
+                d = doc.to_dict() or {}
+                out[(parts[1], doc.id)] = {
+                    "userId": parts[1], "id": doc.id, "date": d.get("date", ""), "time": d.get("time", ""),
+                    "slots": max(1, len(_reservation_times(d))), "seats": list(d.get("seats") or []),
+                }
+    return sorted(out.values(), key=lambda b: (b["date"], b["time"], b["userId"], b["id"]))
+
+
+def find_reservations_for_doctor_date(doctor_id: str, date: str) -> list[tuple[str, str]]:
+    """指定医師・指定日の全予約を (user_id, reservation_id) で返す（急な休診時の一括キャンセル用）"""
+    return [(b["userId"], b["id"]) for b in find_doctor_bookings(doctor_id, [(date or "").strip()])]
+
+
+def resolve_reservation_owners(reservation_ids: list[str]) -> dict[str, str]:
+    """予約ID → user_id を booked_slots の reservationId から引く（見つからない ID は含まない）"""
+    ids = [r for r in dict.fromkeys(reservation_ids) if r]
+    if not ids:
+        return {}
+    db = _get_firestore()
+    owners: dict[str, str] = {}
+    chunk_size = 30
+    for i in range(0, len(ids), chunk_size):
+        q = db.collection("booked_slots").where("reservationId", "in", ids[i:i + chunk_size])
+        for doc in q.stream():
+            d = doc.to_dict() or {}
+            if d.get("reservationId") and d.get("userId"):
+                owners[d["reservationId"]] = d["userId"]
+    return owners
 
-    data = res_doc.to_dict() or {}
-    doctor_id = data.get("doctorId", "")
-    date = data.get("date", "")
-    time_val = data.get("time", "")
 
-    # booked_slots のスロットを解放
-    if doctor_id and date and time_val and doctor_id != "demo":
-        sid = _slot_doc_id(doctor_id, date, time_val)
+def cancel_reservations_bulk(targets: list[tuple[str, str]], *, chunk_size: int = BULK_CANCEL_CHUNK_SIZE) -> list[dict[str, Any]]:
+    """
+    複数予約を一括キャンセルし、1件ごとの結果を返す。
+    chunk_size 件ずつ1トランザクションで処理する。トランザクション自体が失敗したチャンクは
+    1件ずつ cancel_reservation で再試行し、失敗した予約だけを error として報告する。
+    戻り値: [{"userId", "id", "status": "cancelled" | "not_found" | "error", "detail"}]
+    """
+    unique = [t for t in dict.fromkeys(targets) if t[0] and t[1]]
+    db = _get_firestore()
+    results: dict[tuple[str, str], dict[str, Any]] = {}
+    for i in range(0, len(unique), chunk_size):
+        chunk = unique[i:i + chunk_size]
         try:
-            db.collection("booked_slots").document(sid).delete()
-            logger.info("cancel_reservation: released slot %s", sid)
+            done = _cancel_in_transaction(db.transaction(), db, chunk)
         except Exception as e:
-            logger.warning("cancel_reservation: failed to release slot %s: %s", sid, e)
-
-    # 予約ドキュメントを削除
-    res_ref.delete()
-    logger.info("cancel_reservation done: user=%s reservation=%s", user_id, reservation_id)
-    return {"ok": True, "id": reservation_id}
+            logger.warning("cancel_reservations_bulk: chunk of %d failed, retrying one by one: %s", len(chunk), e)
+            for uid, rid in chunk:
+                try:
+                    cancel_reservation(uid, rid)
+                    results[(uid, rid)] = {"userId": uid, "id": rid, "status": "cancelled", "detail": None}
+                except ValueError as ve:
+                    results[(uid, rid)] = {"userId": uid, "id": rid, "status": "not_found", "detail": str(ve)}
+                except Exception as item_err:
+                    logger.exception("cancel_reservations_bulk: %s/%s failed", uid, rid)
+                    results[(uid, rid)] = {"userId": uid, "id": rid, "status": "error", "detail": str(item_err)}
+            continue
+        for uid, rid in chunk:
+            data = done.get((uid, rid))
+            if data is not None:
+                _forget_user_booking(uid, data)
+            status = "cancelled" if data is not None else "not_found"
+            results[(uid, rid)] = {"userId": uid, "id": rid, "status": status, "detail": None}
+    logger.info(
+        "cancel_reservations_bulk done: requested=%d cancelled=%d",
+        len(unique), sum(1 for r in results.values() if r["status"] == "cancelled"),
+    )
+    return [results[t] for t in unique]
@@ -0,0 +1,94 @@
+"""
+予約集中時（ストーム）の医師割当戦略を比較するベンチマーク（インメモリ Firestore スタブを使用）。
+実行: Day5/backend で
+  python -m scripts.bench_assignment_storm
+  python -m scripts.bench_assignment_storm --doctors 4 --requests 400 --concurrency 32 --latency 0.002
+
+複数ワーカープロセスからの同時予約を模擬するため、プロセス内ロックを通さず
+create_reservation と同じ「空き医師の一括取得 → 戦略で並べ替え → booked_slots.create()」を並列に実行する。
+戦略ごとに ALREADY_EXISTS 衝突回数・書き込み試行回数・レイテンシを表示する。
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+import metrics
+import reservation_service as rs
+import storage
+from fake_firestore import FakeBackend, FakeFirestore
+from slot_logic import ASSIGN_STRATEGIES, TIME_SLOTS, order_candidates
+
+DEPARTMENT = "ベンチ科"
+DATE = "2030-04-08"  # 月曜
+
+
+def _seed(db: FakeFirestore, n_doctors: int) -> None:
+    for i in range(n_doctors):
+        db.collection("doctors").document(f"doc_{i:02d}").set({
+            "name": f"医師{i}", "department": DEPARTMENT, "schedules": {"mon": TIME_SLOTS},
+        })
+
+
+def _book_once(strategy: str, user_id: str, time_slot: str) -> tuple[bool, float]:
+    """1リクエスト分（create_reservation の割当部分と同じ手順）。戻り値: (成功, 秒)"""
+    started = time.perf_counter()
+    available, load = rs._get_slot_candidates(DEPARTMENT, DATE, time_slot)
+    ordered = order_candidates(available, strategy, date=DATE, time=time_slot, user_id=user_id, load=load)
+    doctor, _ = rs._claim_slot(storage.get_db(), ordered, DEPARTMENT, DATE, time_slot, user_id, strategy=strategy)
+    return doctor is not None, time.perf_counter() - started
+
+
+def run(strategy: str, args: argparse.Namespace) -> dict:
+    db = FakeFirestore(latency=args.latency)
+    storage.set_backend(FakeBackend(db))
+    _seed(db, args.doctors)
+    metrics.reset()
+    rng = random.Random(args.seed)
+    hot = TIME_SLOTS[:args.hot_slots]
+    jobs = [(f"user_{i}", rng.choice(hot)) for i in range(args.requests)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda j: _book_once(strategy, *j), jobs))
+    latencies = sorted(sec for _, sec in results)
+    return {
+        "strategy": strategy,
+        "booked": sum(1 for ok, _ in results if ok),
+        "attempts": metrics.get("slot_claim_attempts"),
+        "collisions": metrics.get("slot_claim_collisions"),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="医師割当戦略のストームベンチマーク")
+    parser.add_argument("--doctors", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--hot-slots", type=int, default=8, help="予約が集中する時間枠の数（先頭から）")
+    parser.add_argument("--latency", type=float, default=0.002, help="Firestore RPC 1回あたりの模擬遅延（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"doctors={args.doctors} requests={args.requests} concurrency={args.concurrency} "
+          f"hot_slots={args.hot_slots} capacity={args.doctors * args.hot_slots}")
+    print(f"{'strategy':<14}{'booked':>8}{'attempts':>10}{'collisions':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    try:
+        for strategy in ASSIGN_STRATEGIES:
+            r = run(strategy, args)
+            print(f"{r['strategy']:<14}{r['booked']:>8}{r['attempts']:>10}{r['collisions']:>12}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    finally:
+        storage.reset_backend()
+
+
+if __name__ == "__main__":
+    main()
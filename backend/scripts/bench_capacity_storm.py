@@ -0,0 +1,97 @@
+"""
+定員制の枠に予約が集中したとき（ストーム）の、カウンターのシャード数による差を測るベンチマーク（インメモリ Firestore スタブを使用）。
+実行: Day5/backend で
+  python -m scripts.bench_capacity_storm
+  python -m scripts.bench_capacity_storm --capacity 20 --requests 400 --concurrency 32 --shards 1 4 8
+
+シャード数1は「枠ごとに1ドキュメントの予約数」を全員が読み書きする従来型の設計に相当する。
+create_reservation と同じ slot_counters.claim_seats（トランザクション + 競合時の取り直し）を並列に実行し、
+シャード数ごとに確保数・トランザクション中断（競合）回数・取り直しても競合した失敗数（本番では 503）・レイテンシを表示する。
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+import slot_counters
+import storage
+from fake_firestore import FakeBackend, FakeFirestore
+from slot_logic import TIME_SLOTS
+
+DEPARTMENT = "ベンチ科"
+DATE = "2030-04-08"
+DOCTOR = "doc_00"
+
+
+def _book_once(db: FakeFirestore, time_slot: str, capacity: int) -> tuple[str, float]:
+    """1リクエスト分。戻り値: ("booked" | "full" | "failed", 秒)"""
+    started = time.perf_counter()
+    try:
+        seats = slot_counters.claim_seats(db, DOCTOR, DEPARTMENT, DATE, [time_slot], capacity)
+        outcome = "booked" if seats else "full"
+    except Exception:
+        outcome = "failed"  # 取り直しても競合した
+    return outcome, time.perf_counter() - started
+
+
+def run(shards: int, args: argparse.Namespace) -> dict:
+    db = FakeFirestore(latency=args.latency)
+    storage.set_backend(FakeBackend(db))
+    slot_counters.COUNTER_SHARDS = shards
+    rng = random.Random(args.seed)
+    hot = TIME_SLOTS[:args.hot_slots]
+    jobs = [rng.choice(hot) for _ in range(args.requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda t: _book_once(db, t, args.capacity), jobs))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(sec for _, sec in results)
+    seated = sum(d.get("count", 0) for d in db.dump(slot_counters.COLLECTION).values())
+    return {
+        "shards": shards,
+        "booked": sum(1 for o, _ in results if o == "booked"),
+        "failed": sum(1 for o, _ in results if o == "failed"),
+        "aborted": db.aborted_count,
+        "seated": seated,
+        "rps": len(results) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="定員制の枠の分散カウンターのストームベンチマーク")
+    parser.add_argument("--capacity", type=int, default=100, help="1枠の定員")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--hot-slots", type=int, default=2, help="予約が集中する時間枠の数（先頭から）")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.002, help="Firestore RPC 1回あたりの模擬遅延（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    original = slot_counters.COUNTER_SHARDS
+    print(f"capacity={args.capacity} requests={args.requests} concurrency={args.concurrency} "
+          f"hot_slots={args.hot_slots} seats={args.capacity * args.hot_slots}")
+    print(f"{'shards':>6}{'booked':>8}{'failed':>8}{'aborted':>9}{'seated':>8}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    try:
+        for shards in args.shards:
+            r = run(shards, args)
+            print(f"{r['shards']:>6}{r['booked']:>8}{r['failed']:>8}{r['aborted']:>9}{r['seated']:>8}"
+                  f"{r['rps']:>9.0f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    finally:
+        slot_counters.COUNTER_SHARDS = original
+        storage.reset_backend()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+読み取りのヘッジ（deadline.call）でテール遅延がどれだけ縮むかを比べるベンチマーク（Firestore 不要）。
+実行: Day5/backend で
+  python -m scripts.bench_hedged_reads
+  python -m scripts.bench_hedged_reads --requests 500 --slow-rate 0.03 --slow-ms 200
+
+インメモリスタブ（RPC ごとに --latency-ms の往復）に FaultInjector で一部の読み取りだけ遅延を入れ、
+空き状況（get_availability_for_dates、医師取得 + 予約一括取得）を順に呼んで所要時間の p50 / p99 / 最大を出す。
+毎回の読み取りを計測するため、呼び出しごとに空き状況キャッシュ（availability_cache）を空にする。
+  - baseline: ヘッジなし（遅い1回がそのままレスポンスの遅延になる）
+  - hedged:   HEDGED_READS=1 相当（p95 を過ぎたら同じ読み取りをもう1本出す）
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+import availability_cache
+import deadline
+import metrics
+import reservation_service
+import storage
+from fake_firestore import FakeBackend, FakeFirestore, FaultInjector
+from slot_logic import TIME_SLOTS
+
+DEPARTMENT = "内科"
+DATES = ["2030-02-12", "2030-02-13", "2030-02-14", "2030-02-15", "2030-02-18"]
+
+
+def build_db(latency: float) -> FakeFirestore:
+    """医師3人・数件の予約がある内科"""
+    db = FakeFirestore(latency=latency)
+    days = {day: TIME_SLOTS for day in ("mon", "tue", "wed", "thu", "fri")}
+    for i in range(3):
+        db.collection("doctors").document(f"doc_{i}").set({"name": f"医師{i}", "department": DEPARTMENT, "schedules": days})
+    for i, date in enumerate(DATES):
+        doctor_id = f"doc_{i % 3}"
+        db.collection("booked_slots").document(f"{doctor_id}_{date}_09:00").set({"doctorId": doctor_id, "date": date, "time": "09:00"})
+    return db
+
+
+def run(db: FakeFirestore, injector: FaultInjector, requests: int, hedge: bool) -> list[float]:
+    deadline.HEDGE_ENABLED = hedge
+    deadline.reset_latencies()
+    db.on_rpc = None
+    # ヘッジの待ち時間（p95）を求めるため、遅延なしで所要時間を先に集める
+    for _ in range(deadline.MIN_SAMPLES):
+        availability_cache.clear()
+        reservation_service.get_availability_for_dates(DEPARTMENT, DATES)
+    db.on_rpc = injector
+    samples = []
+    for _ in range(requests):
+        availability_cache.clear()
+        started = time.perf_counter()
+        reservation_service.get_availability_for_dates(DEPARTMENT, DATES)
+        samples.append(time.perf_counter() - started)
+    return sorted(samples)
+
+
+def _pct(samples: list[float], p: int) -> float:
+    return samples[min(len(samples) - 1, len(samples) * p // 100)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ヘッジ読み取りのテール遅延ベンチマーク")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="RPC ごとの通常の往復時間")
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="遅延させる読み取りの割合")
+    parser.add_argument("--slow-ms", type=float, default=150.0, help="遅延させる読み取りの追加時間")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    db = build_db(args.latency_ms / 1000)
+    storage.set_backend(FakeBackend(db))
+    print(f"{args.requests} requests, rpc {args.latency_ms} ms, {args.slow_rate:.0%} of reads +{args.slow_ms} ms")
+    try:
+        for name, hedge in (("baseline", False), ("hedged", True)):
+            injector = FaultInjector(slow_rate=args.slow_rate, slow_seconds=args.slow_ms / 1000, seed=args.seed)
+            before = metrics.get("read_hedged")
+            samples = run(db, injector, args.requests, hedge)
+            hedged = metrics.get("read_hedged") - before
+            print(
+                f"  {name:<9} p50 {_pct(samples, 50):7.1f} ms  p99 {_pct(samples, 99):7.1f} ms  "
+                f"max {samples[-1] * 1000:7.1f} ms  hedged reads {hedged}"
+            )
+    finally:
+        storage.reset_backend()
+
+
+if __name__ == "__main__":
+    main()
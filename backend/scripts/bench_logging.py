@@ -0,0 +1,155 @@
+"""
+予約1件あたりのログ出力コストを比較するベンチマーク（インメモリ Firestore スタブを使用）。
+実行: Day5/backend で
+  python -m scripts.bench_logging
+  python -m scripts.bench_logging --bookings 20000 --concurrency 16 --sample-rate 0.05
+
+create_reservation を1回実行して出るログ呼び出し（logger・レベル・メッセージ・引数・extra）を記録し、
+それを予約 --bookings 件分、--concurrency スレッドから再生してリクエストスレッド側の所要時間を比べる
+（Firestore スタブの処理時間に埋もれず、ログのコストだけを測るため）。
+  - off:         INFO を出さない（基準）
+  - sync_text:   従来の logging.basicConfig 相当（リクエストスレッドで整形・ファイルへ書き込み）
+  - queue_json:  log_setup（QueueHandler → 専用スレッドで JSON 化・書き込み）
+  - queue_json_sampled: 上記 + 大量イベント（extra=SAMPLED）を --sample-rate の割合に間引く
+出力先は一時ファイル（stderr を汚さず、実ファイルへの書き込みコストを含める）。
+--sink-latency で1回の書き込みごとに待ちを入れ、詰まった stderr パイプ（ログ収集側の遅延）を模擬できる。
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+import log_setup
+import metrics
+import reservation_service as rs
+import storage
+from fake_firestore import FakeBackend, FakeFirestore
+from slot_logic import TIME_SLOTS
+
+DEPARTMENT = "ベンチ科"
+DATE = "2030-04-08"  # 月曜
+
+CONFIGS = {
+    "off": {"LOG_LEVEL": "WARNING", "LOG_QUEUE": "0", "LOG_FORMAT": "text", "LOG_SAMPLE_RATE": "1"},
+    "sync_text": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "0", "LOG_FORMAT": "text", "LOG_SAMPLE_RATE": "1"},
+    "queue_json": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "1", "LOG_FORMAT": "json", "LOG_SAMPLE_RATE": "1"},
+    "queue_json_sampled": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "1", "LOG_FORMAT": "json"},
+}
+
+
+def _capture_booking_calls() -> list[tuple[str, int, str, tuple, dict | None]]:
+    """create_reservation 1件分のログ呼び出しを記録する"""
+    calls: list[tuple[str, int, str, tuple, dict | None]] = []
+    standard = set(vars(logging.makeLogRecord({})))
+
+    class Capture(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            extra = {k: v for k, v in vars(record).items() if k not in standard and k not in ("message", "taskName")}
+            calls.append((record.name, record.levelno, record.msg, record.args or (), extra or None))
+
+    db = FakeFirestore()
+    storage.set_backend(FakeBackend(db))
+    db.collection("doctors").document("doc_00").set({
+        "name": "医師0", "department": DEPARTMENT, "schedules": {"mon": TIME_SLOTS},
+    })
+    root = logging.getLogger()
+    handler, level = Capture(), root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        rs.create_reservation(DEPARTMENT, DATE, TIME_SLOTS[0], "user_0", purpose="再診")
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+        storage.reset_backend()
+    return calls
+
+
+class _SlowSink:
+    """書き込みごとに latency 秒待つ出力先"""
+
+    def __init__(self, stream, latency: float):
+        self._stream, self._latency = stream, latency
+
+    def write(self, s: str) -> int:
+        if self._latency:
+            time.sleep(self._latency)
+        return self._stream.write(s)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+
+def _replay(calls, n: int) -> None:
+    loggers = [(logging.getLogger(name), level, msg, args, extra) for name, level, msg, args, extra in calls]
+    for _ in range(n):
+        for logger, level, msg, args, extra in loggers:
+            logger.log(level, msg, *args, extra=extra)
+
+
+def run(name: str, calls, args: argparse.Namespace) -> dict:
+    env = {**CONFIGS[name]}
+    env.setdefault("LOG_SAMPLE_RATE", str(args.sample_rate))
+    os.environ.update(env)
+    metrics.reset()
+    per_thread = args.bookings // args.concurrency
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".log", delete=False) as out:
+        log_setup.setup_logging(stream=_SlowSink(out, args.sink_latency), force=True)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda _: _replay(calls, per_thread), range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        log_setup.stop_logging()
+        out.flush()
+        size = os.path.getsize(out.name)
+    os.unlink(out.name)
+    return {
+        "config": name,
+        "us_per_booking": elapsed / (per_thread * args.concurrency) * 1e6,
+        "log_kb": size / 1024,
+        "dropped": metrics.get("log_dropped"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="予約1件あたりのログ出力コストのベンチマーク")
+    parser.add_argument("--bookings", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="queue_json_sampled の LOG_SAMPLE_RATE")
+    parser.add_argument("--sink-latency", type=float, default=0.0, help="出力先への書き込み1回あたりの模擬遅延（秒）")
+    args = parser.parse_args()
+
+    saved = {k: os.environ.get(k) for k in ("LOG_LEVEL", "LOG_QUEUE", "LOG_FORMAT", "LOG_SAMPLE_RATE")}
+    calls = _capture_booking_calls()
+    print(f"bookings={args.bookings} concurrency={args.concurrency} sample_rate={args.sample_rate} sink_latency={args.sink_latency} "
+          f"log_calls_per_booking={len(calls)} sampled_calls={sum(1 for c in calls if c[4] and c[4].get('sampled'))}")
+    print(f"{'config':<20}{'us/booking':>12}{'log cost us':>13}{'log KB':>9}{'dropped':>9}")
+    try:
+        base = None
+        for name in CONFIGS:
+            r = run(name, calls, args)
+            base = r["us_per_booking"] if base is None else base
+            print(f"{r['config']:<20}{r['us_per_booking']:>12.1f}{r['us_per_booking'] - base:>13.1f}"
+                  f"{r['log_kb']:>9.0f}{r['dropped']:>9}")
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        log_setup.stop_logging()
+        logging.getLogger().setLevel(logging.WARNING)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+空き枠レスポンスの直列化コストを比較するベンチマーク（Firestore 不要）。
+実行: Day5/backend で
+  python -m scripts.bench_serialization
+  python -m scripts.bench_serialization --days 14 31 --repeat 2000
+
+比較する経路:
+  - pydantic:  AvailabilityForDateResponse で検証 → jsonable_encoder → json.dumps（従来の /api/slots 相当）
+  - jsonable:  dict のまま jsonable_encoder → json.dumps（従来の /api/slots/week 相当）
+  - fast_cold: fast_json.encode_days（日ごとキャッシュを毎回クリア）
+  - fast_warm: fast_json.encode_days（変化のない日は直列化済み bytes を再利用）
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import timeit
+from datetime import date, timedelta
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from fastapi.encoders import jsonable_encoder
+
+import fast_json
+from models import AvailabilityForDateResponse
+from slot_logic import TIME_SLOTS
+
+
+def build_payload(n_days: int) -> list[dict]:
+    """n_days 日分の空き状況（平日は午前が○、土日は×）"""
+    start = date(2026, 4, 6)
+    out = []
+    for i in range(n_days):
+        d = start + timedelta(days=i)
+        weekday = d.weekday() < 5
+        slots = [{"time": t, "reservable": weekday and (t < "12:00" or j % 3 == 0)} for j, t in enumerate(TIME_SLOTS)]
+        out.append({
+            "date": d.isoformat(),
+            "is_holiday": False,
+            "reservable": any(s["reservable"] for s in slots),
+            "reason": None,
+            "degraded": False,
+            "slots": slots,
+        })
+    return out
+
+
+def _pydantic(days):
+    validated = [AvailabilityForDateResponse.model_validate(d) for d in days]
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode("utf-8")
+
+
+def _jsonable(days):
+    return json.dumps(jsonable_encoder(days), ensure_ascii=False).encode("utf-8")
+
+
+def _fast_cold(days):
+    fast_json.clear_cache()
+    return fast_json.encode_days(days)
+
+
+def _fast_warm(days):
+    return fast_json.encode_days(days)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="空き枠レスポンス直列化ベンチマーク")
+    parser.add_argument("--days", type=int, nargs="+", default=[14, 31])
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"json backend: {'orjson' if fast_json.orjson is not None else 'stdlib json'}")
+    for n in args.days:
+        days = build_payload(n)
+        # 出力が同値であることを確認してから計測
+        assert json.loads(_pydantic(days)) == json.loads(_fast_cold(days)) == json.loads(_jsonable(days))
+        print(f"\n{n} days ({len(_fast_warm(days))} bytes), {args.repeat} iterations:")
+        baseline = None
+        for name, fn in (("pydantic", _pydantic), ("jsonable", _jsonable), ("fast_cold", _fast_cold), ("fast_warm", _fast_warm)):
+            sec = timeit.timeit(lambda: fn(days), number=args.repeat)
+            per_us = sec / args.repeat * 1e6
+            baseline = baseline or per_us
+            print(f"  {name:<10} {per_us:10.1f} us/op  x{baseline / per_us:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
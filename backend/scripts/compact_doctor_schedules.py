@@ -0,0 +1,61 @@
+"""
+doctors の schedules を勤務時間帯の形式（{"mon": ["09:00-12:00", "13:00-17:00"], ...}）に書き換えるスクリプト。
+従来の15分枠の列挙（最大32個の "HH:MM"）や整数マスクで保存された医師を変換する。冪等（変換済みは書き込まない）。
+
+実行: Day5/backend で FIREBASE_SERVICE_ACCOUNT_JSON を設定したうえで
+  python -m scripts.compact_doctor_schedules            # 変換する
+  python -m scripts.compact_doctor_schedules --dry-run  # 変換内容の表示のみ
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(backend_dir / ".env")
+except ImportError:
+    pass
+
+from slot_logic import _normalize_schedules, compact_schedules
+
+
+def compact_all(db, *, dry_run: bool = False) -> tuple[int, int]:
+    """全医師を変換する。(書き換えた件数, 変換済みでスキップした件数) を返す"""
+    updated = skipped = 0
+    for snap in db.collection("doctors").stream():
+        schedules = (snap.to_dict() or {}).get("schedules")
+        compact = compact_schedules(schedules)
+        if schedules == compact:
+            skipped += 1
+            continue
+        # 変換で勤務枠が変わらないことを確かめてから書く
+        if _normalize_schedules(compact) != _normalize_schedules(schedules):
+            raise RuntimeError(f"doctors/{snap.id}: schedule changed by conversion")
+        print(f"  doctors/{snap.id}: {compact}")
+        if not dry_run:
+            snap.reference.update({"schedules": compact})
+        updated += 1
+    return updated, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="doctors の schedules を勤務時間帯の形式に変換する")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに変換内容を表示する")
+    args = parser.parse_args()
+
+    from firebase_admin import firestore
+    from firebase_admin_client import init_firebase_admin
+
+    init_firebase_admin()
+    updated, skipped = compact_all(firestore.client(), dry_run=args.dry_run)
+    print(f"Done. {'would update' if args.dry_run else 'updated'}={updated}, already compact={skipped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+期間内の全予約を CSV / NDJSON / Parquet に書き出すスクリプト（受付・運用向けの日次・月次出力）。
+reservation_export と同じくページ単位で読み書きするため、期間が長くてもメモリ使用量は一定。
+
+実行: Day5/backend で FIREBASE_SERVICE_ACCOUNT_JSON を設定したうえで
+  python -m scripts.export_reservations --from 2026-04-01 --to 2026-04-30                 # reservations_2026-04-01_2026-04-30.csv
+  python -m scripts.export_reservations --from 2026-04-01 --to 2026-04-01 --format ndjson --out -   # 標準出力へ
+  python -m scripts.export_reservations --from 2026-04-01 --to 2026-04-30 --department 内科 --format parquet
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(backend_dir / ".env")
+except ImportError:
+    pass
+
+from reservation_export import EXPORT_FORMATS, export_filename, export_reservations
+
+
+def write_export(out, date_from: str, date_to: str, fmt: str, *, department: str = "", doctor_id: str = "") -> int:
+    """out（バイナリのファイル）に書き出し、書いたバイト数を返す"""
+    written = 0
+    for chunk in export_reservations(date_from, date_to, fmt, department=department, doctor_id=doctor_id):
+        out.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="期間内の予約をファイルに書き出す")
+    parser.add_argument("--from", dest="date_from", required=True, help="開始日 YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", required=True, help="終了日 YYYY-MM-DD（この日を含む）")
+    parser.add_argument("--format", default="csv", choices=EXPORT_FORMATS)
+    parser.add_argument("--department", default="", help="診療科で絞り込む")
+    parser.add_argument("--doctor-id", default="", help="医師IDで絞り込む")
+    parser.add_argument("--out", default="", help="出力先（既定は reservations_<from>_<to>.<format>、- で標準出力）")
+    args = parser.parse_args()
+
+    from firebase_admin_client import init_firebase_admin
+
+    init_firebase_admin()
+    kwargs = {"department": args.department, "doctor_id": args.doctor_id}
+    try:
+        if args.out == "-":
+            written = write_export(sys.stdout.buffer, args.date_from, args.date_to, args.format, **kwargs)
+            sys.stdout.buffer.flush()
+            return
+        path = args.out or export_filename(args.date_from, args.date_to, args.format)
+        with open(path, "wb") as f:
+            written = write_export(f, args.date_from, args.date_to, args.format, **kwargs)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Done. wrote {written} bytes to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+traffic_capture で記録したリクエストをローカルのサーバーに再送し、ルートごとの遅延分布を出すスクリプト。
+合成ベンチマークでは再現しにくい実際の偏り（人気の診療科・週送り・予約の集中）でビルド間の遅延を比べる。
+
+準備: 比べるビルドごとに、インメモリの Firestore スタブでサーバーを起動する（データはシードの医師のみ・起動ごとに空）
+  FIRESTORE_BACKEND=fake RATE_LIMIT_PER_MINUTE=0 uvicorn main:app --port 8001
+  （FIRESTORE_BACKEND=fake のときは "fake:<uid>" のトークンを受け付けるので、記録の client ごとに別の利用者として送る）
+  キャッシュなしの読み取りを比べるときは AVAILABILITY_CACHE_TTL=0 PREFETCH_ENABLED=0 も付ける
+
+実行: Day5/backend で
+  python -m scripts.replay_traffic replay traffic.jsonl* --base-url http://127.0.0.1:8001 --speed 10 --out before.json
+  python -m scripts.replay_traffic replay traffic.jsonl* --base-url http://127.0.0.1:8002 --speed 10 --out after.json
+  python -m scripts.replay_traffic compare before.json after.json
+
+  --speed N        記録の時間間隔を 1/N に縮める（10 なら10倍速）
+  --scale N        各リクエストを N 人分（別の利用者として）送り、同時実行数を N 倍にする
+  --concurrency N  同時に送る上限（送信が追いつかない分は lag_ms として記録する）
+  --shift-days N   日付（YYYY-MM-DD）を N 日ずらす。既定は記録日から今日までの日数（過去日にならないように）
+パスに ID を含むルート（/api/holds/{hold_id} など）は ID を記録していないため再送しない。
+結果には再送先の空き状況キャッシュ・先読みの設定（/health の cache）を残し、compare で並べて表示する。
+キャッシュが有効だと繰り返しの空き枠リクエストは問い合わせずに返るため、設定の違う結果どうしは比べられない。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Iterable
+from urllib.parse import urlencode
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from firebase_admin_client import FAKE_TOKEN_PREFIX
+
+_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+
+
+def load_traces(paths: Iterable[str]) -> tuple[list[dict[str, Any]], int]:
+    """記録ファイルを読み、時刻順に並べて返す。戻り値: (再送できる記録, 読み飛ばした件数)"""
+    records, skipped = [], 0
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if not isinstance(rec, dict) or "{" in str(rec.get("route", "{")) or "ts" not in rec:
+                    skipped += 1
+                    continue
+                records.append(rec)
+    records.sort(key=lambda r: r["ts"])
+    return records, skipped
+
+
+def shift_dates(value: Any, days: int) -> Any:
+    """value（query・body）に含まれる YYYY-MM-DD を days 日ずらす"""
+    if not days:
+        return value
+    if isinstance(value, dict):
+        return {k: shift_dates(v, days) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shift_dates(v, days) for v in value]
+    if isinstance(value, str):
+        def repl(m: re.Match) -> str:
+            try:
+                return (date(int(m[1]), int(m[2]), int(m[3])) + timedelta(days=days)).isoformat()
+            except ValueError:
+                return m[0]
+        return _DATE.sub(repl, value)
+    return value
+
+
+def plan(
+    records: list[dict[str, Any]], *, speed: float = 1.0, scale: int = 1, shift_days: int | None = None,
+) -> list[tuple[float, dict[str, Any]]]:
+    """再送の予定 (開始からの秒数, リクエスト) を時刻順に返す。scale 倍したコピーは別の利用者として送る"""
+    if not records:
+        return []
+    t0 = records[0]["ts"]
+    if shift_days is None:
+        shift_days = max(0, (date.today() - datetime.fromtimestamp(t0).date()).days)
+    out = []
+    for rec in records:
+        offset = (rec["ts"] - t0) / speed
+        for copy in range(scale):
+            client = rec.get("client") or ""
+            out.append((offset, {
+                "method": rec.get("method", "GET"),
+                "route": rec["route"],
+                "query": shift_dates(rec.get("query") or {}, shift_days),
+                "body": shift_dates(rec.get("body"), shift_days),
+                "token": f"{FAKE_TOKEN_PREFIX}replay-{client}-{copy}" if client else "",
+            }))
+    return out
+
+
+def http_sender(base_url: str, timeout: float = 30.0) -> Callable[[dict[str, Any]], int]:
+    """リクエストを base_url に送り、ステータスコードを返す関数（接続できなければ 0）"""
+    base_url = base_url.rstrip("/")
+
+    def send(req: dict[str, Any]) -> int:
+        url = base_url + req["route"] + ("?" + urlencode(req["query"]) if req["query"] else "")
+        data = json.dumps(req["body"], ensure_ascii=False).encode("utf-8") if req["body"] is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        if req["token"]:
+            headers["Authorization"] = f"Bearer {req['token']}"
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers, method=req["method"]), timeout=timeout) as res:
+                res.read()
+                return res.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (urllib.error.URLError, TimeoutError, OSError):
+            return 0
+
+    return send
+
+
+def server_cache(base_url: str, timeout: float = 5.0) -> dict[str, Any] | None:
+    """再送先の空き状況キャッシュ・先読みの設定（/health の cache）。取得できなければ None"""
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/health", timeout=timeout) as res:
+            return json.loads(res.read()).get("cache")
+    except (urllib.error.URLError, TimeoutError, OSError, ValueError, AttributeError):
+        return None
+
+
+def describe_cache(cache: dict[str, Any] | None) -> str:
+    """server_cache の結果を1行で（"availability cache on (ttl 15 s), prefetch on" など）"""
+    if not cache:
+        return "cache unknown"
+    ttl = cache.get("availability_ttl") or 0
+    availability = f"on (ttl {ttl:g} s)" if ttl > 0 else "off"
+    return f"availability cache {availability}, prefetch {'on' if cache.get('prefetch') else 'off'}"
+
+
+def replay(
+    schedule: list[tuple[float, dict[str, Any]]], send: Callable[[dict[str, Any]], int], *, concurrency: int = 16,
+) -> list[dict[str, Any]]:
+    """予定どおりの時刻に send を呼び、1件ごとの {route, method, status, ms, lag_ms} を返す"""
+    samples: list[dict[str, Any]] = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def one(due: float, req: dict[str, Any]) -> None:
+        begin = time.perf_counter()
+        status = send(req)
+        sample = {
+            "route": req["route"], "method": req["method"], "status": status,
+            "ms": round((time.perf_counter() - begin) * 1000, 2),
+            "lag_ms": round(max(0.0, begin - started - due) * 1000, 2),
+        }
+        with lock:
+            samples.append(sample)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for due, req in schedule:
+            wait = due - (time.perf_counter() - started)
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(one, due, req)
+    return samples
+
+
+def _pct(values: list[float], p: int) -> float:
+    return values[min(len(values) - 1, len(values) * p // 100)] if values else 0.0
+
+
+def summarize(samples: list[dict[str, Any]]) -> dict[str, dict[str, float]]:
+    """ルート（"GET /api/slots/week" など）ごとの件数・エラー数（5xx と接続失敗）・p50 / p95 / p99（ミリ秒）"""
+    by_route: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for s in samples:
+        by_route[f"{s['method']} {s['route']}"].append(s)
+    out = {}
+    for route, items in sorted(by_route.items()):
+        ms = sorted(s["ms"] for s in items)
+        out[route] = {
+            "count": len(items),
+            "errors": sum(1 for s in items if s["status"] == 0 or s["status"] >= 500),
+            "p50": _pct(ms, 50), "p95": _pct(ms, 95), "p99": _pct(ms, 99),
+        }
+    return out
+
+
+def print_summary(summary: dict[str, dict[str, float]]) -> None:
+    for route, s in summary.items():
+        print(f"  {route:<36} n={s['count']:<6} err={s['errors']:<4} p50 {s['p50']:8.1f}  p95 {s['p95']:8.1f}  p99 {s['p99']:8.1f} ms")
+
+
+def print_comparison(
+    before: dict[str, dict[str, float]], after: dict[str, dict[str, float]],
+    before_cache: dict[str, Any] | None = None, after_cache: dict[str, Any] | None = None,
+) -> None:
+    """2つの結果をルートごとに並べる（比は after / before。1 未満なら速くなった）。先にキャッシュ設定を表示する"""
+    print(f"  before: {describe_cache(before_cache)}")
+    print(f"  after:  {describe_cache(after_cache)}")
+    if before_cache != after_cache:
+        print("  warning: キャッシュ・先読みの設定が違うため、空き枠ルートの遅延は比べられません")
+    for route in sorted(set(before) | set(after)):
+        a, b = before.get(route), after.get(route)
+        if a is None or b is None:
+            print(f"  {route:<36} only in {'after' if a is None else 'before'}")
+            continue
+        cols = "  ".join(f"{p} {a[p]:7.1f} -> {b[p]:7.1f} (x{b[p] / a[p] if a[p] else 0:4.2f})" for p in ("p50", "p99"))
+        print(f"  {route:<36} {cols}  err {a['errors']} -> {b['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録したトラフィックの再送と遅延分布の比較")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rp = sub.add_parser("replay", help="記録を再送して結果を保存する")
+    rp.add_argument("traces", nargs="+", help="traffic_capture の記録ファイル（ローテーション分も含めて指定）")
+    rp.add_argument("--base-url", default="http://127.0.0.1:8000")
+    rp.add_argument("--speed", type=float, default=1.0)
+    rp.add_argument("--scale", type=int, default=1)
+    rp.add_argument("--concurrency", type=int, default=16)
+    rp.add_argument("--shift-days", type=int, default=None)
+    rp.add_argument("--out", default="", help="結果の保存先（compare に渡す JSON）")
+    cp = sub.add_parser("compare", help="2つの結果の遅延分布を比べる")
+    cp.add_argument("before")
+    cp.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.before, encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.after, encoding="utf-8") as f:
+            after = json.load(f)
+        print_comparison(
+            before["summary"], after["summary"], before["meta"].get("cache"), after["meta"].get("cache"),
+        )
+        return
+
+    records, skipped = load_traces(args.traces)
+    schedule = plan(records, speed=args.speed, scale=args.scale, shift_days=args.shift_days)
+    cache = server_cache(args.base_url)
+    print(f"replaying {len(schedule)} requests ({len(records)} recorded x{args.scale}, {skipped} skipped) at x{args.speed} to {args.base_url}")
+    print(f"  server: {describe_cache(cache)}")
+    samples = replay(schedule, http_sender(args.base_url), concurrency=args.concurrency)
+    summary = summarize(samples)
+    print_summary(summary)
+    lag = sorted(s["lag_ms"] for s in samples)
+    print(f"  send lag p99 {_pct(lag, 99):.1f} ms（大きい場合は --concurrency を増やす）")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {"base_url": args.base_url, "speed": args.speed, "scale": args.scale, "traces": args.traces, "cache": cache},
+                "summary": summary,
+                "samples": samples,
+            }, f, ensure_ascii=False)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
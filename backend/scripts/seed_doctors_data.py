@@ -8,27 +8,15 @@
 masterData.js の診療科 label と完全一致させること。15分刻み 09:00〜16:45（フロント getTimeSlots と整合）。
 """
 # 曜日キー: mon, tue, wed, thu, fri, sat, sun
-# 時間: ["09:00", "09:15", "09:30", ...] 空配列は勤務なし
+# 時間: 勤務時間帯 ["09:00-12:00", ...]（開始を含み終了を含まない）。空配列は勤務なし
+# （従来の ["09:00", "09:15", ...] の列挙もバックエンドは読めるが、保存はこの形にする: scripts.compact_doctor_schedules）
 
-def _slots(start_h, start_m, end_h, end_m, step_minutes=15):
-    """15分刻みの時間リストを生成（start 含む〜end 未満）"""
-    out = []
-    h, m = start_h, start_m
-    while (h, m) < (end_h, end_m):
-        out.append(f"{h:02d}:{m:02d}")
-        m += step_minutes
-        if m >= 60:
-            h += 1
-            m = 0
-    return out
-
-
-# 共通: 平日 9:00-12:00, 13:00-17:00（15分刻みで 16:45 まで）
-WEEKDAY_MORNING = _slots(9, 0, 12, 0)   # 9:00〜11:45
-WEEKDAY_AFTERNOON = _slots(13, 0, 17, 0)  # 13:00〜16:45
+# 共通: 平日 9:00-12:00, 13:00-17:00（15分枠の最終は 16:45 開始）
+WEEKDAY_MORNING = ["09:00-12:00"]
+WEEKDAY_AFTERNOON = ["13:00-17:00"]
 WEEKDAY_FULL = WEEKDAY_MORNING + WEEKDAY_AFTERNOON
-WED_AM = _slots(9, 0, 12, 0)
-FRI_AM = _slots(9, 0, 12, 0)
+WED_AM = ["09:00-12:00"]
+FRI_AM = ["09:00-12:00"]
 
 EMPTY = []
 
@@ -0,0 +1,424 @@
+"""
+ワーカープロセス間で共有する空き状況（共有メモリ）
+- uvicorn を複数ワーカーで動かすと、プロセス内のキャッシュはワーカー数だけ重複し、それぞれ別々に冷える。
+  ここでは1ホストにつき1つの共有メモリ（multiprocessing.shared_memory）に
+  (診療科, 今日からの日数) ごとの「32枠の○×ビットマスク」を固定レイアウトで置き、全ワーカーが読む
+- 書き手はホストに1プロセスだけ（ロックファイルの flock を取れたワーカー）。書き手は
+  1. REFRESH_SECONDS ごとに全診療科・WINDOW_DAYS 日分を再計算する（医師1クエリ + 予約一括取得）
+  2. booked_slots・slot_counters の on_snapshot で変更のあった診療科だけをすぐ再計算する
+  書き手のプロセスが落ちるとロックが外れ、次に古いデータを見た読み手が書き手を引き継ぐ
+- 読み手はコピーせずバッファから直接読む。レコードごとの版番号（seqlock: 書き込み中は奇数）で
+  書きかけを検出し、読み直しても揃わなければ共有メモリを使わず通常の計算に回す
+- 更新から STALE_SECONDS 以上経っている・未登録の診療科・範囲外の日付も通常の計算に回す（結果は常に正しい側に倒す）
+- SHARED_AVAILABILITY=1 で有効。flock を使うため POSIX のみ（Windows の開発環境では無効のまま）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import date as date_cls, datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any
+
+import metrics
+from slot_logic import TIME_SLOTS, day_from_mask, slots_to_mask
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("SHARED_AVAILABILITY", "0").strip() == "1"
+NAME = os.environ.get("SHARED_AVAILABILITY_NAME", "reservation_availability")
+# 今日から何日分を置くか（予約フォームの最大 90 日先 + 余裕）
+WINDOW_DAYS = int(os.environ.get("SHARED_AVAILABILITY_DAYS", "92"))
+# 全体の再計算間隔（秒）。変更は on_snapshot で随時反映し、これは取りこぼし対策
+REFRESH_SECONDS = float(os.environ.get("SHARED_AVAILABILITY_REFRESH", "60"))
+# 最終更新からこれ以上経ったデータは使わない（書き手が止まっている）
+STALE_SECONDS = REFRESH_SECONDS * 3
+# 変更通知をまとめる時間（秒）
+DEBOUNCE_SECONDS = 0.2
+
+MAX_DEPARTMENTS = 64
+_NAME_BYTES = 64
+_MAGIC = 0x52534156  # "RSAV"
+_LAYOUT_VERSION = 1
+assert len(TIME_SLOTS) <= 32
+
+# ヘッダー: magic, layout, seq, base（今日の日付の序数）, window_days, 診療科数, use_demo, 予備, 最終更新（UNIX 秒）
+_HEADER = struct.Struct("<IIIIIIIId")
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 8
+_REFRESHED_OFFSET = 32
+# レコード: seq, mask, flags, 予備
+_RECORD = struct.Struct("<IIII")
+_FLAG_VALID = 1
+_FLAG_HAS_DOCTORS = 2
+
+
+def _size(window_days: int) -> int:
+    return _HEADER_SIZE + MAX_DEPARTMENTS * _NAME_BYTES + MAX_DEPARTMENTS * window_days * _RECORD.size
+
+
+def _open_segment(name: str, *, create: bool, size: int = 0) -> shared_memory.SharedMemory:
+    """
+    共有メモリを開く。プロセス終了時に resource_tracker が消さないよう追跡を外す
+    （書き手が入れ替わっても読み手の見ている領域が残るようにするため。領域はホスト再起動まで残る）。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:  # Python 3.12 以前
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedAvailability:
+    """共有メモリ上の空き状況テーブル（書き手・読み手共通）"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, *, writer: bool):
+        self._shm = shm
+        self._buf = shm.buf
+        self.writer = writer
+        # 読み手: ヘッダーの seq → 診療科名 → 番号（名前表はヘッダー seq が変わったときだけ読み直す）
+        self._names_seq = -1
+        self._names: dict[str, int] = {}
+        # 書き手: 診療科名 → 番号
+        self._index: dict[str, int] = {}
+
+    @classmethod
+    def create(cls, name: str, window_days: int, use_demo: bool) -> "SharedAvailability":
+        """書き手として開く（無ければ作る・大きさが合わなければ作り直す）。内容は空にする"""
+        size = _size(window_days)
+        try:
+            shm = _open_segment(name, create=True, size=size)
+        except FileExistsError:
+            shm = _open_segment(name, create=False)
+            if shm.size < size:
+                shm.close()
+                shared_memory.SharedMemory(name=name).unlink()
+                shm = _open_segment(name, create=True, size=size)
+        store = cls(shm, writer=True)
+        store._begin_header()
+        shm.buf[_HEADER_SIZE:size] = bytes(size - _HEADER_SIZE)
+        seq = struct.unpack_from("<I", shm.buf, _SEQ_OFFSET)[0]
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, _LAYOUT_VERSION, seq, date_cls.today().toordinal(), window_days, 0, int(use_demo), 0, 0.0)
+        store._end_header()
+        return store
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedAvailability | None":
+        """読み手として開く。まだ無い・レイアウトが違うなら None"""
+        try:
+            shm = _open_segment(name, create=False)
+        except FileNotFoundError:
+            return None
+        magic, layout = struct.unpack_from("<II", shm.buf, 0)
+        if magic != _MAGIC or layout != _LAYOUT_VERSION:
+            shm.close()
+            return None
+        return cls(shm, writer=False)
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        shared_memory.SharedMemory(name=self._shm.name).unlink()
+
+    # ----- ヘッダー -----
+    def _header(self) -> tuple[int, int, int, int, int, float]:
+        """(seq, base, window_days, 診療科数, use_demo, 最終更新)"""
+        _, _, seq, base, window, count, demo, _, refreshed = _HEADER.unpack_from(self._buf, 0)
+        return seq, base, window, count, demo, refreshed
+
+    def _begin_header(self) -> None:
+        seq = struct.unpack_from("<I", self._buf, _SEQ_OFFSET)[0]
+        struct.pack_into("<I", self._buf, _SEQ_OFFSET, (seq + 1) | 1)
+
+    def _end_header(self) -> None:
+        seq = struct.unpack_from("<I", self._buf, _SEQ_OFFSET)[0]
+        struct.pack_into("<I", self._buf, _SEQ_OFFSET, (seq + 1) & 0xFFFFFFFE)
+
+    def refreshed_at(self) -> float:
+        return struct.unpack_from("<d", self._buf, _REFRESHED_OFFSET)[0]
+
+    def _record_offset(self, index: int, offset: int, window: int) -> int:
+        return _HEADER_SIZE + MAX_DEPARTMENTS * _NAME_BYTES + (index * window + offset) * _RECORD.size
+
+    # ----- 読み手 -----
+    def _department_index(self, department: str, header_seq: int, count: int) -> int | None:
+        if header_seq != self._names_seq:
+            names = {}
+            for i in range(min(count, MAX_DEPARTMENTS)):
+                start = _HEADER_SIZE + i * _NAME_BYTES
+                raw = bytes(self._buf[start:start + _NAME_BYTES]).rstrip(b"\0")
+                names[raw.decode("utf-8", errors="replace")] = i
+            self._names, self._names_seq = names, header_seq
+        return self._names.get(department)
+
+    def _read_record(self, pos: int) -> tuple[int, int] | None:
+        """(mask, flags)。書きかけなら読み直し、揃わなければ None"""
+        for _ in range(3):
+            seq1, mask, flags, _ = _RECORD.unpack_from(self._buf, pos)
+            if seq1 & 1:
+                continue
+            if struct.unpack_from("<I", self._buf, pos)[0] == seq1:
+                return mask, flags
+        return None
+
+    def lookup(self, department: str, dates: list[str], use_demo: bool) -> tuple[bool, dict[str, dict[str, Any]]] | None:
+        """
+        計算対象日（classify_date が None の日）の空き状況を返す。戻り値は
+        reservation_service._compute_base_availability と同じ (医師がいるか, 日付 → 1日分)。使えなければ None。
+        """
+        for _ in range(3):
+            seq, base, window, count, demo, refreshed = self._header()
+            if seq & 1:
+                continue
+            if time.time() - refreshed > STALE_SECONDS or bool(demo) != use_demo:
+                return None
+            index = self._department_index(department, seq, count)
+            if index is None:
+                return None
+            out: dict[str, dict[str, Any]] = {}
+            has_doctors = False
+            for date in dates:
+                try:
+                    offset = datetime.strptime(date, "%Y-%m-%d").toordinal() - base
+                except ValueError:
+                    return None
+                if not 0 <= offset < window:
+                    return None
+                rec = self._read_record(self._record_offset(index, offset, window))
+                if rec is None or not rec[1] & _FLAG_VALID:
+                    return None
+                has_doctors = bool(rec[1] & _FLAG_HAS_DOCTORS)
+                out[date] = day_from_mask(date, rec[0])
+            if struct.unpack_from("<I", self._buf, _SEQ_OFFSET)[0] == seq:
+                return has_doctors, out
+        return None
+
+    # ----- 書き手 -----
+    def _ensure_department(self, department: str) -> int | None:
+        index = self._index.get(department)
+        if index is not None:
+            return index
+        index = len(self._index)
+        raw = department.encode("utf-8")
+        if index >= MAX_DEPARTMENTS or len(raw) > _NAME_BYTES:
+            return None
+        self._begin_header()
+        start = _HEADER_SIZE + index * _NAME_BYTES
+        self._buf[start:start + _NAME_BYTES] = raw.ljust(_NAME_BYTES, b"\0")
+        struct.pack_into("<I", self._buf, 20, index + 1)
+        self._end_header()
+        self._index[department] = index
+        return index
+
+    def roll_to(self, today: date_cls) -> None:
+        """日付が変わったら先頭日を進め、全レコードを無効にする"""
+        _, base, window, *_ = self._header()
+        if base == today.toordinal():
+            return
+        self._begin_header()
+        struct.pack_into("<I", self._buf, 12, today.toordinal())
+        start = self._record_offset(0, 0, window)
+        end = self._record_offset(MAX_DEPARTMENTS, 0, window)
+        self._buf[start:end] = bytes(end - start)
+        self._end_header()
+
+    def write(self, department: str, has_doctors: bool, days: dict[str, dict[str, Any]]) -> None:
+        """診療科の日ごとの計算結果を書き込む（範囲外の日は無視）"""
+        index = self._ensure_department(department)
+        if index is None:
+            return
+        _, base, window, *_ = self._header()
+        flags = _FLAG_VALID | (_FLAG_HAS_DOCTORS if has_doctors else 0)
+        for date, day in days.items():
+            offset = datetime.strptime(date, "%Y-%m-%d").toordinal() - base
+            if not 0 <= offset < window:
+                continue
+            pos = self._record_offset(index, offset, window)
+            seq = struct.unpack_from("<I", self._buf, pos)[0]
+            struct.pack_into("<I", self._buf, pos, (seq + 1) | 1)
+            struct.pack_into("<II", self._buf, pos + 4, slots_to_mask(day["slots"]), flags)
+            struct.pack_into("<I", self._buf, pos, (seq + 2) & 0xFFFFFFFE)
+
+    def mark_refreshed(self) -> None:
+        struct.pack_into("<d", self._buf, _REFRESHED_OFFSET, time.time())
+
+
+# --------------- プロセスごとの状態 ---------------
+_lock = threading.Lock()
+_store: SharedAvailability | None = None
+_lock_fd: int | None = None
+_next_attempt = 0.0
+_dirty: set[str] = set()
+_cond = threading.Condition()
+
+
+def _use_demo() -> bool:
+    return os.environ.get("USE_DEMO_SLOTS", "1").strip() != "0"
+
+
+def _try_become_writer() -> bool:
+    """ロックファイルの flock を取れたら書き手になる（_lock 保持中に呼ぶ）"""
+    global _lock_fd
+    path = os.path.join(tempfile.gettempdir(), f"{NAME}.lock")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _lock_fd = fd
+    return True
+
+
+def _get_store() -> SharedAvailability | None:
+    """
+    共有テーブルを返す。未接続・古いままなら（数秒に1回だけ）書き手の引き継ぎか読み直しを試みる。
+    無効・未準備なら None。
+    """
+    global _store, _next_attempt
+    if not ENABLED or fcntl is None:
+        return None
+    store = _store
+    if store is not None and (store.writer or time.time() - store.refreshed_at() <= STALE_SECONDS):
+        return store
+    now = time.monotonic()
+    with _lock:
+        if _store is not store or now < _next_attempt:
+            return _store
+        _next_attempt = now + 5.0
+        try:
+            if _try_become_writer():
+                new = SharedAvailability.create(NAME, WINDOW_DAYS, _use_demo())
+                threading.Thread(target=_writer_loop, args=(new,), name="shared-availability", daemon=True).start()
+                logger.info("shared_availability: this process (pid=%s) is the writer", os.getpid())
+            else:
+                new = SharedAvailability.attach(NAME)
+        except Exception as e:
+            logger.warning("shared_availability: open failed: %s", e)
+            return store
+        if store is not None and new is not None:
+            store.close()
+        if new is not None:
+            _store = new
+        return _store
+
+
+def lookup(department: str, dates: list[str], use_demo: bool) -> tuple[bool, dict[str, dict[str, Any]]] | None:
+    """共有テーブルから空き状況を引く（reservation_service.get_availability_for_dates から呼ぶ）。使えなければ None"""
+    store = _get_store()
+    if store is None or not dates:
+        return None
+    try:
+        base = store.lookup(department, dates, use_demo)
+    except Exception as e:
+        logger.warning("shared_availability: lookup failed: %s", e)
+        base = None
+    metrics.incr("shared_availability.hit" if base is not None else "shared_availability.miss")
+    return base
+
+
+# --------------- 書き手 ---------------
+def refresh(store: SharedAvailability, departments: set[str] | None = None) -> int:
+    """
+    全診療科（departments 指定時はその診療科のみ）の WINDOW_DAYS 日分を計算して書き込む。書いた診療科数を返す。
+    医師は全件を1クエリ、予約は全医師分を一括取得する（診療科ごとに問い合わせない）。
+    """
+    # reservation_service は空き計算でこのモジュールを使うため、I/O 関数は呼び出し時に import する
+    from reservation_service import _get_firestore, _get_reservations_bulk
+    from slot_logic import _normalize_schedules, classify_date, compute_availability
+
+    today = date_cls.today()
+    store.roll_to(today)
+    _, base, window, *_ = store._header()
+    doctors_by_department: dict[str, list[dict[str, Any]]] = {}
+    for snap in _get_firestore().collection("doctors").stream():
+        d = snap.to_dict() or {}
+        department = str(d.get("department") or "").strip()
+        if not department or (departments is not None and department not in departments):
+            continue
+        doctors_by_department.setdefault(department, []).append({
+            "id": snap.id, "name": d.get("name") or "", "department": department,
+            "schedules": _normalize_schedules(d.get("schedules")),
+        })
+    if departments is not None:
+        for department in departments:
+            doctors_by_department.setdefault(department, [])
+    # 祝日など医師データを見ずに決まる日は読み手も問い合わせないので書かない（判定は診療科に依存しない）
+    dates = [
+        day for day in (date_cls.fromordinal(base + i).isoformat() for i in range(window))
+        if classify_date("-", day, today) is None
+    ]
+    doctor_ids = [doc["id"] for docs in doctors_by_department.values() for doc in docs]
+    reserved = _get_reservations_bulk(doctor_ids, dates)
+    use_demo = _use_demo()
+    for department, docs in doctors_by_department.items():
+        store.write(department, bool(docs), compute_availability(dates, docs, reserved, use_demo=use_demo))
+    store.mark_refreshed()
+    metrics.incr("shared_availability.refresh")
+    return len(doctors_by_department)
+
+
+def _watch_changes() -> Any:
+    """今日以降の booked_slots・slot_counters（定員制の枠）の変更で、その診療科を再計算対象にする"""
+    from reservation_service import _get_firestore
+
+    def make_callback():
+        initial = [True]
+
+        def on_snapshot(_docs, changes, _read_time) -> None:
+            if initial[0]:
+                initial[0] = False
+                return
+            # 削除（キャンセル）は元の内容が取れないため、全体の再計算（"*"）に回す
+            departments = {str((change.document.to_dict() or {}).get("department") or "*") for change in changes}
+            with _cond:
+                _dirty.update(departments)
+                _cond.notify()
+
+        return on_snapshot
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    db = _get_firestore()
+    return [
+        db.collection(collection).where("date", ">=", today).on_snapshot(make_callback())
+        for collection in ("booked_slots", "slot_counters")
+    ]
+
+
+def _writer_loop(store: SharedAvailability) -> None:
+    try:
+        _watch_changes()
+    except Exception as e:
+        logger.warning("shared_availability: watch failed (periodic refresh only): %s", e)
+    next_full = 0.0
+    while True:
+        with _cond:
+            timeout = next_full - time.monotonic()
+            if not _dirty and timeout > 0:
+                _cond.wait(timeout=timeout)
+            has_dirty = bool(_dirty)
+        if has_dirty:
+            time.sleep(DEBOUNCE_SECONDS)
+        with _cond:
+            dirty = set(_dirty)
+            _dirty.clear()
+        full = "*" in dirty or time.monotonic() >= next_full
+        try:
+            refresh(store, None if full else dirty)
+            if full:
+                next_full = time.monotonic() + REFRESH_SECONDS
+        except Exception as e:
+            logger.warning("shared_availability: refresh failed: %s", e)
+            time.sleep(1.0)
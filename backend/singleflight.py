@@ -0,0 +1,75 @@
+"""
+同一計算の相乗り（シングルフライト）
+- 同じキーの計算が実行中なら、後から来た呼び出しは自分では計算せず、その結果を待って受け取る
+- スレッドプール（同期エンドポイント）からは do()、イベントループ上からは do_async() で呼ぶ。
+  両者は同じ実行中テーブルを共有するため、同期・非同期の呼び出しが互いに相乗りできる
+- 実行中の間だけ共有し、結果は保持しない（キャッシュではない）。例外も待機中の全員に伝わる
+- 相乗り回数は metrics の singleflight.{name}.leader / .coalesced で数える
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+import metrics
+
+
+class SingleFlight:
+    """キーごとに実行中の計算を1つに束ねる"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, Future] = {}
+
+    def _join_or_lead(self, key: Hashable) -> tuple[Future, bool]:
+        """実行中の Future と、自分が実行役（leader）かどうかを返す"""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                metrics.incr(f"singleflight.{self.name}.coalesced")
+                return fut, False
+            fut = Future()
+            self._inflight[key] = fut
+        metrics.incr(f"singleflight.{self.name}.leader")
+        return fut, True
+
+    def _run(self, key: Hashable, fut: Future, fn: Callable[[], Any]) -> None:
+        """fn を実行して結果（例外）を Future に渡し、実行中テーブルから外す"""
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+        fut.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """key の計算が実行中なら結果を待ち、無ければ fn() を実行する（同期版）"""
+        fut, leader = self._join_or_lead(key)
+        if leader:
+            self._run(key, fut, fn)
+        return fut.result()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        do() の非同期版。fn は同期関数（Firestore I/O）で、実行役のときは既定の executor で実行する。
+        待機側はスレッドを占有せずにイベントループ上で待つ。
+        """
+        fut, leader = self._join_or_lead(key)
+        if leader:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._run, key, fut, fn)
+        return await asyncio.wrap_future(fut)
+
+    def inflight(self) -> int:
+        """実行中のキー数"""
+        with self._lock:
+            return len(self._inflight)
@@ -0,0 +1,141 @@
+"""
+定員制の枠（1枠に複数人）の予約数カウンター（分散カウンター）
+- 定員 c の枠 (医師, 日, 時間) の予約数は slot_counters/{医師ID}_{日付}_{時間}_{i} の min(c, COUNTER_SHARDS) 個の
+  シャードに分けて数える。シャード i の上限（cap）は c をシャード数で割り振った値で、上限の合計が c なので定員を超えない
+- 予約はランダムな順にシャードを読み、上限に達していないシャードを +1 する（トランザクション）。
+  同時予約が1つのドキュメントに集中しないため、トランザクション競合（中断・再試行）で直列化しない
+- それでも再試行が尽きた場合（競合）は満枠とは区別する。claim_seats が間隔をあけて新しい順序で取り直し、
+  なお取れなければ中断の例外をそのまま送出する（呼び出し側で「混雑」として扱い、満枠とは報告しない）
+- 予約ドキュメントに確保したシャードのID（seats）を記録し、キャンセル・振替ではそのシャードを -1 する
+- 空き判定は日付ごとにシャードを一括取得し、枠ごとの合計が定員に達していれば満枠とする
+- 定員1の枠は従来どおり booked_slots の create() で確保する（このモジュールは使わない）
+"""
+from __future__ import annotations
+
+import os
+import random
+import time
+from collections import Counter
+from typing import Any
+
+from storage import is_aborted, transactional
+
+COLLECTION = "slot_counters"
+# 1枠あたりのシャード数の上限（定員がこれより少なければ定員と同じ数）
+COUNTER_SHARDS = max(1, int(os.environ.get("SLOT_COUNTER_SHARDS", "4")))
+# 競合で take_seats の再試行が尽きたときに取り直す回数（合計の試行回数）と、取り直すまでの待ちの基準（秒。試行ごとに倍）
+CLAIM_ATTEMPTS = max(1, int(os.environ.get("SLOT_COUNTER_CLAIM_ATTEMPTS", "3")))
+CLAIM_BACKOFF_SECONDS = 0.01
+
+
+def shard_caps(capacity: int, shards: int | None = None) -> list[int]:
+    """定員をシャードに割り振った上限の列（合計が capacity）"""
+    n = max(1, min(capacity, shards or COUNTER_SHARDS))
+    base, extra = divmod(capacity, n)
+    return [base + (1 if i < extra else 0) for i in range(n)]
+
+
+def shard_id(doctor_id: str, date: str, time: str, index: int) -> str:
+    return f"{doctor_id}_{date}_{time}_{index}"
+
+
+def _take_one(transaction, db, doctor_id: str, date: str, time: str, capacity: int, rng) -> tuple[Any, dict[str, Any]] | None:
+    """1枠分: シャードをランダムな順に読み、上限に達していない最初のシャードと書き込む内容を返す（満枠なら None）"""
+    caps = shard_caps(capacity)
+    order = list(range(len(caps)))
+    rng.shuffle(order)
+    for i in order:
+        ref = db.collection(COLLECTION).document(shard_id(doctor_id, date, time, i))
+        snap = ref.get(transaction=transaction)
+        count = int((snap.to_dict() or {}).get("count") or 0) if snap.exists else 0
+        if count < caps[i]:
+            return ref, {"count": count + 1, "cap": caps[i]}
+    return None
+
+
+def pick_seats(transaction, db, doctor_id: str, date: str, times: list[str], capacity: int, rng=None) -> list[tuple[str, Any, dict[str, Any]]] | None:
+    """
+    times の各枠で空きのあるシャードを読んで選ぶ（書き込みはしない）。(時刻, シャード参照, 書く内容) の列、満枠の枠があれば None。
+    複数の予約を1トランザクションで確保するとき（batch_booking）は、全件分をこれで読んでから write_seats で書く。
+    """
+    rng = rng or random
+    picked = []
+    for t in times:
+        taken = _take_one(transaction, db, doctor_id, date, t, capacity, rng)
+        if taken is None:
+            return None
+        picked.append((t, *taken))
+    return picked
+
+
+def write_seats(
+    transaction, picked: list[tuple[str, Any, dict[str, Any]]], doctor_id: str, department_label: str, date: str, capacity: int,
+) -> list[str]:
+    """pick_seats で選んだシャードを +1 で書き、シャードIDの列を返す"""
+    for t, ref, data in picked:
+        transaction.set(ref, {
+            "doctorId": doctor_id, "date": date, "time": t, "department": department_label, "capacity": capacity, **data,
+        })
+    return [ref.id for _, ref, _ in picked]
+
+
+@transactional
+def take_seats(
+    transaction, db, doctor_id: str, department_label: str, date: str, times: list[str], capacity: int, rng=None,
+) -> list[str] | None:
+    """
+    times の各枠で1席ずつ確保する（全枠取れたときだけ書く）。確保したシャードIDの列、満枠の枠があれば None。
+    競合で中断されたら新しい順序で再試行される（storage.transactional）。
+    """
+    picked = pick_seats(transaction, db, doctor_id, date, times, capacity, rng)
+    if picked is None:
+        return None
+    return write_seats(transaction, picked, doctor_id, department_label, date, capacity)
+
+
+def claim_seats(
+    db, doctor_id: str, department_label: str, date: str, times: list[str], capacity: int, rng=None,
+) -> list[str] | None:
+    """
+    take_seats を、競合で中断されたら最大 CLAIM_ATTEMPTS 回まで取り直す（待ちはランダムにずらし、シャードの順序も引き直す）。
+    戻り値は take_seats と同じ（満枠なら None）。取り直しても中断されたら、その例外を送出する（満枠ではない）。
+    """
+    for attempt in range(CLAIM_ATTEMPTS):
+        try:
+            return take_seats(db.transaction(), db, doctor_id, department_label, date, times, capacity, rng)
+        except Exception as e:
+            if not is_aborted(e) or attempt == CLAIM_ATTEMPTS - 1:
+                raise
+        time.sleep(random.uniform(0, CLAIM_BACKOFF_SECONDS * 2 ** attempt))
+    return None
+
+
+def seat_refs(db, seats: list[str]) -> list[Any]:
+    return [db.collection(COLLECTION).document(s) for s in seats]
+
+
+def release(transaction, snap, n: int = 1) -> None:
+    """確保済みのシャードを -n する（トランザクションの読み取り後に呼ぶ。同じシャードは1回にまとめること）"""
+    if not snap.exists:
+        return
+    count = int((snap.to_dict() or {}).get("count") or 0)
+    transaction.update(snap.reference, {"count": max(0, count - n)})
+
+
+@transactional
+def release_seats(transaction, db, seats: list[str]) -> None:
+    """take_seats で確保したシャードを返す（予約ドキュメントの作成に失敗したとき用）"""
+    counts = Counter(seats)
+    for snap in list(transaction.get_all(seat_refs(db, list(counts)))):
+        release(transaction, snap, counts[snap.reference.id])
+
+
+def full_slots(docs: list[dict[str, Any]]) -> set[tuple[str, str, str]]:
+    """シャードのデータ列から、合計が定員に達した (doctorId, date, time) の集合を返す"""
+    counts: Counter[tuple[str, str, str]] = Counter()
+    capacity: dict[tuple[str, str, str], int] = {}
+    for d in docs:
+        key = (d.get("doctorId") or "", d.get("date") or "", d.get("time") or "")
+        counts[key] += int(d.get("count") or 0)
+        capacity[key] = max(capacity.get(key, 0), int(d.get("capacity") or 0))
+    return {key for key, n in counts.items() if capacity[key] and n >= capacity[key]}
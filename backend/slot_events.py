@@ -0,0 +1,38 @@
+"""
+予約枠の変更通知（プロセス内）
+- 予約確定・キャンセル・仮押さえなど booked_slots を書き換えた処理が、コミット後に notify() を呼ぶ
+- 受け手（slot_stream の配信ハブなど）は add_listener() で登録する。受け手が無ければ何もしない
+- 受け手の例外は握りつぶしてログのみ（通知の失敗で予約処理を失敗させない）
+"""
+from __future__ import annotations
+
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[str, str, str], None]  # (department, date, time)
+
+_listeners: list[Listener] = []
+
+
+def add_listener(fn: Listener) -> None:
+    """変更通知の受け手を登録する（同じ関数の二重登録はしない）"""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def remove_listener(fn: Listener) -> None:
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def notify(department: str, date: str, time: str) -> None:
+    """診療科・日付・時間の空き状況が変わった可能性を通知する"""
+    if not department or not date or not time:
+        return
+    for fn in list(_listeners):
+        try:
+            fn(department, date, time)
+        except Exception:
+            logger.exception("slot_events listener failed")
@@ -0,0 +1,329 @@
+"""
+予約枠の仮押さえ（ホールド）
+- 予約フォームで枠を選んだ時点で booked_slots に hold=True・holdId・expiresAt 付きのドキュメントを作り、
+  確認画面で入力している間に他の人に取られないようにする
+- 有効な仮押さえは空き判定で予約済みとして扱う（期限切れは空きとみなす: reservation_service._is_expired_hold）
+- 確定（confirm_hold）は1トランザクションで 予約ドキュメント作成 + スロットを本予約へ書き換え を行う
+- 期限切れの回収:
+  1. このプロセスで作った仮押さえは期限順の min-heap に積み、スイーパースレッドが期限到来時に削除する
+  2. 他プロセス分は expiresAt の単一フィールドインデックス（期限順）で定期的に回収する
+  3. 回収前でも、期限切れの仮押さえは予約時に _claim_slot / _claim_run がその場で取り直す
+- 仮押さえは1ユーザー1件。新しく仮押さえすると同じユーザーの以前の仮押さえは解放する
+- 所要時間が複数枠の種別は、連続枠すべてに同じ holdId の仮押さえを置き、確定・解放もまとめて行う
+- 定員制の枠（slot_capacity が2以上の医師）は仮押さえしない。holdId が空の結果を返し、確定時に通常の予約として
+  分散カウンター（slot_counters）で席を確保する
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import metrics
+import slot_events
+import user_booked_cache
+from reservation_service import (
+    SLOT_MINUTES_STEP,
+    _appointment_run,
+    _assign_strategy,
+    _claim_run,
+    _get_firestore,
+    _get_slot_candidates,
+    _is_expired_hold,
+    _overlaps_own_booking,
+    _own_bookings_query,
+    _validate_booking_request,
+    order_candidates,
+    slot_capacity,
+)
+from storage import ASCENDING, server_timestamp, transactional
+
+logger = logging.getLogger(__name__)
+
+# 仮押さえの有効期間（秒）。確認画面で内容を確かめる時間を見込む
+HOLD_TTL_SECONDS = int(os.environ.get("HOLD_TTL_SECONDS", "180"))
+# 他プロセス分も含めた期限切れ回収（expiresAt 順のクエリ）の間隔（秒）と1回の件数
+SWEEP_INTERVAL_SECONDS = float(os.environ.get("HOLD_SWEEP_INTERVAL", "60"))
+SWEEP_BATCH = 200
+# HOLD_SWEEPER=0 でスイーパースレッドを起動しない（別プロセスで sweep_expired_holds を回す場合・テスト用）
+SWEEPER_ENABLED = os.environ.get("HOLD_SWEEPER", "1").strip() != "0"
+
+# (期限, booked_slots のドキュメントID, holdId) の min-heap。このプロセスで作った仮押さえのみ
+_heap: list[tuple[datetime, str, str]] = []
+_cond = threading.Condition()
+_sweeper: threading.Thread | None = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@transactional
+def _delete_hold(transaction, slot_ref, *, hold_id: str = "", user_id: str = "", expired_only: bool = False) -> dict[str, Any] | None:
+    """
+    スロットが条件に合う仮押さえなら削除し、削除したデータを返す（本予約に変わったものは消さない）。
+    hold_id / user_id 指定時は一致するものだけ、expired_only なら期限切れのものだけ。該当しなければ None。
+    """
+    snap = slot_ref.get(transaction=transaction)
+    if not snap.exists:
+        return None
+    data = snap.to_dict() or {}
+    if not data.get("hold"):
+        return None
+    if hold_id and data.get("holdId") != hold_id:
+        return None
+    if user_id and data.get("userId") != user_id:
+        return None
+    if expired_only and not _is_expired_hold(data):
+        return None
+    transaction.delete(slot_ref)
+    return data
+
+
+def _notify_released(data: dict[str, Any] | None) -> bool:
+    """解放した仮押さえの枠について空き状況の変更を通知する。解放していれば True。"""
+    if data is None:
+        return False
+    slot_events.notify(data.get("department") or "", data.get("date") or "", data.get("time") or "")
+    return True
+
+
+def _find_hold(db, hold_id: str) -> list[Any]:
+    """holdId から booked_slots のスナップショットを時間順に引く（複数枠の仮押さえは枠の数だけ。無ければ空）"""
+    snaps = list(db.collection("booked_slots").where("holdId", "==", hold_id).stream())
+    return sorted(snaps, key=lambda snap: (snap.to_dict() or {}).get("time") or "")
+
+
+def release_user_holds(user_id: str, *, except_hold_id: str = "") -> int:
+    """ユーザーの仮押さえをすべて解放する（except_hold_id は残す）。解放した件数を返す。"""
+    db = _get_firestore()
+    released = 0
+    q = db.collection("booked_slots").where("userId", "==", user_id).where("hold", "==", True)
+    for snap in q.stream():
+        hid = (snap.to_dict() or {}).get("holdId") or ""
+        if hid and hid == except_hold_id:
+            continue
+        if _notify_released(_delete_hold(db.transaction(), snap.reference, hold_id=hid, user_id=user_id)):
+            released += 1
+    return released
+
+
+def place_hold(department_label: str, date: str, time: str, user_id: str, *, purpose: str = "") -> dict[str, Any]:
+    """
+    空いている医師の枠を HOLD_TTL_SECONDS 秒だけ仮押さえする（purpose の所要時間分の連続枠）。
+    入力チェックは create_reservation と同じ。空きが無ければ ValueError。
+    戻り値: {"holdId", "department", "date", "time", "expiresAt"(ISO 8601)}。定員制の枠は holdId・expiresAt が空。
+    """
+    department_label, date, time, user_id = _validate_booking_request(department_label, date, time, user_id)
+    times = _appointment_run(department_label, time, purpose)
+    db = _get_firestore()
+    # create_reservation と同じく、占める枠の重なる自分の予約があれば仮押さえしない
+    if _overlaps_own_booking(_own_bookings_query(db, user_id, department_label, date).stream(), times):
+        raise ValueError("この診療科・日時はすでに予約済みです。予約一覧からご確認ください。")
+
+    try:
+        release_user_holds(user_id)
+    except Exception as e:
+        logger.warning("place_hold: releasing previous holds failed: %s", e)
+
+    available, load = _get_slot_candidates(department_label, date, time, len(times))
+    if any(slot_capacity(d, department_label) > 1 for d in available):
+        # 定員制の枠は1人の仮押さえで枠全体を塞がない（確定時に席を確保する）
+        return {"holdId": "", "department": department_label, "date": date, "time": time, "expiresAt": ""}
+    strategy = _assign_strategy()
+    ordered = order_candidates(available, strategy, date=date, time=time, user_id=user_id, load=load)
+    hold_id = secrets.token_urlsafe(16)
+    expires_at = _now() + timedelta(seconds=HOLD_TTL_SECONDS)
+    doctor, sids = _claim_run(
+        db, ordered, department_label, date, times, user_id,
+        strategy=strategy, extra={"hold": True, "holdId": hold_id, "expiresAt": expires_at},
+    )
+    if not doctor:
+        raise ValueError("この時間は現在予約できません。別の時間をお選びください。")
+    metrics.incr("slot_holds_placed")
+    for sid, t in zip(sids, times):
+        _schedule(expires_at, sid, hold_id)
+        slot_events.notify(department_label, date, t)
+    logger.info("place_hold: slots=%s hold=%s expires=%s", ",".join(sids), hold_id, expires_at.isoformat())
+    return {
+        "holdId": hold_id,
+        "department": department_label,
+        "date": date,
+        "time": time,
+        "expiresAt": expires_at.isoformat(),
+    }
+
+
+def release_hold(hold_id: str, user_id: str) -> bool:
+    """仮押さえを解放する（本人の有効・期限切れの仮押さえのみ）。解放したら True。"""
+    if not hold_id or not user_id:
+        return False
+    db = _get_firestore()
+    released = False
+    for snap in _find_hold(db, hold_id):
+        if _notify_released(_delete_hold(db.transaction(), snap.reference, hold_id=hold_id, user_id=user_id)):
+            released = True
+    if released:
+        metrics.incr("slot_holds_released")
+    return released
+
+
+@transactional
+def _confirm_in_transaction(
+    transaction, db, slot_refs: list[Any], res_ref, hold_id: str, user_id: str,
+    department_label: str, date: str, times: list[str], purpose: str,
+) -> dict[str, Any] | None:
+    """
+    仮押さえが有効なら本予約に変える（予約作成 + スロット書き換え）。無効なら None。
+    slot_refs は times（予約が占める枠）の順。全枠が同じ医師・同じ holdId の有効な仮押さえであること。
+    仮押さえ後に同じユーザーの重なる予約ができていれば ValueError（利用者向けメッセージ）。
+    """
+    datas = []
+    for ref, t in zip(slot_refs, times):
+        snap = ref.get(transaction=transaction)
+        data = (snap.to_dict() or {}) if snap.exists else {}
+        if (
+            not data.get("hold") or data.get("holdId") != hold_id or data.get("userId") != user_id
+            or data.get("department") != department_label or data.get("date") != date or data.get("time") != t
+            or _is_expired_hold(data)
+        ):
+            return None
+        datas.append(data)
+    doctor_id = datas[0].get("doctorId") or ""
+    if any(d.get("doctorId") != doctor_id for d in datas):
+        return None
+    if _overlaps_own_booking(transaction.get(_own_bookings_query(db, user_id, department_label, date)), times):
+        raise ValueError("この診療科・日時はすでに予約済みです。予約一覧からご確認ください。")
+    doctor_name = ""
+    doctor_snap = db.collection("doctors").document(doctor_id).get(transaction=transaction)
+    if doctor_snap.exists:
+        doctor_name = str((doctor_snap.to_dict() or {}).get("name") or "").strip()
+    transaction.create(res_ref, {
+        "date": date,
+        "time": times[0],
+        "category": "",
+        "department": department_label,
+        "purpose": purpose,
+        "duration": len(times) * SLOT_MINUTES_STEP,
+        "doctor": doctor_name or "（自動割当）",
+        "doctorId": doctor_id,
+        "createdAt": server_timestamp(),
+    })
+    # hold 関連フィールドを含まない通常の予約スロットに置き換える
+    for ref, t, data in zip(slot_refs, times, datas):
+        transaction.set(ref, {
+            "doctorId": doctor_id,
+            "date": date,
+            "time": t,
+            "department": department_label,
+            "userId": user_id,
+            "reservationId": res_ref.id,
+            "createdAt": data.get("createdAt") or server_timestamp(),
+        })
+    return {"id": res_ref.id, "doctorId": doctor_id}
+
+
+def confirm_hold(hold_id: str, department_label: str, date: str, time: str, user_id: str, *, purpose: str = "") -> dict[str, Any] | None:
+    """
+    仮押さえを本予約にする（1トランザクション）。
+    仮押さえが見つからない・期限切れ・内容不一致（種別の所要時間と仮押さえの枠数が違う場合を含む）なら None
+    （呼び出し側で通常の予約にフォールバックする）。戻り値は create_reservation と同じ形。
+    同じユーザーの重なる予約があれば仮押さえを解放して ValueError。
+    """
+    department_label, date, time, user_id = _validate_booking_request(department_label, date, time, user_id)
+    purpose = (purpose or "").strip()
+    times = _appointment_run(department_label, time, purpose)
+    db = _get_firestore()
+    snaps = _find_hold(db, hold_id) if hold_id else []
+    if len(snaps) != len(times):
+        return None
+    res_ref = db.collection("users").document(user_id).collection("reservations").document()
+    try:
+        out = _confirm_in_transaction(
+            db.transaction(), db, [snap.reference for snap in snaps], res_ref, hold_id, user_id, department_label, date, times, purpose,
+        )
+    except ValueError:
+        release_hold(hold_id, user_id)
+        raise
+    if out is None:
+        return None
+    metrics.incr("slot_holds_confirmed")
+    user_booked_cache.add(user_id, department_label, date, times)
+    logger.info("confirm_hold done: hold=%s reservation=%s", hold_id, out["id"])
+    return {
+        "id": out["id"],
+        "departmentId": department_label,
+        "doctorId": out["doctorId"],
+        "date": date,
+        "time": time,
+        "userId": user_id,
+    }
+
+
+# --------------- 期限切れの回収 ---------------
+def sweep_expired_holds(limit: int = SWEEP_BATCH) -> int:
+    """
+    期限切れの仮押さえを expiresAt 順に最大 limit 件回収する（全プロセス分）。回収した件数を返す。
+    expiresAt を持つのは仮押さえだけなので、単一フィールドインデックスの範囲クエリで済む。
+    """
+    db = _get_firestore()
+    q = db.collection("booked_slots").where("expiresAt", "<=", _now()).order_by("expiresAt", direction=ASCENDING).limit(limit)
+    swept = 0
+    for snap in q.stream():
+        if _notify_released(_delete_hold(db.transaction(), snap.reference, expired_only=True)):
+            swept += 1
+    if swept:
+        metrics.incr("slot_holds_expired", swept)
+    return swept
+
+
+def _pop_due(now: datetime) -> list[tuple[str, str]]:
+    """heap から期限到来分を取り出す（_cond 保持中に呼ぶ）"""
+    due = []
+    while _heap and _heap[0][0] <= now:
+        _, sid, hold_id = heapq.heappop(_heap)
+        due.append((sid, hold_id))
+    return due
+
+
+def _sweep_loop() -> None:
+    next_full_sweep = _now()
+    while True:
+        with _cond:
+            now = _now()
+            due = _pop_due(now)
+            if not due and now < next_full_sweep:
+                wait_until = next_full_sweep if not _heap else min(_heap[0][0], next_full_sweep)
+                _cond.wait(timeout=max((wait_until - now).total_seconds(), 0.01))
+                continue
+        try:
+            db = _get_firestore()
+            expired = 0
+            for sid, hold_id in due:
+                slot_ref = db.collection("booked_slots").document(sid)
+                if _notify_released(_delete_hold(db.transaction(), slot_ref, hold_id=hold_id, expired_only=True)):
+                    expired += 1
+            if expired:
+                metrics.incr("slot_holds_expired", expired)
+            if _now() >= next_full_sweep:
+                next_full_sweep = _now() + timedelta(seconds=SWEEP_INTERVAL_SECONDS)
+                sweep_expired_holds()
+        except Exception as e:
+            logger.warning("hold sweeper failed: %s", e)
+
+
+def _schedule(expires_at: datetime, slot_doc_id: str, hold_id: str) -> None:
+    """仮押さえを期限 heap に積み、スイーパーを（未起動なら）起動する"""
+    global _sweeper
+    with _cond:
+        heapq.heappush(_heap, (expires_at, slot_doc_id, hold_id))
+        if not SWEEPER_ENABLED:
+            return
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_loop, name="slot-hold-sweeper", daemon=True)
+            _sweeper.start()
+        _cond.notify()
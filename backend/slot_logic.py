@@ -0,0 +1,501 @@
+"""
+空き枠計算の純粋ロジック（Firebase 非依存）
+- 時間枠グリッド・祝日判定・勤務スケジュール正規化・空き判定をここに集約する
+- Firestore へのアクセスは一切行わないため、CLI・テスト・ワーカーから即座に import できる
+- I/O は reservation_service が担当し、取得済みのデータをこのモジュールの関数に渡す
+"""
+from __future__ import annotations
+
+import math
+import random
+import zlib
+from datetime import date as date_cls, datetime
+from typing import Any, Iterable
+
+# 15分刻み 09:00〜16:45（フロント getTimeSlots と一致）
+TIME_SLOTS = [
+    f"{h:02d}:{m:02d}"
+    for h in range(9, 17)
+    for m in (0, 15, 30, 45)
+]
+
+WEEKDAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def _weekday_key(date_str: str) -> str:
+    """YYYY-MM-DD → mon, tue, ... (0=Mon)"""
+    try:
+        dt = datetime.strptime(date_str, "%Y-%m-%d")
+        return WEEKDAY_KEYS[dt.weekday()]
+    except (ValueError, IndexError):
+        return "sun"
+
+
+# TIME_SLOTS の各枠の位置（勤務ビットマスクのビット番号）と開始分
+_SLOT_INDEX = {t: i for i, t in enumerate(TIME_SLOTS)}
+_SLOT_MINUTES = [int(t[:2]) * 60 + int(t[3:]) for t in TIME_SLOTS]
+SLOT_MINUTES_STEP = 15
+FULL_DAY_MASK = (1 << len(TIME_SLOTS)) - 1
+
+
+def _minutes(hhmm: str) -> int:
+    h, m = hhmm.strip().split(":")
+    return int(h) * 60 + int(m)
+
+
+def parse_day_schedule(value: Any) -> int:
+    """
+    1曜日分の勤務を TIME_SLOTS のビットマスク（i 番目の枠に勤務なら bit i が1）にする。受け付ける形式:
+    - 勤務時間帯: ["09:00-12:00", "13:00-17:00"]（開始を含み終了を含まない）
+    - 曜日ごとの整数マスク: 0b1111...
+    - 従来の枠の列挙: ["09:00", "09:15", ...]
+    不正な値・要素は無視する（勤務なし扱い）。
+    """
+    if isinstance(value, bool):
+        return 0
+    if isinstance(value, int):
+        return value & FULL_DAY_MASK
+    if not isinstance(value, list):
+        return 0
+    mask = 0
+    for item in value:
+        if not isinstance(item, str):
+            continue
+        if "-" in item:
+            start, _, end = item.partition("-")
+            try:
+                lo, hi = _minutes(start), _minutes(end)
+            except ValueError:
+                continue
+            for i, m in enumerate(_SLOT_MINUTES):
+                if lo <= m < hi:
+                    mask |= 1 << i
+        elif item in _SLOT_INDEX:
+            mask |= 1 << _SLOT_INDEX[item]
+    return mask
+
+
+def _normalize_schedules(schedules: dict[str, Any] | None) -> dict[str, int]:
+    """schedules（どの形式でも）を WEEKDAY_KEYS ごとの勤務ビットマスクに正規化する（キー欠損・不正値は 0）"""
+    schedules = schedules if isinstance(schedules, dict) else {}
+    return {k: parse_day_schedule(schedules.get(k)) for k in WEEKDAY_KEYS}
+
+
+def schedule_ranges(mask: int) -> list[str]:
+    """勤務ビットマスクを時間帯の列（["09:00-12:00", ...]）にする。parse_day_schedule の逆変換"""
+    ranges: list[str] = []
+    i, n = 0, len(TIME_SLOTS)
+    while i < n:
+        if not mask >> i & 1:
+            i += 1
+            continue
+        j = i
+        while j + 1 < n and mask >> (j + 1) & 1 and _SLOT_MINUTES[j + 1] - _SLOT_MINUTES[j] == SLOT_MINUTES_STEP:
+            j += 1
+        end = _SLOT_MINUTES[j] + SLOT_MINUTES_STEP
+        ranges.append(f"{TIME_SLOTS[i]}-{end // 60:02d}:{end % 60:02d}")
+        i = j + 1
+    return ranges
+
+
+def compact_schedules(schedules: dict[str, Any] | None) -> dict[str, list[str]]:
+    """doctors に保存する形（曜日ごとの勤務時間帯）にする。移行スクリプト・シード用"""
+    return {k: schedule_ranges(mask) for k, mask in _normalize_schedules(schedules).items()}
+
+
+def _day_mask(doctor: dict[str, Any], weekday_key: str) -> int:
+    """医師のその曜日の勤務マスク（正規化済みならそのまま、未正規化ならその場で変換）"""
+    value = (doctor.get("schedules") or {}).get(weekday_key)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return parse_day_schedule(value)
+
+
+def _is_working(doctor: dict[str, Any], date: str, time: str) -> bool:
+    """その日・その時間に勤務しているか（その曜日の勤務マスクで time の枠が立っているか）"""
+    index = _SLOT_INDEX.get(time)
+    return index is not None and bool(_day_mask(doctor, _weekday_key(date)) >> index & 1)
+
+
+# 予約1件の所要時間（分）。(診療科, 種別) → 分で、"*" はどの診療科・種別にも当てはまる。
+# 引く順: (診療科, 種別) → (診療科, "*") → ("*", 種別) → SLOT_MINUTES_STEP（1枠）
+APPOINTMENT_MINUTES: dict[tuple[str, str], int] = {
+    ("*", "初診"): 30,
+    ("画像診断・検査", "*"): 60,
+}
+# 診療科ごとの予約開始時刻の刻み（分）。未登録の診療科は SLOT_MINUTES_STEP（どの枠からでも開始できる）
+START_STEP_MINUTES: dict[str, int] = {
+    "画像診断・検査": 30,
+}
+
+
+# 1枠に受け入れる患者数（定員）の診療科ごとの既定。doctors の capacity（1以上の整数）があればそちらを優先し、
+# どちらも無ければ1（医師1人・1枠に1人）。定員2以上の枠は slot_counters の分散カウンターで数える
+DEPARTMENT_SLOT_CAPACITY: dict[str, int] = {
+    "臨床検査": 3,
+    "リハビリテーション科": 2,
+}
+
+
+def slot_capacity(doctor: dict[str, Any], department_label: str = "") -> int:
+    """医師の1枠あたりの定員"""
+    value = doctor.get("capacity")
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 1:
+        return value
+    department_label = (department_label or doctor.get("department") or "").strip()
+    return DEPARTMENT_SLOT_CAPACITY.get(department_label, 1)
+
+
+def appointment_minutes(department_label: str, purpose: str = "") -> int:
+    """診療科・種別から予約1件の所要時間（分）を返す"""
+    department_label, purpose = (department_label or "").strip(), (purpose or "").strip()
+    for key in ((department_label, purpose), (department_label, "*"), ("*", purpose)):
+        if key in APPOINTMENT_MINUTES:
+            return APPOINTMENT_MINUTES[key]
+    return SLOT_MINUTES_STEP
+
+
+def appointment_slots(department_label: str, purpose: str = "") -> int:
+    """予約1件が占める連続枠数（所要時間を枠の長さで切り上げ、最低1）"""
+    return max(1, -(-appointment_minutes(department_label, purpose) // SLOT_MINUTES_STEP))
+
+
+def longest_appointment_slots() -> int:
+    """どの診療科・種別の予約1件でも占めうる最大の連続枠数（一括処理の書き込み数の見積もり用）"""
+    return max(1, *(-(-m // SLOT_MINUTES_STEP) for m in APPOINTMENT_MINUTES.values()))
+
+
+def start_mask(department_label: str) -> int:
+    """その診療科で予約を開始できる枠のビットマスク（最初の枠から START_STEP_MINUTES 刻み）"""
+    step = START_STEP_MINUTES.get((department_label or "").strip(), SLOT_MINUTES_STEP)
+    mask = 0
+    for i, m in enumerate(_SLOT_MINUTES):
+        if (m - _SLOT_MINUTES[0]) % step == 0:
+            mask |= 1 << i
+    return mask
+
+
+def run_starts(free: int, k: int) -> int:
+    """
+    free（空き枠のビットマスク）の中で、k 枠連続して空いている区間の開始位置のビットマスクを返す。
+    r = free から始めて「r の各ビットが span 枠連続の開始」を保ちながら span を倍々に伸ばすため、
+    枠を1つずつ見ずに O(log k) 回のシフトと AND で済む。
+    """
+    if k <= 1:
+        return free
+    r, span = free, 1
+    while span < k:
+        step = min(span, k - span)
+        r &= r >> step
+        span += step
+    return r
+
+
+def slot_run(time: str, k: int) -> list[str] | None:
+    """time から始まる連続 k 枠の時刻の列。グリッドからはみ出す・途中で時刻が途切れるなら None"""
+    index = _SLOT_INDEX.get(time)
+    if index is None or k < 1 or index + k > len(TIME_SLOTS):
+        return None
+    if _SLOT_MINUTES[index + k - 1] - _SLOT_MINUTES[index] != (k - 1) * SLOT_MINUTES_STEP:
+        return None
+    return TIME_SLOTS[index:index + k]
+
+
+def _reserved_mask(doctor_id: str, date: str, reserved: set[tuple[str, str, str]]) -> int:
+    """その医師・日の予約済み枠のビットマスク"""
+    mask = 0
+    for i, t in enumerate(TIME_SLOTS):
+        if (doctor_id, date, t) in reserved:
+            mask |= 1 << i
+    return mask
+
+
+def free_mask(doctor: dict[str, Any], date: str, reserved: set[tuple[str, str, str]]) -> int:
+    """医師のその日の空き枠（勤務中かつ未予約）のビットマスク"""
+    return _day_mask(doctor, _weekday_key(date)) & ~_reserved_mask(doctor["id"], date, reserved)
+
+
+# 医師割当の戦略（環境変数 ASSIGN_STRATEGY で選択）
+# - first:        Firestore の取得順（従来動作）。同時予約が同じ医師のスロットに集中しやすい
+# - random:       ランダムな位置から巡回。同時リクエストの衝突先を分散する
+# - least_loaded: その日の予約数が少ない医師から（同数はランダム）。負荷平準化と分散を兼ねる
+# - user_hash:    ユーザー・日時のハッシュで開始位置を決める。同じユーザーの再試行は同じ医師に向かう
+ASSIGN_STRATEGIES = ("first", "random", "least_loaded", "user_hash")
+DEFAULT_ASSIGN_STRATEGY = "least_loaded"
+
+
+def order_candidates(
+    candidates: list[dict[str, Any]],
+    strategy: str = "first",
+    *,
+    date: str = "",
+    time: str = "",
+    user_id: str = "",
+    load: dict[str, int] | None = None,
+    rng: random.Random | None = None,
+) -> list[dict[str, Any]]:
+    """
+    空いている医師を、スロット確保を試す順に並べ替える。
+    load は医師ID → その日の予約数（least_loaded 用、予約一括取得の結果から数える）。
+    """
+    n = len(candidates)
+    if n <= 1 or strategy == "first" or strategy not in ASSIGN_STRATEGIES:
+        return list(candidates)
+    rng = rng or random
+    if strategy == "least_loaded":
+        load = load or {}
+        keyed = [(load.get(d.get("id", ""), 0), rng.random(), i) for i, d in enumerate(candidates)]
+        return [candidates[i] for _, _, i in sorted(keyed)]
+    if strategy == "user_hash":
+        start = zlib.crc32(f"{user_id}|{date}|{time}".encode("utf-8")) % n
+    else:  # random
+        start = rng.randrange(n)
+    return candidates[start:] + candidates[:start]
+
+
+def assign_doctor(available_doctors: list[dict[str, Any]], strategy: str = "first", **kwargs: Any) -> dict[str, Any] | None:
+    """空いている医師から1人を選択（strategy の並びの先頭を返す。既定は先頭）"""
+    if not available_doctors:
+        return None
+    return order_candidates(available_doctors, strategy, **kwargs)[0]
+
+
+def _nth_monday(year: int, month: int, n: int) -> int:
+    """year/month の第n月曜の日を返す（weekday(): 0=Mon）"""
+    first = datetime(year, month, 1)
+    return (n - 1) * 7 + 1 + (7 - first.weekday()) % 7
+
+
+def _vernal_equinox_day(year: int) -> int:
+    """春分の日（簡易天文計算: 2000〜2099年用）"""
+    return math.floor(20.8431 + 0.242194 * (year - 1980) - math.floor((year - 1980) / 4))
+
+
+def _autumnal_equinox_day(year: int) -> int:
+    """秋分の日（簡易天文計算: 2000〜2099年用）"""
+    return math.floor(23.2488 + 0.242194 * (year - 1980) - math.floor((year - 1980) / 4))
+
+
+def _is_japanese_holiday(date_str: str) -> bool:
+    """日本の祝日かどうか。フロント utils/holiday.js isJapaneseHoliday と同一条件にすること。"""
+    try:
+        dt = datetime.strptime(date_str, "%Y-%m-%d")
+    except (ValueError, TypeError):
+        return False
+    y, m, d = dt.year, dt.month, dt.day
+    # 固定祝日
+    fixed = [
+        (1, 1),    # 元日
+        (2, 11),   # 建国記念の日
+        (2, 23),   # 天皇誕生日（令和）
+        (4, 29),   # 昭和の日
+        (5, 3),    # 憲法記念日
+        (5, 4),    # みどりの日
+        (5, 5),    # こどもの日
+        (8, 11),   # 山の日
+        (11, 3),   # 文化の日
+        (11, 23),  # 勤労感謝の日
+    ]
+    if (m, d) in fixed:
+        return True
+    # 成人の日（1月第2月曜）
+    if m == 1 and d == _nth_monday(y, 1, 2):
+        return True
+    # 春分の日
+    if m == 3 and d == _vernal_equinox_day(y):
+        return True
+    # 海の日（7月第3月曜）
+    if m == 7 and d == _nth_monday(y, 7, 3):
+        return True
+    # 敬老の日（9月第3月曜）
+    if m == 9 and d == _nth_monday(y, 9, 3):
+        return True
+    # 秋分の日
+    if m == 9 and d == _autumnal_equinox_day(y):
+        return True
+    # スポーツの日（10月第2月曜）
+    if m == 10 and d == _nth_monday(y, 10, 2):
+        return True
+    return False
+
+
+def _demo_reservable(date_str: str, time_str: str) -> bool:
+    """デモ用: 平日の 09:00〜11:45 を予約可とする（シード未実行時用）"""
+    try:
+        dt = datetime.strptime(date_str, "%Y-%m-%d")
+        if dt.weekday() >= 5:  # 土日は×
+            return False
+    except (ValueError, TypeError):
+        return False
+    demo_times = [t for t in TIME_SLOTS if t < "12:00"]  # 09:00〜11:45
+    return time_str in demo_times
+
+
+def _all_false_slots() -> list[dict[str, Any]]:
+    """全枠 reservable=False のスロット一覧"""
+    return [{"time": t, "reservable": False} for t in TIME_SLOTS]
+
+
+def _day_result(
+    date: str, slots: list[dict[str, Any]], *, is_holiday: bool = False, reason: str | None = None, degraded: bool = False,
+) -> dict[str, Any]:
+    """1日分のレスポンス dict（AvailabilityForDateResponse と同形）を組み立てる"""
+    return {
+        "date": date,
+        "is_holiday": is_holiday,
+        "reservable": any(s["reservable"] for s in slots),
+        "reason": reason,
+        "degraded": degraded,
+        "slots": slots,
+    }
+
+
+def classify_date(department_label: str, date: str, today: date_cls) -> dict[str, Any] | None:
+    """
+    医師データを見ずに決まる日（休診・過去日・祝日）の結果を返す。計算が必要な日は None。
+    判定優先: 入力不備 → 過去日 → 祝日。
+    """
+    if not date or not department_label:
+        return _day_result(date or "", _all_false_slots(), reason="closed")
+    try:
+        dt = datetime.strptime(date, "%Y-%m-%d")
+    except (ValueError, TypeError):
+        return _day_result(date, _all_false_slots(), reason="closed")
+    if dt.date() < today:
+        return _day_result(date, _all_false_slots(), reason="past")
+    # 祝日は必ず is_holiday: True と全枠 reservable: False を返す（フロントは isHoliday で表示制御）
+    if _is_japanese_holiday(date):
+        return _day_result(date, _all_false_slots(), is_holiday=True, reason="holiday")
+    return None
+
+
+def degraded_day(date: str) -> dict[str, Any]:
+    """
+    予約状況を読めなかった日の結果（全枠×・reason="degraded"・degraded=True）。
+    読み取りの失敗・期限切れで空きを推測せず、予約済みの枠を○と誤表示しないために使う。
+    """
+    return _day_result(date, _all_false_slots(), reason="degraded", degraded=True)
+
+
+def compute_day_slots(
+    date: str,
+    doctors: list[dict[str, Any]],
+    reserved: set[tuple[str, str, str]],
+    user_booked: set[tuple[str, str]] | None = None,
+    *,
+    slots_needed: int = 1,
+    starts: int = FULL_DAY_MASK,
+) -> list[dict[str, Any]]:
+    """
+    1日分の各時間枠の空き判定（メモリ上のみ）。
+    ルール: 勤務中かつ未予約の枠が slots_needed 個続く医師が1人でもいれば、その開始枠を○（ただしユーザー既存予約は×）。
+    starts は開始できる枠のマスク（start_mask）。医師ごとの空き枠マスクに run_starts をかけ、医師間で OR する。
+    """
+    user_booked = user_booked or set()
+    ok = 0
+    for doc in doctors:
+        ok |= run_starts(free_mask(doc, date, reserved), slots_needed)
+    ok &= starts
+    # このユーザーが既に同じ診療科+日+時間で予約済みなら×
+    return [
+        {"time": t, "reservable": bool(ok >> i & 1) and (date, t) not in user_booked}
+        for i, t in enumerate(TIME_SLOTS)
+    ]
+
+
+def available_for_run(
+    doctors: list[dict[str, Any]], date: str, time: str, reserved: set[tuple[str, str, str]], slots_needed: int = 1,
+) -> list[dict[str, Any]]:
+    """time から slots_needed 枠続けて空いている医師（予約確保の候補）"""
+    index = _SLOT_INDEX.get(time)
+    if index is None:
+        return []
+    return [d for d in doctors if run_starts(free_mask(d, date, reserved), slots_needed) >> index & 1]
+
+
+def compute_doctor_grid(
+    date: str, doctors: list[dict[str, Any]], reserved: set[tuple[str, str, str]], *, past: bool = False, is_holiday: bool = False,
+) -> list[dict[str, Any]]:
+    """
+    1日分の医師 × 枠の表（メモリ上のみ）。医師ごとに TIME_SLOTS 順の working（勤務）・booked（予約済み・満席）・free（予約可）。
+    祝日は勤務なし、過去日は勤務・予約はそのまま示して free をすべて False にする。
+    """
+    rows = []
+    for doc in doctors:
+        working = 0 if is_holiday else _day_mask(doc, _weekday_key(date))
+        booked = _reserved_mask(doc["id"], date, reserved)
+        free = 0 if past else working & ~booked
+        rows.append({
+            "id": doc["id"],
+            "name": doc.get("name") or "",
+            "working": [bool(working >> i & 1) for i in range(len(TIME_SLOTS))],
+            "booked": [bool(booked >> i & 1) for i in range(len(TIME_SLOTS))],
+            "free": [bool(free >> i & 1) for i in range(len(TIME_SLOTS))],
+        })
+    return rows
+
+
+def slots_to_mask(slots: list[dict[str, Any]]) -> int:
+    """1日分の枠の○×をビットマスクにする（TIME_SLOTS の i 番目が○なら bit i が1）。32枠なので32ビットに収まる"""
+    mask = 0
+    for s in slots:
+        if s["reservable"] and s["time"] in _SLOT_INDEX:
+            mask |= 1 << _SLOT_INDEX[s["time"]]
+    return mask
+
+
+def day_from_mask(date: str, mask: int) -> dict[str, Any]:
+    """slots_to_mask の逆変換。計算対象日（休診・祝日でない日）の1日分の結果を返す"""
+    return _day_result(date, [{"time": t, "reservable": bool(mask >> i & 1)} for i, t in enumerate(TIME_SLOTS)])
+
+
+def apply_user_booked(day: dict[str, Any], user_booked: set[tuple[str, str]], slots_needed: int = 1) -> dict[str, Any]:
+    """
+    ユーザーの予約済みの枠 (date, time) と重なる開始時刻（time から slots_needed 枠）を×にした1日分の結果を返す。
+    該当が無ければ day をそのまま返し、ある場合は新しい dict を作る（day は他の呼び出しと共有されうるため変更しない）。
+    """
+    date = day["date"]
+
+    def own(time: str) -> bool:
+        return any((date, t) in user_booked for t in slot_run(time, slots_needed) or [time])
+
+    if not any(own(s["time"]) for s in day["slots"] if s["reservable"]):
+        return day
+    slots = [
+        {"time": s["time"], "reservable": False} if s["reservable"] and own(s["time"]) else s
+        for s in day["slots"]
+    ]
+    return _day_result(date, slots, is_holiday=day["is_holiday"], reason=day["reason"], degraded=day.get("degraded", False))
+
+
+def compute_availability(
+    dates: Iterable[str],
+    doctors: list[dict[str, Any]],
+    reserved: set[tuple[str, str, str]],
+    user_booked: set[tuple[str, str]] | None = None,
+    *,
+    use_demo: bool = False,
+    slots_needed: int = 1,
+    starts: int = FULL_DAY_MASK,
+) -> dict[str, dict[str, Any]]:
+    """
+    計算対象日（classify_date が None を返した日）ごとの空き状況を返す。
+    医師が0人のとき use_demo なら平日午前をデモの○にする。
+    slots_needed・starts は compute_day_slots と同じ（複数枠の予約・診療科ごとの開始刻み）。
+    """
+    results: dict[str, dict[str, Any]] = {}
+    for date in dates:
+        if not doctors:
+            if use_demo:
+                demo = 0
+                for i, t in enumerate(TIME_SLOTS):
+                    if _demo_reservable(date, t):
+                        demo |= 1 << i
+                ok = run_starts(demo, slots_needed) & starts
+                slot_list = [{"time": t, "reservable": bool(ok >> i & 1)} for i, t in enumerate(TIME_SLOTS)]
+            else:
+                slot_list = _all_false_slots()
+        else:
+            slot_list = compute_day_slots(date, doctors, reserved, user_booked, slots_needed=slots_needed, starts=starts)
+        results[date] = _day_result(date, slot_list)
+    return results
@@ -0,0 +1,272 @@
+"""
+空き枠の変更配信（Server-Sent Events）
+- クライアントは (診療科, 日付範囲) を購読し、その範囲の枠の○×が変わるたびに差分だけを受け取る。
+  予約画面が数秒おきに /api/slots/week をポーリングしなくて済む
+- 変更の検知は2系統。どちらも (診療科, 日付, 時間) を publish() に渡すだけで、同じ枠の重複は束ねる
+  1. このプロセスでの予約・キャンセル・仮押さえ: slot_events.notify（コミット直後）
+  2. 他プロセス分: booked_slots と slot_counters（定員制の枠）の on_snapshot。診療科ごとに1組だけ張り、購読者がいなくなったら外す
+- 配信スレッドは変更を DEBOUNCE_SECONDS だけ溜めてから、診療科ごとに get_availability_for_dates を1回
+  （シングルフライト）呼んで現在の○×を求め、購読範囲に入る枠だけを各購読者へ送る
+- 送る値はユーザーに依存しない空き状況。自分の予約による×はクライアントが既に知っている
+- 購読時に種別（purpose）を指定すると、その所要時間分の連続枠が取れるかの○×を送る。
+  1枠の変更は、その枠を含みうる開始枠（所要枠数 - 1 個前まで）の○×を変えるため、それらもまとめて送る
+- 購読者ごとのキューは有限。溢れたら溜まった差分を捨てて resync を送り、クライアントに全体を取り直させる
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import availability_cache
+import slot_events
+from fast_json import dumps
+from reservation_service import _get_firestore, get_availability_for_dates
+from slot_logic import _SLOT_INDEX, TIME_SLOTS, appointment_slots
+
+logger = logging.getLogger(__name__)
+
+# 変更を溜める時間（秒）。同時に来た予約・キャンセルを1回の空き計算・1通の送信にまとめる
+DEBOUNCE_SECONDS = float(os.environ.get("SLOT_STREAM_DEBOUNCE", "0.2"))
+# 接続維持のためのコメント送信間隔（秒）。プロキシのアイドル切断を防ぐ
+HEARTBEAT_SECONDS = float(os.environ.get("SLOT_STREAM_HEARTBEAT", "15"))
+# 購読者ごとの未送信イベント数の上限
+QUEUE_SIZE = int(os.environ.get("SLOT_STREAM_QUEUE", "64"))
+# SLOT_STREAM_WATCH=0 で booked_slots・slot_counters の on_snapshot を張らない（単一プロセス運用・テスト用）
+WATCH_ENABLED = os.environ.get("SLOT_STREAM_WATCH", "1").strip() != "0"
+# 1購読で指定できる日数の上限
+MAX_RANGE_DAYS = 31
+
+RESYNC = {"event": "resync"}
+
+
+class Subscriber:
+    """1接続分の購読。キューはイベントループ上でのみ触る"""
+
+    def __init__(self, department: str, date_from: str, date_to: str, loop: asyncio.AbstractEventLoop, purpose: str = ""):
+        self.department = department
+        self.purpose = purpose
+        self.date_from = date_from
+        self.date_to = date_to
+        self.loop = loop
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(QUEUE_SIZE)
+
+    def covers(self, date: str) -> bool:
+        return self.date_from <= date <= self.date_to
+
+    def offer(self, event: dict[str, Any]) -> None:
+        """配信スレッドから呼ぶ。イベントループに渡して積む"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # ループ終了済み（接続が閉じた直後）
+            pass
+
+    def _put(self, event: dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 読み出しが追いつかない: 差分を捨てて全体の取り直しを促す
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+def _parse_slot_doc_id(doc_id: str) -> tuple[str, str] | None:
+    """booked_slots のドキュメントID（医師ID_日付_時間）から (日付, 時間) を取り出す"""
+    parts = doc_id.rsplit("_", 2)
+    if len(parts) != 3:
+        return None
+    return parts[1], parts[2]
+
+
+def _changed_slot(document) -> tuple[str, str] | None:
+    """変更されたドキュメントの (日付, 時間)。内容が取れないときは booked_slots のIDから求める"""
+    d = document.to_dict() or {}
+    if d.get("date") and d.get("time"):
+        return d["date"], d["time"]
+    return _parse_slot_doc_id(document.id)
+
+
+class SlotStreamHub:
+    """購読の管理・変更の集約・配信（ワーカープロセスごとに1つ）"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._subs: dict[str, set[Subscriber]] = {}
+        self._pending: dict[str, set[tuple[str, str]]] = {}
+        self._watches: dict[str, list[Any]] = {}
+        self._worker: threading.Thread | None = None
+
+    # ----- 購読 -----
+    def subscribe(
+        self, department: str, date_from: str, date_to: str, loop: asyncio.AbstractEventLoop, purpose: str = "",
+    ) -> Subscriber:
+        sub = Subscriber(department, date_from, date_to, loop, purpose)
+        with self._cond:
+            subs = self._subs.setdefault(department, set())
+            subs.add(sub)
+            first = len(subs) == 1
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="slot-stream", daemon=True)
+                self._worker.start()
+        slot_events.add_listener(self.publish)
+        if first and WATCH_ENABLED:
+            self._start_watch(department)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._cond:
+            subs = self._subs.get(sub.department)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if subs:
+                return
+            del self._subs[sub.department]
+            self._pending.pop(sub.department, None)
+            watches = self._watches.pop(sub.department, [])
+        for watch in watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning("slot_stream: unsubscribe watch failed: %s", e)
+
+    def subscriber_count(self) -> int:
+        with self._cond:
+            return sum(len(s) for s in self._subs.values())
+
+    # ----- 変更の受け付け -----
+    def publish(self, department: str, date: str, time_slot: str) -> None:
+        """枠が変わった可能性を受け取る（任意のスレッドから）。購読者のいない診療科は無視する"""
+        with self._cond:
+            if department not in self._subs:
+                return
+            self._pending.setdefault(department, set()).add((date, time_slot))
+            self._cond.notify()
+
+    def _start_watch(self, department: str) -> None:
+        """他プロセスの書き込みを拾うため、診療科の今日以降の booked_slots・slot_counters を購読する"""
+
+        def make_callback():
+            initial = [True]
+
+            def on_snapshot(_docs, changes, _read_time) -> None:
+                if initial[0]:
+                    # 初回は現在の一覧（変更ではない）
+                    initial[0] = False
+                    return
+                for change in changes:
+                    slot = _changed_slot(change.document)
+                    if slot is not None:
+                        # 他プロセスの変更。このプロセスの空き状況キャッシュも捨ててから計算させる
+                        availability_cache.invalidate(department, *slot)
+                        self.publish(department, *slot)
+
+            return on_snapshot
+
+        watches: list[Any] = []
+        try:
+            today = datetime.now().strftime("%Y-%m-%d")
+            db = _get_firestore()
+            for collection in ("booked_slots", "slot_counters"):
+                q = db.collection(collection).where("department", "==", department).where("date", ">=", today)
+                watches.append(q.on_snapshot(make_callback()))
+        except Exception as e:
+            logger.warning("slot_stream: watch for %s failed (in-process changes only): %s", department, e)
+            for watch in watches:
+                watch.unsubscribe()
+            return
+        with self._cond:
+            if department in self._subs and department not in self._watches:
+                self._watches[department] = watches
+                return
+        for watch in watches:
+            watch.unsubscribe()  # 張っている間に購読者がいなくなった・二重に張った
+
+    # ----- 配信 -----
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(DEBOUNCE_SECONDS)
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            for department, slots in pending.items():
+                try:
+                    self._deliver(department, slots)
+                except Exception as e:
+                    logger.warning("slot_stream: deliver %s failed: %s", department, e)
+
+    def _deliver(self, department: str, slots: set[tuple[str, str]]) -> None:
+        with self._cond:
+            subs = list(self._subs.get(department, ()))
+        by_purpose: dict[str, list[Subscriber]] = {}
+        for sub in subs:
+            by_purpose.setdefault(sub.purpose, []).append(sub)
+        for purpose, group in by_purpose.items():
+            self._deliver_purpose(department, purpose, group, slots)
+
+    def _deliver_purpose(self, department: str, purpose: str, subs: list[Subscriber], slots: set[tuple[str, str]]) -> None:
+        """同じ種別の購読者へ送る。変わった枠を含みうる開始枠の○×を1回の空き計算で求める"""
+        dates = sorted({d for d, _ in slots if any(s.covers(d) for s in subs)})
+        if not dates:
+            return
+        k = appointment_slots(department, purpose)
+        starts: set[tuple[str, str]] = set()
+        for d, t in slots:
+            if d not in dates:
+                continue
+            index = _SLOT_INDEX.get(t)
+            if index is None:
+                starts.add((d, t))
+                continue
+            starts.update((d, TIME_SLOTS[j]) for j in range(max(0, index - k + 1), index + 1))
+        reservable: dict[tuple[str, str], bool] = {}
+        days = get_availability_for_dates(department, dates, purpose=purpose)
+        if any(day.get("reason") == "degraded" for day in days):
+            # 予約状況を読めなかった。全枠×の差分は送らず、クライアントに取り直させる
+            for sub in subs:
+                sub.offer(RESYNC)
+            return
+        for day in days:
+            for s in day.get("slots") or []:
+                reservable[(day["date"], s["time"])] = bool(s["reservable"])
+        changes = sorted((d, t, reservable.get((d, t), False)) for d, t in starts)
+        for sub in subs:
+            mine = [list(c) for c in changes if sub.covers(c[0])]
+            if mine:
+                sub.offer({"event": "slots", "data": {"department": department, "c": mine}})
+
+
+hub = SlotStreamHub()
+
+
+def _format(event: dict[str, Any]) -> bytes:
+    """SSE の1イベント（event 行 + data 行）"""
+    return b"event: " + event["event"].encode() + b"\ndata: " + dumps(event.get("data") or {}) + b"\n\n"
+
+
+async def stream(
+    department: str, date_from: str, date_to: str, is_disconnected: Callable[[], Awaitable[bool]], purpose: str = "",
+) -> AsyncIterator[bytes]:
+    """
+    SSE の本文を生成する。最初に ready、以降は slots（差分）/ resync、無通信時はコメント行を送る。
+    切断（またはジェネレータの終了）で購読を外す。
+    """
+    sub = hub.subscribe(department, date_from, date_to, asyncio.get_running_loop(), purpose)
+    try:
+        yield _format({"event": "ready", "data": {"department": department, "from": date_from, "to": date_to}})
+        while not await is_disconnected():
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield _format(event)
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,97 @@
+"""
+永続化層（Firestore）へのアクセス窓口
+- firebase_admin / google-cloud-firestore は初回利用時まで import しない（CLI・テストの起動を軽くする）
+- set_backend() で Firestore 互換のクライアント（テスト用のスタブ等）に差し替えられる
+- FIRESTORE_BACKEND=fake で起動すると、シードの医師を入れたインメモリスタブ（fake_firestore）を使う
+  （トラフィックのリプレイ・負荷試験をローカルで行う用。データはプロセス終了で消える）
+"""
+from __future__ import annotations
+
+import functools
+import os
+from typing import Any, Callable
+
+# クエリの並び順・ドキュメントID指定（google-cloud-firestore の Query.ASCENDING 等と同じ値。import せずに使えるよう定数で持つ）
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+DOCUMENT_ID = "__name__"
+
+
+class FirestoreBackend:
+    """本番用: firebase_admin の Firestore クライアントを遅延 import して返す"""
+
+    def client(self) -> Any:
+        from firebase_admin import firestore
+        from firebase_admin_client import init_firebase_admin
+
+        init_firebase_admin()
+        return firestore.client()
+
+    def server_timestamp(self) -> Any:
+        from firebase_admin import firestore
+
+        return firestore.SERVER_TIMESTAMP
+
+    def transactional(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        from firebase_admin import firestore
+
+        return firestore.transactional(fn)
+
+
+def _default_backend() -> Any:
+    """FIRESTORE_BACKEND（firestore / fake）に応じた既定の実装"""
+    if os.environ.get("FIRESTORE_BACKEND", "firestore").strip().lower() == "fake":
+        from fake_firestore import FakeBackend, seeded_client
+
+        return FakeBackend(seeded_client(latency=float(os.environ.get("FAKE_FIRESTORE_LATENCY_MS", "0")) / 1000))
+    return FirestoreBackend()
+
+
+_backend: Any = _default_backend()
+
+
+def set_backend(backend: Any) -> None:
+    """ストレージ実装を差し替える（client() / server_timestamp() / transactional() を持つオブジェクト）"""
+    global _backend
+    _backend = backend
+
+
+def reset_backend() -> None:
+    """既定の実装（FIRESTORE_BACKEND）に戻す"""
+    set_backend(_default_backend())
+
+
+def get_db() -> Any:
+    """Firestore 互換クライアントを返す"""
+    return _backend.client()
+
+
+def server_timestamp() -> Any:
+    """createdAt などに使うサーバー時刻の sentinel"""
+    return _backend.server_timestamp()
+
+
+def transactional(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    firestore.transactional 相当のデコレータ。
+    呼び出し時点のバックエンドで包むため、モジュール読み込み時に firebase_admin を import しない。
+    使い方: fn(db.transaction(), *args) — 競合時は fn ごと再実行される。
+    """
+
+    @functools.wraps(fn)
+    def run(transaction: Any, *args: Any, **kwargs: Any) -> Any:
+        return _backend.transactional(fn)(transaction, *args, **kwargs)
+
+    return run
+
+
+def is_already_exists(exc: BaseException) -> bool:
+    """create() がドキュメント既存で失敗したか（ALREADY_EXISTS / 409）"""
+    err_str = str(exc).lower()
+    return "already exists" in err_str or "already_exists" in err_str or "409" in err_str
+
+
+def is_aborted(exc: BaseException) -> bool:
+    """トランザクションが競合で中断され、再試行も尽きたか（ABORTED / 409 contention）"""
+    err_str = str(exc).lower()
+    return type(exc).__name__ == "Aborted" or "aborted" in err_str or "contention" in err_str
@@ -1,29 +1,232 @@
 """
-ユーザーデータの保持（メモリ上の DB）
-認証は Firebase に一本化するため、バックエンドは uid / email のみ記録する
+doctors / booked_slots のローカル読み取りレプリカ（SQLite）
+- Firestore の on_snapshot で doctors（全件）と booked_slots・slot_counters（今日以降）を購読し、差分だけを SQLite に反映する
+- reservation_service の空き計算（医師一覧・予約済み枠の一括取得）はレプリカが準備できていればここを読む。
+  ネットワーク往復が無くなり、ローカルのインデックス検索だけで済む
+- 書き込みは常に Firestore（正）。レプリカは数百ミリ秒程度遅れうるが、予約の確定はトランザクションで
+  Firestore を確認するため二重予約にはならない（遅れは○×表示にのみ影響する）
+- WAL モードのため、購読スレッドの書き込み中もリクエストスレッドは待たずに読める（接続はスレッドごと）
+- 初回スナップショットがすべて届くまでは ready() が False で、呼び出し側は Firestore を直接読む
+- LOCAL_REPLICA=1 で有効。booked_slots を正とするため、migrate_booked_slots.py 実施済みの環境で使う
 """
-from typing import Dict, List, Optional
+from __future__ import annotations
 
-# users: uid -> { uid, email }
-users_db: Dict[str, dict] = {}
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Any
 
+from slot_logic import _normalize_schedules
 
-def upsert_user(uid: str, email: str) -> dict:
-    """ユーザーを作成/更新する（uid 単位）"""
-    key = (uid or "").strip()
-    if not key:
-        raise ValueError("uid is required")
-    payload = {"uid": key, "email": (email or "").strip().lower()}
-    users_db[key] = payload
-    return payload
+logger = logging.getLogger(__name__)
 
+ENABLED = os.environ.get("LOCAL_REPLICA", "0").strip() == "1"
+# DB ファイル（ワーカープロセスごと。起動時に作り直す）
+DB_PATH = os.environ.get("LOCAL_REPLICA_PATH", "").strip() or os.path.join(
+    tempfile.gettempdir(), f"reservation_replica_{os.getpid()}.db",
+)
 
-def get_user(uid: str) -> Optional[dict]:
-    """uid でユーザーを取得"""
-    key = (uid or "").strip()
-    return users_db.get(key)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS doctors (
+    id TEXT PRIMARY KEY,
+    department TEXT NOT NULL,
+    name TEXT NOT NULL,
+    schedules TEXT NOT NULL,
+    capacity INTEGER
+);
+CREATE INDEX IF NOT EXISTS doctors_department ON doctors (department);
+CREATE TABLE IF NOT EXISTS booked_slots (
+    id TEXT PRIMARY KEY,
+    doctorId TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    department TEXT NOT NULL,
+    hold INTEGER NOT NULL,
+    expiresAt REAL
+);
+CREATE INDEX IF NOT EXISTS booked_slots_doctor_date ON booked_slots (doctorId, date);
+CREATE INDEX IF NOT EXISTS booked_slots_date_department ON booked_slots (date, department);
+CREATE TABLE IF NOT EXISTS slot_counters (
+    id TEXT PRIMARY KEY,
+    doctorId TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    capacity INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slot_counters_doctor_date ON slot_counters (doctorId, date);
+"""
+
+
+def _epoch(value: Any) -> float | None:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+
+class Replica:
+    """SQLite のレプリカ本体（購読の開始・差分の反映・読み取り）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._ready: set[str] = set()
+        self._watches: list[Any] = []
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        self._writer = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=OFF")  # 落ちたら作り直すので永続性は不要
+        self._writer.executescript(_SCHEMA)
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+        return conn
+
+    # ----- 購読 -----
+    def start(self, db) -> None:
+        """doctors と今日以降の booked_slots・slot_counters の購読を始める"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        self._watches.append(db.collection("doctors").on_snapshot(self._callback("doctors", self._apply_doctor)))
+        q = db.collection("booked_slots").where("date", ">=", today)
+        self._watches.append(q.on_snapshot(self._callback("booked_slots", self._apply_slot)))
+        q = db.collection("slot_counters").where("date", ">=", today)
+        self._watches.append(q.on_snapshot(self._callback("slot_counters", self._apply_counter)))
+
+    def stop(self) -> None:
+        for watch in self._watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning("store: unsubscribe failed: %s", e)
+        self._watches.clear()
+        self._ready.clear()
+
+    def ready(self) -> bool:
+        return self._ready == {"doctors", "booked_slots", "slot_counters"}
+
+    def _callback(self, collection: str, apply):
+        def on_snapshot(_docs, changes, _read_time) -> None:
+            try:
+                with self._write_lock:
+                    self._writer.execute("BEGIN")
+                    try:
+                        for change in changes:
+                            apply(change.type.name, change.document)
+                        self._writer.execute("COMMIT")
+                    except BaseException:
+                        self._writer.execute("ROLLBACK")
+                        raise
+            except Exception:
+                # 反映に失敗したレプリカは使わない（Firestore を直接読む）
+                logger.exception("store: apply %s snapshot failed", collection)
+                self._ready.discard(collection)
+                return
+            self._ready.add(collection)
+        return on_snapshot
+
+    def _apply_doctor(self, change_type: str, snap) -> None:
+        if change_type == "REMOVED":
+            self._writer.execute("DELETE FROM doctors WHERE id = ?", (snap.id,))
+            return
+        d = snap.to_dict() or {}
+        capacity = d.get("capacity")
+        self._writer.execute(
+            "INSERT OR REPLACE INTO doctors (id, department, name, schedules, capacity) VALUES (?, ?, ?, ?, ?)",
+            (snap.id, str(d.get("department") or "").strip(), d.get("name") or "", json.dumps(_normalize_schedules(d.get("schedules"))),
+             capacity if isinstance(capacity, int) and not isinstance(capacity, bool) else None),
+        )
+
+    def _apply_slot(self, change_type: str, snap) -> None:
+        if change_type == "REMOVED":
+            self._writer.execute("DELETE FROM booked_slots WHERE id = ?", (snap.id,))
+            return
+        d = snap.to_dict() or {}
+        self._writer.execute(
+            "INSERT OR REPLACE INTO booked_slots (id, doctorId, date, time, department, hold, expiresAt) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (snap.id, d.get("doctorId") or "", d.get("date") or "", d.get("time") or "",
+             d.get("department") or "", int(bool(d.get("hold"))), _epoch(d.get("expiresAt"))),
+        )
+
+    def _apply_counter(self, change_type: str, snap) -> None:
+        if change_type == "REMOVED":
+            self._writer.execute("DELETE FROM slot_counters WHERE id = ?", (snap.id,))
+            return
+        d = snap.to_dict() or {}
+        self._writer.execute(
+            "INSERT OR REPLACE INTO slot_counters (id, doctorId, date, time, count, capacity) VALUES (?, ?, ?, ?, ?, ?)",
+            (snap.id, d.get("doctorId") or "", d.get("date") or "", d.get("time") or "",
+             int(d.get("count") or 0), int(d.get("capacity") or 0)),
+        )
+
+    # ----- 読み取り -----
+    def doctors_by_department(self, department_label: str) -> list[dict[str, Any]]:
+        rows = self._reader().execute(
+            "SELECT id, name, department, schedules, capacity FROM doctors WHERE department = ? ORDER BY id", (department_label.strip(),),
+        ).fetchall()
+        return [{"id": r[0], "name": r[1], "department": r[2], "schedules": json.loads(r[3]), "capacity": r[4]} for r in rows]
+
+    def reserved_slots(self, doctor_ids: list[str], dates: list[str]) -> set[tuple[str, str, str]]:
+        """(doctorId, date, time) の集合。有効な仮押さえは予約済み、期限切れは空き、定員制の枠は満席なら予約済みとして扱う"""
+        if not doctor_ids or not dates:
+            return set()
+        where = f"doctorId IN ({','.join('?' * len(doctor_ids))}) AND date IN ({','.join('?' * len(dates))})"
+        sql = (
+            f"SELECT doctorId, date, time FROM booked_slots WHERE {where}"
+            f" AND (hold = 0 OR expiresAt IS NULL OR expiresAt > ?)"
+            f" UNION SELECT doctorId, date, time FROM slot_counters WHERE {where}"
+            f" GROUP BY doctorId, date, time HAVING MAX(capacity) > 0 AND SUM(count) >= MAX(capacity)"
+        )
+        now = datetime.now(timezone.utc).timestamp()
+        return set(self._reader().execute(sql, (*doctor_ids, *dates, now, *doctor_ids, *dates)))
+
+
+_lock = threading.Lock()
+_replica: Replica | None = None
+_started = False
+
+
+def get_replica() -> Replica | None:
+    """
+    準備のできたレプリカを返す。無効・初回スナップショット待ち・開始失敗なら None。
+    最初の呼び出しで購読を始める（以後はバックグラウンドで追従）。
+    """
+    global _replica, _started
+    if not ENABLED:
+        return None
+    if not _started:
+        with _lock:
+            if not _started:
+                _started = True
+                from reservation_service import _get_firestore  # reservation_service がこのモジュールを使うため
+                try:
+                    replica = Replica(DB_PATH)
+                    replica.start(_get_firestore())
+                    _replica = replica
+                except Exception as e:
+                    logger.warning("store: replica start failed (reading Firestore directly): %s", e)
+    replica = _replica
+    return replica if replica is not None and replica.ready() else None
 
 
-def get_all_users() -> List[dict]:
-    """全ユーザー一覧（確認用）"""
-    return list(users_db.values())
+def reset() -> None:
+    """購読を止めてレプリカを捨てる（テスト・バックエンド差し替え用）"""
+    global _replica, _started
+    with _lock:
+        if _replica is not None:
+            _replica.stop()
+        _replica, _started = None, False
@@ -0,0 +1,109 @@
+"""
+予約書き込みの受付制御（admission）のテスト。
+実行: cd Day5/backend && python -m pytest test_admission.py -v
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionController, Overloaded
+
+
+def _controller(**kw):
+    opts = {"max_concurrent": 1, "max_queue_per_key": 4, "max_queue_total": 8, "queue_timeout": 1.0}
+    opts.update(kw)
+    return AdmissionController(opts.pop("max_concurrent"), **opts)
+
+
+def test_fifo_per_key_and_round_robin_across_keys():
+    ctl = _controller()
+    order = []
+
+    async def job(key, name, gate=None):
+        async with ctl.slot(key):
+            if gate is not None:
+                await gate.wait()
+            order.append(name)
+
+    async def main_():
+        gate = asyncio.Event()
+        first = asyncio.ensure_future(job("A", "a0", gate))
+        await asyncio.sleep(0)
+        jobs = []
+        for key, name in [("A", "a1"), ("A", "a2"), ("A", "a3"), ("B", "b1"), ("B", "b2")]:
+            jobs.append(asyncio.ensure_future(job(key, name)))
+            await asyncio.sleep(0)
+        assert ctl.stats() == {"running": 1, "queued": 5, "keys": 2}
+        gate.set()
+        await asyncio.gather(first, *jobs)
+
+    asyncio.run(main_())
+    assert order == ["a0", "a1", "b1", "a2", "b2", "a3"]
+    assert ctl.stats() == {"running": 0, "queued": 0, "keys": 0}
+
+
+def test_full_queue_rejects_immediately_with_retry_after():
+    ctl = _controller(max_queue_per_key=1)
+
+    async def main_():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with ctl.slot("A"):
+                await gate.wait()
+
+        async def wait_turn():
+            async with ctl.slot("A"):
+                pass
+
+        running = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(wait_turn())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as exc:
+            async with ctl.slot("A"):
+                pass
+        assert exc.value.retry_after >= 1 and exc.value.reason == "key_queue_full"
+        gate.set()
+        await asyncio.gather(running, queued)
+
+    asyncio.run(main_())
+
+
+def test_queue_timeout_gives_up_and_frees_place():
+    ctl = _controller(queue_timeout=0.05)
+
+    async def main_():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with ctl.slot("A"):
+                await gate.wait()
+
+        running = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as exc:
+            async with ctl.slot("A"):
+                pass
+        assert exc.value.reason == "timeout"
+        assert ctl.stats()["queued"] == 0
+        gate.set()
+        await running
+
+    asyncio.run(main_())
+
+
+def test_endpoint_returns_503_with_retry_after(monkeypatch):
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "u1"})
+    # 実行枠も待ち行列も 0 = すべて即時拒否
+    monkeypatch.setattr(main, "booking_admission", _controller(max_concurrent=0, max_queue_total=0))
+    client = TestClient(main.app)
+    res = client.post(
+        "/api/reservations",
+        json={"department": "内科", "date": "2030-02-12", "time": "09:00"},
+        headers={"Authorization": "Bearer t"},
+    )
+    assert res.status_code == 503
+    assert int(res.headers["retry-after"]) >= 1
@@ -0,0 +1,95 @@
+"""
+稼働率の集計（analytics・GET /api/admin/analytics/utilization）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_analytics.py -v
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import analytics
+import main
+from slot_logic import TIME_SLOTS, _is_japanese_holiday, _is_working, _normalize_schedules, slot_capacity
+
+DATES = ["2030-02-11", "2030-02-12", "2030-02-13"]  # 月（建国記念の日）・火・水
+
+
+@pytest.fixture
+def clinic(fake_db):
+    analytics.clear_cache()
+    doctors = {
+        "doc_a": {"name": "A", "department": "内科", "schedules": {"mon": TIME_SLOTS, "tue": ["09:00-10:00"], "wed": ["13:00-14:00"]}},
+        "doc_b": {"name": "B", "department": "内科", "schedules": {"tue": ["09:00-09:30"]}},
+        "doc_lab": {"name": "L", "department": "臨床検査", "schedules": {"tue": ["09:00-09:15"]}},
+    }
+    for doc_id, data in doctors.items():
+        fake_db.collection("doctors").document(doc_id).set(data)
+    slots = fake_db.collection("booked_slots")
+    slots.document("doc_a_2030-02-12_09:00").set({"doctorId": "doc_a", "department": "内科", "date": "2030-02-12", "time": "09:00"})
+    slots.document("doc_a_2030-02-12_09:15").set({"doctorId": "doc_a", "department": "内科", "date": "2030-02-12", "time": "09:15"})
+    slots.document("doc_a_2030-02-12_09:30").set({"doctorId": "doc_a", "department": "内科", "date": "2030-02-12", "time": "09:30", "hold": True})
+    slots.document("doc_a_2030-02-13_13:00").set({"doctorId": "doc_a", "department": "内科", "date": "2030-02-13", "time": "13:00"})
+    slots.document("doc_b_2030-02-14_09:00").set({"doctorId": "doc_b", "department": "内科", "date": "2030-02-14", "time": "09:00"})  # 期間外
+    fake_db.collection("slot_counters").document("doc_lab_2030-02-12_09:00_0").set(
+        {"doctorId": "doc_lab", "department": "臨床検査", "date": "2030-02-12", "time": "09:00", "count": 2, "capacity": 3},
+    )
+    yield fake_db
+    analytics.clear_cache()
+
+
+def _naive(db):
+    """枠ごとに回す素朴な集計（ベクトル化した結果との照合用）"""
+    out = {}
+    for snap in db.collection("doctors").stream():
+        d = snap.to_dict()
+        doctor = {**d, "schedules": _normalize_schedules(d["schedules"])}
+        cap = sum(
+            slot_capacity(doctor, d["department"])
+            for date in DATES if not _is_japanese_holiday(date) for t in TIME_SLOTS if _is_working(doctor, date, t)
+        )
+        out[snap.id] = cap
+    return out
+
+
+def test_utilization_matches_slot_by_slot_count(clinic):
+    result = analytics.utilization(DATES[0], DATES[-1])
+    doctors = {d["doctorId"]: d for d in result["doctors"]}
+    assert {k: v["capacity"] for k, v in doctors.items()} == _naive(clinic) == {"doc_a": 8, "doc_b": 2, "doc_lab": 3}
+    assert {k: v["booked"] for k, v in doctors.items()} == {"doc_a": 3, "doc_b": 0, "doc_lab": 2}
+    assert result["total"] == {"capacity": 13, "booked": 5, "utilization": round(5 / 13, 4)}
+    assert [(d["department"], d["capacity"], d["booked"]) for d in result["departments"]] == [("内科", 10, 3), ("臨床検査", 3, 2)]
+    weekdays = {w["weekday"]: w for w in result["weekdays"]}
+    assert weekdays["mon"]["capacity"] == 0 and weekdays["mon"]["utilization"] is None  # 祝日
+    assert (weekdays["tue"]["capacity"], weekdays["tue"]["booked"]) == (9, 4)
+    hours = {h["hour"]: h for h in result["hours"]}
+    assert (hours[9]["capacity"], hours[9]["booked"]) == (9, 4) and hours[13]["utilization"] == 0.25
+    assert result["weekdayHour"][1][0] == round(4 / 9, 4)
+
+
+def test_department_filter_and_cache(clinic):
+    queries = []
+    clinic.on_rpc = lambda op, path: queries.append(path) if op == "query" else None
+    first = analytics.utilization(DATES[0], DATES[-1], department="臨床検査")
+    assert [d["doctorId"] for d in first["doctors"]] == ["doc_lab"] and first["total"]["booked"] == 2
+    n = len(queries)
+    assert analytics.utilization(DATES[0], DATES[-1], department="臨床検査") is first
+    assert len(queries) == n
+    analytics.utilization(DATES[0], DATES[-1], department="臨床検査", use_cache=False)
+    assert len(queries) > n
+
+
+def test_invalid_range(fake_db):
+    with pytest.raises(ValueError):
+        analytics.utilization("2030-02-13", "2030-02-12")
+    with pytest.raises(ValueError):
+        analytics.utilization("2030-01-01", "2031-06-01")
+
+
+def test_endpoint_requires_admin(clinic, monkeypatch):
+    client = TestClient(main.app)
+    headers = {"Authorization": "Bearer t"}
+    url = f"/api/admin/analytics/utilization?from={DATES[0]}&to={DATES[-1]}"
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "u1"})
+    assert client.get(url, headers=headers).status_code == 403
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "staff", "admin": True})
+    res = client.get(url, headers=headers)
+    assert res.status_code == 200 and res.json()["total"]["booked"] == 5
+    assert client.get("/api/admin/analytics/utilization?from=x&to=y", headers=headers).status_code == 400
@@ -0,0 +1,108 @@
+"""
+複数枠の一括予約（batch_booking・POST /api/reservations/batch）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_batch_booking.py -v
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import reservation_service as rs
+from batch_booking import create_reservations_batch
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def clinic(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setenv("ASSIGN_STRATEGY", "first")
+    fake_db.collection("doctors").document("lab_a").set({
+        "name": "検査A", "department": "臨床検査", "schedules": {"tue": TIME_SLOTS}, "capacity": 2,
+    })
+    for i in range(2):
+        fake_db.collection("doctors").document(f"cardio_{i}").set({
+            "name": f"循環器{i}", "department": "循環器内科", "schedules": {"tue": TIME_SLOTS},
+        })
+    return fake_db
+
+
+ITEMS = [
+    {"department": "臨床検査", "date": DATE, "time": "09:00", "purpose": "再診"},
+    {"department": "循環器内科", "date": DATE, "time": "10:00", "purpose": "初診"},
+]
+
+
+def test_batch_books_every_item_in_one_transaction(clinic):
+    commits = []
+    clinic.on_rpc = lambda op, path: commits.append(op) if op == "commit" else None
+    out = create_reservations_batch(ITEMS, "u1")
+    assert commits == ["commit"]
+    assert [(r["departmentId"], r["time"], r["doctorId"]) for r in out] == [
+        ("臨床検査", "09:00", "lab_a"), ("循環器内科", "10:00", "cardio_0"),
+    ]
+    reservations = clinic.dump("users/u1/reservations")
+    assert set(reservations) == {r["id"] for r in out}
+    lab = reservations[out[0]["id"]]
+    assert lab["seats"] and clinic.dump("slot_counters")[lab["seats"][0]]["count"] == 1
+    slots = clinic.dump("booked_slots")
+    assert sorted(slots) == [f"cardio_0_{DATE}_10:00", f"cardio_0_{DATE}_10:15"]  # 初診は2枠
+    assert {s["reservationId"] for s in slots.values()} == {out[1]["id"]}
+
+
+def test_batch_is_all_or_nothing(clinic):
+    for i in range(2):
+        rs.create_reservation("循環器内科", DATE, "10:15", f"other{i}")
+    before_slots, before_counters = clinic.dump("booked_slots"), clinic.dump("slot_counters")
+    with pytest.raises(ValueError, match="2件目"):
+        create_reservations_batch(ITEMS, "u1")
+    assert clinic.dump("users/u1/reservations") == {}
+    assert clinic.dump("booked_slots") == before_slots and clinic.dump("slot_counters") == before_counters
+
+
+def test_slot_taken_after_planning_rolls_back(clinic, monkeypatch):
+    import batch_booking
+
+    real = batch_booking._attach_candidates
+
+    def planned_then_taken(plans, user_id):
+        real(plans, user_id)
+        # 候補を決めた後に別の予約が入った（一括取得の結果が古い）
+        for i in range(2):
+            clinic.collection("booked_slots").document(f"cardio_{i}_{DATE}_10:00").set(
+                {"doctorId": f"cardio_{i}", "date": DATE, "time": "10:00", "userId": "x"},
+            )
+
+    monkeypatch.setattr(batch_booking, "_attach_candidates", planned_then_taken)
+    with pytest.raises(ValueError):
+        create_reservations_batch(ITEMS, "u1")
+    assert clinic.dump("users/u1/reservations") == {} and clinic.dump("slot_counters") == {}
+
+
+def test_rejects_overlapping_and_duplicate_items(clinic):
+    with pytest.raises(ValueError, match="重なって"):
+        create_reservations_batch([ITEMS[1], {**ITEMS[0], "department": "循環器内科", "time": "10:15"}], "u1")
+    create_reservations_batch(ITEMS[:1], "u1")
+    with pytest.raises(ValueError, match="すでに予約済み"):
+        create_reservations_batch(ITEMS, "u1")
+    with pytest.raises(ValueError):
+        create_reservations_batch([], "u1")
+
+
+def test_rejects_item_inside_an_existing_multi_slot_booking(clinic):
+    create_reservations_batch(ITEMS[1:], "u1")  # 初診 30分: 10:00〜10:15 の2枠
+    with pytest.raises(ValueError, match="すでに予約済み"):
+        create_reservations_batch([{**ITEMS[1], "time": "10:15", "purpose": "再診"}], "u1")
+    create_reservations_batch([{**ITEMS[1], "time": "10:30", "purpose": "再診"}], "u1")
+
+
+def test_endpoint(clinic, monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "u1"})
+    headers = {"Authorization": "Bearer t"}
+    res = client.post("/api/reservations/batch", json={"items": ITEMS}, headers=headers)
+    assert res.status_code == 200
+    assert [(r["department"], r["time"]) for r in res.json()["items"]] == [("臨床検査", "09:00"), ("循環器内科", "10:00")]
+    again = client.post("/api/reservations/batch", json={"items": ITEMS}, headers=headers)
+    assert again.status_code == 400
+    assert client.post("/api/reservations/batch", json={"items": []}, headers=headers).status_code == 422
@@ -0,0 +1,75 @@
+"""
+予約キャンセル（単体・一括）のテスト。Firestore はインメモリスタブ（conftest.fake_db）を使う。
+実行: cd Day5/backend && python -m pytest test_cancellation.py -v
+"""
+import pytest
+
+import reservation_service as rs
+from slot_logic import longest_appointment_slots
+
+
+def _book(db, uid, rid, doctor_id="doc_a", date="2030-02-12", time="09:00"):
+    db.collection("users").document(uid).collection("reservations").document(rid).set({
+        "date": date, "time": time, "department": "内科", "doctorId": doctor_id, "doctor": "A",
+    })
+    db.collection("booked_slots").document(f"{doctor_id}_{date}_{time}").set({
+        "doctorId": doctor_id, "date": date, "time": time, "department": "内科",
+        "userId": uid, "reservationId": rid,
+    })
+
+
+def test_cancel_releases_slot_and_reservation(fake_db):
+    _book(fake_db, "u1", "r1")
+    assert rs.cancel_reservation("u1", "r1") == {"ok": True, "id": "r1"}
+    assert fake_db.dump("booked_slots") == {}
+    assert fake_db.dump("users/u1/reservations") == {}
+
+
+def test_cancel_missing_reservation(fake_db):
+    with pytest.raises(ValueError):
+        rs.cancel_reservation("u1", "nope")
+
+
+def test_cancel_is_atomic_when_commit_fails(fake_db):
+    _book(fake_db, "u1", "r1")
+
+    def fail_commit(op, path):
+        if op == "commit":
+            raise RuntimeError("unavailable")
+
+    fake_db.on_rpc = fail_commit
+    with pytest.raises(RuntimeError):
+        rs.cancel_reservation("u1", "r1")
+    fake_db.on_rpc = None
+    # どちらも残っている（スロットだけ消えて漏れることはない）
+    assert "doc_a_2030-02-12_09:00" in fake_db.dump("booked_slots")
+    assert "r1" in fake_db.dump("users/u1/reservations")
+
+
+def test_cancel_keeps_slot_rebooked_by_other_user(fake_db):
+    _book(fake_db, "u1", "r1")
+    fake_db.collection("booked_slots").document("doc_a_2030-02-12_09:00").update({"userId": "u2", "reservationId": "r9"})
+    rs.cancel_reservation("u1", "r1")
+    assert fake_db.dump("booked_slots")["doc_a_2030-02-12_09:00"]["userId"] == "u2"
+
+
+def test_bulk_cancel_reports_each_item(fake_db):
+    _book(fake_db, "u1", "r1", time="09:00")
+    _book(fake_db, "u2", "r2", time="09:15")
+    out = rs.cancel_reservations_bulk([("u1", "r1"), ("u2", "r2"), ("u3", "missing"), ("u1", "r1")], chunk_size=2)
+    assert [(r["id"], r["status"]) for r in out] == [("r1", "cancelled"), ("r2", "cancelled"), ("missing", "not_found")]
+    assert fake_db.dump("booked_slots") == {}
+
+
+def test_bulk_cancel_chunk_fits_transaction_write_limit():
+    # 画像診断・検査（60分）は予約 + 4枠で1件5書き込み
+    assert longest_appointment_slots() == 4
+    assert rs.BULK_CANCEL_CHUNK_SIZE * (1 + longest_appointment_slots()) <= rs.TRANSACTION_MAX_WRITES
+
+
+def test_find_and_resolve_for_doctor_date(fake_db):
+    _book(fake_db, "u1", "r1", time="09:00")
+    _book(fake_db, "u2", "r2", time="10:00")
+    _book(fake_db, "u3", "r3", doctor_id="doc_b", time="10:00")
+    assert sorted(rs.find_reservations_for_doctor_date("doc_a", "2030-02-12")) == [("u1", "r1"), ("u2", "r2")]
+    assert rs.resolve_reservation_owners(["r3", "zzz"]) == {"r3": "u3"}
@@ -0,0 +1,96 @@
+"""
+読み取りの期限・ヘッジ（deadline）と縮退レスポンスのテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_deadline.py -v
+"""
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import deadline
+import main
+import reservation_service as rs
+from fake_firestore import FaultInjector
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def clinic(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    fake_db.collection("doctors").document("doc_a").set({"name": "A", "department": "内科", "schedules": {"tue": TIME_SLOTS}})
+    fake_db.collection("booked_slots").document(f"doc_a_{DATE}_09:00").set({"doctorId": "doc_a", "date": DATE, "time": "09:00"})
+    deadline.reset_latencies()
+    yield fake_db
+    deadline.reset_latencies()
+
+
+def test_slow_read_returns_degraded_day_within_deadline(clinic, monkeypatch):
+    monkeypatch.setattr(deadline, "READ_DEADLINE_SECONDS", 0.05)
+    clinic.on_rpc = FaultInjector(slow_rate=1.0, slow_seconds=0.5, ops=["query"])
+    started = time.monotonic()
+    (day,) = rs.get_availability_for_dates("内科", [DATE])
+    assert time.monotonic() - started < 0.4
+    assert day["reason"] == "degraded" and day["degraded"] is True
+    assert not any(s["reservable"] for s in day["slots"])
+
+
+def test_read_error_does_not_show_booked_slot_as_free(clinic):
+    clinic.on_rpc = FaultInjector(error_rate=1.0, ops=["query"])
+    (day,) = rs.get_availability_for_dates("内科", [DATE])
+    assert day["reason"] == "degraded" and not day["reservable"]
+    clinic.on_rpc = None
+    (day,) = rs.get_availability_for_dates("内科", [DATE])
+    assert day["degraded"] is False
+    assert [s["reservable"] for s in day["slots"][:2]] == [False, True]
+
+
+def test_user_fetch_failure_marks_day_degraded(clinic):
+    def fail_user_reads(op, path):
+        if path.startswith("users/"):
+            raise RuntimeError("unavailable")
+
+    clinic.on_rpc = fail_user_reads
+    (day,) = rs.get_availability_for_dates("内科", [DATE], user_id="u1")
+    assert day["degraded"] is True and day["reason"] is None
+    assert day["slots"][1]["reservable"] is True  # 空き自体は正しいので○×はそのまま
+
+
+def test_grid_endpoint_returns_503_on_deadline(clinic, monkeypatch):
+    monkeypatch.setattr(deadline, "READ_DEADLINE_SECONDS", 0.05)
+    clinic.on_rpc = FaultInjector(slow_rate=1.0, slow_seconds=0.5, ops=["query"])
+    res = TestClient(main.app).get("/api/grid", params={"department": "内科", "date": DATE})
+    assert res.status_code == 503 and res.headers["Retry-After"] == "1"
+
+
+def test_hedged_read_returns_faster_duplicate(monkeypatch):
+    monkeypatch.setattr(deadline, "HEDGE_ENABLED", True)
+    deadline.reset_latencies()
+    for _ in range(deadline.MIN_SAMPLES):
+        deadline._record("t", 0.01)
+    calls = []
+    lock = threading.Lock()
+
+    def read(timeout):
+        with lock:
+            calls.append(timeout)
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.0)
+        return "first" if first else "hedge"
+
+    started = time.monotonic()
+    with deadline.budget(2.0):
+        assert deadline.call("t", read) == "hedge"
+    assert time.monotonic() - started < 0.5 and len(calls) == 2
+    deadline.reset_latencies()
+
+
+def test_nested_budget_keeps_shorter_deadline():
+    with deadline.budget(0.05):
+        with deadline.budget(10):
+            assert deadline.remaining() <= 0.05
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.call("t", lambda timeout: time.sleep(0.5))
+    assert deadline.remaining() is None
@@ -0,0 +1,80 @@
+"""
+医師 × 時間枠の表（get_doctor_grid・GET /api/grid）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_doctor_grid.py -v
+"""
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import reservation_service as rs
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+HOLIDAY = "2030-02-11"  # 建国記念の日
+
+
+@pytest.fixture
+def clinic(fake_db):
+    doctors = {
+        "doc_b": {"name": "B", "department": "内科", "schedules": {"mon": ["09:00-10:00"], "tue": ["09:00-09:30"]}},
+        "doc_a": {"name": "A", "department": "内科", "schedules": {"tue": ["09:00-10:00"]}},
+        "doc_x": {"name": "X", "department": "眼科", "schedules": {"tue": TIME_SLOTS}},
+    }
+    for doc_id, data in doctors.items():
+        fake_db.collection("doctors").document(doc_id).set(data)
+    slots = fake_db.collection("booked_slots")
+    slots.document(f"doc_a_{DATE}_09:00").set({"doctorId": "doc_a", "date": DATE, "time": "09:00"})
+    slots.document(f"doc_b_{DATE}_09:15").set({
+        "doctorId": "doc_b", "date": DATE, "time": "09:15", "hold": True, "expiresAt": datetime(2099, 1, 1, tzinfo=timezone.utc),
+    })
+    return fake_db
+
+
+def _row(grid, doctor_id):
+    row = next(d for d in grid["doctors"] if d["id"] == doctor_id)
+    return {t: (row["working"][i], row["booked"][i], row["free"][i]) for i, t in enumerate(grid["timeSlots"])}
+
+
+def test_grid_marks_working_booked_and_free(clinic):
+    grid = rs.get_doctor_grid("内科", DATE)
+    assert grid["timeSlots"] == TIME_SLOTS and grid["reason"] is None and not grid["is_holiday"]
+    assert [(d["id"], d["name"]) for d in grid["doctors"]] == [("doc_a", "A"), ("doc_b", "B")]
+    a, b = _row(grid, "doc_a"), _row(grid, "doc_b")
+    assert a["09:00"] == (True, True, False) and a["09:15"] == (True, False, True) and a["10:00"] == (False, False, False)
+    assert b["09:15"] == (True, True, False)  # 有効な仮押さえは予約済み
+    # 診療科全体の○×（/api/slots）と free の OR が一致する
+    day = rs.get_availability_for_date("内科", DATE)
+    assert [s["reservable"] for s in day["slots"]] == [
+        any(d["free"][i] for d in grid["doctors"]) for i in range(len(TIME_SLOTS))
+    ]
+
+
+def test_grid_uses_one_bulk_read_for_all_doctors(clinic):
+    queries = []
+    clinic.on_rpc = lambda op, path: queries.append(path) if op == "query" else None
+    rs.get_doctor_grid("内科", DATE)
+    n = len(queries)
+    for i in range(20):
+        clinic.collection("doctors").document(f"doc_extra{i:02d}").set({"name": "E", "department": "内科", "schedules": {"tue": TIME_SLOTS}})
+    queries.clear()
+    assert len(rs.get_doctor_grid("内科", DATE)["doctors"]) == 22
+    assert len(queries) == n
+
+
+def test_holiday_past_and_invalid_dates(clinic):
+    holiday = rs.get_doctor_grid("内科", HOLIDAY)
+    assert holiday["is_holiday"] and holiday["reason"] == "holiday"
+    assert not any(any(d["working"]) or any(d["free"]) for d in holiday["doctors"])
+    past = rs.get_doctor_grid("内科", "2020-02-11")
+    assert past["reason"] == "past" and any(past["doctors"][0]["working"]) and not any(past["doctors"][0]["free"])
+    assert rs.get_doctor_grid("内科", "2030-13-01")["doctors"] == []
+
+
+def test_endpoint(clinic):
+    client = TestClient(main.app)
+    res = client.get(f"/api/grid?department=内科&date={DATE}")
+    assert res.status_code == 200
+    assert _row(res.json(), "doc_a")["09:15"] == (True, False, True)
+    assert client.get(f"/api/grid?date={DATE}").status_code == 400
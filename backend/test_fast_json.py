@@ -0,0 +1,35 @@
+"""
+空き枠レスポンス高速直列化（fast_json）のテスト
+実行: cd Day5/backend && python -m pytest test_fast_json.py -v
+"""
+import json
+
+import fast_json
+from models import AvailabilityForDateResponse
+from slot_logic import compute_availability
+
+DOCTORS = [{"id": "doc_a", "name": "A", "schedules": {"tue": ["09:00", "10:00"]}}]
+
+
+def _day(reserved=frozenset()):
+    return compute_availability(["2026-02-10"], DOCTORS, set(reserved))["2026-02-10"]
+
+
+def test_same_json_as_pydantic_model():
+    day = _day()
+    expected = AvailabilityForDateResponse.model_validate(day).model_dump(mode="json")
+    assert json.loads(fast_json.encode_day(day)) == expected
+
+
+def test_unchanged_day_reuses_bytes_and_changes_are_reflected():
+    fast_json.clear_cache()
+    first = fast_json.encode_day(_day())
+    assert fast_json.encode_day(_day()) is first
+    booked = fast_json.encode_day(_day({("doc_a", "2026-02-10", "09:00")}))
+    assert booked is not first
+    assert json.loads(booked)["slots"][0]["reservable"] is False
+
+
+def test_encode_days_is_json_array():
+    assert json.loads(fast_json.encode_days([])) == []
+    assert [d["date"] for d in json.loads(fast_json.encode_days([_day(), _day()]))] == ["2026-02-10"] * 2
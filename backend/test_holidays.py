@@ -2,47 +2,10 @@
 祝日判定・モデルバリデーションの基本テスト
 実行: cd Day5/backend && python -m pytest test_holidays.py -v
 """
-import math
 import pytest
-from datetime import datetime
-
-
-# --- reservation_service.py から祝日関連関数をコピー（firebase_admin 依存を避ける） ---
-def _nth_monday(year: int, month: int, n: int) -> int:
-    first = datetime(year, month, 1)
-    return (n - 1) * 7 + 1 + (7 - first.weekday()) % 7
-
-def _vernal_equinox_day(year: int) -> int:
-    return math.floor(20.8431 + 0.242194 * (year - 1980) - math.floor((year - 1980) / 4))
-
-def _autumnal_equinox_day(year: int) -> int:
-    return math.floor(23.2488 + 0.242194 * (year - 1980) - math.floor((year - 1980) / 4))
-
-def _is_japanese_holiday(date_str: str) -> bool:
-    try:
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-    except (ValueError, TypeError):
-        return False
-    y, m, d = dt.year, dt.month, dt.day
-    fixed = [
-        (1, 1), (2, 11), (2, 23), (4, 29), (5, 3), (5, 4), (5, 5),
-        (8, 11), (11, 3), (11, 23),
-    ]
-    if (m, d) in fixed:
-        return True
-    if m == 1 and d == _nth_monday(y, 1, 2):
-        return True
-    if m == 3 and d == _vernal_equinox_day(y):
-        return True
-    if m == 7 and d == _nth_monday(y, 7, 3):
-        return True
-    if m == 9 and d == _nth_monday(y, 9, 3):
-        return True
-    if m == 9 and d == _autumnal_equinox_day(y):
-        return True
-    if m == 10 and d == _nth_monday(y, 10, 2):
-        return True
-    return False
+
+# firebase_admin に依存しない slot_logic から本番と同じ関数を直接使う
+from slot_logic import _is_japanese_holiday, _nth_monday
 
 
 class TestNthMonday:
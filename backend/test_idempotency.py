@@ -0,0 +1,88 @@
+"""
+予約作成の Idempotency-Key（idempotency・POST /api/reservations）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_idempotency.py -v
+"""
+from unittest import mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+import idempotency
+import main
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+BODY = {"department": "内科", "date": DATE, "time": "09:00", "purpose": "再診"}
+
+
+@pytest.fixture
+def client(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    fake_db.collection("doctors").document("doc_a").set({"name": "A", "department": "内科", "schedules": {"tue": TIME_SLOTS}})
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "u1"})
+    return TestClient(main.app)
+
+
+def _post(client, key, body=BODY, path="/api/reservations"):
+    headers = {"Authorization": "Bearer t", **({"Idempotency-Key": key} if key else {})}
+    return client.post(path, json=body, headers=headers)
+
+
+@pytest.mark.parametrize("store", ["local", "firestore"])
+def test_retry_returns_original_response_without_booking(client, fake_db, monkeypatch, store):
+    monkeypatch.setenv("IDEMPOTENCY_STORE", store)
+    idempotency.clear()
+    first = _post(client, "k1")
+    assert first.status_code == 200
+    with mock.patch.object(main, "create_reservation_service", side_effect=AssertionError("booked again")):
+        again = _post(client, "k1")
+    assert again.status_code == 200 and again.json() == first.json()
+    assert len(fake_db.dump("users/u1/reservations")) == 1
+    assert (len(fake_db.dump(idempotency.COLLECTION)) == 1) is (store == "firestore")
+
+
+def test_without_key_retry_fails_as_duplicate(client):
+    assert _post(client, None).status_code == 200
+    assert _post(client, None).status_code == 400
+
+
+def test_key_reused_with_other_body_is_rejected(client):
+    assert _post(client, "k1").status_code == 200
+    assert _post(client, "k1", {**BODY, "time": "09:15"}).status_code == 422
+    assert _post(client, "x" * 300).status_code == 400
+
+
+def test_failures_are_not_stored(client, fake_db):
+    fake_db.collection("booked_slots").document(f"doc_a_{DATE}_09:00").set({"doctorId": "doc_a", "date": DATE, "time": "09:00"})
+    assert _post(client, "k1").status_code == 400
+    fake_db.collection("booked_slots").document(f"doc_a_{DATE}_09:00").delete()
+    assert _post(client, "k1").status_code == 200
+
+
+def test_lost_race_with_other_worker_returns_stored_result(fake_db):
+    stored = {"id": "r1", "date": DATE, "time": "09:00", "department": "内科"}
+    fp = idempotency.fingerprint("reservations", "内科", DATE, "09:00", "")
+
+    def other_worker_won():
+        idempotency.get_store().put("u1", "k1", {"fingerprint": fp, "result": stored})
+        raise ValueError("この診療科・日時はすでに予約済みです。")
+
+    assert idempotency.run("u1", "k1", fp, other_worker_won) == stored
+
+
+def test_local_store_is_bounded():
+    store = idempotency.LocalStore(max_keys=2, ttl=60)
+    for key in ("a", "b", "c"):
+        store.put("u1", key, {"fingerprint": key, "result": {}})
+    assert store.get("u1", "a") is None and store.get("u1", "c") is not None
+    expired = idempotency.LocalStore(max_keys=2, ttl=0)
+    expired.put("u1", "a", {"fingerprint": "a", "result": {}})
+    assert expired.get("u1", "a") is None
+
+
+def test_batch_endpoint_replays(client):
+    body = {"items": [BODY, {**BODY, "time": "10:00"}]}
+    first = _post(client, "b1", body, "/api/reservations/batch")
+    assert first.status_code == 200
+    assert _post(client, "b1", body, "/api/reservations/batch").json() == first.json()
+    assert _post(client, "b1", BODY).status_code == 422  # 別のエンドポイントでは使えない
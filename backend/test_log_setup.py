@@ -0,0 +1,86 @@
+"""
+ログ設定（log_setup: QueueHandler・JSON 整形・間引き）のテスト。
+実行: cd Day5/backend && python -m pytest test_log_setup.py -v
+"""
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+import pytest
+
+import log_setup
+import metrics
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    monkeypatch.delenv("LOG_SAMPLE_RATE", raising=False)
+    monkeypatch.delenv("LOG_QUEUE", raising=False)
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    out = io.StringIO()
+    yield out
+    log_setup.stop_logging()
+    for h in saved_handlers:
+        root.addHandler(h)
+    root.setLevel(saved_level)
+
+
+def _lines(out):
+    log_setup.stop_logging()  # キューを書き出してから読む
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_records_are_written_as_json_by_listener(captured):
+    log_setup.setup_logging(stream=captured, force=True)
+    assert isinstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+    logging.getLogger("svc").info("booked %s", "doc_a_2030-02-12_09:00", extra={"event": "reservation_created"})
+    logging.getLogger("svc").debug("hidden")
+
+    (line,) = _lines(captured)
+    assert line["level"] == "INFO" and line["logger"] == "svc"
+    assert line["msg"] == "booked doc_a_2030-02-12_09:00" and line["event"] == "reservation_created"
+
+
+def test_sampling_keeps_warnings_and_untagged_records(captured, monkeypatch):
+    monkeypatch.setenv("LOG_SAMPLE_RATE", "0")
+    log_setup.setup_logging(stream=captured, force=True)
+    logger = logging.getLogger("svc")
+    for _ in range(50):
+        logger.info("slot locked", extra=log_setup.SAMPLED)
+    logger.info("done")
+    logger.warning("slow", extra=log_setup.SAMPLED)
+
+    assert [line["msg"] for line in _lines(captured)] == ["done", "slow"]
+
+
+def test_sampling_filter_rate():
+    f = log_setup.SamplingFilter(0.25, rng=random.Random(1))
+    records = [logging.makeLogRecord({"levelno": logging.INFO, "sampled": True}) for _ in range(4000)]
+    kept = [r for r in records if f.filter(r)]
+    assert 800 < len(kept) < 1200
+    assert all(r.sample_rate == 0.25 for r in kept)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    metrics.reset()
+    handler = log_setup._NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(logging.makeLogRecord({"msg": "x"}))
+    assert metrics.get("log_dropped") == 2
+
+
+def test_setup_leaves_foreign_handlers_alone(captured):
+    root = logging.getLogger()
+    foreign = logging.NullHandler()
+    root.addHandler(foreign)
+    try:
+        log_setup.setup_logging(stream=captured)
+        assert foreign in root.handlers and not log_setup._installed
+    finally:
+        root.removeHandler(foreign)
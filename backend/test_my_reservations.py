@@ -0,0 +1,79 @@
+"""
+マイ予約一覧（カーソル方式のページング・射影・ETag）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_my_reservations.py -v
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import reservation_service as rs
+
+
+def _add(db, uid, rid, date, time="09:00"):
+    db.collection("users").document(uid).collection("reservations").document(rid).set({
+        "date": date, "time": time, "category": "", "department": "内科", "purpose": "再診",
+        "doctor": "A", "doctorId": "doc_a",
+    })
+
+
+@pytest.fixture
+def history(fake_db):
+    # 過去 5 件（同日同時刻を含む）+ 今後 3 件
+    for i, date in enumerate(["2001-01-05", "2001-01-05", "2001-01-06", "2002-03-01", "2003-07-07"]):
+        _add(fake_db, "u1", f"p{i}", date)
+    for i, (date, time) in enumerate([("2099-01-01", "10:00"), ("2099-01-01", "09:00"), ("2099-02-01", "09:00")]):
+        _add(fake_db, "u1", f"f{i}", date, time)
+    _add(fake_db, "u2", "other", "2099-01-01")
+    return fake_db
+
+
+def _all_pages(**kw):
+    ids, cursor = [], ""
+    while True:
+        page = rs.list_user_reservations("u1", cursor=cursor, **kw)
+        ids.extend(item["id"] for item in page["items"])
+        cursor = page["nextCursor"]
+        if not cursor:
+            return ids
+
+
+def test_upcoming_is_ascending_and_own_only(history):
+    page = rs.list_user_reservations("u1")
+    assert [i["id"] for i in page["items"]] == ["f1", "f0", "f2"]
+    assert page["nextCursor"] is None
+
+
+def test_past_pages_are_newest_first_without_gaps(history):
+    assert _all_pages(scope="past", limit=2) == ["p4", "p3", "p2", "p1", "p0"]
+
+
+def test_all_scope_pages_cover_everything_once(history):
+    page = rs.list_user_reservations("u1", scope="all", limit=3)
+    assert len(page["items"]) == 3 and page["nextCursor"]
+    assert _all_pages(scope="all", limit=3) == ["p0", "p1", "p2", "p3", "p4", "f1", "f0", "f2"]
+
+
+def test_projection_and_validation(history):
+    item = rs.list_user_reservations("u1", fields=["date", "department"])["items"][0]
+    assert item == {"id": "f1", "date": "2099-01-01", "department": "内科"}
+    with pytest.raises(ValueError):
+        rs.list_user_reservations("u1", fields=["doctorId"])
+    with pytest.raises(ValueError):
+        rs.list_user_reservations("u1", scope="someday")
+    with pytest.raises(ValueError):
+        rs.list_user_reservations("u1", cursor="%%%")
+
+
+def test_endpoint_etag_returns_304(history, monkeypatch):
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "u1"})
+    client = TestClient(main.app)
+    headers = {"Authorization": "Bearer t"}
+    first = client.get("/api/reservations?scope=past&limit=2", headers=headers)
+    assert first.status_code == 200
+    assert [i["id"] for i in first.json()["items"]] == ["p4", "p3"]
+    etag = first.headers["etag"]
+    again = client.get("/api/reservations?scope=past&limit=2", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    _add(history, "u1", "p5", "2004-01-01")
+    changed = client.get("/api/reservations?scope=past&limit=2", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
@@ -0,0 +1,81 @@
+"""
+空き状況のキャッシュ（availability_cache）と隣の週の先読み（prefetch）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_prefetch.py -v
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import availability_cache
+import main
+import prefetch
+import reservation_service as rs
+from slot_logic import TIME_SLOTS, day_from_mask
+
+WEEK = [f"2030-02-{d:02d}" for d in range(4, 11)]  # 月〜日
+NEXT_WEEK = [f"2030-02-{d:02d}" for d in range(11, 18)]
+
+
+@pytest.fixture
+def clinic(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setattr(prefetch, "ENABLED", True)
+    prefetch.reset()
+    schedules = {d: TIME_SLOTS for d in ("mon", "tue", "wed", "thu", "fri")}
+    fake_db.collection("doctors").document("doc_a").set({"name": "A", "department": "内科", "schedules": schedules})
+    queries = []
+    fake_db.on_rpc = lambda op, path: queries.append(path) if op == "query" else None
+    fake_db.queries = queries
+    return fake_db
+
+
+def _week(client, dates):
+    res = client.get("/api/slots/week", params={"department": "内科", "dates": ",".join(dates)})
+    assert res.status_code == 200
+    return res.json()
+
+
+def test_next_week_is_served_warm(clinic, monkeypatch):
+    client = TestClient(main.app)
+    _week(client, WEEK)
+    assert prefetch.drain()
+    monkeypatch.setattr(prefetch, "ENABLED", False)  # 次の次の週の先読みを数えない
+    clinic.queries.clear()
+    days = _week(client, NEXT_WEEK)
+    assert clinic.queries == []  # 医師・予約とも読まない
+    assert [d["date"] for d in days] == NEXT_WEEK and days[1]["slots"][0]["reservable"] is True
+
+
+def test_booking_invalidates_prefetched_days(clinic):
+    client = TestClient(main.app)
+    _week(client, WEEK)
+    assert prefetch.drain()
+    rs.create_reservation("内科", "2030-02-12", "09:00", "u1")
+    days = _week(client, NEXT_WEEK)
+    assert days[1]["slots"][0]["reservable"] is False
+    assert prefetch.drain()
+
+
+def test_prefetch_skipped_under_load_and_over_budget(clinic, monkeypatch):
+    stats = prefetch.booking_admission.stats
+    monkeypatch.setattr(prefetch.booking_admission, "stats", lambda: {"running": 8, "queued": 3, "keys": 1})
+    assert prefetch.schedule("内科", WEEK) is False
+    monkeypatch.setattr(prefetch.booking_admission, "stats", stats)
+    monkeypatch.setattr(prefetch, "PER_MINUTE", 1.0)
+    prefetch.reset()
+    assert prefetch.schedule("内科", WEEK) is True
+    assert prefetch.schedule("内科", NEXT_WEEK) is False
+    assert prefetch.drain()
+
+
+def test_result_computed_before_a_change_is_not_stored(fake_db):
+    variant = ("内科", False, 1, (1 << len(TIME_SLOTS)) - 1)
+    started = availability_cache.generation("内科", ["2030-02-12"])
+    availability_cache.invalidate("内科", "2030-02-12")
+    availability_cache.store(variant, (True, {"2030-02-12": day_from_mask("2030-02-12", 1)}), started, 0.0)
+    assert availability_cache.lookup(variant, ["2030-02-12"]) is None
+
+
+def test_next_dates():
+    assert prefetch.next_dates(WEEK) == NEXT_WEEK
+    assert prefetch.next_dates(["2030-02-28"]) == ["2030-03-01"]
+    assert prefetch.next_dates(["bad"]) == []
@@ -0,0 +1,97 @@
+"""
+医師休診時の予約一括振替（reassignment）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_reassignment.py -v
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from reassignment import reassign_absent_doctor
+from test_cancellation import _book
+
+TUE = ["09:00", "09:15", "09:30"]
+
+
+def _doctors(db):
+    for doc_id, name, tue in (("doc_a", "A", TUE), ("doc_b", "B", TUE[:2]), ("doc_c", "C", [])):
+        db.collection("doctors").document(doc_id).set({"name": name, "department": "内科", "schedules": {"tue": tue}})
+    db.collection("doctors").document("doc_x").set({"name": "X", "department": "眼科", "schedules": {"tue": TUE}})
+
+
+def test_moves_to_free_colleague_and_reports_unplaced(fake_db):
+    _doctors(fake_db)
+    _book(fake_db, "u1", "r1", time="09:00")
+    _book(fake_db, "u2", "r2", time="09:30")  # doc_b は 09:30 勤務なし
+    _book(fake_db, "u3", "r3", doctor_id="doc_b", time="09:15")
+    _book(fake_db, "u4", "r4", time="09:15")  # doc_b は u3 で埋まっている
+
+    out = reassign_absent_doctor("doc_a", "2030-02-12", "2030-02-12")
+
+    assert [(m["id"], m["toDoctorId"]) for m in out["moved"]] == [("r1", "doc_b")]
+    assert sorted((u["id"], u["reason"]) for u in out["unplaced"]) == [("r2", "no_available_doctor"), ("r4", "no_available_doctor")]
+    slots = fake_db.dump("booked_slots")
+    assert "doc_a_2030-02-12_09:00" not in slots
+    assert slots["doc_b_2030-02-12_09:00"]["reservationId"] == "r1"
+    res = fake_db.dump("users/u1/reservations")["r1"]
+    assert (res["doctorId"], res["doctor"]) == ("doc_b", "B")
+
+
+def test_dry_run_does_not_write(fake_db):
+    _doctors(fake_db)
+    _book(fake_db, "u1", "r1", time="09:00")
+    out = reassign_absent_doctor("doc_a", "2030-02-12", "2030-02-13", dry_run=True)
+    assert out["dryRun"] is True and len(out["moved"]) == 1
+    assert "doc_a_2030-02-12_09:00" in fake_db.dump("booked_slots")
+
+
+def test_conflicting_slot_is_reported(fake_db):
+    _doctors(fake_db)
+    _book(fake_db, "u1", "r1", time="09:00")
+
+    # 計画後・確定前に別の予約が doc_b の 09:00 を確保した状況を再現
+    def race(op, path):
+        if op == "get_all":
+            fake_db.on_rpc = None
+            fake_db.collection("booked_slots").document("doc_b_2030-02-12_09:00").create({"userId": "u9"})
+
+    fake_db.on_rpc = race
+    out = reassign_absent_doctor("doc_a", "2030-02-12", "2030-02-12")
+    assert out["moved"] == []
+    assert [u["reason"] for u in out["unplaced"]] == ["conflict"]
+    assert fake_db.dump("users/u1/reservations")["r1"]["doctorId"] == "doc_a"
+
+
+def test_expired_hold_on_target_slot_is_overwritten(fake_db):
+    _doctors(fake_db)
+    _book(fake_db, "u1", "r1", time="09:00")
+    fake_db.collection("booked_slots").document("doc_b_2030-02-12_09:00").set({
+        "doctorId": "doc_b", "date": "2030-02-12", "time": "09:00", "department": "内科", "userId": "u9",
+        "hold": True, "holdId": "h1", "expiresAt": datetime.now(timezone.utc) - timedelta(seconds=1),
+    })
+    out = reassign_absent_doctor("doc_a", "2030-02-12", "2030-02-12")
+    assert [(m["id"], m["toDoctorId"]) for m in out["moved"]] == [("r1", "doc_b")] and out["unplaced"] == []
+    slot = fake_db.dump("booked_slots")["doc_b_2030-02-12_09:00"]
+    assert (slot["userId"], slot["reservationId"]) == ("u1", "r1") and "hold" not in slot
+
+
+def test_invalid_input(fake_db):
+    _doctors(fake_db)
+    with pytest.raises(ValueError):
+        reassign_absent_doctor("doc_a", "2030-02-13", "2030-02-12")
+    with pytest.raises(ValueError):
+        reassign_absent_doctor("nobody", "2030-02-12", "2030-02-12")
+
+
+def test_multi_slot_booking_moves_as_a_run(fake_db):
+    _doctors(fake_db)
+    # 30分（09:00・09:15 の2枠）の予約。doc_b は 09:00〜09:30 勤務で 2枠続けて空いている
+    for t in ("09:00", "09:15"):
+        fake_db.collection("booked_slots").document(f"doc_a_2030-02-12_{t}").set({
+            "doctorId": "doc_a", "date": "2030-02-12", "time": t, "department": "内科", "userId": "u1", "reservationId": "r1",
+        })
+    fake_db.collection("users").document("u1").collection("reservations").document("r1").set({
+        "date": "2030-02-12", "time": "09:00", "department": "内科", "doctorId": "doc_a", "doctor": "A", "duration": 30,
+    })
+    out = reassign_absent_doctor("doc_a", "2030-02-12", "2030-02-12")
+    assert [(m["id"], m["time"], m["toDoctorId"]) for m in out["moved"]] == [("r1", "09:00", "doc_b")]
+    assert sorted(fake_db.dump("booked_slots")) == ["doc_b_2030-02-12_09:00", "doc_b_2030-02-12_09:15"]
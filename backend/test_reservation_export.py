@@ -0,0 +1,100 @@
+"""
+予約の一括エクスポート（reservation_export・GET /api/admin/reservations/export）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_reservation_export.py -v
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import reservation_export as rx
+
+
+@pytest.fixture
+def bookings(fake_db):
+    rows = [
+        ("u1", "r1", "2030-02-12", "09:00", "内科", "doc_a"),
+        ("u2", "r2", "2030-02-12", "09:00", "内科", "doc_b"),
+        ("u1", "r3", "2030-02-12", "10:00", "眼科", "doc_x"),
+        ("u3", "r4", "2030-02-13", "09:15", "内科", "doc_a"),
+        ("u2", "r5", "2030-02-14", "11:00", "内科", "doc_a"),
+        ("u3", "r6", "2030-02-11", "09:00", "内科", "doc_a"),  # 期間外
+    ]
+    for uid, rid, date, time, dept, doctor in rows:
+        fake_db.collection("users").document(uid).collection("reservations").document(rid).set({
+            "date": date, "time": time, "department": dept, "doctorId": doctor, "doctor": f"医師{doctor[-1]}",
+            "purpose": "再診", "category": "", "duration": 15,
+            "createdAt": datetime(2030, 1, 1, tzinfo=timezone.utc),
+        })
+    return fake_db
+
+
+def test_pages_follow_cursor_in_date_time_order(bookings):
+    queries = []
+    bookings.on_rpc = lambda op, path: queries.append(op) if op == "query" else None
+    pages = list(rx.iter_pages("2030-02-12", "2030-02-14", page_size=2))
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert len(queries) == 3
+    rows = [r for p in pages for r in p]
+    assert [(r["date"], r["time"], r["reservationId"]) for r in rows] == [
+        ("2030-02-12", "09:00", "r1"), ("2030-02-12", "09:00", "r2"), ("2030-02-12", "10:00", "r3"),
+        ("2030-02-13", "09:15", "r4"), ("2030-02-14", "11:00", "r5"),
+    ]
+    assert rows[0]["userId"] == "u1" and rows[0]["createdAt"] == "2030-01-01T00:00:00+00:00"
+
+
+def test_filters_by_department_and_doctor(bookings):
+    rows = [r for p in rx.iter_pages("2030-02-12", "2030-02-14", department="内科", doctor_id="doc_a") for r in p]
+    assert [r["reservationId"] for r in rows] == ["r1", "r4", "r5"]
+
+
+def test_csv_is_written_page_by_page(bookings):
+    chunks = list(rx.export_reservations("2030-02-12", "2030-02-14", "csv", page_size=2))
+    assert len(chunks) == 4  # ヘッダー + 3ページ
+    text = b"".join(chunks).decode("utf-8-sig")
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert list(rows[0]) == list(rx.EXPORT_COLUMNS)
+    assert [r["reservationId"] for r in rows] == ["r1", "r2", "r3", "r4", "r5"]
+    assert rows[2]["department"] == "眼科"
+
+
+def test_ndjson_lines(bookings):
+    body = b"".join(rx.export_reservations("2030-02-13", "2030-02-13", "ndjson"))
+    (line,) = body.decode("utf-8").splitlines()
+    assert json.loads(line)["reservationId"] == "r4" and json.loads(line)["duration"] == 15
+
+
+def test_parquet_round_trip(bookings):
+    pq = pytest.importorskip("pyarrow.parquet")
+    body = b"".join(rx.export_reservations("2030-02-12", "2030-02-14", "parquet", page_size=2))
+    table = pq.read_table(io.BytesIO(body))
+    assert table.column("reservationId").to_pylist() == ["r1", "r2", "r3", "r4", "r5"]
+
+
+def test_invalid_arguments_fail_before_streaming(fake_db):
+    with pytest.raises(ValueError):
+        rx.export_reservations("2030-02-12", "2030-02-14", "xlsx")
+    with pytest.raises(ValueError):
+        rx.export_reservations("2030-02-14", "2030-02-12", "csv")
+    with pytest.raises(ValueError):
+        rx.export_reservations("2030-01-01", "2031-01-02", "csv")
+
+
+def test_endpoint_requires_admin_and_streams_csv(bookings, monkeypatch):
+    client = TestClient(main.app)
+    headers = {"Authorization": "Bearer t"}
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "u1"})
+    assert client.get("/api/admin/reservations/export?from=2030-02-12&to=2030-02-14", headers=headers).status_code == 403
+
+    monkeypatch.setattr(main, "verify_id_token", lambda token: {"uid": "staff", "admin": True})
+    res = client.get("/api/admin/reservations/export?from=2030-02-12&to=2030-02-12&department=内科", headers=headers)
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/csv")
+    assert 'filename="reservations_2030-02-12_2030-02-12.csv"' in res.headers["content-disposition"]
+    assert [r["reservationId"] for r in csv.DictReader(io.StringIO(res.content.decode("utf-8-sig")))] == ["r1", "r2"]
+    bad = client.get("/api/admin/reservations/export?from=2030-02-12&to=2030-02-12&format=xml", headers=headers)
+    assert bad.status_code == 400
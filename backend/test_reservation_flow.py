@@ -0,0 +1,120 @@
+"""
+予約作成フロー（create_reservation）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_reservation_flow.py -v
+"""
+import pytest
+
+import metrics
+import reservation_service as rs
+import user_booked_cache
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def doctors(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    for i in range(3):
+        fake_db.collection("doctors").document(f"doc_{i}").set({
+            "name": f"医師{i}", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+        })
+    return fake_db
+
+
+def test_create_reservation_claims_slot(doctors):
+    out = rs.create_reservation("内科", DATE, "09:00", "u1", purpose="再診")
+    slots = doctors.dump("booked_slots")
+    assert len(slots) == 1
+    (sid, slot), = slots.items()
+    assert slot["reservationId"] == out["id"] and slot["userId"] == "u1"
+    assert sid == f"{out['doctorId']}_{DATE}_09:00"
+    with pytest.raises(ValueError):
+        rs.create_reservation("内科", DATE, "09:00", "u1")
+
+
+def test_least_loaded_spreads_bookings(doctors, monkeypatch):
+    monkeypatch.setenv("ASSIGN_STRATEGY", "least_loaded")
+    assigned = [rs.create_reservation("内科", DATE, t, f"u{i}")["doctorId"] for i, t in enumerate(TIME_SLOTS[:6])]
+    assert sorted(assigned.count(f"doc_{i}") for i in range(3)) == [2, 2, 2]
+
+
+def test_full_slot_counts_collisions(doctors, monkeypatch):
+    monkeypatch.setenv("ASSIGN_STRATEGY", "first")
+    metrics.reset()
+    for i in range(3):
+        rs.create_reservation("内科", DATE, "10:00", f"u{i}")
+    with pytest.raises(ValueError):
+        rs.create_reservation("内科", DATE, "10:00", "u9")
+    # 一括取得の結果で埋まった医師は候補から外れるため、逐次実行では衝突しない
+    assert metrics.get("slot_claim_collisions") == 0
+    assert metrics.get("slot_claim_attempts") == 3
+
+
+def test_first_visit_claims_consecutive_slots_of_one_doctor(doctors, monkeypatch):
+    monkeypatch.setenv("ASSIGN_STRATEGY", "first")
+    # 初診は30分 = 2枠。09:15 が全員埋まっていると 09:00 開始の初診は取れない
+    for i in range(3):
+        rs.create_reservation("内科", DATE, "09:15", f"u{i}")
+    day = rs.get_availability_for_date("内科", DATE, purpose="初診")
+    reservable = {s["time"]: s["reservable"] for s in day["slots"]}
+    assert reservable["09:00"] is False and reservable["09:15"] is False and reservable["09:30"] is True
+    assert reservable["16:45"] is False  # 診療時間をはみ出す
+    with pytest.raises(ValueError):
+        rs.create_reservation("内科", DATE, "09:00", "u9", purpose="初診")
+
+    out = rs.create_reservation("内科", DATE, "09:30", "u9", purpose="初診")
+    slots = doctors.dump("booked_slots")
+    ids = {f"{out['doctorId']}_{DATE}_09:30", f"{out['doctorId']}_{DATE}_09:45"}
+    assert ids <= set(slots) and all(slots[sid]["reservationId"] == out["id"] for sid in ids)
+    assert doctors.dump("users/u9/reservations")[out["id"]]["duration"] == 30
+
+    rs.cancel_reservation("u9", out["id"])
+    assert not ids & set(doctors.dump("booked_slots"))
+
+
+def test_department_start_grid(doctors):
+    for i in range(2):
+        doctors.collection("doctors").document(f"img_{i}").set({
+            "name": f"検査{i}", "department": "画像診断・検査", "schedules": {"tue": ["09:00-11:00"]},
+        })
+    day = rs.get_availability_for_date("画像診断・検査", DATE)
+    assert [s["time"] for s in day["slots"] if s["reservable"]] == ["09:00", "09:30", "10:00"]
+    with pytest.raises(ValueError):
+        rs.create_reservation("画像診断・検査", DATE, "09:15", "u1")
+    out = rs.create_reservation("画像診断・検査", DATE, "10:00", "u1")
+    assert len([sid for sid in doctors.dump("booked_slots") if sid.startswith(out["doctorId"])]) == 4
+
+
+def test_same_user_cannot_overlap_own_multi_slot_booking(doctors):
+    for i in range(2):
+        doctors.collection("doctors").document(f"img_{i}").set({
+            "name": f"検査{i}", "department": "画像診断・検査", "schedules": {"tue": ["09:00-11:00"]},
+        })
+    rs.create_reservation("画像診断・検査", DATE, "09:00", "u1")  # 60分: 09:00〜09:45 の4枠
+    with pytest.raises(ValueError, match="すでに予約済み"):
+        rs.create_reservation("画像診断・検査", DATE, "09:30", "u1")
+    rs.create_reservation("画像診断・検査", DATE, "09:30", "u2")  # 別の利用者はもう1人の医師で予約できる
+    rs.create_reservation("画像診断・検査", DATE, "10:00", "u1")
+
+
+def test_own_multi_slot_booking_marks_every_overlapping_start(doctors):
+    def reservable(dept, user_id, purpose=""):
+        day = rs.get_availability_for_date(dept, DATE, user_id=user_id, purpose=purpose)
+        return {s["time"]: s["reservable"] for s in day["slots"]}
+
+    doctors.collection("doctors").document("img_0").set({
+        "name": "検査0", "department": "画像診断・検査", "schedules": {"tue": ["09:00-11:00"]},
+    })
+    reservable("画像診断・検査", "u1")  # 予約前に本人の予約済み枠をキャッシュしておく
+    out = rs.create_reservation("画像診断・検査", DATE, "09:00", "u1")
+    assert reservable("画像診断・検査", "u1")["09:30"] is False
+    user_booked_cache.clear()  # Firestore から読み直しても同じ
+    assert reservable("画像診断・検査", "u1")["09:30"] is False
+    rs.cancel_reservation("u1", out["id"])
+    assert reservable("画像診断・検査", "u1")["09:30"] is True
+
+    # 30分の種別では、開始枠から続く枠が自分の予約と重なる開始時刻も×
+    rs.create_reservation("内科", DATE, "09:15", "u1", purpose="再診")
+    slots = reservable("内科", "u1", purpose="初診")
+    assert (slots["09:00"], slots["09:15"], slots["09:30"]) == (False, False, True)
@@ -0,0 +1,94 @@
+"""
+ワーカー間共有の空き状況（shared_availability）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_shared_availability.py -v
+"""
+import os
+import struct
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+import metrics
+import reservation_service as rs
+import shared_availability as sa
+from slot_logic import TIME_SLOTS
+
+pytestmark = pytest.mark.skipif(sa.fcntl is None, reason="POSIX のみ")
+
+
+def _next_tuesday() -> str:
+    d = date.today() + timedelta(days=7)
+    while d.weekday() != 1 or rs.classify_date("内科", d.isoformat(), date.today()) is not None:
+        d += timedelta(days=1)
+    return d.isoformat()
+
+
+@pytest.fixture
+def store(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    fake_db.collection("doctors").document("doc_0").set({
+        "name": "医師0", "department": "内科", "schedules": {"tue": TIME_SLOTS[:8]},
+    })
+    name = f"test_avail_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+    writer = sa.SharedAvailability.create(name, 92, use_demo=False)
+    reader = sa.SharedAvailability.attach(name)
+    yield writer, reader
+    reader.close()
+    writer.unlink()
+    writer.close()
+
+
+def test_reader_sees_writer_refresh_without_recomputing(store, fake_db):
+    writer, reader = store
+    day = _next_tuesday()
+    assert reader.lookup("内科", [day], use_demo=False) is None  # 未更新
+
+    rs.create_reservation("内科", day, "09:15", "u1")
+    assert sa.refresh(writer) == 1
+    expected = rs._compute_base_availability("内科", [day], False)
+    assert reader.lookup("内科", [day], use_demo=False) == expected
+    slots = {s["time"]: s["reservable"] for s in expected[1][day]["slots"]}
+    assert slots["09:00"] is True and slots["09:15"] is False and slots["11:00"] is False
+
+    # 未登録の診療科・範囲外の日付・use_demo の不一致は使わない
+    assert reader.lookup("外科", [day], use_demo=False) is None
+    far = (date.today() + timedelta(days=200)).isoformat()
+    assert reader.lookup("内科", [far], use_demo=False) is None
+    assert reader.lookup("内科", [day], use_demo=True) is None
+
+
+def test_torn_or_stale_records_fall_back(store, monkeypatch):
+    writer, reader = store
+    day = _next_tuesday()
+    sa.refresh(writer)
+    assert reader.lookup("内科", [day], use_demo=False) is not None
+
+    # 書き込み途中（seq が奇数）のレコードは読まない
+    _, base, window, *_ = writer._header()
+    pos = writer._record_offset(0, date.fromisoformat(day).toordinal() - base, window)
+    seq = struct.unpack_from("<I", writer._buf, pos)[0]
+    struct.pack_into("<I", writer._buf, pos, seq | 1)
+    assert reader.lookup("内科", [day], use_demo=False) is None
+    struct.pack_into("<I", writer._buf, pos, seq)
+
+    monkeypatch.setattr(sa, "STALE_SECONDS", -1)
+    assert reader.lookup("内科", [day], use_demo=False) is None
+
+
+def test_get_availability_reads_shared_store(store, monkeypatch):
+    writer, reader = store
+    day = _next_tuesday()
+    sa.refresh(writer)
+    monkeypatch.setattr(sa, "ENABLED", True)
+    monkeypatch.setattr(sa, "_store", reader)
+    monkeypatch.setattr(sa, "STALE_SECONDS", 3600)
+
+    def fail(*_args):
+        raise AssertionError("shared store should have been used")
+
+    monkeypatch.setattr(rs, "_compute_base_availability", fail)
+    metrics.reset()
+    result = rs.get_availability_for_dates("内科", [day])
+    assert result[0]["date"] == day and result[0]["reservable"] is True
+    assert metrics.get("shared_availability.hit") == 1
@@ -0,0 +1,104 @@
+"""
+同一計算の相乗り（singleflight）のテスト。
+実行: cd Day5/backend && python -m pytest test_singleflight.py -v
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import metrics
+import reservation_service as rs
+from singleflight import SingleFlight
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+def _slow(release: threading.Event, calls: list, value="v"):
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return value
+    return fn
+
+
+def _wait_inflight(flight, n=1):
+    for _ in range(200):
+        if flight.inflight() >= n:
+            return
+        time.sleep(0.005)
+
+
+def test_threads_share_one_computation():
+    metrics.reset()
+    flight, release, calls = SingleFlight("t"), threading.Event(), []
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        leader = pool.submit(flight.do, "k", _slow(release, calls))
+        _wait_inflight(flight)
+        followers = [pool.submit(flight.do, "k", _slow(release, calls)) for _ in range(7)]
+        time.sleep(0.05)
+        release.set()
+        assert leader.result() == "v" and all(f.result() == "v" for f in followers)
+    assert len(calls) == 1
+    assert metrics.get("singleflight.t.leader") == 1
+    assert metrics.get("singleflight.t.coalesced") == 7
+    assert flight.inflight() == 0
+
+
+def test_error_reaches_all_waiters_and_is_not_kept():
+    flight = SingleFlight("err")
+
+    def boom():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", boom)
+    assert flight.do("k", lambda: 1) == 1
+
+
+def test_async_caller_joins_thread_leader():
+    flight, release, calls = SingleFlight("mixed"), threading.Event(), []
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        leader = loop.run_in_executor(None, flight.do, "k", _slow(release, calls, "sync"))
+        await loop.run_in_executor(None, _wait_inflight, flight)
+        waiters = [asyncio.ensure_future(flight.do_async("k", _slow(release, calls, "async"))) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await leader, await asyncio.gather(*waiters)
+
+    first, rest = asyncio.run(main())
+    assert first == "sync" and rest == ["sync"] * 5
+    assert len(calls) == 1
+
+
+def test_concurrent_availability_requests_query_once(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    fake_db.collection("doctors").document("doc_0").set({
+        "name": "医師0", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+    })
+    fake_db.collection("users").document("u1").collection("reservations").document("r1").set({
+        "department": "内科", "date": DATE, "time": "09:00", "doctorId": "doc_x",
+    })
+    release, queries = threading.Event(), []
+
+    def on_rpc(op, path):
+        if path == "doctors":
+            queries.append(path)
+            release.wait(2)
+
+    fake_db.on_rpc = on_rpc
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        futures = [pool.submit(rs.get_availability_for_dates, "内科", [DATE], user_id=f"u{i}") for i in range(6)]
+        _wait_inflight(rs._availability_flight)
+        time.sleep(0.05)
+        release.set()
+        days = [f.result()[0] for f in futures]
+    assert queries == ["doctors"]
+    # 共有結果にユーザーごとの×を重ねる（u1 の 09:00 だけ×）
+    assert days[1]["slots"][0]["reservable"] is False
+    assert all(d["slots"][0]["reservable"] is True for i, d in enumerate(days) if i != 1)
@@ -0,0 +1,117 @@
+"""
+定員制の枠（slot_counters の分散カウンター）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_slot_counters.py -v
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import reservation_service as rs
+from admission import Overloaded
+from fake_firestore import Aborted
+import slot_counters
+import store
+from reassignment import reassign_absent_doctor
+from slot_logic import TIME_SLOTS, slot_capacity
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def lab(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setenv("ASSIGN_STRATEGY", "first")
+    fake_db.collection("doctors").document("doc_a").set({
+        "name": "A", "department": "内科", "schedules": {"tue": TIME_SLOTS}, "capacity": 3,
+    })
+    return fake_db
+
+
+def _reservable(time):
+    day = rs.get_availability_for_date("内科", DATE, purpose="再診")
+    return {s["time"]: s["reservable"] for s in day["slots"]}[time]
+
+
+def test_shard_caps_sum_to_capacity():
+    assert slot_counters.shard_caps(10, 4) == [3, 3, 2, 2]
+    assert slot_counters.shard_caps(2, 4) == [1, 1]
+    assert all(sum(slot_counters.shard_caps(c, n)) == c for c in range(1, 30) for n in range(1, 9))
+
+
+def test_capacity_prefers_doctor_then_department():
+    assert slot_capacity({"capacity": 5}, "臨床検査") == 5
+    assert slot_capacity({}, "臨床検査") == 3
+    assert slot_capacity({"capacity": 0}, "内科") == 1
+
+
+def test_bookings_fill_capacity_and_cancel_frees_a_seat(lab):
+    outs = [rs.create_reservation("内科", DATE, "09:00", f"u{i}", purpose="再診") for i in range(3)]
+    assert {o["doctorId"] for o in outs} == {"doc_a"}
+    assert lab.dump("booked_slots") == {}
+    assert sum(d["count"] for d in lab.dump("slot_counters").values()) == 3
+    assert _reservable("09:00") is False and _reservable("09:15") is True
+    with pytest.raises(ValueError):
+        rs.create_reservation("内科", DATE, "09:00", "u9", purpose="再診")
+
+    rs.cancel_reservation("u1", outs[1]["id"])
+    assert sum(d["count"] for d in lab.dump("slot_counters").values()) == 2
+    assert _reservable("09:00") is True
+    rs.create_reservation("内科", DATE, "09:00", "u9", purpose="再診")
+
+
+def test_concurrent_bookings_never_exceed_capacity(fake_db):
+    def take(_):
+        return slot_counters.take_seats(fake_db.transaction(), fake_db, "doc_a", "内科", DATE, ["09:00"], 5)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(take, range(40)))
+    assert sum(1 for r in results if r) == 5
+    docs = fake_db.dump("slot_counters")
+    assert sum(d["count"] for d in docs.values()) == 5
+    assert all(d["count"] <= d["cap"] for d in docs.values())
+
+
+def test_contention_is_retried_and_not_reported_as_full(lab, monkeypatch):
+    take_seats = slot_counters.take_seats
+    aborts = iter([True, False])
+
+    def flaky(*args, **kwargs):
+        if next(aborts, True):
+            raise Aborted("transaction aborted: too much contention")
+        return take_seats(*args, **kwargs)
+
+    monkeypatch.setattr(slot_counters, "CLAIM_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(slot_counters, "take_seats", flaky)
+    # 1回目は中断、取り直しで確保できる
+    out = rs.create_reservation("内科", DATE, "09:00", "u1", purpose="再診")
+    assert out["doctorId"] == "doc_a"
+    # 取り直しても中断が続けば、満枠（ValueError）ではなく再試行を促す Overloaded
+    with pytest.raises(Overloaded) as e:
+        rs.create_reservation("内科", DATE, "09:15", "u2", purpose="再診")
+    assert e.value.reason == "seat_contention"
+    assert sum(d["count"] for d in lab.dump("slot_counters").values()) == 1
+
+
+def test_reassignment_moves_seat_to_single_slot_doctor(lab):
+    out = rs.create_reservation("内科", DATE, "09:00", "u1", purpose="再診")
+    lab.collection("doctors").document("doc_b").set({"name": "B", "department": "内科", "schedules": {"tue": TIME_SLOTS}})
+
+    moved = reassign_absent_doctor("doc_a", DATE, DATE)["moved"]
+
+    assert [(m["id"], m["toDoctorId"]) for m in moved] == [(out["id"], "doc_b")]
+    assert sum(d["count"] for d in lab.dump("slot_counters").values()) == 0
+    assert lab.dump("booked_slots")[f"doc_b_{DATE}_09:00"]["reservationId"] == out["id"]
+    assert lab.dump("users/u1/reservations")[out["id"]]["seats"] == []
+
+
+def test_replica_treats_full_counters_as_reserved(lab, tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "ENABLED", True)
+    monkeypatch.setattr(store, "DB_PATH", str(tmp_path / "replica.db"))
+    replica = store.get_replica()
+    try:
+        for i in range(3):
+            rs.create_reservation("内科", DATE, "09:00", f"u{i}", purpose="再診")
+        assert replica.doctors_by_department("内科")[0]["capacity"] == 3
+        assert replica.reserved_slots(["doc_a"], [DATE]) == {("doc_a", DATE, "09:00")}
+    finally:
+        store.reset()
@@ -0,0 +1,113 @@
+"""
+予約枠の仮押さえ（slot_holds）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_slot_holds.py -v
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import metrics
+import reservation_service as rs
+import slot_holds
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def one_doctor(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setattr(slot_holds, "SWEEPER_ENABLED", False)
+    monkeypatch.setattr(slot_holds, "_heap", [])
+    fake_db.collection("doctors").document("doc_0").set({
+        "name": "医師0", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+    })
+    metrics.reset()
+    return fake_db
+
+
+def _reservable(user_id, time="09:00"):
+    day = rs.get_availability_for_date("内科", DATE, user_id=user_id)
+    return next(s["reservable"] for s in day["slots"] if s["time"] == time)
+
+
+def test_hold_blocks_others_and_confirms_in_one_step(one_doctor):
+    hold = slot_holds.place_hold("内科", DATE, "09:00", "u1", purpose="初診")
+    assert _reservable("u2") is False and _reservable("u2", "09:15") is False
+    with pytest.raises(ValueError):
+        rs.create_reservation("内科", DATE, "09:00", "u2")
+
+    out = slot_holds.confirm_hold(hold["holdId"], "内科", DATE, "09:00", "u1", purpose="初診")
+    assert out["doctorId"] == "doc_0"
+    for t in ("09:00", "09:15"):
+        slot = one_doctor.dump("booked_slots")[f"doc_0_{DATE}_{t}"]
+        assert slot["reservationId"] == out["id"] and "hold" not in slot and "expiresAt" not in slot
+    res = one_doctor.dump("users/u1/reservations")[out["id"]]
+    assert res["doctor"] == "医師0" and res["purpose"] == "初診" and res["duration"] == 30
+    # 確定済みの仮押さえは再利用できない
+    assert slot_holds.confirm_hold(hold["holdId"], "内科", DATE, "09:00", "u1") is None
+
+
+def test_multi_slot_hold_must_match_purpose_and_releases_together(one_doctor):
+    hold = slot_holds.place_hold("内科", DATE, "09:00", "u1", purpose="初診")
+    assert sorted(one_doctor.dump("booked_slots")) == [f"doc_0_{DATE}_09:00", f"doc_0_{DATE}_09:15"]
+    # 仮押さえ（2枠）と種別の所要時間（1枠）が合わなければ確定しない
+    assert slot_holds.confirm_hold(hold["holdId"], "内科", DATE, "09:00", "u1", purpose="再診") is None
+    assert slot_holds.release_hold(hold["holdId"], "u1") is True
+    assert one_doctor.dump("booked_slots") == {}
+
+
+def test_expired_hold_counts_as_free_and_is_reclaimed(one_doctor, monkeypatch):
+    monkeypatch.setattr(slot_holds, "HOLD_TTL_SECONDS", -1)
+    hold = slot_holds.place_hold("内科", DATE, "09:00", "u1")
+    assert _reservable("u2") is True
+    assert slot_holds.confirm_hold(hold["holdId"], "内科", DATE, "09:00", "u1") is None
+    out = rs.create_reservation("内科", DATE, "09:00", "u2")
+    assert one_doctor.dump("booked_slots")[f"doc_0_{DATE}_09:00"]["reservationId"] == out["id"]
+    assert metrics.get("slot_holds_reclaimed") == 1
+
+
+def test_new_hold_releases_previous_one(one_doctor):
+    slot_holds.place_hold("内科", DATE, "09:00", "u1")
+    second = slot_holds.place_hold("内科", DATE, "09:15", "u1")
+    assert list(one_doctor.dump("booked_slots")) == [f"doc_0_{DATE}_09:15"]
+    assert slot_holds.release_hold(second["holdId"], "other") is False
+    assert slot_holds.release_hold(second["holdId"], "u1") is True
+    assert one_doctor.dump("booked_slots") == {}
+
+
+def test_hold_overlapping_own_multi_slot_booking_is_rejected(one_doctor):
+    for i in range(3):
+        one_doctor.collection("doctors").document(f"img_{i}").set({
+            "name": f"検査{i}", "department": "画像診断・検査", "schedules": {"tue": ["09:00-11:00"]},
+        })
+    rs.create_reservation("画像診断・検査", DATE, "09:00", "u1")  # 60分: 09:00〜09:45
+    with pytest.raises(ValueError, match="すでに予約済み"):
+        slot_holds.place_hold("画像診断・検査", DATE, "09:30", "u1")
+
+    # 仮押さえの後にできた重なる予約は確定時に確認し、仮押さえは解放する
+    hold = slot_holds.place_hold("画像診断・検査", DATE, "10:00", "u2")
+    rs.create_reservation("画像診断・検査", DATE, "09:30", "u2")
+    with pytest.raises(ValueError, match="すでに予約済み"):
+        slot_holds.confirm_hold(hold["holdId"], "画像診断・検査", DATE, "10:00", "u2")
+    assert not any(s.get("hold") for s in one_doctor.dump("booked_slots").values())
+    assert len(one_doctor.dump("users/u2/reservations")) == 1
+
+
+def test_sweep_removes_only_expired_holds(one_doctor, monkeypatch):
+    rs.create_reservation("内科", DATE, "10:00", "u0")
+    slot_holds.place_hold("内科", DATE, "09:00", "u1")
+    monkeypatch.setattr(slot_holds, "HOLD_TTL_SECONDS", -1)
+    slot_holds.place_hold("内科", DATE, "09:15", "u2")
+    assert slot_holds.sweep_expired_holds() == 1
+    assert sorted(one_doctor.dump("booked_slots")) == [f"doc_0_{DATE}_09:00", f"doc_0_{DATE}_10:00"]
+
+
+def test_heap_pops_due_holds_in_expiry_order(monkeypatch):
+    monkeypatch.setattr(slot_holds, "_heap", [])
+    monkeypatch.setattr(slot_holds, "SWEEPER_ENABLED", False)
+    now = datetime.now(timezone.utc)
+    for sec, sid in [(30, "c"), (-5, "b"), (-10, "a")]:
+        slot_holds._schedule(now + timedelta(seconds=sec), sid, f"h_{sid}")
+    assert slot_holds._pop_due(now) == [("a", "h_a"), ("b", "h_b")]
+    assert [sid for _, sid, _ in slot_holds._heap] == ["c"]
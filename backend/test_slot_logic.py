@@ -0,0 +1,158 @@
+"""
+空き判定ロジック（slot_logic）のテスト。Firebase なしで実行できる。
+実行: cd Day5/backend && python -m pytest test_slot_logic.py -v
+"""
+import random
+from datetime import date
+
+from slot_logic import (
+    FULL_DAY_MASK, TIME_SLOTS, _normalize_schedules, apply_user_booked, appointment_slots, assign_doctor, classify_date,
+    compact_schedules, compute_availability, order_candidates, parse_day_schedule, run_starts, start_mask,
+)
+
+TODAY = date(2026, 2, 2)
+
+DOCTORS = [
+    {"id": "doc_a", "name": "A", "schedules": {"tue": ["09:00", "09:15"]}},
+    {"id": "doc_b", "name": "B", "schedules": {"tue": ["09:00"]}},
+]
+
+
+class TestClassifyDate:
+    def test_past(self):
+        assert classify_date("内科", "2026-02-01", TODAY)["reason"] == "past"
+
+    def test_holiday(self):
+        out = classify_date("内科", "2026-02-11", TODAY)
+        assert out["is_holiday"] is True
+        assert out["reason"] == "holiday"
+
+    def test_invalid_or_missing(self):
+        assert classify_date("内科", "invalid", TODAY)["reason"] == "closed"
+        assert classify_date("", "2026-02-10", TODAY)["reason"] == "closed"
+
+    def test_needs_compute(self):
+        assert classify_date("内科", "2026-02-10", TODAY) is None
+
+
+class TestComputeAvailability:
+    def test_any_free_doctor_makes_slot_reservable(self):
+        reserved = {("doc_a", "2026-02-10", "09:00")}
+        day = compute_availability(["2026-02-10"], DOCTORS, reserved)["2026-02-10"]
+        by_time = {s["time"]: s["reservable"] for s in day["slots"]}
+        assert by_time["09:00"] is True  # doc_b が空いている
+        assert by_time["09:15"] is True
+        assert by_time["09:30"] is False
+        assert day["reservable"] is True
+        assert len(day["slots"]) == len(TIME_SLOTS)
+
+    def test_fully_booked(self):
+        reserved = {("doc_a", "2026-02-10", "09:00"), ("doc_b", "2026-02-10", "09:00")}
+        day = compute_availability(["2026-02-10"], DOCTORS, reserved)["2026-02-10"]
+        assert day["slots"][0] == {"time": "09:00", "reservable": False}
+
+    def test_user_booked_is_hidden(self):
+        day = compute_availability(["2026-02-10"], DOCTORS, set(), {("2026-02-10", "09:15")})["2026-02-10"]
+        assert day["slots"][1] == {"time": "09:15", "reservable": False}
+
+    def test_apply_user_booked_does_not_mutate_shared_day(self):
+        day = compute_availability(["2026-02-10"], DOCTORS, set())["2026-02-10"]
+        assert apply_user_booked(day, {("2026-02-11", "09:00")}) is day
+        out = apply_user_booked(day, {("2026-02-10", "09:00"), ("2026-02-10", "09:15")})
+        assert out["reservable"] is False
+        assert day["slots"][0]["reservable"] is True and day["reservable"] is True
+
+    def test_demo_when_no_doctors(self):
+        day = compute_availability(["2026-02-10"], [], set(), use_demo=True)["2026-02-10"]
+        assert day["slots"][0]["reservable"] is True
+        assert day["slots"][-1]["reservable"] is False
+        off = compute_availability(["2026-02-10"], [], set(), use_demo=False)["2026-02-10"]
+        assert off["reservable"] is False
+
+
+class TestOrderCandidates:
+    CANDS = [{"id": f"doc_{i}"} for i in range(4)]
+
+    def _ids(self, out):
+        return [d["id"] for d in out]
+
+    def test_first_keeps_order(self):
+        assert self._ids(order_candidates(self.CANDS, "first")) == ["doc_0", "doc_1", "doc_2", "doc_3"]
+        assert assign_doctor(self.CANDS)["id"] == "doc_0"
+        assert assign_doctor([]) is None
+
+    def test_random_is_rotation(self):
+        out = self._ids(order_candidates(self.CANDS, "random", rng=random.Random(3)))
+        start = out.index("doc_0")
+        assert out[start:] + out[:start] == ["doc_0", "doc_1", "doc_2", "doc_3"]
+
+    def test_least_loaded(self):
+        load = {"doc_0": 5, "doc_1": 2, "doc_2": 0, "doc_3": 2}
+        out = self._ids(order_candidates(self.CANDS, "least_loaded", load=load, rng=random.Random(0)))
+        assert out[0] == "doc_2" and out[-1] == "doc_0"
+
+    def test_user_hash_is_stable_per_user(self):
+        a = order_candidates(self.CANDS, "user_hash", user_id="u1", date="2026-02-10", time="09:00")
+        b = order_candidates(self.CANDS, "user_hash", user_id="u1", date="2026-02-10", time="09:00")
+        assert a == b
+        starts = {
+            order_candidates(self.CANDS, "user_hash", user_id=f"u{i}", date="2026-02-10", time="09:00")[0]["id"]
+            for i in range(20)
+        }
+        assert len(starts) > 1
+
+
+class TestSchedules:
+    LEGACY = [t for t in TIME_SLOTS if t < "12:00" or t >= "13:00"]
+
+    def test_formats_expand_to_same_mask(self):
+        mask = parse_day_schedule(self.LEGACY)
+        assert parse_day_schedule(["09:00-12:00", "13:00-17:00"]) == mask
+        assert parse_day_schedule(mask) == mask
+        assert parse_day_schedule(None) == parse_day_schedule(["bad", 3, "x-y"]) == 0
+
+    def test_compact_round_trip(self):
+        compact = compact_schedules({"mon": self.LEGACY, "wed": ["09:00-12:00"], "sat": "oops"})
+        assert compact["mon"] == ["09:00-12:00", "13:00-17:00"]
+        assert compact["wed"] == ["09:00-12:00"] and compact["sat"] == [] and compact["sun"] == []
+        assert _normalize_schedules(compact) == _normalize_schedules({"mon": self.LEGACY, "wed": ["09:00-12:00"]})
+
+    def test_ranges_and_legacy_doctors_compute_alike(self):
+        legacy = [{"id": "a", "schedules": {"tue": self.LEGACY}}]
+        ranged = [{"id": "a", "schedules": _normalize_schedules({"tue": ["09:00-12:00", "13:00-17:00"]})}]
+        day = "2030-02-12"
+        assert compute_availability([day], legacy, set()) == compute_availability([day], ranged, set())
+
+
+class TestMultiSlot:
+    def test_run_starts_matches_naive_scan(self):
+        rng = random.Random(0)
+        n = len(TIME_SLOTS)
+        for _ in range(200):
+            free = rng.getrandbits(n)
+            for k in range(1, 9):
+                naive = 0
+                for i in range(n - k + 1):
+                    if all(free >> j & 1 for j in range(i, i + k)):
+                        naive |= 1 << i
+                assert run_starts(free, k) == naive
+
+    def test_durations_and_start_grid(self):
+        assert appointment_slots("内科", "再診") == 1
+        assert appointment_slots("内科", "初診") == 2
+        assert appointment_slots("画像診断・検査", "再診") == 4
+        assert start_mask("内科") == FULL_DAY_MASK
+        assert [t for i, t in enumerate(TIME_SLOTS) if start_mask("画像診断・検査") >> i & 1][:3] == ["09:00", "09:30", "10:00"]
+
+    def test_run_must_fit_one_doctor(self):
+        # doc_a は 09:00 のみ空き・doc_b は 09:15 のみ空き。枠ごとには○だが、同じ医師で2枠続けては取れない
+        doctors = [
+            {"id": "doc_a", "schedules": {"tue": ["09:00-09:30"]}},
+            {"id": "doc_b", "schedules": {"tue": ["09:00-09:30"]}},
+        ]
+        day = "2030-02-12"
+        reserved = {("doc_a", day, "09:15"), ("doc_b", day, "09:00")}
+        one = compute_availability([day], doctors, reserved)[day]["slots"]
+        two = compute_availability([day], doctors, reserved, slots_needed=2)[day]["slots"]
+        assert [s["reservable"] for s in one[:2]] == [True, True]
+        assert not any(s["reservable"] for s in two)
@@ -0,0 +1,95 @@
+"""
+空き枠の変更配信（slot_stream）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_slot_stream.py -v
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import reservation_service as rs
+import slot_holds
+import slot_stream
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def hub(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setattr(slot_holds, "SWEEPER_ENABLED", False)
+    monkeypatch.setattr(slot_stream, "DEBOUNCE_SECONDS", 0.01)
+    fake_db.collection("doctors").document("doc_0").set({
+        "name": "医師0", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+    })
+    h = slot_stream.SlotStreamHub()
+    monkeypatch.setattr(slot_stream, "hub", h)
+    yield h
+    slot_stream.slot_events.remove_listener(h.publish)
+
+
+async def _next(sub, timeout=2.0):
+    return await asyncio.wait_for(sub.queue.get(), timeout)
+
+
+def test_commits_are_pushed_to_subscribers_in_range(hub):
+    async def run():
+        loop = asyncio.get_running_loop()
+        inside = hub.subscribe("内科", DATE, DATE, loop)
+        outside = hub.subscribe("内科", "2030-03-01", "2030-03-07", loop)
+        other_dept = hub.subscribe("外科", DATE, DATE, loop)
+
+        out = await loop.run_in_executor(None, rs.create_reservation, "内科", DATE, "09:00", "u1")
+        event = await _next(inside)
+        assert event == {"event": "slots", "data": {"department": "内科", "c": [[DATE, "09:00", False]]}}
+
+        await loop.run_in_executor(None, rs.cancel_reservation, "u1", out["id"])
+        event = await _next(inside)
+        assert event["data"]["c"] == [[DATE, "09:00", True]]
+
+        await asyncio.sleep(0.05)
+        assert outside.queue.empty() and other_dept.queue.empty()
+        for sub in (inside, outside, other_dept):
+            hub.unsubscribe(sub)
+        assert hub.subscriber_count() == 0
+
+    asyncio.run(run())
+
+
+def test_snapshot_listener_sees_writes_from_other_processes(hub, fake_db):
+    async def run():
+        loop = asyncio.get_running_loop()
+        sub = hub.subscribe("内科", DATE, DATE, loop)
+        assert len(hub._watches["内科"]) == 2
+        # slot_events を通らない書き込み（別ワーカープロセスの予約に相当）
+        fake_db.collection("booked_slots").document(f"doc_0_{DATE}_10:00").set({
+            "doctorId": "doc_0", "date": DATE, "time": "10:00", "department": "内科", "userId": "u9",
+        })
+        event = await _next(sub)
+        assert event["data"]["c"] == [[DATE, "10:00", False]]
+        hub.unsubscribe(sub)
+        assert hub._watches == {}
+
+    asyncio.run(run())
+
+
+def test_overflow_collapses_to_resync(hub, monkeypatch):
+    monkeypatch.setattr(slot_stream, "QUEUE_SIZE", 2)
+
+    async def run():
+        sub = hub.subscribe("内科", DATE, DATE, asyncio.get_running_loop())
+        for i in range(3):
+            sub._put({"event": "slots", "data": {"c": [i]}})
+        assert sub.queue.qsize() == 1 and sub.queue.get_nowait() == slot_stream.RESYNC
+        hub.unsubscribe(sub)
+
+    asyncio.run(run())
+
+
+def test_stream_endpoint_validates_range(fake_db):
+    client = TestClient(main.app)
+    assert client.get("/api/slots/stream", params={"department": "内科", "from": DATE, "to": "2030-04-01"}).status_code == 400
+    assert client.get("/api/slots/stream", params={"department": "内科", "from": "bad", "to": DATE}).status_code == 400
+    assert client.get("/api/slots/stream", params={"from": DATE, "to": DATE}).status_code == 400
@@ -0,0 +1,65 @@
+"""
+ローカル読み取りレプリカ（store）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_store.py -v
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import reservation_service as rs
+import store
+from slot_logic import FULL_DAY_MASK, TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def replica(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setattr(store, "ENABLED", True)
+    monkeypatch.setattr(store, "DB_PATH", str(tmp_path / "replica.db"))
+    for i in range(2):
+        fake_db.collection("doctors").document(f"doc_{i}").set({
+            "name": f"医師{i}", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+        })
+    r = store.get_replica()
+    assert r is not None
+    yield r
+    store.reset()
+
+
+def _slot(db, doctor_id, time, **extra):
+    db.collection("booked_slots").document(f"{doctor_id}_{DATE}_{time}").set({
+        "doctorId": doctor_id, "date": DATE, "time": time, "department": "内科", "userId": "u1", **extra,
+    })
+
+
+def test_replica_follows_snapshots(replica, fake_db):
+    assert [d["id"] for d in replica.doctors_by_department("内科")] == ["doc_0", "doc_1"]
+    assert replica.doctors_by_department("内科")[0]["schedules"]["tue"] == FULL_DAY_MASK
+
+    _slot(fake_db, "doc_0", "09:00")
+    _slot(fake_db, "doc_1", "09:00", hold=True, expiresAt=datetime.now(timezone.utc) + timedelta(minutes=3))
+    _slot(fake_db, "doc_1", "09:15", hold=True, expiresAt=datetime.now(timezone.utc) - timedelta(seconds=1))
+    ids = ["doc_0", "doc_1"]
+    assert replica.reserved_slots(ids, [DATE]) == {("doc_0", DATE, "09:00"), ("doc_1", DATE, "09:00")}
+
+    fake_db.collection("booked_slots").document(f"doc_0_{DATE}_09:00").delete()
+    fake_db.collection("doctors").document("doc_1").delete()
+    assert replica.reserved_slots(ids, [DATE]) == {("doc_1", DATE, "09:00")}
+    assert [d["id"] for d in replica.doctors_by_department("内科")] == ["doc_0"]
+
+
+def test_availability_reads_replica(replica, monkeypatch):
+    out = rs.create_reservation("内科", DATE, "09:00", "u1")
+    rs.create_reservation("内科", DATE, "09:00", "u2")
+    rs.cancel_reservation("u1", out["id"])
+    rs.create_reservation("内科", DATE, "09:15", "u1")
+    rs.create_reservation("内科", DATE, "09:15", "u3")
+    # 空き計算は Firestore に問い合わせない
+    with monkeypatch.context() as m:
+        m.setattr(rs, "_get_firestore", lambda: pytest.fail("Firestore should not be read"))
+        day = rs._compute_base_availability("内科", [DATE], False)[1][DATE]
+    slots = {s["time"]: s["reservable"] for s in day["slots"]}
+    # 09:00 は1人キャンセルで空きあり、09:15 は医師2人とも予約済み
+    assert slots["09:00"] is True and slots["09:15"] is False and slots["09:30"] is True
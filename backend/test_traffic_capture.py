@@ -0,0 +1,97 @@
+"""
+トラフィックの記録（traffic_capture）と再送（scripts.replay_traffic）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_traffic_capture.py -v
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import storage
+import traffic_capture
+from scripts import replay_traffic
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def clinic(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    monkeypatch.setenv("FIRESTORE_BACKEND", "fake")  # "fake:<uid>" のトークンを受け付ける
+    for doc_id in ("doc_a", "doc_b"):
+        fake_db.collection("doctors").document(doc_id).set({"name": doc_id, "department": "内科", "schedules": {"tue": TIME_SLOTS}})
+    return fake_db
+
+
+def _capture(tmp_path, requests):
+    path = tmp_path / "traffic.jsonl"
+    recorder = traffic_capture.Recorder(str(path))
+    client = TestClient(traffic_capture.TrafficCaptureMiddleware(main.app, recorder))
+    for method, url, kwargs in requests:
+        client.request(method, url, **kwargs)
+    recorder.close()
+    return path, [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_capture_records_routes_without_identifiers(clinic, tmp_path):
+    auth = {"Authorization": "Bearer fake:secret-uid"}
+    path, records = _capture(tmp_path, [
+        ("GET", f"/api/slots/week?department=内科&dates={DATE}&token=abc", {"headers": auth}),
+        ("POST", "/api/reservations", {"headers": auth, "json": {"department": "内科", "date": DATE, "time": "09:00", "holdId": "h123"}}),
+        ("DELETE", "/api/holds/h123", {"headers": auth}),
+        ("GET", "/api/admin/metrics", {"headers": auth}),
+    ])
+    raw = path.read_text(encoding="utf-8")
+    assert "secret-uid" not in raw and "h123" not in raw and "abc" not in raw
+    assert [(r["method"], r["route"]) for r in records] == [
+        ("GET", "/api/slots/week"), ("POST", "/api/reservations"), ("DELETE", "/api/holds/{hold_id}"),
+    ]
+    week, booking, _ = records
+    assert week["query"] == {"department": "内科", "dates": DATE} and week["status"] == 200
+    assert booking["body"] == {"department": "内科", "date": DATE, "time": "09:00"}
+    assert week["client"] and len({r["client"] for r in records}) == 1
+    assert all(r["duration_ms"] >= 0 for r in records)
+
+
+def test_replay_reissues_scaled_and_shifted_requests(clinic, tmp_path):
+    _, records = _capture(tmp_path, [
+        ("GET", f"/api/slots?department=内科&date={DATE}", {}),
+        ("POST", "/api/reservations", {"headers": {"Authorization": "Bearer fake:u1"}, "json": {"department": "内科", "date": "2030-02-05", "time": "09:00"}}),
+        ("DELETE", "/api/holds/h1", {"headers": {"Authorization": "Bearer fake:u1"}}),
+    ])
+    trace = tmp_path / "traffic.jsonl"
+    loaded, skipped = replay_traffic.load_traces([str(trace)])
+    assert skipped == 1 and len(loaded) == 2  # パスに ID を含むルートは再送しない
+
+    schedule = replay_traffic.plan(loaded, speed=100, scale=2, shift_days=7)
+    assert len(schedule) == 4 and schedule[0][1]["query"]["date"] == "2030-02-19"
+    client = TestClient(main.app)
+
+    def send(req):
+        headers = {"Authorization": f"Bearer {req['token']}"} if req["token"] else {}
+        return client.request(req["method"], req["route"], params=req["query"], json=req["body"], headers=headers).status_code
+
+    samples = replay_traffic.replay(schedule, send, concurrency=1)
+    assert sorted(s["status"] for s in samples) == [200, 200, 200, 200]  # コピーは別の利用者として予約する
+    replayed = sorted(s["doctorId"] for s in clinic.dump("booked_slots").values() if s["date"] == DATE)
+    assert replayed == ["doc_a", "doc_b"]
+    summary = replay_traffic.summarize(samples)
+    assert summary["POST /api/reservations"]["count"] == 2 and summary["GET /api/slots"]["errors"] == 0
+
+
+def test_fake_backend_is_seeded(monkeypatch):
+    monkeypatch.setenv("FIRESTORE_BACKEND", "fake")
+    db = storage._default_backend().client()
+    departments = {d.to_dict()["department"] for d in db.collection("doctors").stream()}
+    assert "循環器内科" in departments
+
+
+def test_replay_reports_server_cache_settings(clinic, monkeypatch, capsys):
+    monkeypatch.setattr(main.availability_cache, "TTL_SECONDS", 15.0)
+    cache = TestClient(main.app).get("/health").json()["cache"]
+    assert cache["availability_ttl"] == 15.0
+    assert replay_traffic.describe_cache(cache).startswith("availability cache on (ttl 15 s)")
+    replay_traffic.print_comparison({}, {}, cache, {"availability_ttl": 0, "prefetch": False})
+    assert "warning" in capsys.readouterr().out
@@ -0,0 +1,78 @@
+"""
+ユーザーごとの予約済み枠キャッシュ（user_booked_cache）のテスト。Firestore はインメモリスタブを使う。
+実行: cd Day5/backend && python -m pytest test_user_booked_cache.py -v
+"""
+import pytest
+
+import reservation_service as rs
+import user_booked_cache
+from slot_logic import TIME_SLOTS
+
+DATE = "2030-02-12"  # 火曜
+
+
+@pytest.fixture
+def doctors(fake_db, monkeypatch):
+    monkeypatch.setenv("USE_DEMO_SLOTS", "0")
+    fake_db.collection("doctors").document("doc_0").set({
+        "name": "医師0", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+    })
+    fake_db.collection("doctors").document("doc_1").set({
+        "name": "医師1", "department": "内科", "schedules": {"tue": TIME_SLOTS},
+    })
+    return fake_db
+
+
+def _reservable(day, time):
+    return next(s["reservable"] for s in day["slots"] if s["time"] == time)
+
+
+def test_logged_in_browsing_reads_user_reservations_once(doctors):
+    rs.get_availability_for_dates("内科", [DATE], user_id="u1")
+    queries = []
+    doctors.on_rpc = lambda op, path: queries.append(path)
+    rs.get_availability_for_dates("内科", [DATE], user_id="u1")
+    anonymous = len(queries)
+    queries.clear()
+    rs.get_availability_for_dates("内科", [DATE])
+    assert len(queries) == anonymous
+    assert not any(p.startswith("users/") for p in queries)
+
+
+def test_create_and_cancel_update_cached_overlay(doctors):
+    assert _reservable(rs.get_availability_for_date("内科", DATE, user_id="u1"), "09:00") is True
+    out = rs.create_reservation("内科", DATE, "09:00", "u1")
+    assert _reservable(rs.get_availability_for_date("内科", DATE, user_id="u1"), "09:00") is False
+    # 他のユーザーからは（もう1人の医師が空いているので）予約可のまま
+    assert _reservable(rs.get_availability_for_date("内科", DATE, user_id="u2"), "09:00") is True
+    rs.cancel_reservation("u1", out["id"])
+    assert _reservable(rs.get_availability_for_date("内科", DATE, user_id="u1"), "09:00") is True
+
+
+def test_ttl_and_user_bound(monkeypatch):
+    calls = []
+
+    def loader(uid):
+        return lambda: calls.append(uid) or {("内科", DATE, "09:00")}
+
+    monkeypatch.setattr(user_booked_cache, "MAX_USERS", 2)
+    for uid in ("a", "b", "a", "c", "b"):
+        user_booked_cache.get(uid, loader(uid))
+    # a, b を読み込み → a はヒット → c で最も古い b を追い出し → b は再読み込み
+    assert calls == ["a", "b", "c", "b"]
+    monkeypatch.setattr(user_booked_cache, "TTL_SECONDS", 0)
+    user_booked_cache.get("b", loader("b"))
+    assert calls[-1] == "b" and len(calls) == 5
+    user_booked_cache.clear()
+
+
+def test_update_during_load_is_not_lost():
+    def loader():
+        # 読み込み中に予約が確定した（読み込み結果には含まれていない）
+        user_booked_cache.add("u1", "内科", DATE, ["09:15"])
+        return set()
+
+    assert user_booked_cache.get("u1", loader) == set()
+    # 古い読み込み結果は保存されず、次回は読み直す
+    assert user_booked_cache.get("u1", lambda: {("内科", DATE, "09:15")}) == {("内科", DATE, "09:15")}
+    user_booked_cache.clear()
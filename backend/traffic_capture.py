@@ -0,0 +1,161 @@
+"""
+本番トラフィックの記録（scripts.replay_traffic で再生し、実際の利用の偏りでビルド間の遅延を比べる）
+- TRAFFIC_CAPTURE_PATH を設定したときだけ有効。/api へのリクエストを1行1 JSON で記録する
+  （管理 API と SSE の /api/slots/stream は除く）
+- 記録する項目: ts（UNIX 秒）・method・route（/api/holds/{hold_id} のようなテンプレート）・query・body・status・duration_ms・client
+- トークン・IP・パス中の ID は記録しない。query と body は診療科・日付・時間・種別など RECORDED_FIELDS のキーだけを残す。
+  client は Authorization ヘッダーの HMAC（鍵はプロセスごとの乱数）で、同じ利用者のリクエストは束ねられるがトークン・uid には戻せない
+- 書き込みは log_setup と同じくキューに積むだけで、専用スレッドが RotatingFileHandler で書く
+  （TRAFFIC_CAPTURE_MAX_BYTES で次のファイルへ切り替え、TRAFFIC_CAPTURE_BACKUPS 世代まで残す）。キューが溢れたら捨てて数える
+- TRAFFIC_CAPTURE_SAMPLE_RATE の割合のリクエストだけを記録する
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Any
+from urllib.parse import parse_qsl
+
+import metrics
+
+CAPTURE_PATH = os.environ.get("TRAFFIC_CAPTURE_PATH", "").strip()
+MAX_BYTES = int(os.environ.get("TRAFFIC_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+BACKUPS = int(os.environ.get("TRAFFIC_CAPTURE_BACKUPS", "5"))
+SAMPLE_RATE = float(os.environ.get("TRAFFIC_CAPTURE_SAMPLE_RATE", "1.0"))
+# 書き込み待ちの上限件数と、記録する本文の上限バイト数（超えた本文は記録しない）
+QUEUE_SIZE = 10000
+MAX_BODY_BYTES = 16 * 1024
+
+# query・body で記録するキー（個人を特定しない予約条件だけ）
+RECORDED_FIELDS = frozenset({"department", "date", "dates", "from", "to", "time", "purpose", "limit", "items"})
+# 記録しないパス
+_SKIP_PREFIXES = ("/api/admin", "/api/slots/stream")
+
+
+def _pick(value: Any) -> Any:
+    """RECORDED_FIELDS のキーだけを残す（items の中も同じ）"""
+    if isinstance(value, dict):
+        return {k: _pick(v) for k, v in value.items() if k in RECORDED_FIELDS}
+    if isinstance(value, list):
+        return [_pick(v) for v in value]
+    return value
+
+
+def _body(chunks: list[bytes]) -> dict[str, Any] | None:
+    raw = b"".join(chunks)
+    if not raw or len(raw) > MAX_BODY_BYTES:
+        return None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    return _pick(data) if isinstance(data, dict) else None
+
+
+class Recorder:
+    """記録を1行1 JSON でローテーションするファイルに書く（書き込みは専用スレッド）"""
+
+    def __init__(self, path: str, *, max_bytes: int = MAX_BYTES, backups: int = BACKUPS, sample_rate: float = SAMPLE_RATE):
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self._key = secrets.token_bytes(32)
+        self._queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = QueueListener(self._queue, handler)
+        self._handler = handler
+        self._listener.start()
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def client_id(self, authorization: str) -> str:
+        """Authorization ヘッダーの仮名（未指定なら空文字）"""
+        if not authorization:
+            return ""
+        return hmac.new(self._key, authorization.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def record(self, entry: dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+        except queue.Full:
+            metrics.incr("traffic_capture_dropped")
+
+    def close(self) -> None:
+        """書き込み待ちを書き切って閉じる"""
+        self._listener.stop()
+        self._handler.close()
+
+
+class TrafficCaptureMiddleware:
+    """/api のリクエストを Recorder に記録する ASGI ミドルウェア（本文は読み取りを横取りせずに写す）"""
+
+    def __init__(self, app, recorder: Recorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http" or not path.startswith("/api") or path.startswith(_SKIP_PREFIXES)
+            or not self.recorder.sampled()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        ts = time.time()
+        started = time.perf_counter()
+        chunks: list[bytes] = []
+        size = 0
+        status = 500
+
+        async def receive_copy():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request" and size <= MAX_BODY_BYTES:
+                body = message.get("body", b"")
+                size += len(body)
+                chunks.append(body)
+            return message
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_copy, send_status)
+        finally:
+            headers = dict(scope.get("headers") or [])
+            route = scope.get("route")
+            self.recorder.record({
+                "ts": round(ts, 3),
+                "method": scope["method"],
+                "route": getattr(route, "path", None) or path,
+                "query": _pick(dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))),
+                "body": _body(chunks) if size <= MAX_BODY_BYTES else None,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "client": self.recorder.client_id(headers.get(b"authorization", b"").decode("latin-1")),
+            })
+
+
+def install(app) -> Recorder | None:
+    """TRAFFIC_CAPTURE_PATH が設定されていれば app に記録用ミドルウェアを付ける（最も外側に付けるため最後に呼ぶ）"""
+    if not CAPTURE_PATH:
+        return None
+    recorder = Recorder(CAPTURE_PATH)
+    atexit.register(recorder.close)
+    app.add_middleware(TrafficCaptureMiddleware, recorder=recorder)
+    logging.getLogger(__name__).info("traffic capture enabled: %s (sample_rate=%s)", CAPTURE_PATH, recorder.sample_rate)
+    return recorder
@@ -0,0 +1,105 @@
+"""
+ユーザーごとの予約済み枠キャッシュ（空き枠表示の「自分の予約は×」用）
+- uid → そのユーザーの今日以降の予約が占める枠 (department, date, time) の集合を保持する
+  （所要時間が複数枠の予約は占める枠すべて。重複予約の確認と同じく reservation_service._reservation_times で展開する）
+- 件数（ユーザー数）の上限は LRU、鮮度は TTL で管理する
+- create_reservation / cancel_reservation が同じ uid のエントリを直接更新するため、本人の操作は即座に反映される
+- ワーカープロセスごとのキャッシュ。他プロセスでの予約・キャンセルは最大 TTL 秒遅れて反映される
+  （表示上の×だけで、二重予約は create_reservation の Firestore 確認で防ぐ）
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+BookedKey = tuple[str, str, str]  # (department, date, time)
+
+# キャッシュするユーザー数の上限と有効期間（秒）
+MAX_USERS = int(os.environ.get("USER_BOOKED_CACHE_SIZE", "10000"))
+TTL_SECONDS = float(os.environ.get("USER_BOOKED_CACHE_TTL", "300"))
+
+# uid → (読み込み時刻, 予約済み集合)
+_entries: OrderedDict[str, tuple[float, set[BookedKey]]] = OrderedDict()
+# 読み込み中の uid → [読み込み中の数, 読み込み開始後の更新回数]。
+# 読み込み中に予約・キャンセルがあった場合、その変更を含まない可能性がある結果を保存しないために使う
+_loading: dict[str, list[int]] = {}
+_lock = threading.Lock()
+
+
+def get(user_id: str, loader: Callable[[], set[BookedKey]]) -> set[BookedKey]:
+    """
+    user_id の予約済み集合を返す（コピー）。未キャッシュ・期限切れなら loader() で読み込んで保存する。
+    loader は Firestore への問い合わせで、ロックの外で呼ぶ。
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and now - entry[0] < TTL_SECONDS:
+            _entries.move_to_end(user_id)
+            return set(entry[1])
+        state = _loading.setdefault(user_id, [0, 0])
+        state[0] += 1
+        started_at = state[1]
+    try:
+        booked = set(loader())
+    except BaseException:
+        with _lock:
+            _finish_loading(user_id)
+        raise
+    with _lock:
+        # 読み込み中に add/discard があった結果は保存しない（次回読み直す）
+        if _finish_loading(user_id) == started_at:
+            _entries[user_id] = (now, set(booked))
+            _entries.move_to_end(user_id)
+            while len(_entries) > MAX_USERS:
+                _entries.popitem(last=False)
+    return booked
+
+
+def _finish_loading(user_id: str) -> int:
+    """読み込み終了を記録し、読み込み開始後の更新回数を返す（_lock 保持中に呼ぶ）"""
+    state = _loading[user_id]
+    state[0] -= 1
+    if state[0] == 0:
+        del _loading[user_id]
+    return state[1]
+
+
+def _update(user_id: str, keys: list[BookedKey], add: bool) -> None:
+    with _lock:
+        if user_id in _loading:
+            _loading[user_id][1] += 1
+        entry = _entries.get(user_id)
+        if entry is None:
+            return
+        if add:
+            entry[1].update(keys)
+        else:
+            entry[1].difference_update(keys)
+
+
+def add(user_id: str, department: str, date: str, times: Iterable[str]) -> None:
+    """予約確定時: 予約が占める枠（times）をキャッシュ済みなら集合に加える（未キャッシュなら次回の読み込みに任せる）"""
+    _update(user_id, [(department, date, t) for t in times], True)
+
+
+def discard(user_id: str, department: str, date: str, times: Iterable[str]) -> None:
+    """キャンセル時: 予約が占めていた枠（times）をキャッシュ済みなら集合から外す"""
+    _update(user_id, [(department, date, t) for t in times], False)
+
+
+def invalidate(user_id: str) -> None:
+    """user_id のエントリを捨てる（次回 get で読み直す）"""
+    with _lock:
+        if user_id in _loading:
+            _loading[user_id][1] += 1
+        _entries.pop(user_id, None)
+
+
+def clear() -> None:
+    """全エントリを捨てる（テスト用）"""
+    with _lock:
+        _entries.clear()
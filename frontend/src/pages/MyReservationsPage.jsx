@@ -1,13 +1,13 @@
 /**
  * 予約一覧画面（予約確認）
- * users/{uid}/reservations を取得し、カード形式で表示。変更・キャンセル操作を安全に提供。
+ * バックエンド GET /api/reservations から今後の予約を取得し、カード形式で表示。変更・キャンセル操作を安全に提供。
+ * 予約履歴（過去）は表示したときに1ページずつ取得する（履歴が長くても読み込み量は一定）。
  */
-import React, { useState, useEffect, useMemo, useCallback, useRef } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../App';
 import Breadcrumb from '../components/Breadcrumb';
-import { getReservationsByUser } from '../services/reservation';
-import { cancelReservationApi, invalidateSlotsCache } from '../services/backend';
+import { cancelReservationApi, getMyReservationsApi, invalidateSlotsCache } from '../services/backend';
 import { invalidateAvailabilityCache } from '../services/availability';
 import { logout } from '../services/auth';
 import { getAuth } from 'firebase/auth';
@@ -22,15 +22,17 @@ function formatDateTime(dateStr, timeStr) {
   return time ? `${dateFormatted} ${time}` : dateFormatted;
 }
 
-/** 予約が過去かどうか判定（日付+時間で比較） */
-function isPastReservation(dateStr, timeStr) {
-  if (!dateStr) return false;
-  const now = new Date();
-  const todayYmd = `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, '0')}-${String(now.getDate()).padStart(2, '0')}`;
-  const nowTime = `${String(now.getHours()).padStart(2, '0')}:${String(now.getMinutes()).padStart(2, '0')}`;
-  if (dateStr < todayYmd) return true;
-  if (dateStr === todayYmd && timeStr && timeStr <= nowTime) return true;
-  return false;
+/** 今後の予約は1回で取得する件数（バックエンドの上限） */
+const UPCOMING_LIMIT = 100;
+/** 予約履歴の1ページの件数 */
+const HISTORY_PAGE_SIZE = 20;
+/** 履歴カードで使うフィールドのみ取得する */
+const HISTORY_FIELDS = ['date', 'time', 'department', 'purpose'];
+
+async function currentIdToken() {
+  const idToken = await getAuth().currentUser?.getIdToken();
+  if (!idToken) throw new Error('認証情報がありません。再ログインしてください。');
+  return idToken;
 }
 
 /** キャンセル確認ダイアログ（Escape/バックドロップクリック/フォーカス管理） */
@@ -73,7 +75,7 @@ function CancelDialog({ cancelTarget, cancellingId, onConfirm, onClose }) {
 function MyReservationsPage() {
   const navigate = useNavigate();
   const user = useAuth();
-  const [reservations, setReservations] = useState([]);
+  const [upcoming, setUpcoming] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [successMessage, setSuccessMessage] = useState('');
@@ -84,8 +86,9 @@ function MyReservationsPage() {
     if (!user?.uid) return;
     setLoading(true);
     setError('');
-    getReservationsByUser(user.uid)
-      .then(setReservations)
+    currentIdToken()
+      .then((idToken) => getMyReservationsApi(idToken, { scope: 'upcoming', limit: UPCOMING_LIMIT }))
+      .then((page) => setUpcoming(page.items))
       .catch((err) => setError(err?.message ?? '予約一覧の取得に失敗しました。'))
       .finally(() => setLoading(false));
   }, [user?.uid]);
@@ -104,9 +107,7 @@ function MyReservationsPage() {
     setError('');
     try {
       // バックエンド API 経由でキャンセル（booked_slots も同時に解放される）
-      const auth = getAuth();
-      const idToken = await auth.currentUser?.getIdToken();
-      if (!idToken) throw new Error('認証情報がありません。再ログインしてください。');
+      const idToken = await currentIdToken();
       await cancelReservationApi(idToken, cancelTarget.id);
       invalidateSlotsCache();
       invalidateAvailabilityCache();
@@ -134,23 +135,38 @@ function MyReservationsPage() {
     }
   };
 
-  // 今後の予約（日付の近い順）と過去の予約（日付の新しい順）に分離
-  const { upcoming, past } = useMemo(() => {
-    const up = [];
-    const pa = [];
-    for (const r of reservations) {
-      if (isPastReservation(r.date, r.time)) {
-        pa.push(r);
-      } else {
-        up.push(r);
-      }
+  // 予約履歴（日付の新しい順）。初回表示時に1ページ目を取得し、「もっと見る」で続きを取得する
+  const [showHistory, setShowHistory] = useState(false);
+  const [past, setPast] = useState([]);
+  const [pastCursor, setPastCursor] = useState(null);
+  const [pastLoaded, setPastLoaded] = useState(false);
+  const [pastLoading, setPastLoading] = useState(false);
+
+  const fetchHistoryPage = useCallback(async (cursor) => {
+    setPastLoading(true);
+    setError('');
+    try {
+      const idToken = await currentIdToken();
+      const page = await getMyReservationsApi(idToken, {
+        scope: 'past',
+        limit: HISTORY_PAGE_SIZE,
+        cursor: cursor || '',
+        fields: HISTORY_FIELDS,
+      });
+      setPast((prev) => (cursor ? [...prev, ...page.items] : page.items));
+      setPastCursor(page.nextCursor);
+      setPastLoaded(true);
+    } catch (err) {
+      setError(err?.message ?? '予約履歴の取得に失敗しました。');
+    } finally {
+      setPastLoading(false);
     }
-    up.sort((a, b) => (a.date + a.time).localeCompare(b.date + b.time));
-    pa.sort((a, b) => (b.date + b.time).localeCompare(a.date + a.time));
-    return { upcoming: up, past: pa };
-  }, [reservations]);
+  }, []);
 
-  const [showHistory, setShowHistory] = useState(false);
+  const handleHistoryToggle = () => {
+    if (!showHistory && !pastLoaded) fetchHistoryPage(null);
+    setShowHistory((v) => !v);
+  };
 
   return (
     <div className="page page-reservations">
@@ -223,15 +239,18 @@ function MyReservationsPage() {
       )}
 
       {/* 予約履歴（過去） */}
-      {!loading && !error && past.length > 0 && (
+      {!loading && !error && (
         <>
           <button
             type="button"
             className="btn btn-text reservations-history-toggle"
-            onClick={() => setShowHistory((v) => !v)}
+            onClick={handleHistoryToggle}
           >
-            {showHistory ? '▲ 予約履歴を閉じる' : `▼ 予約履歴を表示（${past.length}件）`}
+            {showHistory ? '▲ 予約履歴を閉じる' : '▼ 予約履歴を表示'}
           </button>
+          {showHistory && pastLoaded && past.length === 0 && (
+            <p className="reservations-empty-text">予約履歴はありません</p>
+          )}
           {showHistory && (
             <ul className="reservations-list reservations-list-past" aria-label="予約履歴">
               {past.map((r) => (
@@ -248,6 +267,16 @@ function MyReservationsPage() {
               ))}
             </ul>
           )}
+          {showHistory && (pastCursor || pastLoading) && (
+            <button
+              type="button"
+              className="btn btn-secondary reservations-history-more"
+              onClick={() => fetchHistoryPage(pastCursor)}
+              disabled={pastLoading}
+            >
+              {pastLoading ? '読み込み中…' : 'もっと見る'}
+            </button>
+          )}
         </>
       )}
 
@@ -11,6 +11,8 @@ import ReservationStepHeader from '../components/ReservationStepHeader';
 import Calendar from '../components/Calendar';
 import { CATEGORIES, DEPARTMENTS_BY_CATEGORY } from '../constants/masterData';
 import { getDepartmentAvailabilityForDate } from '../services/availability';
+import { createHoldApi } from '../services/backend';
+import { subscribeSlotChanges } from '../services/slotStream';
 
 const HOSPITAL_NAME = 'さくら総合病院';
 const TYPES = ['初診', '再診'];
@@ -153,6 +155,8 @@ export default function ReservationFormPage() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [availByDate, setAvailByDate] = useState({});
+  // 変更配信から全体の取り直しを求められたら増やす（空き状況の再取得トリガー）
+  const [reloadKey, setReloadKey] = useState(0);
 
   const todayStr = useMemo(() => toDateStr(today), [today]);
   const [currentTimeStr, setCurrentTimeStr] = useState(() => {
@@ -193,7 +197,8 @@ export default function ReservationFormPage() {
     return `${mon.getFullYear()}/${mon.getMonth() + 1}/${mon.getDate()}（${WEEKDAY_JP[mon.getDay()]}）〜${fri.getMonth() + 1}/${fri.getDate()}（${WEEKDAY_JP[fri.getDay()]}）`;
   }, [weekDates]);
 
-  // weekStartDate または department が変わったら空き状況を再取得（到着次第で1日ずつ表示）
+  // weekStartDate・department・種別が変わったら空き状況を再取得（到着次第で1日ずつ表示）
+  // 種別で所要時間（連続して必要な枠数）が変わるため、○×は種別ごとに異なる
   useEffect(() => {
     let canceled = false;
     setError('');
@@ -219,7 +224,7 @@ export default function ReservationFormPage() {
       }
 
       dates.forEach((dateStr) => {
-        getDepartmentAvailabilityForDate(department, dateStr, idToken)
+        getDepartmentAvailabilityForDate(department, dateStr, idToken, type)
           .then((r) => {
             if (canceled) return;
             const row = {
@@ -230,6 +235,7 @@ export default function ReservationFormPage() {
               reason: r.reason ?? null,
             };
             setAvailByDate((prev) => ({ ...prev, [dateStr]: row }));
+            if (r.degraded) setError('空き状況の一部を確認できませんでした。しばらくしてから再度お試しください。');
           })
           .catch(() => {
             if (!canceled) setError('空き状況の取得に一時失敗しました。しばらくしてから再度お試しください。');
@@ -243,7 +249,34 @@ export default function ReservationFormPage() {
     fetchWithToken();
 
     return () => { canceled = true; };
-  }, [department, weekStartDate, weekDates, user]);
+  }, [department, type, weekStartDate, weekDates, user, reloadKey]);
+
+  // 表示中の週の空き状況の変更をサーバーから受け取り、変わった枠だけ書き換える
+  useEffect(() => {
+    if (!department) return undefined;
+    const from = toDateStr(weekDates[0]);
+    const to = toDateStr(weekDates[weekDates.length - 1]);
+    return subscribeSlotChanges(department, from, to, type, {
+      onChange: (changes) => {
+        setAvailByDate((prev) => {
+          const next = { ...prev };
+          for (const { date, time, reservable } of changes) {
+            const row = next[date];
+            if (!row) continue;
+            next[date] = {
+              ...row,
+              availableDoctorByTime: {
+                ...row.availableDoctorByTime,
+                [time]: reservable ? { id: 'auto', name: '（自動割当）' } : null,
+              },
+            };
+          }
+          return next;
+        });
+      },
+      onResync: () => setReloadKey((k) => k + 1),
+    });
+  }, [department, type, weekDates]);
 
   const timeSlots = useMemo(() => {
     const first = weekDates[0] ? toDateStr(weekDates[0]) : '';
@@ -295,13 +328,40 @@ export default function ReservationFormPage() {
     setCalendarOpen(false);
   };
 
-  const handleConfirm = () => {
-    if (!canProceed) return;
+  const [holding, setHolding] = useState(false);
+
+  const handleConfirm = async () => {
+    if (!canProceed || holding) return;
     setError('');
     if (!isSlotAvailable(selectedDate, selectedTime)) {
       setError('この時間は現在ご予約いただけません。別の日時をお選びください。');
       return;
     }
+    // 確認画面の間に他の人に取られないよう枠を仮押さえする。
+    // 409（満枠）はその場で案内し、通信エラー等は仮押さえなしで進む（確定時に通常の予約になる）
+    let hold = null;
+    setHolding(true);
+    try {
+      const idToken = await user?.getIdToken();
+      if (idToken) {
+        hold = await createHoldApi(idToken, { department, date: selectedDate, time: selectedTime, purpose: type });
+      }
+    } catch (err) {
+      if (err?.status === 409) {
+        setError(err.detail ?? 'この時間は現在ご予約いただけません。別の日時をお選びください。');
+        return;
+      }
+      if (err?.status === 503) {
+        // 混雑による受付制限。確認画面に進んでも確定できないため、ここで再試行を促す
+        setError(err.detail ?? 'ただいま予約が混み合っています。しばらくしてから再度お試しください。');
+        return;
+      }
+      if (import.meta.env.DEV) {
+        console.warn('[仮押さえ] 失敗したため仮押さえなしで進みます', err);
+      }
+    } finally {
+      setHolding(false);
+    }
     navigate('/reserve/confirm', {
       state: {
         selectedDate,
@@ -309,6 +369,8 @@ export default function ReservationFormPage() {
         category: '',
         department,
         purpose: type,
+        holdId: hold?.holdId || undefined,
+        holdExpiresAt: hold?.expiresAt || undefined,
         isEditing: isEditing || undefined,
         editingReservationId: editingReservationId || undefined,
       },
@@ -488,11 +550,13 @@ export default function ReservationFormPage() {
                         const selected = selectedDate === dateStr && selectedTime === t;
                         const reasonUnavailable = isHoliday
                           ? '祝日のため予約不可'
-                          : isPastDate
-                            ? '過去日のため予約不可'
-                            : isTodaySlotPast
-                              ? '時刻を過ぎているため予約不可'
-                              : '予約不可';
+                          : row?.reason === 'degraded'
+                            ? '空き状況を確認できないため予約不可'
+                            : isPastDate
+                              ? '過去日のため予約不可'
+                              : isTodaySlotPast
+                                ? '時刻を過ぎているため予約不可'
+                                : '予約不可';
                         return (
                           <td key={dateStr} className={`reservation-grid-td ${isHoliday ? 'reservation-grid-td-holiday' : ''}`}>
                             <button
@@ -520,7 +584,7 @@ export default function ReservationFormPage() {
           <button
             type="button"
             className="btn btn-primary btn-nav reservation-form-confirm"
-            disabled={!canProceed || loading}
+            disabled={!canProceed || loading || holding}
             onClick={handleConfirm}
           >
             内容を確認する
@@ -8,7 +8,7 @@ import { useNavigate, useLocation } from 'react-router-dom';
 import { useAuth } from '../App';
 import Breadcrumb from '../components/Breadcrumb';
 import ReservationStepHeader from '../components/ReservationStepHeader';
-import { createReservationApi, cancelReservationApi, invalidateSlotsCache } from '../services/backend';
+import { createReservationApi, cancelReservationApi, invalidateSlotsCache, releaseHoldApi } from '../services/backend';
 import { invalidateAvailabilityCache } from '../services/availability';
 
 function ReserveConfirmPage() {
@@ -22,6 +22,7 @@ function ReserveConfirmPage() {
     department,
     purpose,
     time,
+    holdId,
     isEditing,
     editingReservationId,
   } = state;
@@ -42,6 +43,7 @@ function ReserveConfirmPage() {
       date: selectedDate,
       time,
       purpose: purpose ?? '',
+      holdId: holdId ?? '',
     };
     if (import.meta.env.DEV) {
       console.log('confirm payload', payload);
@@ -100,13 +102,25 @@ function ReserveConfirmPage() {
       setError(
         is401
           ? (err?.message || 'セッションが切れました。再ログインしてください。')
-          : 'ご予約を確定できませんでした。お手数ですが、もう一度お試しください。'
+          : err?.status === 503
+            ? err.message
+            : 'ご予約を確定できませんでした。お手数ですが、もう一度お試しください。'
       );
     } finally {
       setLoading(false);
     }
   };
 
+  // 修正に戻る場合は仮押さえを解放する（解放に失敗しても期限で自動解放される）
+  const handleBack = () => {
+    if (holdId && user) {
+      user.getIdToken().then((idToken) => releaseHoldApi(idToken, holdId)).catch(() => {});
+    }
+    invalidateSlotsCache();
+    invalidateAvailabilityCache();
+    navigate(-1);
+  };
+
   if (!selectedDate || !time) {
     return (
       <div className="page">
@@ -224,7 +238,7 @@ function ReserveConfirmPage() {
         <button
           type="button"
           className="btn btn-secondary btn-nav"
-          onClick={() => navigate(-1)}
+          onClick={handleBack}
           disabled={loading}
         >
           内容を修正する
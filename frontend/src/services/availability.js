@@ -4,11 +4,10 @@
  * ②担当医未指定時: 各診療科ごとに判定する。
  *    選択した診療科に所属する担当医の予約状況のみを確認し、
  *    いずれか1人でも空いていれば可（自動割当: ID昇順で先に空いている担当医を割り当て）
+ * 担当医ごとの勤務・予約状況はバックエンドの GET /api/grid で一括取得する（担当医ごとに Firestore を読まない）。
  */
 import { getTimeSlots } from '../constants/masterData';
-import { getWeekdayKey } from '../utils/schedule';
-import { getDoctorsByDepartment } from './doctors';
-import { getReservedTimesForDoctorAndDate } from './reservation';
+import { getDoctorGrid } from './backend';
 
 function isValidYmd(dateStr) {
   return typeof dateStr === 'string' && /^\d{4}-\d{2}-\d{2}$/.test(dateStr);
@@ -48,28 +47,15 @@ export async function getAvailableDoctorForSlot(departmentLabel, date, time) {
   const startedAt = Date.now();
   logAvailability('start:getAvailableDoctorForSlot', { departmentLabel, date, time });
   try {
-    const doctors = await getDoctorsByDepartment(departmentLabel); // その診療科の医師のみ
-    if (!Array.isArray(doctors)) throw new Error('[availability] doctors result is not an array');
-    if (doctors.length === 0) {
-      logAvailability('result:getAvailableDoctorForSlot', { ok: true, assigned: null, reason: 'no_doctors', ms: Date.now() - startedAt });
-      return null;
-    }
-    const weekday = getWeekdayKey(date);
-    const sorted = [...doctors].sort((a, b) => (a.id || '').localeCompare(b.id || ''));
-
-    for (const d of sorted) {
-      const scheduleSlots = d.schedules?.[weekday];
-      if (!Array.isArray(scheduleSlots) || !scheduleSlots.includes(time)) continue;
-      const reserved = await getReservedTimesForDoctorAndDate(departmentLabel, d.name || '', date);
-      if (!(reserved instanceof Set)) throw new Error('[availability] reservedTimes result is not a Set');
-      if (!reserved.has(time)) {
-        const assigned = { id: d.id, name: d.name || '' };
-        logAvailability('result:getAvailableDoctorForSlot', { ok: true, assigned, ms: Date.now() - startedAt });
-        return assigned;
-      }
-    }
-    logAvailability('result:getAvailableDoctorForSlot', { ok: true, assigned: null, reason: 'fully_booked_or_off_schedule', ms: Date.now() - startedAt });
-    return null;
+    const { assignableByTime } = await getDoctorTimeGrid(departmentLabel, date);
+    const assigned = assignableByTime[time] ?? null;
+    logAvailability('result:getAvailableDoctorForSlot', {
+      ok: true,
+      assigned,
+      ...(assigned ? {} : { reason: 'fully_booked_or_off_schedule' }),
+      ms: Date.now() - startedAt,
+    });
+    return assigned;
   } catch (err) {
     logAvailability('error:getAvailableDoctorForSlot', { message: err?.message, departmentLabel, date, time });
     throw err;
@@ -80,8 +66,8 @@ export async function getAvailableDoctorForSlot(departmentLabel, date, time) {
 const availabilityCache = new Map();
 const CACHE_TTL_MS = 60 * 1000; // 1分
 
-function getCacheKey(departmentLabel, date) {
-  return `${String(departmentLabel).trim()}\n${String(date).trim()}`;
+function getCacheKey(departmentLabel, date, purpose = '') {
+  return `${String(departmentLabel).trim()}\n${String(date).trim()}\n${String(purpose).trim()}`;
 }
 
 function getCached(key) {
@@ -107,9 +93,11 @@ export function invalidateAvailabilityCache() {
  * 指定した診療科・日付について、全時間枠の空き状況を返す。祝日・理由はバックエンドのレスポンスのみ使用（フロントで判定しない）。
  * @param {string} departmentLabel - 診療科の表示名（その診療科のみ対象）
  * @param {string} date - YYYY-MM-DD
- * @returns {Promise<{ timeSlots: string[], availableDoctorByTime: Record<string, { id: string, name: string } | null>, isHoliday?: boolean, reason?: string | null }>}
+ * @param {string} [idToken]
+ * @param {string} [purpose] - 種別（初診/再診）。所要時間分の連続枠が取れる開始時刻だけを○にする
+ * @returns {Promise<{ timeSlots: string[], availableDoctorByTime: Record<string, { id: string, name: string } | null>, isHoliday?: boolean, reason?: string | null, degraded?: boolean }>}
  */
-export async function getDepartmentAvailabilityForDate(departmentLabel, date, idToken) {
+export async function getDepartmentAvailabilityForDate(departmentLabel, date, idToken, purpose = '') {
   const timeSlots = getTimeSlots();
   const availableDoctorByTime = {};
   if (!departmentLabel || !date) {
@@ -118,7 +106,7 @@ export async function getDepartmentAvailabilityForDate(departmentLabel, date, id
   }
   assertQueryReady({ departmentLabel, date });
 
-  const cacheKey = getCacheKey(departmentLabel, date);
+  const cacheKey = getCacheKey(departmentLabel, date, purpose);
   const cached = getCached(cacheKey);
   if (cached) {
     logAvailability('result:getDepartmentAvailabilityForDate', { ok: true, fromCache: true });
@@ -129,7 +117,7 @@ export async function getDepartmentAvailabilityForDate(departmentLabel, date, id
   logAvailability('start:getDepartmentAvailabilityForDate', { departmentLabel, date });
   try {
     const { getSlots } = await import('./backend');
-    const result = await getSlots(departmentLabel, date, idToken);
+    const result = await getSlots(departmentLabel, date, idToken, purpose);
     const slots = result.slots ?? [];
     timeSlots.forEach((t) => {
       const slot = slots.find((s) => s.time === t);
@@ -140,8 +128,10 @@ export async function getDepartmentAvailabilityForDate(departmentLabel, date, id
       availableDoctorByTime,
       isHoliday: Boolean(result.isHoliday),
       reason: result.reason ?? null,
+      degraded: Boolean(result.degraded),
     };
-    setCached(cacheKey, out);
+    // 縮退した結果（バックエンドが予約状況を読めなかった）はキャッシュせず次回取り直す
+    if (!out.degraded) setCached(cacheKey, out);
     logAvailability('result:getDepartmentAvailabilityForDate', {
       ok: true,
       timeSlots: timeSlots.length,
@@ -176,57 +166,37 @@ export async function getDoctorTimeGrid(departmentLabel, date) {
   const startedAt = Date.now();
   logAvailability('start:getDoctorTimeGrid', { departmentLabel, date });
   try {
-    const doctors = await getDoctorsByDepartment(departmentLabel);
-    if (!Array.isArray(doctors)) throw new Error('[availability] doctors result is not an array');
+    // 全担当医分の勤務・予約状況を1リクエストで取得（医師ID昇順で返る）
+    const data = await getDoctorGrid(departmentLabel, date);
+    const doctors = data.doctors;
     const result = {
       doctors: doctors.map((d) => ({ id: d.id, name: d.name || '' })),
       timeSlots: [...timeSlots],
       grid: {},
       assignableByTime: {},
     };
-    if (doctors.length === 0) {
-      // 成功だが「医師が存在しない」
-      timeSlots.forEach((t) => { result.assignableByTime[t] = null; });
-      logAvailability('result:getDoctorTimeGrid', { ok: true, doctors: 0, timeSlots: timeSlots.length, ms: Date.now() - startedAt, reason: 'no_doctors' });
-      return result;
-    }
+    const indexByTime = new Map(data.timeSlots.map((t, i) => [t, i]));
 
-    const weekday = getWeekdayKey(date);
-    const sorted = [...doctors].sort((a, b) => (a.id || '').localeCompare(b.id || ''));
-    const reservedByDoctor = {};
-    for (const d of sorted) {
-      const reserved = await getReservedTimesForDoctorAndDate(departmentLabel, d.name || '', date);
-      if (!(reserved instanceof Set)) throw new Error('[availability] reservedTimes result is not a Set');
-      reservedByDoctor[d.id] = reserved;
-    }
-
-    for (const d of sorted) {
+    for (const d of doctors) {
       result.grid[d.id] = {};
-      const scheduleSlots = d.schedules?.[weekday];
-      const reserved = reservedByDoctor[d.id] || new Set();
       for (const time of timeSlots) {
-        const onSchedule = Array.isArray(scheduleSlots) && scheduleSlots.includes(time);
-        const notReserved = !reserved.has(time);
-        if (!onSchedule || !notReserved) {
-          result.grid[d.id][time] = 'unavailable';
-          continue;
-        }
-        result.grid[d.id][time] = 'available';
+        const i = indexByTime.get(time);
+        result.grid[d.id][time] = i !== undefined && d.free?.[i] === true ? 'available' : 'unavailable';
       }
     }
 
     for (const time of timeSlots) {
-      let assigned = null;
-      for (const d of sorted) {
-        if (result.grid[d.id][time] === 'available') {
-          assigned = { id: d.id, name: d.name || '' };
-          break;
-        }
-      }
-      result.assignableByTime[time] = assigned;
+      const d = doctors.find((x) => result.grid[x.id][time] === 'available');
+      result.assignableByTime[time] = d ? { id: d.id, name: d.name || '' } : null;
     }
 
-    logAvailability('result:getDoctorTimeGrid', { ok: true, doctors: doctors.length, timeSlots: timeSlots.length, ms: Date.now() - startedAt });
+    logAvailability('result:getDoctorTimeGrid', {
+      ok: true,
+      doctors: doctors.length,
+      timeSlots: timeSlots.length,
+      ms: Date.now() - startedAt,
+      ...(doctors.length === 0 ? { reason: 'no_doctors' } : {}),
+    });
     return result;
   } catch (err) {
     logAvailability('error:getDoctorTimeGrid', { message: err?.message, departmentLabel, date });
@@ -63,10 +63,12 @@ function messageForStatus(status, defaultMessage) {
 
 /**
  * 診療科・日付の空き状況を取得。バックエンドが date, is_holiday, reason, slots を返す。
+ * purpose（種別）を渡すと、その所要時間分の連続枠が取れる開始時刻だけが reservable になる。
  * @returns {{ date?: string, isHoliday?: boolean, reason?: string | null, slots: Array<{ time: string, reservable: boolean }>, isDemoFallback: boolean }}
  */
-export async function getSlots(department, date, idToken) {
+export async function getSlots(department, date, idToken, purpose = '') {
   const params = new URLSearchParams({ department: department || '', date: date || '' });
+  if (purpose) params.set('purpose', purpose);
   try {
     const res = await fetch(`${getBaseUrl()}/api/slots?${params}`, {
       method: 'GET',
@@ -84,6 +86,8 @@ export async function getSlots(department, date, idToken) {
       date: isLegacyArray ? date : (data.date ?? date),
       isHoliday,
       reason: isLegacyArray ? null : (data.reason ?? null),
+      // 予約状況を読めなかった日（reason: 'degraded' は全枠×）。○×を推測しないので、時間をおいて取り直す
+      degraded: !isLegacyArray && Boolean(data.degraded),
       slots,
       isDemoFallback: false,
     };
@@ -106,6 +110,29 @@ export async function getSlots(department, date, idToken) {
   }
 }
 
+/**
+ * 診療科・日付の担当医×時間枠の表を1回のリクエストで取得する（GET /api/grid）。
+ * 医師ごとの working / booked / free は timeSlots と同じ順の真偽値配列。空き判定はバックエンドのみ。
+ * @param {string} department - 診療科表示名
+ * @param {string} date - YYYY-MM-DD
+ * @returns {Promise<{ date: string, isHoliday: boolean, reason: string | null, timeSlots: string[], doctors: Array<{ id: string, name: string, working: boolean[], booked: boolean[], free: boolean[] }> }>}
+ */
+export async function getDoctorGrid(department, date) {
+  const params = new URLSearchParams({ department: department || '', date: date || '' });
+  const res = await fetch(`${getBaseUrl()}/api/grid?${params}`, { method: 'GET' });
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    throw new Error(data.detail ?? messageForStatus(res.status, '空き枠の取得に失敗しました。'));
+  }
+  return {
+    date: data.date ?? date,
+    isHoliday: Boolean(data.is_holiday),
+    reason: data.reason ?? null,
+    timeSlots: Array.isArray(data.timeSlots) ? data.timeSlots : [],
+    doctors: Array.isArray(data.doctors) ? data.doctors : [],
+  };
+}
+
 /**
  * 空き枠キャッシュ（診療科+日付 → { data, fetchedAt }）。5分間有効。
  * 週を戻っても同じ診療科・日付なら再取得しない。
@@ -182,7 +209,8 @@ export async function getSlotsWeek(department, dates, idToken) {
         isDemoFallback: false,
       };
       result[date] = entry;
-      _setCache(department, date, entry);
+      // 縮退した結果（degraded）はキャッシュせず次回取り直す
+      if (!item.degraded) _setCache(department, date, entry);
     }
     return result;
   } catch (err) {
@@ -195,10 +223,99 @@ export async function getSlotsWeek(department, dates, idToken) {
   }
 }
 
+/**
+ * 予約一覧の ETag キャッシュ（リクエストURL → { etag, data }）。
+ * 同じページを再取得するときは If-None-Match を送り、304 ならキャッシュを返す（本文の転送なし）。
+ */
+const _reservationsEtagCache = new Map();
+
+/**
+ * ログインユーザーの予約を1ページ取得する（バックエンドがカーソル方式でページング）。認証必須。
+ * @param {string} idToken - Firebase ID トークン（必須）
+ * @param {{ scope?: 'upcoming'|'past'|'all', limit?: number, cursor?: string, fields?: string[] }} [options]
+ * @returns {Promise<{ items: Array<{ id: string, date?: string, time?: string, department?: string, purpose?: string, doctor?: string }>, nextCursor: string | null }>}
+ */
+export async function getMyReservationsApi(idToken, { scope = 'upcoming', limit = 20, cursor = '', fields = [] } = {}) {
+  if (!idToken || typeof idToken !== 'string' || !idToken.trim()) {
+    const err = new Error('認証情報がありません。再ログインしてください。');
+    err.status = 401;
+    throw err;
+  }
+  const params = new URLSearchParams({ scope, limit: String(limit) });
+  if (cursor) params.set('cursor', cursor);
+  if (fields.length) params.set('fields', fields.join(','));
+  const url = `${getBaseUrl()}/api/reservations?${params}`;
+  const cached = _reservationsEtagCache.get(url);
+  const res = await fetch(url, {
+    method: 'GET',
+    headers: { ...authHeaders(idToken), ...(cached ? { 'If-None-Match': cached.etag } : {}) },
+  });
+  if (res.status === 304 && cached) return cached.data;
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    const err = new Error(
+      res.status === 401
+        ? 'セッションが切れました。再ログインしてください。'
+        : data.detail ?? messageForStatus(res.status, '予約一覧の取得に失敗しました。'),
+    );
+    err.status = res.status;
+    err.detail = data.detail;
+    throw err;
+  }
+  const page = { items: Array.isArray(data.items) ? data.items : [], nextCursor: data.nextCursor ?? null };
+  const etag = res.headers.get('ETag');
+  if (etag) _reservationsEtagCache.set(url, { etag, data: page });
+  return page;
+}
+
+/**
+ * 予約枠を仮押さえする（確認画面の間に他の人に取られないように）。認証必須。
+ * 期限（expiresAt）を過ぎるとバックエンドで自動解放される。
+ * @param {string} idToken - Firebase ID トークン（必須）
+ * @param {object} body - { department, date, time, purpose? }（purpose の所要時間分の連続枠を仮押さえする）
+ * @returns {Promise<{ holdId: string, department: string, date: string, time: string, expiresAt: string }>}
+ */
+export async function createHoldApi(idToken, body) {
+  const res = await fetch(`${getBaseUrl()}/api/holds`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...authHeaders(idToken) },
+    body: JSON.stringify({
+      department: body.department ?? '',
+      date: body.date ?? '',
+      time: body.time ?? '',
+      purpose: body.purpose ?? '',
+    }),
+  });
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    const err = new Error(data.detail ?? messageForStatus(res.status, '予約枠を確保できませんでした。'));
+    err.status = res.status;
+    err.detail = data.detail;
+    err.retryAfter = Number(res.headers.get('Retry-After')) || undefined;
+    throw err;
+  }
+  return data;
+}
+
+/**
+ * 仮押さえを解放する（失敗しても期限で自動解放されるため例外は投げない）。
+ * @param {string} idToken
+ * @param {string} holdId
+ */
+export async function releaseHoldApi(idToken, holdId) {
+  if (!idToken || !holdId) return;
+  try {
+    await fetch(`${getBaseUrl()}/api/holds/${encodeURIComponent(holdId)}`, {
+      method: 'DELETE',
+      headers: authHeaders(idToken),
+    });
+  } catch (_) {}
+}
+
 /**
  * 予約を確定する。担当医はバックエンドで自動割当。認証必須。
  * @param {string} idToken - Firebase ID トークン（必須）
- * @param {object} body - { department, date, time }
+ * @param {object} body - { department, date, time, purpose, holdId? }（holdId があれば仮押さえを確定）
  * @returns {Promise<{ id: string, date: string, time: string, department: string }>}
  */
 export async function createReservationApi(idToken, body) {
@@ -213,6 +330,7 @@ export async function createReservationApi(idToken, body) {
     date: body.date ?? '',
     time: body.time ?? '',
     purpose: body.purpose ?? '',
+    holdId: body.holdId ?? '',
   };
   const res = await fetch(url, {
     method: 'POST',
@@ -222,12 +340,15 @@ export async function createReservationApi(idToken, body) {
   const data = await res.json().catch(() => ({}));
   if (!res.ok) {
     // 401 時は再ログインを促す。500 時はサーバー案内。その他は汎用メッセージ
+    // 503 は混雑による受付制限（Retry-After 秒後に再試行できる）
     const userMsg =
       res.status === 401
         ? 'セッションが切れました。再ログインしてください。'
-        : res.status >= 500
-          ? 'サーバーでエラーが発生しました。しばらくしてから再度お試しください。'
-          : '予約を確定できませんでした。入力内容を確認してもう一度お試しください。';
+        : res.status === 503 && data.detail
+          ? data.detail
+          : res.status >= 500
+            ? 'サーバーでエラーが発生しました。しばらくしてから再度お試しください。'
+            : '予約を確定できませんでした。入力内容を確認してもう一度お試しください。';
     if (import.meta.env.DEV) {
       console.error('[createReservationApi]', {
         status: res.status,
@@ -239,6 +360,7 @@ export async function createReservationApi(idToken, body) {
     const err = new Error(userMsg);
     err.status = res.status;
     err.detail = data.detail;
+    err.retryAfter = Number(res.headers.get('Retry-After')) || undefined;
     throw err;
   }
   return data;
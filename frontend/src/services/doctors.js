@@ -1,13 +1,44 @@
 /**
  * Firestore doctors コレクションの取得
  * doctors/{doctorId}: { name, department, schedules: { mon, tue, wed, thu, fri } }
- * schedules は 30分刻みの時間配列（例: ["09:00", "09:30"]）、空配列は勤務なし
+ * schedules は曜日ごとの勤務時間帯（例: ["09:00-12:00", "13:00-17:00"]、終了を含まない）、空配列は勤務なし。
+ * 従来の15分枠の列挙（["09:00", "09:15", ...]）・整数マスクも読める。画面用には15分枠の配列に展開して返す。
  */
 import { collection, doc, getDoc, getDocs, query, where } from 'firebase/firestore';
 import { db } from '../firebase/firebase';
+import { getTimeSlots } from '../constants/masterData';
 
 const WEEKDAY_KEYS = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'];
 
+const toMinutes = (hhmm) => {
+  const [h, m] = String(hhmm).trim().split(':').map(Number);
+  return h * 60 + m;
+};
+
+/**
+ * 1曜日分の勤務（時間帯・枠の列挙・整数マスク）を15分枠の時間配列にする
+ * @param {unknown} value
+ * @returns {string[]}
+ */
+function expandDaySchedule(value) {
+  const timeSlots = getTimeSlots();
+  if (Number.isInteger(value)) return timeSlots.filter((_, i) => (value >>> i) & 1);
+  if (!Array.isArray(value)) return [];
+  const set = new Set();
+  for (const item of value) {
+    if (typeof item !== 'string') continue;
+    if (item.includes('-')) {
+      const [start, end] = item.split('-');
+      const lo = toMinutes(start);
+      const hi = toMinutes(end);
+      timeSlots.forEach((t) => { if (toMinutes(t) >= lo && toMinutes(t) < hi) set.add(t); });
+    } else {
+      set.add(item);
+    }
+  }
+  return timeSlots.filter((t) => set.has(t));
+}
+
 /**
  * 診療科（表示名）に紐づく医師一覧を取得
  * @param {string} departmentLabel - 診療科の表示名（例: "循環器内科"）
@@ -23,8 +54,7 @@ export async function getDoctorsByDepartment(departmentLabel) {
     const schedules = x.schedules ?? {};
     const normalized = {};
     WEEKDAY_KEYS.forEach((key) => {
-      const arr = schedules[key];
-      normalized[key] = Array.isArray(arr) ? [...arr] : [];
+      normalized[key] = expandDaySchedule(schedules[key]);
     });
     return {
       id: d.id,
@@ -49,8 +79,7 @@ export async function getDoctorById(doctorId) {
   const schedules = x.schedules ?? {};
   const normalized = {};
   WEEKDAY_KEYS.forEach((key) => {
-    const arr = schedules[key];
-    normalized[key] = Array.isArray(arr) ? [...arr] : [];
+    normalized[key] = expandDaySchedule(schedules[key]);
   });
   return {
     id: snap.id,
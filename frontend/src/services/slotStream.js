@@ -0,0 +1,55 @@
+/**
+ * 空き枠の変更配信（GET /api/slots/stream, Server-Sent Events）の購読
+ * 表示中の診療科・期間で他の人が予約・キャンセルすると、変わった枠だけが届く（ポーリング不要）。
+ * 接続が切れた場合は EventSource が自動で再接続し、再接続時は resync として全体の取り直しを促す。
+ */
+import { invalidateSlotsCache } from './backend';
+import { invalidateAvailabilityCache } from './availability';
+
+const getBaseUrl = () => import.meta.env.VITE_API_BASE ?? 'http://localhost:8002';
+
+/**
+ * @param {string} department - 診療科表示名
+ * @param {string} from - YYYY-MM-DD
+ * @param {string} to - YYYY-MM-DD（from から31日以内）
+ * @param {string} purpose - 種別（空き枠 API と同じく、所要時間分の連続枠が取れるかの○×が届く）
+ * @param {{ onChange: (changes: Array<{ date: string, time: string, reservable: boolean }>) => void, onResync?: () => void }} handlers
+ * @returns {() => void} 購読解除
+ */
+export function subscribeSlotChanges(department, from, to, purpose, { onChange, onResync }) {
+  if (!department || !from || !to || typeof EventSource === 'undefined') return () => {};
+
+  const params = new URLSearchParams({ department, from, to });
+  if (purpose) params.set('purpose', purpose);
+  const source = new EventSource(`${getBaseUrl()}/api/slots/stream?${params}`);
+  let connectedOnce = false;
+
+  const resync = () => {
+    invalidateSlotsCache();
+    invalidateAvailabilityCache();
+    onResync?.();
+  };
+
+  source.addEventListener('ready', () => {
+    // 再接続時は切断中の変更を取りこぼしているため取り直す
+    if (connectedOnce) resync();
+    connectedOnce = true;
+  });
+  source.addEventListener('slots', (e) => {
+    let data;
+    try {
+      data = JSON.parse(e.data);
+    } catch {
+      return;
+    }
+    const changes = (Array.isArray(data?.c) ? data.c : []).map(([date, time, reservable]) => ({ date, time, reservable: Boolean(reservable) }));
+    if (!changes.length) return;
+    // キャッシュ済みの空き状況は古くなるので捨てる（表示中の週は onChange で直接更新する）
+    invalidateSlotsCache();
+    invalidateAvailabilityCache();
+    onChange(changes);
+  });
+  source.addEventListener('resync', resync);
+
+  return () => source.close();
+}